@@ -0,0 +1,260 @@
+import collections
+import concurrent.futures
+import copy
+import hashlib
+import logging
+import os
+import string
+import threading
+import typing
+
+import yaml
+
+_logger = logging.getLogger(__name__)
+
+# The number of worker processes used to read and parse files, 1 or less reads them in this process.
+LOAD_WORKERS: str = 'load_workers'
+LOAD_WORKERS_DEFAULT: int = 1
+
+Tokens = typing.Dict[str, object]
+
+
+class FileResult(typing.NamedTuple):
+
+    """The parsed data of a file, or the error reading or parsing it."""
+
+    name: str
+    data: object
+    error: str
+
+
+def picklable_tokens(tokens: Tokens) -> Tokens:
+    """Only the simple token values are used for substitution, so only these are sent to the workers."""
+    if tokens is None:
+        return None
+    return {k: v for k, v in tokens.items() if isinstance(v, (str, int, float, bool))}
+
+
+def substitute(raw: str, tokens: Tokens) -> str:
+    """Substitute the tokens into the raw text as string.Template does, return the raw text if no tokens."""
+    if tokens is None:
+        return raw
+    return string.Template(raw).substitute(tokens)
+
+
+def read_file(name: str, tokens: Tokens = None) -> FileResult:
+    """Read the file, substitute the tokens if given and YAML decode it.
+    Errors are returned rather than raised so they can be collected per file."""
+    try:
+        assert isinstance(name, str)
+        with open(file=name, mode='r') as file:
+            raw = file.read()
+        return FileResult(name, yaml.safe_load(substitute(raw, tokens)), None)
+    except Exception as exception:
+        return FileResult(name, None, '{}: {}'.format(type(exception).__name__, exception))
+
+
+def read_files(names: typing.List[str], tokens: Tokens = None, workers: int = None, cache: 'FileCache' = None) -> typing.List[FileResult]:
+    """Read the files with read_file(), across a pool of worker processes if workers is more than 1.
+    The results are in the same order as the names, so merging them gives the same result as reading one after another.
+    If a cache is given only the files not already cached are read, and what they read is cached."""
+    names = list(names)
+    tokens = picklable_tokens(tokens)
+    workers = LOAD_WORKERS_DEFAULT if workers is None else int(workers)
+    if workers <= 1 or len(names) <= 1:
+        if cache is None:
+            return [read_file(name, tokens) for name in names]
+        return [cache.read(name, tokens) for name in names]
+    results: typing.List[FileResult] = [None] * len(names)
+    signatures: typing.Dict[int, Signature] = dict()
+    if cache is not None:
+        for i, name in enumerate(names):
+            try:
+                signatures[i], results[i] = cache.get(name, tokens)
+            except Exception as exception:
+                results[i] = FileResult(name, None, '{}: {}'.format(type(exception).__name__, exception))
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        _logger.debug('Reading [{}] files with [{}] workers'.format(len(misses), workers))
+        miss_names = [names[i] for i in misses]
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(misses))) as executor:
+                read = list(executor.map(read_file, miss_names, [tokens] * len(misses)))
+        except Exception as exception:
+            _logger.warning('Failed to read files with workers, reading sequentially, exception [{}]'.format(exception))
+            read = [read_file(name, tokens) for name in miss_names]
+        for i, result in zip(misses, read):
+            results[i] = result
+            if cache is not None and result.error is None:
+                cache.put(result.name, signatures[i], tokens, result.data, size=signatures[i][1])
+    return results
+
+
+# A FileCache to use, otherwise the shared file_cache(), or None to always read from disk.
+FILE_CACHE: str = 'file_cache'
+
+FILE_CACHE_BYTES_DEFAULT: int = 64 * 1024 * 1024
+
+Signature = typing.Tuple[int, int, int]
+
+
+def signature(name: str) -> Signature:
+    """The (mtime, size, inode) of the file, which changes whenever the file is written or replaced."""
+    stat = os.stat(name)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def tokens_digest(tokens: Tokens) -> str:
+    """A digest of the simple token values, used to key the substituted text and parsed data."""
+    if tokens is None:
+        return ''
+    return hashlib.sha256(repr(sorted((k, repr(v)) for k, v in picklable_tokens(tokens).items())).encode('utf-8')).hexdigest()
+
+
+class _FileEntry(object):
+
+    def __init__(self, file_signature: Signature) -> None:
+        super().__init__()
+
+        self.signature = file_signature
+
+        self.raw: str = None
+
+        # Tokens digest to substituted text and to parsed data.
+        self.substituted: typing.Dict[str, str] = dict()
+        self.parsed: typing.Dict[str, object] = dict()
+
+        # Parsed data is costed at the size of the text it was parsed from.
+        self.size = 0
+
+
+class FileCache(object):
+
+    """Cache the raw text, substituted text and parsed YAML of files, keyed by path, mtime, size and inode.
+    A changed file has a new signature so its entry is replaced on the next read.
+    Entries are evicted least recently used first to keep within the byte budget.
+    The parsed data is deep copied on return as callers modify it."""
+
+    def __init__(self, max_bytes: int = FILE_CACHE_BYTES_DEFAULT) -> None:
+        super().__init__()
+
+        self.__max_bytes = max_bytes
+
+        self.__lock = threading.Lock()
+
+        self.__entries: collections.OrderedDict = collections.OrderedDict()
+
+        self.__bytes = 0
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    def max_bytes(self) -> int:
+        return self.__max_bytes
+
+    def bytes(self) -> int:
+        return self.__bytes
+
+    def hits(self) -> int:
+        return self.__hits
+
+    def misses(self) -> int:
+        return self.__misses
+
+    def evictions(self) -> int:
+        return self.__evictions
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def _entry(self, name: str, file_signature: Signature) -> _FileEntry:
+        """Return the current entry for the file, replacing it if the signature has changed."""
+        entry = self.__entries.get(name)
+        if entry is None or entry.signature != file_signature:
+            if entry is not None:
+                self.__bytes -= entry.size
+            entry = _FileEntry(file_signature)
+            self.__entries[name] = entry
+        self.__entries.move_to_end(name)
+        return entry
+
+    def _grow(self, entry: _FileEntry, size: int):
+        entry.size += size
+        self.__bytes += size
+        while self.__bytes > self.__max_bytes and len(self.__entries) > 1:
+            name, evicted = self.__entries.popitem(last=False)
+            self.__bytes -= evicted.size
+            self.__evictions += 1
+            _logger.debug('Evicted [{}] size [{}]'.format(name, evicted.size))
+
+    def get(self, name: str, tokens: Tokens = None) -> typing.Tuple[Signature, FileResult]:
+        """Return the file signature and, if cached, the parsed data as a FileResult otherwise None."""
+        file_signature = signature(name)
+        digest = tokens_digest(tokens)
+        with self.__lock:
+            entry = self.__entries.get(name)
+            if entry is not None and entry.signature == file_signature and digest in entry.parsed:
+                self.__entries.move_to_end(name)
+                self.__hits += 1
+                return file_signature, FileResult(name, copy.deepcopy(entry.parsed[digest]), None)
+            self.__misses += 1
+        return file_signature, None
+
+    def put(self, name: str, file_signature: Signature, tokens: Tokens, data: object, raw: str = None, substituted: str = None, size: int = 0):
+        """Cache the parsed data read from the file with the given signature."""
+        digest = tokens_digest(tokens)
+        with self.__lock:
+            entry = self._entry(name, file_signature)
+            grow = 0
+            if raw is not None and entry.raw is None:
+                entry.raw = raw
+                grow += len(raw)
+            if substituted is not None and substituted is not raw and digest not in entry.substituted:
+                entry.substituted[digest] = substituted
+                grow += len(substituted)
+            if digest not in entry.parsed:
+                entry.parsed[digest] = copy.deepcopy(data)
+                grow += size
+            self._grow(entry, grow)
+
+    def read(self, name: str, tokens: Tokens = None) -> FileResult:
+        """As read_file() but only reading, substituting and parsing what is not already cached."""
+        try:
+            assert isinstance(name, str)
+            file_signature, result = self.get(name, tokens)
+            if result is not None:
+                return result
+            digest = tokens_digest(tokens)
+            with self.__lock:
+                entry = self.__entries.get(name)
+                raw = entry.raw if entry is not None and entry.signature == file_signature else None
+                substituted = entry.substituted.get(digest) if raw is not None else None
+            if raw is None:
+                with open(file=name, mode='r') as file:
+                    raw = file.read()
+            if substituted is None:
+                substituted = substitute(raw, tokens)
+            data = yaml.safe_load(substituted)
+            self.put(name, file_signature, tokens, data, raw, substituted, len(substituted))
+            return FileResult(name, data, None)
+        except Exception as exception:
+            return FileResult(name, None, '{}: {}'.format(type(exception).__name__, exception))
+
+    def __str__(self) -> str:
+        return 'Files [{}] Bytes [{}/{}] Hits [{}] Misses [{}] Evictions [{}]'.format(len(self.__entries), self.__bytes, self.__max_bytes, self.__hits, self.__misses, self.__evictions)
+
+
+_file_cache: FileCache = FileCache()
+
+
+def file_cache() -> FileCache:
+    """The FileCache shared by the process."""
+    return _file_cache
+
+
+def cache_for(kwargs: typing.Dict[str, object]) -> FileCache:
+    """The FileCache given by the kwargs, defaulting to the shared file_cache()."""
+    return kwargs.get(FILE_CACHE, _file_cache)
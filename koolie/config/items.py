@@ -4,6 +4,7 @@ import re
 import typing
 import yaml
 
+import koolie.config.files
 import koolie.tools.common
 
 _logger = logging.getLogger(__name__)
@@ -119,6 +120,9 @@ class Items(object):
             Items.LOAD_UNIQUE: self.load_item_unique
         }
 
+        # Map of file name to the error loading it.
+        self._load_errors: typing.Dict[str, str] = dict()
+
     def get_kwargs(self) -> typing.Dict[str, typing.Any]:
         """The kwargs given when this Items was created."""
         return self._kwargs
@@ -139,6 +143,10 @@ class Items(object):
         for item in self.get_items():
             print(item)
 
+    def get_load_errors(self) -> typing.Dict[str, str]:
+        """The errors from the last load(), keyed by file name."""
+        return self._load_errors
+
     def get_fqns(self) -> typing.Set[str]:
         return self._fqns
 
@@ -208,16 +216,31 @@ class Items(object):
     def load_file(self, name: str):
         _logger.debug('load_file()')
         try:
-            assert isinstance(name, str)
-            with open(file=name, mode='r') as file:
-                raw = file.read()
-            self.load_items(yaml.safe_load(raw))
+            cache = koolie.config.files.cache_for(self.get_kwargs())
+            if cache is None:
+                result = koolie.config.files.read_file(name)
+            else:
+                result = cache.read(name)
+            assert result.error is None, result.error
+            self.load_items(result.data)
         except Exception as exception:
+            self._load_errors[name] = str(exception)
             koolie.tools.common.log_exception(exception, logger=_logger)
 
     def load(self, *args: typing.List[typing.Union[str]]):
-        """Load the given YAML files."""
+        """Load the given YAML files.
+        With 'load_workers' more than 1 the files are read and parsed in worker processes, then loaded in the given order."""
         _logger.debug('load()')
+        self._load_errors.clear()
+        workers = self.get_kwargs().get(koolie.config.files.LOAD_WORKERS, koolie.config.files.LOAD_WORKERS_DEFAULT)
+        if workers > 1 and len(args) > 1:
+            for result in koolie.config.files.read_files(args, workers=workers, cache=koolie.config.files.cache_for(self.get_kwargs())):
+                if result.error is None:
+                    self.load_items(result.data)
+                else:
+                    self._load_errors[result.name] = result.error
+                    _logger.warning('Failed to load file [{}] error [{}]'.format(result.name, result.error))
+            return
         for name in args:
             try:
                 assert isinstance(name, str)
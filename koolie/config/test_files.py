@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+import koolie.config.files
+
+
+class TestFileCache(unittest.TestCase):
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'upstream.yaml')
+            with open(name, 'w') as file:
+                file.write('- type: nginx/upstream\n  name: $name\n')
+            cache = koolie.config.files.FileCache()
+
+            result = cache.read(name, {'name': 'foo'})
+            self.assertEqual(result.data, [{'type': 'nginx/upstream', 'name': 'foo'}])
+            result.data[0]['config_file'] = name
+            self.assertEqual(cache.read(name, {'name': 'foo'}).data, [{'type': 'nginx/upstream', 'name': 'foo'}])
+            self.assertEqual(cache.read(name, {'name': 'bar'}).data[0]['name'], 'bar')
+            self.assertEqual((cache.hits(), cache.misses()), (1, 2))
+
+            # A replaced file has a new inode, so is read again.
+            with open(name + '.new', 'w') as file:
+                file.write('- type: nginx/upstream\n  name: ${name}2\n')
+            os.replace(name + '.new', name)
+            self.assertEqual(cache.read(name, {'name': 'foo'}).data[0]['name'], 'foo2')
+
+            self.assertIsNotNone(cache.read(os.path.join(directory, 'missing.yaml')).error)
+
+    def test_budget(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = koolie.config.files.FileCache(max_bytes=100)
+            names = list()
+            for i in range(5):
+                names.append(os.path.join(directory, '{}.yaml'.format(i)))
+                with open(names[-1], 'w') as file:
+                    file.write('- value: {}\n'.format('x' * 20))
+            results = koolie.config.files.read_files(names, workers=2, cache=cache)
+            self.assertEqual([result.data for result in results], [[{'value': 'x' * 20}]] * 5)
+            self.assertLessEqual(cache.bytes(), 100)
+            self.assertGreater(cache.evictions(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import logging
+import os
 import unittest
 
 import koolie.config.items
@@ -36,6 +37,17 @@ class TestLoad(unittest.TestCase):
         items.load('base_nginx_config.yaml')
         items.debug()
 
+    def test_parallel_load(self):
+        directory = os.path.dirname(__file__)
+        names = [os.path.join(directory, name) for name in ['single_item.yaml', 'multiple_item.yaml', 'missing.yaml', 'load_items.yaml']]
+        sequential = koolie.config.items.RawItems()
+        sequential.load(*names)
+        parallel = koolie.config.items.RawItems(load_workers=2)
+        parallel.load(*names)
+        self.assertEqual([item.data() for item in parallel.get_items()], [item.data() for item in sequential.get_items()])
+        self.assertEqual(list(parallel.get_load_errors().keys()), [names[2]])
+        self.assertEqual(list(sequential.get_load_errors().keys()), [names[2]])
+
 
 if __name__ == '__main__':
     unittest.main()
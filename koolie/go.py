@@ -1,4 +1,5 @@
 import argparse
+import koolie.pod_api.pod_snippets
 import koolie.pod_api.pod_status
 import koolie.nginx.zookeeper
 import koolie.version
@@ -29,6 +30,32 @@ def default(name, value) -> str:
     return os.getenv(name, value)
 
 
+def default_flag(name, value: bool = False) -> bool:
+    """The default of a store_true flag from the environment, eg CONFIG_FILES_WATCH=true."""
+    env = os.getenv(name)
+    return value if env is None else env.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def add_zookeeper_pods_buckets(argument_parser: argparse.ArgumentParser):
+    """The pods and the consumers must agree on the bucket layout, so both parsers add the flag here with the same default."""
+    argument_parser.add_argument(
+        '--zookeeper-pods-buckets',
+        type=int,
+        default=default('ZOOKEEPER_PODS_BUCKETS', koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_PODS_BUCKETS_DEFAULT),
+        help='Spread the pod nodes over this many hash buckets, 0 for none, the same for the pods and the consumers'
+    )
+
+
+def add_snippets_path(argument_parser: argparse.ArgumentParser):
+    """The pods publish the snippets where the consumers read them, so both parsers add the flag here with the same default."""
+    argument_parser.add_argument(
+        '--snippets-path',
+        type=str,
+        default=default('SNIPPETS_PATH', koolie.pod_api.pod_snippets.SNIPPETS_PATH_DEFAULT),
+        help='The node the snippet templates are stored under by digest'
+    )
+
+
 def suffix_help(args):
     parser.parse_args(args.help_prefix.split().load_item_append('--help'))
 
@@ -63,13 +90,14 @@ def zookeeper_test(args):
 
 def zookeeper_watch(**kwargs):
 
-    def pod_status(child: dict):
-        _logger.info('add [{}]'.format(child))
+    def pod_status(item: dict):
+        _logger.info('add [{}]'.format(item))
 
     add = dict()
     add[koolie.pod_api.pod_status.STATUS_TYPE] = pod_status
 
     kwargs[koolie.zookeeper_api.koolie_node_watch.StatusTypeWatch.ADD] = add
+    kwargs.setdefault(koolie.zookeeper_api.koolie_node_watch.KOOLIE_NODE_WATCH_PATH, kwargs.get('zookeeper_node_path'))
 
     watch = koolie.zookeeper_api.koolie_node_watch.StatusTypeWatch(**kwargs)
     try:
@@ -107,6 +135,10 @@ pod_subparsers = pod_parser.add_subparsers()
 pod_status_parser = pod_subparsers.add_parser('status', help='Status')
 pod_status_parser.add_argument('--zookeeper-hosts', type=str, default=default('ZOOKEEPER_HOSTS', ZOOKEEPER_HOSTS))
 pod_status_parser.add_argument('--config-files', type=str, nargs='*')
+pod_status_parser.add_argument('--config-files-watch', action='store_true', default=default_flag('CONFIG_FILES_WATCH'), help='Push the status again when a config file changes')
+pod_status_parser.add_argument('--pod-snippets', action='store_true', default=default_flag('POD_SNIPPETS'), help='Publish the config files as shared snippet templates and reference them from the status')
+add_zookeeper_pods_buckets(pod_status_parser)
+add_snippets_path(pod_status_parser)
 pod_status_parser.set_defaults(func=pod_status)
 
 # nginx
@@ -134,6 +166,20 @@ nginx_consume_zookeeper_parser.add_argument('--zookeeper-hosts', type=str, defau
 nginx_consume_zookeeper_parser.add_argument('--zookeeper-kubernetes-pods', type=str, default=default('ZOOKEEPER_KUBERNETES_PODS', ZOOKEEPER_PODS))
 nginx_consume_zookeeper_parser.add_argument('--zookeeper-node-path', type=str, default=default('ZOOKEEPER_NODE_PATH', ZOOKEEPER_ROOT_NODE))
 nginx_consume_zookeeper_parser.add_argument('--config-load-file', type=str, nargs='*')
+nginx_consume_zookeeper_parser.add_argument('--consume-election', action='store_true', help='Elect one replica to render and publish a bundle for the others')
+nginx_consume_zookeeper_parser.add_argument('--consume-snapshot', type=str, help='Persist the pods and rendered files to this file to warm start from')
+nginx_consume_zookeeper_parser.add_argument('--consume-heartbeat-misses', type=int, default=0, help='Evict a pod once its status has missed this many heartbeats, 0 to never')
+nginx_consume_zookeeper_parser.add_argument('--consume-read-api', type=str, help="Serve the pods and files read only as JSON on 'host:port' or 'unix:<path>'")
+nginx_consume_zookeeper_parser.add_argument('--consume-endpoint-slices', action='store_true', help='Add the ready endpoints of the Kubernetes services as upstream servers')
+nginx_consume_zookeeper_parser.add_argument('--endpoint-slices-namespace', type=str, help='The namespace of the endpoint slices, all namespaces if not given')
+nginx_consume_zookeeper_parser.add_argument('--no-consume-zookeeper-pods', dest='consume_zookeeper_pods', action='store_false', help='Do not watch the pods in ZooKeeper')
+nginx_consume_zookeeper_parser.add_argument('--nginx-supervise', action='store_true', help='Start and supervise the NGINX master, reloading it by signal')
+nginx_consume_zookeeper_parser.add_argument('--nginx-upstreams-backend', type=str, choices=['http'], help='Push upstream membership changes to NGINX instead of reloading')
+nginx_consume_zookeeper_parser.add_argument('--nginx-upstreams-url', type=str, default='http://127.0.0.1:8081/koolie/upstreams/{}', help='The URL the servers of an upstream are PUT to')
+nginx_consume_zookeeper_parser.add_argument('--reload-min-interval', type=float, default=5.0, help='Minimum seconds between NGINX reloads')
+nginx_consume_zookeeper_parser.add_argument('--reload-max-staleness', type=float, default=30.0, help='Maximum seconds a reload request waits')
+add_zookeeper_pods_buckets(nginx_consume_zookeeper_parser)
+add_snippets_path(nginx_consume_zookeeper_parser)
 nginx_consume_zookeeper_parser.set_defaults(func=nginx_consume_zookeeper)
 
 # ZooKeeper
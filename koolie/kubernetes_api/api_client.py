@@ -0,0 +1,47 @@
+import logging
+import os
+
+import kubernetes
+
+_logger = logging.getLogger(__name__)
+
+# An API object to use instead of creating a kubernetes.client.CoreV1Api, eg a FakeCoreV1Api.
+KUBERNETES_API: str = 'kubernetes_api'
+
+# An API object to use instead of creating a kubernetes.client.DiscoveryV1Api, eg a FakeDiscoveryV1Api.
+KUBERNETES_DISCOVERY_API: str = 'kubernetes_discovery_api'
+
+# The kubeconfig file, if not given use the in-cluster config when running in a pod otherwise the kubeconfig default.
+KUBERNETES_CONFIG_FILE: str = 'kubernetes_config_file'
+
+
+def load_config(**kwargs):
+    """Load the Kubernetes client configuration given by the kwargs."""
+    config_file = kwargs.get(KUBERNETES_CONFIG_FILE)
+    if config_file is not None:
+        _logger.debug('Loading kubeconfig [{}]'.format(config_file))
+        kubernetes.config.load_kube_config(config_file=os.path.expanduser(config_file))
+    elif 'KUBERNETES_SERVICE_HOST' in os.environ:
+        _logger.debug('Loading in-cluster config')
+        kubernetes.config.load_incluster_config()
+    else:
+        _logger.debug('Loading default kubeconfig')
+        kubernetes.config.load_kube_config()
+
+
+def create_core_v1_api(**kwargs):
+    """Return the `KUBERNETES_API` from the kwargs, otherwise load the config and create a CoreV1Api."""
+    api = kwargs.get(KUBERNETES_API)
+    if api is None:
+        load_config(**kwargs)
+        api = kubernetes.client.CoreV1Api()
+    return api
+
+
+def create_discovery_v1_api(**kwargs):
+    """Return the `KUBERNETES_DISCOVERY_API` from the kwargs, otherwise load the config and create a DiscoveryV1Api."""
+    api = kwargs.get(KUBERNETES_DISCOVERY_API)
+    if api is None:
+        load_config(**kwargs)
+        api = kubernetes.client.DiscoveryV1Api()
+    return api
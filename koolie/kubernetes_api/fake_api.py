@@ -0,0 +1,559 @@
+import bisect
+import copy
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import typing
+import uuid
+
+import kubernetes
+
+import koolie.tools.abstract_service
+
+_logger = logging.getLogger(__name__)
+
+POD_KIND = 'Pod'
+NODE_KIND = 'Node'
+SERVICE_KIND = 'Service'
+ENDPOINT_SLICE_KIND = 'EndpointSlice'
+
+DISCOVERY_API_VERSION = 'discovery.k8s.io/v1'
+
+ADDED = 'ADDED'
+MODIFIED = 'MODIFIED'
+DELETED = 'DELETED'
+BOOKMARK = 'BOOKMARK'
+ERROR = 'ERROR'
+
+HTTP_GONE = 410
+
+_api_client = kubernetes.client.ApiClient()
+
+
+def deserialize(raw: dict, klass: str):
+    """Turn the raw JSON dict into the named model, eg 'V1PodList', as the real client does."""
+    return _api_client._ApiClient__deserialize(raw, klass)
+
+
+def serialize(model) -> dict:
+    """Turn a model, or a dict, into the raw JSON dict."""
+    return _api_client.sanitize_for_serialization(model)
+
+
+def parse_label_selector(label_selector: str) -> typing.List[typing.Tuple[str, str, str]]:
+    """Parse equality based selectors, eg 'a = b, c != d, e', into (key, operator, value) tuples."""
+    requirements = list()
+    for requirement in (label_selector or '').split(','):
+        requirement = requirement.strip()
+        if not requirement:
+            continue
+        if '!=' in requirement:
+            k, v = requirement.split('!=', 1)
+            requirements.append((k.strip(), '!=', v.strip()))
+        elif '=' in requirement:
+            k, v = requirement.replace('==', '=').split('=', 1)
+            requirements.append((k.strip(), '=', v.strip()))
+        else:
+            requirements.append((requirement, 'exists', None))
+    return requirements
+
+
+def match_labels(requirements: typing.List[typing.Tuple[str, str, str]], labels: typing.Dict[str, str]) -> bool:
+    labels = labels or {}
+    for k, operator, v in requirements:
+        if operator == '=' and labels.get(k) != v:
+            return False
+        if operator == '!=' and labels.get(k) == v:
+            return False
+        if operator == 'exists' and k not in labels:
+            return False
+    return True
+
+
+def merge_patch(target: dict, patch: dict) -> dict:
+    """Apply a JSON merge patch (RFC 7386) to target in place."""
+    for k, v in patch.items():
+        if v is None:
+            target.pop(k, None)
+        elif isinstance(v, dict) and isinstance(target.get(k), dict):
+            merge_patch(target[k], v)
+        else:
+            target[k] = copy.deepcopy(v)
+    return target
+
+
+def gone_status(resource_version: int) -> dict:
+    return {
+        'kind': 'Status',
+        'apiVersion': 'v1',
+        'metadata': {},
+        'status': 'Failure',
+        'message': 'too old resource version: {}'.format(resource_version),
+        'reason': 'Expired',
+        'code': HTTP_GONE
+    }
+
+
+class FakeCluster(object):
+
+    """In-memory objects and their event history, shared by the fake APIs.
+    Resource versions are cluster wide, as with etcd.
+    Only the last history events are kept, watching from an older resource version gets a 410 Gone."""
+
+    def __init__(self, history: int = 10000) -> None:
+        super().__init__()
+
+        self.__condition = threading.Condition()
+
+        self.__resource_version = 0
+
+        self.__history = history
+
+        # Kind to (namespace, name) to the raw object.
+        self.__objects: typing.Dict[str, typing.Dict[typing.Tuple[str, str], dict]] = dict()
+
+        # The events as (resource version, kind, type, raw object), plus the resource versions for bisect.
+        self.__events: typing.List[typing.Tuple[int, str, str, dict]] = list()
+        self.__event_versions: typing.List[int] = list()
+
+        # Bumped by expire_watches() to end the open watches with a 410 Gone.
+        self.__watch_epoch = 0
+
+        self.__closed = False
+
+    def condition(self) -> threading.Condition:
+        return self.__condition
+
+    def resource_version(self) -> int:
+        return self.__resource_version
+
+    def oldest_resource_version(self) -> int:
+        """The oldest resource version a watch can start from."""
+        with self.__condition:
+            return self.__event_versions[0] - 1 if self.__event_versions else self.__resource_version
+
+    def watch_epoch(self) -> int:
+        return self.__watch_epoch
+
+    def closed(self) -> bool:
+        return self.__closed
+
+    def close(self):
+        """End all watches."""
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+
+    def objects(self, kind: str, namespace: str = None, label_selector: str = None) -> typing.List[dict]:
+        requirements = parse_label_selector(label_selector)
+        with self.__condition:
+            return [
+                copy.deepcopy(raw) for (ns, name), raw in self.__objects.get(kind, {}).items()
+                if (namespace is None or ns == namespace) and match_labels(requirements, raw['metadata'].get('labels'))
+            ]
+
+    def get(self, kind: str, name: str, namespace: str = None) -> dict:
+        with self.__condition:
+            raw = self.__objects.get(kind, {}).get((namespace, name))
+            return None if raw is None else copy.deepcopy(raw)
+
+    def events_after(self, resource_version: int) -> typing.List[typing.Tuple[int, str, str, dict]]:
+        with self.__condition:
+            return self.__events[bisect.bisect_right(self.__event_versions, resource_version):]
+
+    # Changes.
+
+    def __record(self, kind: str, event_type: str, raw: dict) -> dict:
+        self.__resource_version += 1
+        raw['metadata']['resourceVersion'] = str(self.__resource_version)
+        self.__events.append((self.__resource_version, kind, event_type, copy.deepcopy(raw)))
+        self.__event_versions.append(self.__resource_version)
+        if len(self.__events) > 2 * self.__history:
+            del self.__events[:-self.__history]
+            del self.__event_versions[:-self.__history]
+        self.__condition.notify_all()
+        return copy.deepcopy(raw)
+
+    def add(self, kind: str, raw: dict) -> dict:
+        raw = copy.deepcopy(raw)
+        raw.setdefault('kind', kind)
+        raw.setdefault('apiVersion', 'v1')
+        metadata = raw.setdefault('metadata', {})
+        metadata.setdefault('uid', str(uuid.uuid4()))
+        metadata.setdefault('labels', {})
+        key = (metadata.get('namespace'), metadata['name'])
+        with self.__condition:
+            objects = self.__objects.setdefault(kind, {})
+            if key in objects:
+                raise kubernetes.client.rest.ApiException(status=409, reason='AlreadyExists')
+            objects[key] = raw
+            return self.__record(kind, ADDED, raw)
+
+    def patch(self, kind: str, name: str, namespace: str, patch: dict) -> dict:
+        with self.__condition:
+            raw = self.__objects.get(kind, {}).get((namespace, name))
+            if raw is None:
+                raise kubernetes.client.rest.ApiException(status=404, reason='NotFound')
+            merge_patch(raw, patch)
+            return self.__record(kind, MODIFIED, raw)
+
+    def delete(self, kind: str, name: str, namespace: str = None) -> dict:
+        with self.__condition:
+            raw = self.__objects.get(kind, {}).pop((namespace, name), None)
+            if raw is None:
+                raise kubernetes.client.rest.ApiException(status=404, reason='NotFound')
+            return self.__record(kind, DELETED, raw)
+
+    def compact(self):
+        """Drop the event history, watches from before now will get a 410 Gone."""
+        with self.__condition:
+            self.__events.clear()
+            self.__event_versions.clear()
+
+    def expire_watches(self):
+        """End the open watches with a 410 Gone and drop the history, as an API server restart would."""
+        with self.__condition:
+            self.compact()
+            self.__watch_epoch += 1
+            self.__condition.notify_all()
+
+    def __str__(self) -> str:
+        return 'Resource version [{}] Objects [{}]'.format(self.__resource_version, {kind: len(objects) for kind, objects in self.__objects.items()})
+
+
+class FakeWatchResponse(object):
+
+    """A streaming watch response, written as newline delimited JSON events for kubernetes.watch.Watch to read."""
+
+    def __init__(self, cluster: FakeCluster, kind: str, namespace: str = None, label_selector: str = None, resource_version: str = None, timeout_seconds: float = None, allow_watch_bookmarks: bool = False, bookmark_interval: float = 1.0) -> None:
+        super().__init__()
+
+        self.status = 200
+
+        self._cluster = cluster
+        self._kind = kind
+        self._namespace = namespace
+        self._requirements = parse_label_selector(label_selector)
+        self._resource_version = resource_version
+        self._timeout_seconds = timeout_seconds
+        self._allow_watch_bookmarks = allow_watch_bookmarks
+        self._bookmark_interval = bookmark_interval
+        self._closed = False
+
+    def _match(self, kind: str, raw: dict) -> bool:
+        return kind == self._kind \
+            and (self._namespace is None or raw['metadata'].get('namespace') == self._namespace) \
+            and match_labels(self._requirements, raw['metadata'].get('labels'))
+
+    def _line(self, event_type: str, raw: dict) -> bytes:
+        return '{}\n'.format(json.dumps({'type': event_type, 'object': raw})).encode('utf-8')
+
+    def events(self) -> typing.Iterator[bytes]:
+        cluster = self._cluster
+        deadline = None if self._timeout_seconds is None else time.monotonic() + self._timeout_seconds
+        epoch = cluster.watch_epoch()
+
+        if self._resource_version in {None, '', '0'}:
+            # Start with synthetic ADDED events for the current objects, as the API server does.
+            with cluster.condition():
+                resource_version = cluster.resource_version()
+                current = cluster.objects(self._kind, self._namespace)
+            for raw in current:
+                if self._match(self._kind, raw):
+                    yield self._line(ADDED, raw)
+        else:
+            resource_version = int(self._resource_version)
+
+        if resource_version < cluster.oldest_resource_version():
+            yield self._line(ERROR, gone_status(resource_version))
+            return
+
+        bookmarked = time.monotonic()
+        while not self._closed and not cluster.closed():
+            if cluster.watch_epoch() != epoch:
+                yield self._line(ERROR, gone_status(resource_version))
+                return
+            events = cluster.events_after(resource_version)
+            for event_resource_version, kind, event_type, raw in events:
+                resource_version = event_resource_version
+                if self._match(kind, raw):
+                    yield self._line(event_type, raw)
+            now = time.monotonic()
+            if self._allow_watch_bookmarks and now - bookmarked >= self._bookmark_interval:
+                bookmarked = now
+                yield self._line(BOOKMARK, {'kind': self._kind, 'apiVersion': 'v1', 'metadata': {'resourceVersion': str(resource_version)}})
+            if deadline is not None and now >= deadline:
+                return
+            with cluster.condition():
+                if cluster.resource_version() == resource_version and cluster.watch_epoch() == epoch and not cluster.closed():
+                    wait = self._bookmark_interval if deadline is None else min(self._bookmark_interval, deadline - now)
+                    cluster.condition().wait(max(wait, 0.0))
+
+    def stream(self, amt=None, decode_content=None):
+        return self.events()
+
+    def read_chunked(self, amt=None, decode_content=None):
+        return self.events()
+
+    def close(self):
+        self._closed = True
+
+    def release_conn(self):
+        pass
+
+
+class FakeApi(object):
+
+    """The requests common to the fake APIs, lists return models, watches return a `FakeWatchResponse` so kubernetes.watch.Watch works unchanged."""
+
+    def __init__(self, cluster: FakeCluster = None, latency: float = 0.0, bookmark_interval: float = 1.0) -> None:
+        super().__init__()
+
+        self.__cluster = FakeCluster() if cluster is None else cluster
+
+        # Seconds added to every request.
+        self.__latency = latency
+
+        self.__bookmark_interval = bookmark_interval
+
+        self.__requests = 0
+
+    def cluster(self) -> FakeCluster:
+        return self.__cluster
+
+    def requests(self) -> int:
+        return self.__requests
+
+    def _request(self):
+        self.__requests += 1
+        if self.__latency > 0:
+            time.sleep(self.__latency)
+
+    def _list(self, kind: str, list_type: str, namespace: str = None, watch: bool = False, label_selector: str = None, resource_version: str = None, timeout_seconds: float = None, allow_watch_bookmarks: bool = False, api_version: str = 'v1', **kwargs):
+        self._request()
+        if watch:
+            return FakeWatchResponse(self.__cluster, kind, namespace, label_selector, resource_version, timeout_seconds, allow_watch_bookmarks, self.__bookmark_interval)
+        with self.__cluster.condition():
+            items = self.__cluster.objects(kind, namespace, label_selector)
+            list_resource_version = self.__cluster.resource_version()
+        return deserialize({'apiVersion': api_version, 'kind': '{}List'.format(kind), 'metadata': {'resourceVersion': str(list_resource_version)}, 'items': items}, list_type)
+
+
+class FakeCoreV1Api(FakeApi):
+
+    """Stand-in for kubernetes.client.CoreV1Api serving pods, nodes and services from a `FakeCluster`."""
+
+    def __init__(self, cluster: FakeCluster = None, latency: float = 0.0, bookmark_interval: float = 1.0) -> None:
+        super().__init__(cluster, latency, bookmark_interval)
+
+    def list_pod_for_all_namespaces(self, **kwargs):
+        """List or watch pods in all namespaces.
+
+        :return: V1PodList
+        :rtype: V1PodList
+        """
+        return self._list(POD_KIND, 'V1PodList', **kwargs)
+
+    def list_namespaced_pod(self, namespace: str, **kwargs):
+        """List or watch pods in the namespace.
+
+        :return: V1PodList
+        :rtype: V1PodList
+        """
+        return self._list(POD_KIND, 'V1PodList', namespace, **kwargs)
+
+    def list_node(self, **kwargs):
+        """List or watch nodes.
+
+        :return: V1NodeList
+        :rtype: V1NodeList
+        """
+        return self._list(NODE_KIND, 'V1NodeList', **kwargs)
+
+    def list_service_for_all_namespaces(self, **kwargs):
+        """List or watch services in all namespaces.
+
+        :return: V1ServiceList
+        :rtype: V1ServiceList
+        """
+        return self._list(SERVICE_KIND, 'V1ServiceList', **kwargs)
+
+    def list_namespaced_service(self, namespace: str, **kwargs):
+        """List or watch services in the namespace.
+
+        :return: V1ServiceList
+        :rtype: V1ServiceList
+        """
+        return self._list(SERVICE_KIND, 'V1ServiceList', namespace, **kwargs)
+
+    def patch_namespaced_pod(self, name: str, namespace: str, body, **kwargs):
+        """Merge patch the pod.
+
+        :return: V1Pod
+        :rtype: V1Pod
+        """
+        self._request()
+        return deserialize(self.cluster().patch(POD_KIND, name, namespace, serialize(body)), 'V1Pod')
+
+    def create_namespaced_service(self, namespace: str, body, **kwargs):
+        """Create the service.
+
+        :return: V1Service
+        :rtype: V1Service
+        """
+        self._request()
+        raw = serialize(body)
+        raw.setdefault('metadata', {})['namespace'] = namespace
+        return deserialize(self.cluster().add(SERVICE_KIND, raw), 'V1Service')
+
+
+class FakeDiscoveryV1Api(FakeApi):
+
+    """Stand-in for kubernetes.client.DiscoveryV1Api serving endpoint slices from a `FakeCluster`."""
+
+    def __init__(self, cluster: FakeCluster = None, latency: float = 0.0, bookmark_interval: float = 1.0) -> None:
+        super().__init__(cluster, latency, bookmark_interval)
+
+    def list_endpoint_slice_for_all_namespaces(self, **kwargs):
+        """List or watch endpoint slices in all namespaces.
+
+        :return: V1EndpointSliceList
+        :rtype: V1EndpointSliceList
+        """
+        return self._list(ENDPOINT_SLICE_KIND, 'V1EndpointSliceList', api_version=DISCOVERY_API_VERSION, **kwargs)
+
+    def list_namespaced_endpoint_slice(self, namespace: str, **kwargs):
+        """List or watch endpoint slices in the namespace.
+
+        :return: V1EndpointSliceList
+        :rtype: V1EndpointSliceList
+        """
+        return self._list(ENDPOINT_SLICE_KIND, 'V1EndpointSliceList', namespace, api_version=DISCOVERY_API_VERSION, **kwargs)
+
+
+def pod(name: str, namespace: str = 'default', labels: typing.Dict[str, str] = None, node_name: str = None, pod_ip: str = None) -> dict:
+    """A raw pod for FakeCluster.add()."""
+    return {
+        'metadata': {'name': name, 'namespace': namespace, 'labels': dict(labels or {})},
+        'spec': {'nodeName': node_name, 'containers': [{'name': 'main', 'image': 'koolie'}]},
+        'status': {'phase': 'Running', 'podIP': pod_ip}
+    }
+
+
+def node(name: str, labels: typing.Dict[str, str] = None) -> dict:
+    """A raw node for FakeCluster.add()."""
+    return {'metadata': {'name': name, 'labels': dict(labels or {})}}
+
+
+def service(name: str, namespace: str = 'default', labels: typing.Dict[str, str] = None, selector: typing.Dict[str, str] = None) -> dict:
+    """A raw service for FakeCluster.add()."""
+    return {
+        'metadata': {'name': name, 'namespace': namespace, 'labels': dict(labels or {})},
+        'spec': {'type': 'ClusterIP', 'selector': dict(selector or {}), 'ports': [{'name': 'http', 'port': 80, 'protocol': 'TCP'}]}
+    }
+
+
+def endpoint_slice(name: str, service_name: str, endpoints: typing.List[typing.Tuple[str, bool]], namespace: str = 'default', port: int = 80, port_name: str = 'http') -> dict:
+    """A raw endpoint slice of the service for FakeCluster.add(), with the (address, ready) endpoints."""
+    return {
+        'apiVersion': DISCOVERY_API_VERSION,
+        'metadata': {'name': name, 'namespace': namespace, 'labels': {'kubernetes.io/service-name': service_name}},
+        'addressType': 'IPv4',
+        'endpoints': [{'addresses': [address], 'conditions': {'ready': ready}} for address, ready in endpoints],
+        'ports': [{'name': port_name, 'port': port, 'protocol': 'TCP'}]
+    }
+
+
+class ScriptedEvents(koolie.tools.abstract_service.AbstractService):
+
+    """Drive a `FakeCluster` with pod adds, modifies and deletes at a configurable rate.
+    Optionally expire the open watches with a 410 Gone every gone_interval events."""
+
+    SCRIPTED_EVENTS_RATE = 'scripted_events_rate'
+    SCRIPTED_EVENTS_RATE_DEFAULT = 100.0
+
+    SCRIPTED_EVENTS_COUNT = 'scripted_events_count'
+
+    SCRIPTED_EVENTS_GONE_INTERVAL = 'scripted_events_gone_interval'
+
+    SCRIPTED_EVENTS_NAMESPACE = 'scripted_events_namespace'
+    SCRIPTED_EVENTS_NAMESPACE_DEFAULT = 'default'
+
+    SCRIPTED_EVENTS_LABELS = 'scripted_events_labels'
+
+    def __init__(self, cluster: FakeCluster, **kwargs) -> None:
+        super().__init__(**kwargs)
+
+        self.__cluster = cluster
+
+        self.__random = random.Random(self.get_kv('scripted_events_seed'))
+
+        self.__pods: typing.List[str] = list()
+
+        self.__count = 0
+
+        self.__events = 0
+
+    def events(self) -> int:
+        return self.__events
+
+    def go(self):
+        rate = float(self.get_kv(self.SCRIPTED_EVENTS_RATE, self.SCRIPTED_EVENTS_RATE_DEFAULT))
+        limit = self.get_kv(self.SCRIPTED_EVENTS_COUNT)
+        gone_interval = self.get_kv(self.SCRIPTED_EVENTS_GONE_INTERVAL)
+        started = time.monotonic()
+        while self.state() is koolie.tools.abstract_service.ServiceState.STARTED and self.pending_state() is not koolie.tools.abstract_service.ServiceState.STOPPED:
+            if limit is not None and self.__events >= limit:
+                break
+            wait = started + self.__events / rate - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self.event()
+                self.__events += 1
+                if gone_interval and self.__events % gone_interval == 0:
+                    self.__cluster.expire_watches()
+            except Exception as exception:
+                _logger.warning('Exception in go() [{}].'.format(exception))
+
+    def event(self):
+        namespace = self.get_kv(self.SCRIPTED_EVENTS_NAMESPACE, self.SCRIPTED_EVENTS_NAMESPACE_DEFAULT)
+        choice = self.__random.random()
+        if not self.__pods or choice < 0.4:
+            self.__count += 1
+            name = 'pod-{:06d}'.format(self.__count)
+            self.__cluster.add(POD_KIND, pod(name, namespace, self.get_kv(self.SCRIPTED_EVENTS_LABELS), pod_ip='10.0.{}.{}'.format(self.__count // 250 % 250, self.__count % 250)))
+            self.__pods.append(name)
+        elif choice < 0.8:
+            name = self.__random.choice(self.__pods)
+            self.__cluster.patch(POD_KIND, name, namespace, {'metadata': {'annotations': {'koolie/churn': str(time.time())}}})
+        else:
+            index = self.__random.randrange(len(self.__pods))
+            self.__pods[index], self.__pods[-1] = self.__pods[-1], self.__pods[index]
+            self.__cluster.delete(POD_KIND, self.__pods.pop(), namespace)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    api = FakeCoreV1Api()
+    script = ScriptedEvents(api.cluster(), scripted_events_rate=1000.0, scripted_events_count=5000, scripted_events_gone_interval=2000)
+    script.start()
+
+    received = 0
+    resource_version = None
+    started = time.monotonic()
+    while script.events() < 5000 or resource_version != str(api.cluster().resource_version()):
+        try:
+            watch = kubernetes.watch.Watch()
+            for event in watch.stream(api.list_pod_for_all_namespaces, resource_version=resource_version, timeout_seconds=1, allow_watch_bookmarks=True):
+                received += 1
+            resource_version = watch.resource_version
+        except kubernetes.client.rest.ApiException as api_exception:
+            _logger.info('Watch ended [{}], relisting'.format(api_exception.status))
+            resource_version = api.list_pod_for_all_namespaces().metadata.resource_version
+    _logger.info('Received [{}] events in [{:.2f}]s {}'.format(received, time.monotonic() - started, api.cluster()))
+    script.stop()
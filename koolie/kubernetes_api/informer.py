@@ -0,0 +1,183 @@
+import logging
+import sys
+import time
+import typing
+
+import kubernetes
+
+import koolie.kubernetes_api.api_client
+import koolie.tools.abstract_service
+import koolie.tools.common
+
+_logger = logging.getLogger(__name__)
+
+HTTP_GONE = 410
+
+
+class Informer(koolie.tools.abstract_service.AbstractService):
+
+    """List then watch the objects returned by a list function, eg CoreV1Api.list_node, keeping a local cache keyed by UID.
+    When the watch ends it is resumed from the last resource version seen, including bookmarks.
+    On 410 Gone the objects are listed again and the difference from the cache is reported as added, modified and deleted.
+    Override added(), modified() and deleted() to act on the changes."""
+
+    INFORMER_LIST = 'informer_list'
+
+    # The positional args for the list function, eg the namespace.
+    INFORMER_ARGS = 'informer_args'
+
+    INFORMER_LABEL_SELECTOR = 'informer_label_selector'
+
+    INFORMER_TIMEOUT = 'informer_timeout'
+    INFORMER_TIMEOUT_DEFAULT = 5
+
+    INFORMER_BOOKMARKS = 'informer_bookmarks'
+    INFORMER_BOOKMARKS_DEFAULT = True
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+
+        self._list = self.get_kv(self.INFORMER_LIST)
+        assert callable(self._list)
+
+        self._args = self.get_kv(self.INFORMER_ARGS, [])
+
+        self.__objects: typing.Dict[str, object] = dict()
+
+        self.__resource_version: str = None
+
+        self.__watch: kubernetes.watch.Watch = None
+
+        self.__events = 0
+        self.__lists = 0
+        self.__gones = 0
+        self.__bookmarks = 0
+
+    def objects(self) -> typing.Dict[str, object]:
+        return dict(self.__objects)
+
+    def resource_version(self) -> str:
+        return self.__resource_version
+
+    def events(self) -> int:
+        return self.__events
+
+    def lists(self) -> int:
+        return self.__lists
+
+    def gones(self) -> int:
+        return self.__gones
+
+    def bookmarks(self) -> int:
+        return self.__bookmarks
+
+    def _list_kwargs(self) -> typing.Dict[str, object]:
+        kwargs = dict()
+        label_selector = self.get_kv(self.INFORMER_LABEL_SELECTOR)
+        if label_selector is not None:
+            kwargs['label_selector'] = label_selector
+        return kwargs
+
+    def relist(self):
+        """List the objects and report the difference from the cache."""
+        object_list = self._list(*self._args, **self._list_kwargs())
+        self.__lists += 1
+        listed = {item.metadata.uid: item for item in object_list.items}
+        for uid in set(self.__objects.keys()) - set(listed.keys()):
+            self.deleted(self.__objects.pop(uid))
+        for uid, item in listed.items():
+            previous = self.__objects.get(uid)
+            self.__objects[uid] = item
+            if previous is None:
+                self.added(item)
+            elif previous.metadata.resource_version != item.metadata.resource_version:
+                self.modified(item)
+        self.__resource_version = object_list.metadata.resource_version
+        _logger.debug('Listed [{}] at [{}]'.format(len(listed), self.__resource_version))
+
+    def event(self, event_type: str, item):
+        """Apply the watch event to the cache."""
+        self.__events += 1
+        if event_type == 'BOOKMARK':
+            self.__bookmarks += 1
+            return
+        uid = item.metadata.uid
+        if event_type == 'DELETED':
+            if self.__objects.pop(uid, None) is not None:
+                self.deleted(item)
+        elif uid in self.__objects:
+            self.__objects[uid] = item
+            self.modified(item)
+        else:
+            self.__objects[uid] = item
+            self.added(item)
+
+    def watch(self):
+        """Watch from the last resource version until the watch times out or is stopped."""
+        self.__watch = kubernetes.watch.Watch()
+        kwargs = self._list_kwargs()
+        kwargs['resource_version'] = self.__resource_version
+        kwargs['timeout_seconds'] = self.get_kv(self.INFORMER_TIMEOUT, self.INFORMER_TIMEOUT_DEFAULT)
+        if self.get_kv(self.INFORMER_BOOKMARKS, self.INFORMER_BOOKMARKS_DEFAULT):
+            kwargs['allow_watch_bookmarks'] = True
+        try:
+            for event in self.__watch.stream(self._list, *self._args, **kwargs):
+                self.event(event['type'], event['object'])
+        finally:
+            # The Watch tracks the resource version of every event, bookmarks included.
+            if self.__watch.resource_version is not None:
+                self.__resource_version = self.__watch.resource_version
+
+    def go(self):
+        while self.state() is koolie.tools.abstract_service.ServiceState.STARTED and self.pending_state() is not koolie.tools.abstract_service.ServiceState.STOPPED:
+            try:
+                if self.__resource_version is None:
+                    self.relist()
+                self.watch()
+            except kubernetes.client.rest.ApiException as api_exception:
+                if api_exception.status == HTTP_GONE:
+                    self.__gones += 1
+                    _logger.debug('Gone at [{}], relisting'.format(self.__resource_version))
+                    self.__resource_version = None
+                else:
+                    koolie.tools.common.log_exception(api_exception, logger=_logger)
+                    time.sleep(1)
+            except Exception as exception:
+                koolie.tools.common.log_exception(exception, logger=_logger)
+                time.sleep(1)
+
+    def stop(self):
+        # Stop the watch first so go() does not wait out the watch timeout.
+        if self.__watch is not None:
+            self.__watch.stop()
+        super().stop()
+
+    def added(self, item):
+        pass
+
+    def modified(self, item):
+        pass
+
+    def deleted(self, item):
+        pass
+
+    def __str__(self) -> str:
+        return '{}\nObjects [{}] Resource version [{}] Events [{}] Lists [{}] Gones [{}] Bookmarks [{}]'.format(
+            super().__str__(),
+            len(self.__objects),
+            self.__resource_version,
+            self.__events,
+            self.__lists,
+            self.__gones,
+            self.__bookmarks
+        )
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    api = koolie.kubernetes_api.api_client.create_core_v1_api()
+
+    with Informer(informer_list=api.list_pod_for_all_namespaces) as informer:
+        time.sleep(10)
+        _logger.info(informer)
@@ -8,6 +8,9 @@ import uuid
 
 from kubernetes import client, config, watch
 
+import koolie.kubernetes_api.api_client
+import koolie.kubernetes_api.informer
+import koolie.tools.common
 import koolie.tools.service
 
 _logger = logging.getLogger(__name__)
@@ -52,12 +55,8 @@ LABELS = typing.Dict[str, str]
 #         print('No koolie_type')
 
 
-def create_service():
-    config.load_kube_config(
-        config_file=os.path.expanduser('~/YellowDog/k8s/clusters/oci/uk-london-1/new_tenancy/preprod/kubeconfig')
-    )
-
-    api = client.CoreV1Api()
+def create_service(**kwargs):
+    api = koolie.kubernetes_api.api_client.create_core_v1_api(**kwargs)
 
     https = client.V1ServicePort(name='https', port=443, target_port=443, protocol='TCP')
 
@@ -79,11 +78,8 @@ def create_service():
     api.create_namespaced_service('dev', service)
 
 
-def pods():
-    config.load_kube_config(
-        config_file=os.path.expanduser('~/YellowDog/k8s/clusters/oci/uk-london-1/new_tenancy/preprod/kubeconfig'))
-
-    api = client.CoreV1Api()
+def pods(**kwargs):
+    api = koolie.kubernetes_api.api_client.create_core_v1_api(**kwargs)
 
     pod_list: client.V1PodList = api.list_pod_for_all_namespaces(watch=False, label_selector='app.kubernetes.io/instance = dev, app.kubernetes.io/name = objectstore')
     pod_item: client.V1Pod
@@ -99,11 +95,8 @@ def pods():
             print('{}'.format(service_item.metadata.uid))
 
 
-def uid_label():
-    config.load_kube_config(
-        config_file=os.path.expanduser('~/YellowDog/k8s/clusters/oci/uk-london-1/new_tenancy/preprod/kubeconfig'))
-
-    api = client.CoreV1Api()
+def uid_label(**kwargs):
+    api = koolie.kubernetes_api.api_client.create_core_v1_api(**kwargs)
 
     pod_list = api.list_namespaced_pod('dev', watch=False, label_selector='app.kubernetes.io/instance = dev, app.kubernetes.io/name = objectstore')
     pod_item: client.V1Pod
@@ -116,11 +109,8 @@ def uid_label():
             print(returned_pod)
 
 
-def watch_pods():
-    config.load_kube_config(
-        config_file=os.path.expanduser('~/YellowDog/k8s/clusters/oci/uk-london-1/new_tenancy/preprod/kubeconfig'))
-
-    api = client.CoreV1Api()
+def watch_pods(**kwargs):
+    api = koolie.kubernetes_api.api_client.create_core_v1_api(**kwargs)
 
     args = ['dev']
 
@@ -142,11 +132,8 @@ def watch_pods():
             print('{} {}'.format(v1_pod.metadata.name, v1_pod.metadata.resource_version))
 
 
-def watch_namespace():
-    config.load_kube_config(
-        config_file=os.path.expanduser('~/YellowDog/k8s/clusters/oci/uk-london-1/new_tenancy/preprod/kubeconfig'))
-
-    api = client.CoreV1Api()
+def watch_namespace(**kwargs):
+    api = koolie.kubernetes_api.api_client.create_core_v1_api(**kwargs)
 
     resource_version = ""
 
@@ -162,31 +149,41 @@ def watch_namespace():
 
 class ListNodes(koolie.tools.service.ValueProcessService):
 
-    def __init__(self, name: str = None):
+    def __init__(self, name: str = None, **kwargs):
         super().__init__(name)
 
+        self._kwargs = kwargs
+
     def go(self):
         _logger.debug('go()')
 
-        # config.incluster_config.load_incluster_config()
-        config.load_kube_config(config_file=os.path.expanduser('~/YellowDog/k8s/clusters/oci/uk-london-1/new_tenancy/preprod/kubeconfig'))
+        api = koolie.kubernetes_api.api_client.create_core_v1_api(**self._kwargs)
+
+        class NodeInformer(koolie.kubernetes_api.informer.Informer):
+
+            def added(self, item):
+                _logger.debug('v1_node = [ADDED] [{}]'.format(item.metadata.uid))
+
+            def modified(self, item):
+                _logger.debug('v1_node = [MODIFIED] [{}]'.format(item.metadata.uid))
 
-        api = client.CoreV1Api()
+            def deleted(self, item):
+                _logger.debug('v1_node = [DELETED] [{}]'.format(item.metadata.uid))
 
-        def node(action: str, v1_node: client.V1Node):
-            _logger.debug('v1_node = [{}] [{}]'.format(action, v1_node.metadata.uid))
+        informer = NodeInformer(informer_list=api.list_node, **self._kwargs)
 
         try:
-            if not self.value:
-                node_list: client.V1NodeList = api.list_node()
-                resource_version = node_list.metadata.resource_version
-                _logger.debug('resource_version = [{}]'.format(resource_version))
-                for item in node_list.items:
-                    node('ADDED', item)
-                while not self.value:
-                    stream = watch.Watch().stream(api.list_node, resource_version=resource_version, timeout_seconds=5)
-                    for item in stream:
-                        node(item['type'], item['object'])
+            while not self.value:
+                try:
+                    if informer.resource_version() is None:
+                        informer.relist()
+                        _logger.debug('resource_version = [{}]'.format(informer.resource_version()))
+                    informer.watch()
+                except client.rest.ApiException as api_exception:
+                    if api_exception.status != koolie.kubernetes_api.informer.HTTP_GONE:
+                        raise
+                    # Too old resource version, list again and report the difference.
+                    informer.relist()
             _logger.debug('finished')
         except Exception as exception:
             koolie.tools.common.log_exception(exception, logger=_logger)
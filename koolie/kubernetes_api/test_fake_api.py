@@ -0,0 +1,57 @@
+import time
+import unittest
+
+import kubernetes
+
+from koolie.kubernetes_api.fake_api import FakeCoreV1Api, POD_KIND, NODE_KIND, pod, node
+from koolie.kubernetes_api.informer import Informer
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    until = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestFakeAPI(unittest.TestCase):
+
+    def test_list_and_patch(self):
+        api = FakeCoreV1Api()
+        api.cluster().add(POD_KIND, pod('foo', 'dev', {'app': 'objectstore'}))
+        api.cluster().add(POD_KIND, pod('bar', 'dev', {'app': 'other'}))
+        pod_list = api.list_namespaced_pod('dev', label_selector='app = objectstore')
+        self.assertEqual([item.metadata.name for item in pod_list.items], ['foo'])
+        patched = api.patch_namespaced_pod('foo', 'dev', {'metadata': {'labels': {'koolie/uid': 'x'}}})
+        self.assertEqual(patched.metadata.labels, {'app': 'objectstore', 'koolie/uid': 'x'})
+        self.assertEqual(patched.metadata.resource_version, '3')
+
+    def test_watch_gone(self):
+        api = FakeCoreV1Api()
+        api.cluster().add(NODE_KIND, node('foo'))
+        api.cluster().add(NODE_KIND, node('bar'))
+        api.cluster().compact()
+        watch = kubernetes.watch.Watch()
+        with self.assertRaises(kubernetes.client.rest.ApiException) as context:
+            list(watch.stream(api.list_node, resource_version='1', timeout_seconds=1))
+        self.assertEqual(context.exception.status, 410)
+
+    def test_informer(self):
+        api = FakeCoreV1Api(bookmark_interval=0.05)
+        cluster = api.cluster()
+        cluster.add(NODE_KIND, node('foo'))
+        with Informer(informer_list=api.list_node, informer_timeout=1) as informer:
+            self.assertTrue(wait_for(lambda: len(informer.objects()) == 1))
+            cluster.add(NODE_KIND, node('bar'))
+            self.assertTrue(wait_for(lambda: len(informer.objects()) == 2))
+            cluster.expire_watches()
+            cluster.delete(NODE_KIND, 'foo')
+            self.assertTrue(wait_for(lambda: [item.metadata.name for item in informer.objects().values()] == ['bar']))
+            self.assertGreaterEqual(informer.gones(), 1)
+            self.assertTrue(wait_for(lambda: informer.bookmarks() > 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
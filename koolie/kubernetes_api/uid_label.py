@@ -1,3 +1,4 @@
+import koolie.kubernetes_api.api_client
 import koolie.tools.abstract_service
 
 import kubernetes
@@ -13,11 +14,7 @@ class UIDLabel(koolie.tools.abstract_service.QueueService):
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
 
-        kubernetes.config.load_kube_config(
-            config_file=os.path.expanduser('~/YellowDog/k8s/clusters/oci/uk-london-1/new_tenancy/preprod/kubeconfig')
-        )
-
-        self._api = kubernetes.client.CoreV1Api()
+        self._api = koolie.kubernetes_api.api_client.create_core_v1_api(**kwargs)
 
     def producer(self):
         _logger.debug('producer()')
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import logging
+import sys
+import typing
+import zlib
+
+from kazoo.exceptions import NodeExistsError, NoNodeError
+
+import koolie.zookeeper_api.koolie_zookeeper
+
+_logger = logging.getLogger(__name__)
+
+# Rendered bundles are stored under this node by digest, eg /koolie/nginx/bundles/<sha256>.
+NGINX_BUNDLES_PATH: str = 'nginx_bundles_path'
+NGINX_BUNDLES_PATH_DEFAULT: str = '/koolie/nginx/bundles'
+
+# The value of this node is the digest of the current bundle, its version is the generation.
+NGINX_GENERATION_PATH: str = 'nginx_generation_path'
+NGINX_GENERATION_PATH_DEFAULT: str = '/koolie/nginx/generation'
+
+# The number of bundles kept, older bundles are deleted when a new one is published.
+NGINX_BUNDLES_KEEP: str = 'nginx_bundles_keep'
+NGINX_BUNDLES_KEEP_DEFAULT: int = 5
+
+# The most bytes a bundle may have, a znode must fit in the ZooKeeper jute.maxbuffer, 1MB by default, with room for the request.
+NGINX_BUNDLE_MAX_BYTES: str = 'nginx_bundle_max_bytes'
+NGINX_BUNDLE_MAX_BYTES_DEFAULT: int = 1000 * 1024
+
+Files = typing.Dict[str, str]
+
+
+class BundleTooLarge(ValueError):
+
+    """Raised by publish() when the encoded bundle is larger than a znode may be."""
+
+
+def encode_bundle(files: Files) -> bytes:
+    """Encode the files as compressed JSON, the same files always give the same bytes."""
+    return zlib.compress(json.dumps(files, sort_keys=True, separators=(',', ':')).encode('utf-8'), 6)
+
+
+def decode_bundle(data: bytes) -> Files:
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+
+def bundle_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class Bundles(object):
+
+    """Publish and fetch rendered bundles.
+    A bundle is content-addressed so publishing an unchanged render does not create a new generation."""
+
+    def __init__(self, zoo_keeper: koolie.zookeeper_api.koolie_zookeeper.AbstractKoolieZooKeeper, **kwargs) -> None:
+        super().__init__()
+
+        self.__zoo_keeper = zoo_keeper
+
+        self.__bundles_path: str = kwargs.get(NGINX_BUNDLES_PATH, NGINX_BUNDLES_PATH_DEFAULT).rstrip('/')
+
+        self.__generation_path: str = kwargs.get(NGINX_GENERATION_PATH, NGINX_GENERATION_PATH_DEFAULT)
+
+        self.__keep: int = kwargs.get(NGINX_BUNDLES_KEEP, NGINX_BUNDLES_KEEP_DEFAULT)
+
+        self.__max_bytes: int = kwargs.get(NGINX_BUNDLE_MAX_BYTES, NGINX_BUNDLE_MAX_BYTES_DEFAULT)
+
+    def bundles_path(self) -> str:
+        return self.__bundles_path
+
+    def generation_path(self) -> str:
+        return self.__generation_path
+
+    def bundle_path(self, digest: str) -> str:
+        return '{}/{}'.format(self.__bundles_path, digest)
+
+    def current(self) -> typing.Tuple[str, int]:
+        """The (digest, generation) of the current bundle, (None, None) if nothing has been published."""
+        stat = self.__zoo_keeper.exists(self.__generation_path)
+        if stat is None:
+            return None, None
+        value = self.__zoo_keeper.get_node_value(self.__generation_path)
+        return (value.decode('utf-8') or None) if value else None, stat.version
+
+    def publish(self, files: Files) -> typing.Tuple[str, bool]:
+        """Store the bundle and make it current, return the digest and whether a new generation was made.
+        Raises BundleTooLarge rather than failing in ZooKeeper if the bundle does not fit in a znode."""
+        data = encode_bundle(files)
+        if len(data) > self.__max_bytes:
+            raise BundleTooLarge('Bundle of [{}] files is [{}] bytes, more than [{}]'.format(len(files), len(data), self.__max_bytes))
+        digest = bundle_digest(data)
+        try:
+            self.__zoo_keeper.create_node(self.bundle_path(digest), data, make_path=True)
+        except NodeExistsError:
+            pass
+        if self.current()[0] == digest:
+            return digest, False
+        try:
+            self.__zoo_keeper.set_node_value(self.__generation_path, digest.encode('utf-8'))
+        except NoNodeError:
+            self.__zoo_keeper.create_node(self.__generation_path, digest.encode('utf-8'), make_path=True)
+        _logger.info('Published bundle [{}] files [{}] bytes [{}]'.format(digest, len(files), len(data)))
+        self.prune(digest)
+        return digest, True
+
+    def fetch(self, digest: str) -> Files:
+        """Fetch the bundle, checking its digest."""
+        data = self.__zoo_keeper.get_node_value(self.bundle_path(digest))
+        if data is None:
+            raise NoNodeError(self.bundle_path(digest))
+        if bundle_digest(data) != digest:
+            raise ValueError('Bundle digest mismatch [{}]'.format(digest))
+        return decode_bundle(data)
+
+    def prune(self, current: str):
+        """Delete the oldest bundles beyond the number kept, never the current bundle."""
+        try:
+            bundles = list()
+            for digest in self.__zoo_keeper.get_children(self.__bundles_path):
+                stat = self.__zoo_keeper.exists(self.bundle_path(digest))
+                if stat is not None and digest != current:
+                    bundles.append((stat.mzxid, digest))
+            for mzxid, digest in sorted(bundles)[:max(len(bundles) - self.__keep + 1, 0)]:
+                self.__zoo_keeper.delete_node(self.bundle_path(digest))
+        except Exception as exception:
+            _logger.warning('Failed to prune bundles [{}]'.format(exception))
+
+    def __str__(self) -> str:
+        return 'Bundles [{}] Generation [{}]'.format(self.__bundles_path, self.__generation_path)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    import koolie.zookeeper_api.memory_zookeeper
+
+    with koolie.zookeeper_api.memory_zookeeper.UsingMemory() as zoo_keeper:
+        bundles = Bundles(zoo_keeper)
+        _logger.info(bundles.publish({'upstreams/foo.conf': 'upstream foo {\n}\n'}))
+        _logger.info(bundles.publish({'upstreams/foo.conf': 'upstream foo {\n}\n'}))
+        _logger.info(bundles.current())
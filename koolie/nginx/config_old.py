@@ -1,9 +1,12 @@
 import collections
+import concurrent.futures
 import logging
+import os
 import typing
 import koolie.tools.common
 import yaml
 
+import koolie.config.files
 import koolie.config.items
 
 _logger = logging.getLogger(__name__)
@@ -11,6 +14,12 @@ _logger = logging.getLogger(__name__)
 
 NGINX_KEY = 'nginx'
 
+TYPE_KEY = koolie.config.items.Item.TYPE_KEY
+
+NAME_KEY = koolie.config.items.Item.NAME_KEY
+
+TAG_KEY = koolie.config.items.Item.TAG_KEY_PREFIX
+
 CONFIG_KEY = 'config'
 
 
@@ -22,6 +31,21 @@ NGINX_UPSTREAMS_DIRECTORY_KEY = 'nginx_upstreams_directory'
 
 NGINX_DIRECTORY_DEAFULT = '/tmp/nginx/'
 
+# The buffer size of the file a dump is streamed to.
+WRITE_BUFFER_SIZE = 64 * 1024
+
+# Dump the files across a pool of this many workers, default is 1 so the files are dumped one after another.
+DUMP_WORKERS_KEY = 'dump_workers'
+
+DUMP_WORKERS_DEFAULT = 1
+
+# The pool the files are dumped on, DUMP_EXECUTOR_THREAD or DUMP_EXECUTOR_PROCESS for when substitution dominates.
+DUMP_EXECUTOR_KEY = 'dump_executor'
+
+DUMP_EXECUTOR_THREAD = 'thread'
+
+DUMP_EXECUTOR_PROCESS = 'process'
+
 
 LOAD_POLICY_KEY = 'loadPolicy'
 
@@ -99,7 +123,7 @@ class NGINX(koolie.config.items.Item):
         if self_in_substitute:
             return koolie.tools.common.substitute(self.config(), **collections.ChainMap(substitute, self.tokens()))
 
-        return koolie.tools.common.substitute(self.config(), substitute)
+        return koolie.tools.common.substitute(self.config(), **substitute)
 
 
 class Root(NGINX):
@@ -170,9 +194,9 @@ class Affix(NGINX):
 
 DEFAULT_SERVER_PREFIX = [
     Affix(
-        {
-            koolie.config.items.TYPE_KEY: NGINX_SERVER_PREFIX_TYPE,
-            koolie.config.items.NAME_KEY: 'default',
+        **{
+            TYPE_KEY: NGINX_SERVER_PREFIX_TYPE,
+            NAME_KEY: 'default',
             CONFIG_KEY: 'server ${nginx_server_prefix__name} {{\n'
         }
     )
@@ -180,9 +204,9 @@ DEFAULT_SERVER_PREFIX = [
 
 DEFAULT_SERVER_SUFFIX = [
     Affix(
-        {
-            koolie.config.items.TYPE_KEY: NGINX_SERVER_SUFFIX_TYPE,
-            koolie.config.items.NAME_KEY: 'default',
+        **{
+            TYPE_KEY: NGINX_SERVER_SUFFIX_TYPE,
+            NAME_KEY: 'default',
             CONFIG_KEY: '}\n'
         }
     )
@@ -191,9 +215,9 @@ DEFAULT_SERVER_SUFFIX = [
 
 DEFAULT_LOCATION_PREFIX = [
     Affix(
-        {
-            koolie.config.items.TYPE_KEY: NGINX_LOCATION_PREFIX_TYPE,
-            koolie.config.items.NAME_KEY: 'default',
+        **{
+            TYPE_KEY: NGINX_LOCATION_PREFIX_TYPE,
+            NAME_KEY: 'default',
             CONFIG_KEY: 'location ${nginx_location__match_modifier} ${nginx_location__location_match} {{\n'
         }
     )
@@ -201,9 +225,9 @@ DEFAULT_LOCATION_PREFIX = [
 
 DEFAULT_LOCATION_SUFFIX = [
     Affix(
-        {
-            koolie.config.items.TYPE_KEY: NGINX_LOCATION_SUFFIX_TYPE,
-            koolie.config.items.NAME_KEY: 'default',
+        **{
+            TYPE_KEY: NGINX_LOCATION_SUFFIX_TYPE,
+            NAME_KEY: 'default',
             CONFIG_KEY: '}\n'
         }
     )
@@ -212,9 +236,9 @@ DEFAULT_LOCATION_SUFFIX = [
 
 DEFAULT_UPSTREAM_PREFIX = [
     Affix(
-        {
-            koolie.config.items.TYPE_KEY: NGINX_UPSTREAM_PREFIX_TYPE,
-            koolie.config.items.NAME_KEY: '_default',
+        **{
+            TYPE_KEY: NGINX_UPSTREAM_PREFIX_TYPE,
+            NAME_KEY: '_default',
             CONFIG_KEY: 'upstream ${nginx_upstream__name} {\n'
         }
     )
@@ -222,9 +246,9 @@ DEFAULT_UPSTREAM_PREFIX = [
 
 DEFAULT_UPSTREAM_SUFFIX = [
     Affix(
-        {
-            koolie.config.items.TYPE_KEY: NGINX_UPSTREAM_SUFFIX_TYPE,
-            koolie.config.items.NAME_KEY: '_default',
+        **{
+            TYPE_KEY: NGINX_UPSTREAM_SUFFIX_TYPE,
+            NAME_KEY: '_default',
             CONFIG_KEY: '}\n'
         }
     )
@@ -233,14 +257,14 @@ DEFAULT_UPSTREAM_SUFFIX = [
 
 class LocationPrefix(Affix):
 
-    def __init__(self, data: dict = None) -> None:
-        super().__init__(data)
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
 
 
 class LocationSuffix(Affix):
 
-    def __init__(self, data: dict = None) -> None:
-        super().__init__(data)
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
 
 
 class Upstream(NGINX):
@@ -249,14 +273,75 @@ class Upstream(NGINX):
         super().__init__(**kwargs)
 
 
-class LoadConfig(koolie.config.items.Load):
+# A file to dump, the bases wrapped in the prefixes and suffixes.
+DumpFile = collections.namedtuple('DumpFile', ['directory', 'name', 'bases', 'prefixes', 'suffixes'])
+
+
+def write(directory: str, name: str, *args: typing.Union[str, typing.Iterable[str]], commit: bool = True) -> str:
+    """Stream the strings, or iterables of chunks, into the file through a buffer, returning the file name.
+    The file is written aside and then replaced, so NGINX never reads a partial file.
+    If not commit it is left aside and its name returned, for commit_files().
+    If writing fails the file aside is removed."""
+    _logger.debug('write()')
+    koolie.tools.common.ensure_directory(directory)
+    file = '{}{}'.format(directory, name)
+    tmp = '{}.tmp'.format(file)
+    try:
+        with open(file=tmp, mode='w', buffering=WRITE_BUFFER_SIZE) as out:
+            out.write('# koolie\n\n')
+            for chunks in args:
+                if isinstance(chunks, str):
+                    out.write(chunks)
+                    continue
+                for chunk in chunks:
+                    out.write(chunk)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    if not commit:
+        return tmp
+    os.replace(tmp, file)
+    return file
+
+
+def commit_files(written: typing.List[str]):
+    """Replace the files with those written aside."""
+    for tmp in written:
+        os.replace(tmp, tmp[:-len('.tmp')])
+
+
+def dump_config_chunks(bases: typing.List[NGINX], prefixes: typing.List[NGINX], suffixes: typing.List[NGINX], tokens: typing.Dict[str, str]) -> typing.Iterator[str]:
+    """Generate the config of the bases, wrapped in the prefixes and suffixes, one chunk per item."""
+    if prefixes is not None:
+        yield from dump_config_chunks(prefixes, None, None, tokens)
+
+    yield '\n'
+    for i, base in enumerate(bases):
+        if i > 0:
+            yield '\n'
+        yield '# FQN [{}]\n'.format(base.fqn())
+        yield base.config(tokens, True)
+    yield '\n'
+
+    if suffixes is not None:
+        yield from dump_config_chunks(suffixes, None, None, tokens)
+
+
+def dump_file(file: DumpFile, tokens: typing.Dict[str, str], commit: bool) -> str:
+    """Render and write the file, returning its name, or if not commit the name it was written aside to.
+    Only the file and the tokens are needed, so a process pool pickles just those rather than the whole Config."""
+    return write(file.directory, file.name, dump_config_chunks(file.bases, file.prefixes, file.suffixes, tokens), commit=commit)
+
+
+class LoadConfig(koolie.config.items.Items):
 
     def __init__(self) -> None:
         super().__init__()
 
-        self.get_creators().update(
-            NGINX_SERVER_TYPE=Server
-        )
+        self.get_creators().update({
+            NGINX_SERVER_TYPE: Server
+        })
 
 
 class Config(object):
@@ -319,72 +404,98 @@ class Config(object):
 
     def load(self, *args: typing.List[typing.Union[str]]):
         _logger.debug('load()')
-        for name in args:
+        results = koolie.config.files.read_files(
+            args,
+            workers=self._kwargs().get(koolie.config.files.LOAD_WORKERS),
+            cache=koolie.config.files.cache_for(self._kwargs())
+        )
+        for result in results:
             try:
-                assert isinstance(name, str)
-                _logger.debug('add_file() name=[{}]'.format(name))
-                with open(file=name, mode='r') as file:
-                    raw = file.read()
-                items: typing.List[typing.Dict] = yaml.load(raw)
+                _logger.debug('add_file() name=[{}]'.format(result.name))
+                assert result.error is None, result.error
+                items: typing.List[typing.Dict] = result.data
                 for item in items:
                     try:
-                        nginx: NGINX = NGINX(item)
+                        nginx: NGINX = NGINX(**item)
 
-                        self.add_item(self.item_creator[nginx.type()](nginx.data()))
+                        self.add_item(self.item_creator[nginx.type()](**nginx.data()))
                     except Exception as exception:
                         _logger.warning('load() Item exception [{}]'.format(koolie.tools.common.decode_exception(exception)))
             except Exception as exception:
                 _logger.warning('load() File exception [{}]'.format(koolie.tools.common.decode_exception(exception)))
     # Dump
 
-    def write(self, directory: str, name: str, *args: str):
-        _logger.debug('write()')
-        koolie.tools.common.ensure_directory(directory)
-        file = '{}{}'.format(directory, name)
-        with open(file=file, mode='w') as out:
-            if out.tell() == 0:
-                out.write('# koolie\n\n')
-            for line in args:
-                out.write(line)
+    def write(self, directory: str, name: str, *args: typing.Union[str, typing.Iterable[str]], commit: bool = True) -> str:
+        return write(directory, name, *args, commit=commit)
+
+    def commit_files(self, written: typing.List[str]):
+        commit_files(written)
 
     def dump_config(self, bases: typing.List[NGINX], prefixes: typing.List[NGINX], suffixes: typing.List[NGINX], tokens: typing.Dict[str, str]) -> str:
         _logger.debug('dump_config()')
+        return ''.join(self.dump_config_chunks(bases, prefixes, suffixes, tokens))
 
-        prefix = '' if prefixes is None else self.dump_config(prefixes, None, None, tokens)
-
-        config = '\n'.join('# FQN [{}]\n{}'.format(base.fqn(), base.config(tokens, True)) for base in bases)
-
-        suffix = '' if suffixes is None else self.dump_config(suffixes, None, None, tokens)
+    def dump_config_chunks(self, bases: typing.List[NGINX], prefixes: typing.List[NGINX], suffixes: typing.List[NGINX], tokens: typing.Dict[str, str]) -> typing.Iterator[str]:
+        return dump_config_chunks(bases, prefixes, suffixes, tokens)
 
-        return '{}\n{}\n{}'.format(prefix, config, suffix)
-
-    def dump_root(self, roots: typing.List[Root], tokens: typing.Dict[str, str]):
+    def dump_root(self, roots: typing.List[Root], tokens: typing.Dict[str, str]) -> DumpFile:
         _logger.debug('dump_root()')
-        line = self.dump_config(roots, None, None, tokens)
-        self.write(self.nginx_directory(), '{}.conf'.format(roots[0].name()), line)
+        return DumpFile(self.nginx_directory(), '{}.conf'.format(roots[0].name()), roots, None, None)
 
-    def dump_main(self, roots: typing.List[Root], tokens: typing.Dict[str, str]):
+    def dump_main(self, roots: typing.List[Root], tokens: typing.Dict[str, str]) -> DumpFile:
         _logger.debug('dump_root()')
-        line = self.dump_config(roots, None, None, tokens)
-        self.write(self.nginx_directory(), '{}.conf'.format(roots[0].name()), line)
+        return DumpFile(self.nginx_directory(), '{}.conf'.format(roots[0].name()), roots, None, None)
 
-    def dump_events(self, roots: typing.List[Root], tokens: typing.Dict[str, str]):
+    def dump_events(self, roots: typing.List[Root], tokens: typing.Dict[str, str]) -> DumpFile:
         _logger.debug('dump_root()')
-        line = self.dump_config(roots, None, None, tokens)
-        self.write(self.nginx_directory(), '{}.conf'.format(roots[0].name()), line)
+        return DumpFile(self.nginx_directory(), '{}.conf'.format(roots[0].name()), roots, None, None)
 
-    def dump_http(self, roots: typing.List[Root], tokens: typing.Dict[str, str]):
+    def dump_http(self, roots: typing.List[Root], tokens: typing.Dict[str, str]) -> DumpFile:
         _logger.debug('dump_root()')
-        line = self.dump_config(roots, None, None, tokens)
-        self.write(self.nginx_directory(), '{}.conf'.format(roots[0].name()), line)
+        return DumpFile(self.nginx_directory(), '{}.conf'.format(roots[0].name()), roots, None, None)
 
-    def dump_server(self, servers: typing.List[Server], tokens: typing.Dict[str, str]):
+    def dump_server(self, servers: typing.List[Server], tokens: typing.Dict[str, str]) -> DumpFile:
         _logger.debug('dump_server()')
-        line = self.dump_config(servers, self.items().get(NGINX_SERVER_PREFIX_TYPE, DEFAULT_SERVER_PREFIX), self.items().get(NGINX_SERVER_SUFFIX_TYPE, DEFAULT_SERVER_SUFFIX), tokens)
-        self.write(self.nginx_servers_directory(), '{}.conf'.format(servers[0].name()), line)
+        return DumpFile(
+            self.nginx_servers_directory(),
+            '{}.conf'.format(servers[0].name()),
+            servers,
+            self.items().get(NGINX_SERVER_PREFIX_TYPE, DEFAULT_SERVER_PREFIX),
+            self.items().get(NGINX_SERVER_SUFFIX_TYPE, DEFAULT_SERVER_SUFFIX)
+        )
 
-    def dump_ignore(self, nginx: NGINX, tokens: typing.Dict[str, str]):
+    def dump_ignore(self, nginx: NGINX, tokens: typing.Dict[str, str]) -> DumpFile:
         _logger.warning('dump_ignore() nginx [{}]'.format(nginx))
+        return None
+
+    def dump_files(self, files: typing.List[DumpFile], tokens: typing.Dict[str, str]):
+        """Dump the files one after another, or across a pool of workers then replace them all together.
+        Each file is rendered by dump_file() either way, so the files are the same."""
+        workers = int(self._kwargs().get(DUMP_WORKERS_KEY, DUMP_WORKERS_DEFAULT) or DUMP_WORKERS_DEFAULT)
+        # Files dumped more than once are left to the sequential dump, the last one wins.
+        if workers <= 1 or len(files) <= 1 or len({(file.directory, file.name) for file in files}) < len(files):
+            for file in files:
+                dump_file(file, tokens, True)
+            return
+        if self._kwargs().get(DUMP_EXECUTOR_KEY, DUMP_EXECUTOR_THREAD) == DUMP_EXECUTOR_PROCESS:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(files)))
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(files)))
+        with executor:
+            futures = [executor.submit(dump_file, file, tokens, False) for file in files]
+        written = list()
+        failed = None
+        for future in futures:
+            try:
+                written.append(future.result())
+            except Exception as exception:
+                failed = exception
+        # A file that failed removed its own file aside in write(), remove those of the others.
+        if failed is not None:
+            for tmp in written:
+                os.remove(tmp)
+            raise failed
+        self.commit_files(written)
 
     def dump(self, **kwargs: typing.Dict[str, str]):
         _logger.debug('dump()')
@@ -399,7 +510,7 @@ class Config(object):
         #     write('{}servers/'.format(nginx_directory()), server.name(), [server])
         #     write('{}servers/'.format(nginx_directory()), server.name(), self.items()[NGINX_SERVER_SUFFIX_FQN])
 
-        dump_dispatcher: typing.Dict[str, typing.Callable[['Config', NGINX, typing.Dict[str, str]], None]] = {
+        dump_dispatcher: typing.Dict[str, typing.Callable[[typing.List[NGINX], typing.Dict[str, str]], DumpFile]] = {
             NGINX_ROOT_TYPE: self.dump_root,
             NGINX_MAIN_TYPE: self.dump_main,
             NGINX_EVENTS_TYPE: self.dump_events,
@@ -409,9 +520,14 @@ class Config(object):
             # NGINX_UPSTREAM_TYPE: dump_upstream
         }
 
+        files: typing.List[DumpFile] = list()
         for nginx_list in self.items().values():
             _logger.debug('NGINX [{}]'.format(nginx_list[0].fqn()))
-            dump_dispatcher.get(nginx_list[0].type(), self.dump_ignore)(nginx_list, dump_tokens)
+            file = dump_dispatcher.get(nginx_list[0].type(), self.dump_ignore)(nginx_list, dump_tokens)
+            if file is not None:
+                files.append(file)
+
+        self.dump_files(files, dump_tokens)
 
 
         # _logger.debug('kwargs [{}]'.format('\n'.join(k for k in kwargs.keys())))
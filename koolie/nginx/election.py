@@ -0,0 +1,171 @@
+import logging
+import threading
+import time
+import typing
+
+import kazoo.protocol.states
+
+import koolie.nginx.bundle
+import koolie.zookeeper_api.koolie_zookeeper
+
+_logger = logging.getLogger(__name__)
+
+# Elect one replica to render and publish a bundle, the others only fetch and apply the bundle, default is False.
+CONSUME_ELECTION: str = 'consume_election'
+
+CONSUME_ELECTION_PATH: str = 'consume_election_path'
+CONSUME_ELECTION_PATH_DEFAULT: str = '/koolie/nginx/election'
+
+
+class Election(object):
+
+    """Elect one replica to lead, it alone watches the pods and renders, publishing each render as a content-addressed bundle.
+    The followers apply the current bundle when the generation changes.
+    The owner's watch() is called when elected and its unwatch() when stepping down, on stop or when the session is lost.
+    A change of generation is only given to generation_changed(), the owner applies the bundle from its own thread."""
+
+    def __init__(
+            self,
+            zoo_keeper: koolie.zookeeper_api.koolie_zookeeper.AbstractKoolieZooKeeper,
+            name: str,
+            watch: typing.Callable[[], None],
+            unwatch: typing.Callable[[], None],
+            generation_changed: typing.Callable[[], None],
+            **kwargs
+    ) -> None:
+        super().__init__()
+
+        self.__zoo_keeper = zoo_keeper
+
+        self.__name = name
+
+        self.__watch = watch
+
+        self.__unwatch = unwatch
+
+        self.__generation_changed = generation_changed
+
+        self.__path: str = kwargs.get(CONSUME_ELECTION_PATH, CONSUME_ELECTION_PATH_DEFAULT)
+
+        self.__bundles = koolie.nginx.bundle.Bundles(zoo_keeper, **kwargs)
+
+        self.__contest = None
+
+        self.__thread: threading.Thread = None
+
+        self.__stopped = threading.Event()
+
+        self.__leader = False
+
+        # Set to end the leadership, eg on stop or when the session is lost.
+        self.__step_down = threading.Event()
+
+        # The digest of the bundle last written, by a render or a fetch.
+        self.__applied_digest: str = None
+
+        self.__apply_lock = threading.RLock()
+
+        self.__applies = 0
+
+    def bundles(self) -> koolie.nginx.bundle.Bundles:
+        return self.__bundles
+
+    def leader(self) -> bool:
+        return self.__leader
+
+    def applied_digest(self) -> str:
+        return self.__applied_digest
+
+    def applies(self) -> int:
+        """The number of bundles fetched and applied as a follower."""
+        return self.__applies
+
+    def start(self):
+        self.__stopped.clear()
+        self.__step_down.clear()
+        self.__zoo_keeper.watch_data(self.__bundles.generation_path(), self.generation_changed)
+        self.__thread = threading.Thread(group=None, target=self.elect, name='{}-election'.format(self.__name), daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        if self.__thread is None:
+            return
+        self.__stopped.set()
+        self.__step_down.set()
+        if self.__contest is not None:
+            self.__contest.cancel()
+        self.__thread.join(5)
+        self.__thread = None
+
+    def elect(self):
+        """Contend for leadership until stopped, the election is run again after stepping down."""
+        while not self.__stopped.is_set():
+            try:
+                self.__contest = self.__zoo_keeper.election(self.__path, self.__name)
+                self.__contest.run(self.lead)
+            except Exception as exception:
+                _logger.warning('Election failed [{}]'.format(exception))
+                time.sleep(1)
+
+    def lead(self):
+        """Called when elected, watch the pods and render until stepping down."""
+        _logger.info('Elected leader [{}]'.format(self.__name))
+        self.__step_down.clear()
+        self.__leader = True
+        try:
+            self.__watch()
+            self.__step_down.wait()
+        finally:
+            self.__leader = False
+            self.__unwatch()
+            _logger.info('Stepped down [{}]'.format(self.__name))
+
+    def state_changed(self, state):
+        if state == kazoo.protocol.states.KazooState.LOST and self.__leader:
+            # The election node went with the session, step down and contend again.
+            self.__step_down.set()
+
+    def generation_changed(self, data: bytes, stat):
+        """Called in the ZooKeeper event thread when the generation changes, so only tells the owner."""
+        if data is None or self.__leader:
+            return
+        self.__generation_changed()
+
+    def publish(self, files: koolie.nginx.bundle.Files, write: typing.Callable[[], int]) -> int:
+        """Publish the leader's render and write it unless already applied, returning how many files were written.
+        The leader's own files do not wait for the bundle, if publishing fails the followers keep the generation last published."""
+        try:
+            bundle_digest, published = self.__bundles.publish(files)
+        except Exception as exception:
+            _logger.error('Failed to publish bundle [{}] [{}]'.format(type(exception).__name__, exception))
+            bundle_digest = None
+        with self.__apply_lock:
+            if bundle_digest is not None and bundle_digest == self.__applied_digest:
+                return 0
+            self.__applied_digest = bundle_digest
+            return write()
+
+    def apply(self, write: typing.Callable[[koolie.nginx.bundle.Files], int]):
+        """A follower fetches and writes the current bundle if not already applied."""
+        if self.__leader:
+            return
+        try:
+            digest, generation = self.__bundles.current()
+        except Exception as exception:
+            _logger.warning('Failed to get the current bundle exception [{}]'.format(exception))
+            return
+        with self.__apply_lock:
+            if digest is None or digest == self.__applied_digest:
+                return
+            try:
+                files = self.__bundles.fetch(digest)
+            except Exception as exception:
+                _logger.warning('Failed to fetch bundle [{}] generation [{}] exception [{}]'.format(digest, generation, exception))
+                return
+            _logger.info('Applying bundle [{}] generation [{}]'.format(digest, generation))
+            self.__applied_digest = digest
+            self.__applies += 1
+            write(files)
+
+    def __str__(self) -> str:
+        return 'Election [{}] Leader [{}] Bundle [{}] Applies [{}]'.format(self.__path, self.__leader, self.__applied_digest, self.__applies)
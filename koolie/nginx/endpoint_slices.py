@@ -0,0 +1,105 @@
+import logging
+import sys
+import time
+import typing
+
+import koolie.kubernetes_api.api_client
+import koolie.kubernetes_api.informer
+
+_logger = logging.getLogger(__name__)
+
+# Feed the ready endpoints of the services' endpoint slices to the consumer as upstreams, default is False.
+CONSUME_ENDPOINT_SLICES: str = 'consume_endpoint_slices'
+
+# The namespace to watch, default is None so all namespaces.
+ENDPOINT_SLICES_NAMESPACE: str = 'endpoint_slices_namespace'
+
+# The upstream of a slice, formatted with its service and namespace.
+ENDPOINT_SLICES_UPSTREAM: str = 'endpoint_slices_upstream'
+ENDPOINT_SLICES_UPSTREAM_DEFAULT: str = '{service}'
+
+# The name of the port the servers use, default is None so the slice's first port.
+ENDPOINT_SLICES_PORT_NAME: str = 'endpoint_slices_port_name'
+
+# Every endpoint slice managed for a service has this label, its value is the service name.
+SERVICE_NAME_LABEL: str = 'kubernetes.io/service-name'
+
+# The keys of the slices among the consumer's pods.
+SOURCE_PREFIX: str = 'endpointslices/'
+
+UPSTREAM_TYPE: str = 'nginx/upstream'
+
+
+def slice_key(endpoint_slice) -> str:
+    return '{}{}/{}'.format(SOURCE_PREFIX, endpoint_slice.metadata.namespace, endpoint_slice.metadata.name)
+
+
+def slice_items(endpoint_slice, upstream_format: str = ENDPOINT_SLICES_UPSTREAM_DEFAULT, port_name: str = None) -> list:
+    """The upstream items of the ready endpoints, as a pod would put them in its status.
+    An endpoint whose ready condition is unknown is ready, as Kubernetes says. The endpoints of a slice without the port are not servers."""
+    labels = endpoint_slice.metadata.labels or dict()
+    service = labels.get(SERVICE_NAME_LABEL)
+    if service is None:
+        return list()
+    ports = [port for port in endpoint_slice.ports or list() if port.port is not None and (port_name is None or port.name == port_name)]
+    if not ports:
+        return list()
+    port = ports[0].port
+    upstream = upstream_format.format(service=service, namespace=endpoint_slice.metadata.namespace)
+    items = list()
+    for endpoint in endpoint_slice.endpoints or list():
+        if endpoint.conditions is not None and endpoint.conditions.ready is False:
+            continue
+        for address in endpoint.addresses or list():
+            server = '[{}]:{}'.format(address, port) if ':' in address else '{}:{}'.format(address, port)
+            items.append({
+                'type': UPSTREAM_TYPE,
+                'name': upstream,
+                'tag': server,
+                'loadPolicy': 'append',
+                'config': 'server {};\n'.format(server)
+            })
+    return items
+
+
+class EndpointSliceInformer(koolie.kubernetes_api.informer.Informer):
+
+    """Inform the sink of the upstream items of each endpoint slice, keyed by slice, None when the slice is deleted.
+    Only the slices of services are watched, those labelled with `SERVICE_NAME_LABEL`."""
+
+    def __init__(self, sink: typing.Callable[[str, list], None], **kwargs) -> None:
+        api = koolie.kubernetes_api.api_client.create_discovery_v1_api(**kwargs)
+        namespace = kwargs.get(ENDPOINT_SLICES_NAMESPACE)
+        informer_kwargs = dict(kwargs)
+        if namespace is None:
+            informer_kwargs[self.INFORMER_LIST] = api.list_endpoint_slice_for_all_namespaces
+        else:
+            informer_kwargs[self.INFORMER_LIST] = api.list_namespaced_endpoint_slice
+            informer_kwargs[self.INFORMER_ARGS] = [namespace]
+        informer_kwargs.setdefault(self.INFORMER_LABEL_SELECTOR, SERVICE_NAME_LABEL)
+        super().__init__(**informer_kwargs)
+
+        self.__sink = sink
+
+        self.__upstream_format: str = self.get_kv(ENDPOINT_SLICES_UPSTREAM, ENDPOINT_SLICES_UPSTREAM_DEFAULT)
+
+        self.__port_name: str = self.get_kv(ENDPOINT_SLICES_PORT_NAME)
+
+    def added(self, item):
+        self.__sink(slice_key(item), slice_items(item, self.__upstream_format, self.__port_name))
+
+    def modified(self, item):
+        self.__sink(slice_key(item), slice_items(item, self.__upstream_format, self.__port_name))
+
+    def deleted(self, item):
+        self.__sink(slice_key(item), None)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    informer = EndpointSliceInformer(lambda key, items: _logger.info('[{}] [{}]'.format(key, None if items is None else [item['tag'] for item in items])))
+    informer.start()
+    time.sleep(10)
+    informer.stop()
+    _logger.info(informer)
@@ -0,0 +1,203 @@
+import collections
+import logging
+import random
+import threading
+import time
+import typing
+
+import koolie.pod_api.pod_status
+import koolie.tools.timing_wheel
+import koolie.zookeeper_api.koolie_zookeeper
+
+_logger = logging.getLogger(__name__)
+
+# Evict a pod from the render once its status has missed this many heartbeats, default is 0 so a pod stays until its node goes.
+# The heartbeat is the seconds between status updates, from the `heartbeat` of the pod's status, pods without one are never evicted.
+CONSUME_HEARTBEAT_MISSES: str = 'consume_heartbeat_misses'
+CONSUME_HEARTBEAT_MISSES_DEFAULT: int = 0
+
+# The resolution in seconds of the heartbeat deadlines.
+CONSUME_HEARTBEAT_TICK: str = 'consume_heartbeat_tick'
+CONSUME_HEARTBEAT_TICK_DEFAULT: float = koolie.tools.timing_wheel.TIMING_WHEEL_TICK_DEFAULT
+
+# The due pods are checked with this many requests in flight, the changes waiting in the mailbox are applied between the batches.
+CONSUME_HEARTBEAT_BATCH: str = 'consume_heartbeat_batch'
+CONSUME_HEARTBEAT_BATCH_DEFAULT: int = 256
+
+# The deadlines are stretched by up to this fraction, so the pods fetched by the same render do not all fall due together.
+CONSUME_HEARTBEAT_JITTER: str = 'consume_heartbeat_jitter'
+CONSUME_HEARTBEAT_JITTER_DEFAULT: float = 0.1
+
+
+def pod_heartbeat(items: list) -> float:
+    """The seconds between updates of the pod's status, None if the status has no heartbeat."""
+    for item in items or list():
+        if isinstance(item, dict) and item.get('type') == koolie.pod_api.pod_status.STATUS_TYPE:
+            heartbeat = item.get(koolie.pod_api.pod_status.STATUS_HEARTBEAT_KEY)
+            if isinstance(heartbeat, (int, float)) and heartbeat > 0:
+                return float(heartbeat)
+    return None
+
+
+class Heartbeats(object):
+
+    """Evict the pods whose status has missed its heartbeats, restoring them once it is modified again.
+    Each pod with a heartbeat has a deadline in a timing wheel, only the pods falling due are read from ZooKeeper.
+    The lock is the owner's, guarding its pods too, every method but expire() is called with it held."""
+
+    def __init__(
+            self,
+            zoo_keeper: koolie.zookeeper_api.koolie_zookeeper.AbstractKoolieZooKeeper,
+            path: str,
+            lock: threading.Condition,
+            touch: typing.Callable[[str, float], None],
+            **kwargs
+    ) -> None:
+        super().__init__()
+
+        self.__zoo_keeper = zoo_keeper
+
+        self.__path = path.rstrip('/')
+
+        self.__lock = lock
+
+        # Called with the child and when its status was modified, if seen modified by reading its node.
+        self.__touch = touch
+
+        self.__misses: int = kwargs.get(CONSUME_HEARTBEAT_MISSES, CONSUME_HEARTBEAT_MISSES_DEFAULT)
+
+        # The pods with a heartbeat by when their status must next have been modified, only the due pods are checked.
+        self.__wheel = koolie.tools.timing_wheel.TimingWheel(tick=kwargs.get(CONSUME_HEARTBEAT_TICK, CONSUME_HEARTBEAT_TICK_DEFAULT))
+
+        self.__batch: int = max(1, kwargs.get(CONSUME_HEARTBEAT_BATCH, CONSUME_HEARTBEAT_BATCH_DEFAULT))
+
+        self.__jitter: float = kwargs.get(CONSUME_HEARTBEAT_JITTER, CONSUME_HEARTBEAT_JITTER_DEFAULT)
+
+        # The children due but not yet checked, left over when changes arrived while checking.
+        self.__due: typing.Deque[str] = collections.deque()
+
+        # The exists() sent to check the due children.
+        self.__reads = 0
+
+        # Child to the (heartbeat, mzxid) of its status when last seen modified.
+        self.__seen: typing.Dict[str, typing.Tuple[float, int]] = dict()
+
+        # The children evicted from the render for missing their heartbeats.
+        self.__stale: typing.Set[str] = set()
+
+        self.__evictions = 0
+
+    def enabled(self) -> bool:
+        return self.__misses > 0
+
+    def stale(self) -> typing.Set[str]:
+        """The children evicted for missing their heartbeats."""
+        with self.__lock:
+            return set(self.__stale)
+
+    def evictions(self) -> int:
+        return self.__evictions
+
+    def reads(self) -> int:
+        return self.__reads
+
+    def pending(self) -> bool:
+        """Whether due children are left to check."""
+        return len(self.__due) > 0
+
+    def deadline(self, seconds: float) -> float:
+        """Now plus the seconds, stretched by up to `CONSUME_HEARTBEAT_JITTER` of them."""
+        return time.monotonic() + seconds * (1.0 + random.uniform(0.0, self.__jitter))
+
+    def track(self, child: str, items: list, mzxid: int):
+        """Expect the status of the child to be modified again within its heartbeats."""
+        heartbeat = pod_heartbeat(items) if self.enabled() else None
+        if heartbeat is None:
+            self.remove(child)
+            return
+        self.__seen[child] = (heartbeat, mzxid)
+        self.__wheel.schedule(child, self.deadline(heartbeat * self.__misses))
+
+    def added(self, child: str):
+        self.__stale.discard(child)
+
+    def modified(self, child: str):
+        """In tree mode the event is the heartbeat, so expire() need not read the node to see it was modified.
+        Modified so alive, it is tracked again once fetched."""
+        self.__stale.discard(child)
+        seen = self.__seen.get(child)
+        if seen is not None:
+            self.__wheel.schedule(child, self.deadline(seen[0] * self.__misses))
+
+    def renew(self):
+        """Give the live pods their heartbeats again, eg when the modifications may have been dropped."""
+        for child, (heartbeat, mzxid) in self.__seen.items():
+            if child not in self.__stale:
+                self.__wheel.schedule(child, self.deadline(heartbeat * self.__misses))
+
+    def remove(self, child: str):
+        self.__wheel.cancel(child)
+        self.__seen.pop(child, None)
+        self.__stale.discard(child)
+
+    def expire(self, tree: bool, interrupted: typing.Callable[[], bool]) -> bool:
+        """Check the pods whose heartbeat deadline has passed, evicting those whose status has not been modified since it was last seen.
+        The nodes are read with `CONSUME_HEARTBEAT_BATCH` exists() in flight, stopping between batches if interrupted() is True.
+        In tree mode a modification is an event which moves the deadline, so a pod falls due only if it missed its heartbeats and is not read.
+        An evicted pod is read every heartbeat and restored once its status is modified.
+        Returns True if a pod was evicted or restored, so the render changed."""
+        if not self.enabled():
+            return False
+        with self.__lock:
+            self.__due.extend(self.__wheel.advance())
+        changed = False
+        while self.__due:
+            batch = [self.__due.popleft() for _ in range(min(self.__batch, len(self.__due)))]
+            with self.__lock:
+                seen = {child: self.__seen.get(child) for child in batch}
+                read = [child for child in batch if seen[child] is not None and (not tree or child in self.__stale)]
+            results = [(child, self.__zoo_keeper.exists_async('{}/{}'.format(self.__path, child))) for child in read]
+            self.__reads += len(results)
+            stats = dict()
+            for child, result in results:
+                try:
+                    stats[child] = result.get()
+                except Exception as exception:
+                    _logger.warning('Failed to check the heartbeat of [{}] [{}]'.format(child, exception))
+            with self.__lock:
+                for child in batch:
+                    if seen[child] is None or self.__seen.get(child) is not seen[child]:
+                        continue
+                    heartbeat, mzxid = seen[child]
+                    if child in read:
+                        if child not in stats:
+                            self.__wheel.schedule(child, self.deadline(heartbeat))
+                            continue
+                        stat = stats[child]
+                        if stat is None:
+                            # The node going is left to the watch.
+                            continue
+                        if stat.mzxid != mzxid:
+                            self.__seen[child] = (heartbeat, stat.mzxid)
+                            # Not fetched again in children mode, so take the modified time from ZooKeeper.
+                            self.__touch(child, stat.mtime / 1000.0)
+                            self.__wheel.schedule(child, self.deadline(heartbeat * self.__misses))
+                            if child in self.__stale:
+                                self.__stale.discard(child)
+                                changed = True
+                                _logger.info('Pod [{}] heartbeat resumed, restoring'.format(child))
+                            continue
+                    self.__wheel.schedule(child, self.deadline(heartbeat))
+                    if child not in self.__stale:
+                        self.__stale.add(child)
+                        self.__evictions += 1
+                        changed = True
+                        _logger.warning('Pod [{}] missed [{}] heartbeats of [{}]s, evicting'.format(child, self.__misses, heartbeat))
+            if self.__due and interrupted():
+                break
+        return changed
+
+    def __str__(self) -> str:
+        return 'Heartbeats Tracked [{}] Due [{}] Stale [{}] Evictions [{}] Reads [{}]'.format(
+            len(self.__seen), len(self.__due), len(self.__stale), self.__evictions, self.__reads
+        )
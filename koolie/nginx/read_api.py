@@ -0,0 +1,284 @@
+import hashlib
+import http.server
+import json
+import logging
+import os
+import socketserver
+import sys
+import threading
+import time
+import typing
+import urllib.parse
+import uuid
+
+import koolie.nginx.bundle
+import koolie.tools.abstract_service
+
+_logger = logging.getLogger(__name__)
+
+# Serve the consumer's view of the pods and files, read only, as JSON on this address, default is None so not served.
+# Either 'host:port' or a Unix socket path prefixed with 'unix:', eg 'unix:/run/koolie/consume.sock'.
+CONSUME_READ_API: str = 'consume_read_api'
+
+UNIX_PREFIX: str = 'unix:'
+
+# The number of responses kept, each is built once per generation of the view.
+READ_API_CACHE: int = 256
+
+# The seconds between checks for the service stopping.
+POLL_INTERVAL: float = 0.5
+
+CONTENT_TYPE: str = 'application/json'
+
+# The query parameters whose answer depends on the time as well as the view, these responses are neither cached nor tagged.
+TIME_PARAMETERS: typing.FrozenSet[str] = frozenset(['older_than', 'overdue'])
+
+
+class ConsumeView(object):
+
+    """What the read API serves, implemented by the consumer. Each method returns a copy safe to serialise."""
+
+    def view_generation(self) -> int:
+        """Changes whenever anything the view returns changes."""
+        raise NotImplementedError()
+
+    def pod_view(self) -> typing.Dict[str, list]:
+        """The current pods to their decoded status, None if not fetched yet."""
+        raise NotImplementedError()
+
+    def stale(self) -> typing.Set[str]:
+        raise NotImplementedError()
+
+    def written_files(self) -> typing.Dict[str, str]:
+        """The files last written, None if none have been."""
+        raise NotImplementedError()
+
+    def fleet(self):
+        raise NotImplementedError()
+
+
+def file_digest(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    server_version = 'koolie'
+
+    def address_string(self) -> str:
+        # A Unix socket client has no address.
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        _logger.debug('{} {}'.format(self.address_string(), format % args))
+
+    def do_GET(self):
+        self.respond(True)
+
+    def do_HEAD(self):
+        self.respond(False)
+
+    def respond(self, body: bool):
+        url = urllib.parse.urlsplit(self.path)
+        status, etag, data = self.server.read_api.response(url.path, urllib.parse.parse_qs(url.query))
+        if etag is not None and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(data)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+
+    daemon_threads = True
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+
+class ReadAPI(koolie.tools.abstract_service.AbstractService):
+
+    """Serve the consumer's in-memory view as JSON, so inspecting the pods does not touch ZooKeeper.
+
+    GET /pods, the names of the current pods and those evicted as stale.
+    GET /pods/<child>, the decoded status of the pod.
+    GET /files, the digest of the files last written, as published in a bundle, and the digest of each file.
+    GET /files/<name>, the content of the file.
+    GET /fleet, the names of the pods matching the query parameters type, tag, hostname, older_than and overdue,
+    with hostnames=1 the number of them per hostname instead.
+
+    Every response has the generation of the view and an ETag of it, a request with If-None-Match of the current ETag gets a 304.
+    A response is built once per generation and then served from a cache, except those depending on the time which are built every time."""
+
+    def __init__(self, view: ConsumeView, **kwargs) -> None:
+        super().__init__(**kwargs)
+
+        self.__view = view
+
+        self.__address: str = self.get_kv(CONSUME_READ_API)
+
+        self.__server: socketserver.BaseServer = None
+
+        # Distinguishes the generations of this process from those of a previous one.
+        self.__instance = uuid.uuid4().hex[:8]
+
+        self.__cache_lock = threading.Lock()
+
+        # Request to (generation, response).
+        self.__cache: typing.Dict[str, typing.Tuple[int, typing.Tuple[int, str, bytes]]] = dict()
+
+        self.__requests = 0
+        self.__builds = 0
+
+    def address(self):
+        """The address being served, (host, port) or the socket path, None if not serving."""
+        return None if self.__server is None else self.__server.server_address
+
+    def requests(self) -> int:
+        return self.__requests
+
+    def builds(self) -> int:
+        """The number of responses built rather than served from the cache."""
+        return self.__builds
+
+    def before_start(self):
+        if self.__address.startswith(UNIX_PREFIX):
+            path = self.__address[len(UNIX_PREFIX):]
+            if os.path.exists(path):
+                os.unlink(path)
+            self.__server = _UnixHTTPServer(path, _Handler)
+        else:
+            host, port = self.__address.rsplit(':', 1)
+            self.__server = _HTTPServer((host, int(port)), _Handler)
+        self.__server.timeout = POLL_INTERVAL
+        self.__server.read_api = self
+        _logger.info('Serving the read API on [{}]'.format(self.address()))
+        super().before_start()
+
+    def before_stop(self):
+        server = self.__server
+        self.__server = None
+        if server is not None:
+            server.server_close()
+            if isinstance(server, _UnixHTTPServer):
+                try:
+                    os.unlink(server.server_address)
+                except OSError:
+                    pass
+        super().before_stop()
+
+    def go(self):
+        while self.state() is koolie.tools.abstract_service.ServiceState.STARTED and self.pending_state() is not koolie.tools.abstract_service.ServiceState.STOPPED:
+            self.__server.handle_request()
+
+    def etag(self, generation: int) -> str:
+        return '"{}-{}"'.format(self.__instance, generation)
+
+    def response(self, path: str, query: typing.Dict[str, typing.List[str]]) -> typing.Tuple[int, str, bytes]:
+        """The status, ETag and body for the request, from the cache if the view has not changed since it was built."""
+        self.__requests += 1
+        generation = self.__view.view_generation()
+        key = '{}?{}'.format(path, urllib.parse.urlencode(sorted(query.items()), doseq=True))
+        timed = not TIME_PARAMETERS.isdisjoint(query.keys())
+        with self.__cache_lock:
+            cached = None if timed else self.__cache.get(key)
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+        try:
+            status, document = self.build(path.rstrip('/') or '/', query)
+        except Exception as exception:
+            _logger.warning('Failed to build [{}] exception [{}]'.format(key, exception))
+            status, document = 500, {'error': str(exception)}
+        self.__builds += 1
+        document['generation'] = generation
+        response = (status, self.etag(generation) if status == 200 and not timed else None, json.dumps(document, sort_keys=True).encode('utf-8'))
+        if timed:
+            return response
+        with self.__cache_lock:
+            if len(self.__cache) >= READ_API_CACHE:
+                self.__cache.clear()
+            self.__cache[key] = (generation, response)
+        return response
+
+    def build(self, path: str, query: typing.Dict[str, typing.List[str]]) -> typing.Tuple[int, dict]:
+        def parameter(name: str, convert=str):
+            values = query.get(name)
+            return None if not values else convert(values[0])
+
+        if path == '/pods':
+            return 200, {'pods': sorted(self.__view.pod_view().keys()), 'stale': sorted(self.__view.stale())}
+        if path.startswith('/pods/'):
+            child = path[len('/pods/'):]
+            pods = self.__view.pod_view()
+            if child not in pods:
+                return 404, {'error': 'No pod [{}]'.format(child)}
+            return 200, {'pod': child, 'items': pods[child], 'stale': child in self.__view.stale()}
+        if path == '/files':
+            files = self.__view.written_files()
+            if files is None:
+                return 404, {'error': 'No files written'}
+            return 200, {
+                'digest': koolie.nginx.bundle.bundle_digest(koolie.nginx.bundle.encode_bundle(files)),
+                'files': {name: file_digest(content) for name, content in files.items()}
+            }
+        if path.startswith('/files/'):
+            name = path[len('/files/'):]
+            files = self.__view.written_files() or dict()
+            if name not in files:
+                return 404, {'error': 'No file [{}]'.format(name)}
+            return 200, {'file': name, 'digest': file_digest(files[name]), 'content': files[name]}
+        if path == '/fleet':
+            fleet = self.__view.fleet()
+            bitmap = fleet.select(
+                parameter('type'), parameter('tag'), parameter('older_than', float), parameter('hostname'), parameter('overdue', float)
+            )
+            if parameter('hostnames') in {'1', 'true'}:
+                return 200, {'hostnames': fleet.hostnames(bitmap)}
+            return 200, {'pods': fleet.names(bitmap)}
+        return 404, {'error': 'Unknown path [{}]'.format(path)}
+
+    def __str__(self) -> str:
+        return '{}\nAddress [{}] Requests [{}] Builds [{}]'.format(super().__str__(), self.address(), self.__requests, self.__builds)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    import koolie.pod_api.fleet
+
+    class _Demo(ConsumeView):
+
+        def __init__(self) -> None:
+            self.__fleet, self.__statuses = koolie.pod_api.fleet.synthetic_fleet(10)
+
+        def view_generation(self) -> int:
+            return 1
+
+        def pod_view(self) -> typing.Dict[str, list]:
+            return dict(self.__statuses)
+
+        def stale(self) -> typing.Set[str]:
+            return set()
+
+        def written_files(self) -> typing.Dict[str, str]:
+            return {'upstreams/demo.conf': 'upstream demo {\n}\n'}
+
+        def fleet(self):
+            return self.__fleet
+
+    read_api = ReadAPI(_Demo(), consume_read_api=sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1:8082')
+    read_api.start()
+    try:
+        time.sleep(60)
+    finally:
+        read_api.stop()
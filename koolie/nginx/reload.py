@@ -0,0 +1,204 @@
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import typing
+
+import koolie.nginx.render
+import koolie.tools.abstract_service
+import koolie.tools.common
+
+_logger = logging.getLogger(__name__)
+
+# The minimum seconds from the start of one reload to the start of the next.
+RELOAD_MIN_INTERVAL: str = 'reload_min_interval'
+RELOAD_MIN_INTERVAL_DEFAULT: float = 5.0
+
+# The maximum seconds a request waits, it overrides the minimum interval and the drain wait.
+RELOAD_MAX_STALENESS: str = 'reload_max_staleness'
+RELOAD_MAX_STALENESS_DEFAULT: float = 30.0
+
+# Wait for the workers of the previous reload to finish shutting down before reloading again, default is True.
+RELOAD_DRAIN_WAIT: str = 'reload_drain_wait'
+
+# The seconds between checks for the workers draining.
+DRAIN_CHECK_INTERVAL: float = 0.1
+
+# Called to reload, returning True if it succeeded, instead of running the NGINX reload command.
+RELOAD_FUNCTION: str = 'reload_function'
+
+# The number of durations kept for the percentiles.
+RELOAD_DURATIONS: int = 1024
+
+# NGINX sets the title of a worker draining connections after a reload to this.
+SHUTTING_DOWN_TITLE: str = 'nginx: worker process is shutting down'
+
+
+def shutting_down_workers(proc: str = '/proc') -> int:
+    """The number of NGINX workers still shutting down after a reload, 0 if /proc is not available."""
+    count = 0
+    try:
+        pids = [pid for pid in os.listdir(proc) if pid.isdigit()]
+    except OSError:
+        return count
+    for pid in pids:
+        try:
+            with open(os.path.join(proc, pid, 'cmdline'), 'rb') as file:
+                if file.read().startswith(SHUTTING_DOWN_TITLE.encode('utf-8')):
+                    count += 1
+        except OSError:
+            pass
+    return count
+
+
+class ReloadController(koolie.tools.abstract_service.AbstractService):
+
+    """Reload NGINX on request, at most once per minimum interval.
+    Requests made while waiting or while a reload is in flight are coalesced into the next reload.
+    A reload waits for the workers of the previous reload to drain, but no request waits longer than the maximum staleness."""
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+
+        self.__min_interval: float = self.get_kv(RELOAD_MIN_INTERVAL, RELOAD_MIN_INTERVAL_DEFAULT)
+
+        self.__max_staleness: float = self.get_kv(RELOAD_MAX_STALENESS, RELOAD_MAX_STALENESS_DEFAULT)
+        if self.__max_staleness < self.__min_interval:
+            _logger.warning('Max staleness [{}] is less than the min interval [{}]'.format(self.__max_staleness, self.__min_interval))
+
+        self.__drain_wait: bool = self.get_kv(RELOAD_DRAIN_WAIT, True)
+
+        self.__reload_function: typing.Callable[[], bool] = self.get_kv(RELOAD_FUNCTION) or koolie.nginx.render.NGINXConfig(**kwargs).reload
+
+        self.__condition = threading.Condition(threading.Lock())
+
+        # When the oldest pending request was made, None if no request is pending.
+        self.__pending_since: float = None
+
+        # When the last reload started.
+        self.__last_started: float = None
+
+        self.__in_flight = False
+
+        self.__requests = 0
+        self.__coalesced = 0
+        self.__reloads = 0
+        self.__failures = 0
+        self.__forced = 0
+
+        self.__last_succeeded: bool = None
+
+        self.__durations: typing.Deque[float] = collections.deque(maxlen=RELOAD_DURATIONS)
+
+    def request(self):
+        """Ask for a reload, never blocks."""
+        with self.__condition:
+            self.__requests += 1
+            if self.__pending_since is None:
+                self.__pending_since = time.monotonic()
+            else:
+                self.__coalesced += 1
+            self.__condition.notify_all()
+
+    def pending(self) -> bool:
+        return self.__pending_since is not None
+
+    def in_flight(self) -> bool:
+        return self.__in_flight
+
+    def requests(self) -> int:
+        return self.__requests
+
+    def coalesced(self) -> int:
+        """The number of requests made while another was pending, so served by the same reload."""
+        return self.__coalesced
+
+    def reloads(self) -> int:
+        return self.__reloads
+
+    def failures(self) -> int:
+        return self.__failures
+
+    def forced(self) -> int:
+        """The number of reloads made early because the request reached the maximum staleness."""
+        return self.__forced
+
+    def last_succeeded(self) -> bool:
+        return self.__last_succeeded
+
+    def durations(self) -> typing.List[float]:
+        """The seconds each reload took."""
+        return list(self.__durations)
+
+    def draining(self) -> bool:
+        """Whether the workers of the previous reload are still shutting down."""
+        return self.__drain_wait and self.__last_started is not None and shutting_down_workers() > 0
+
+    def due(self) -> typing.Tuple[float, bool]:
+        """The seconds until the pending request is due and whether that is forced by the staleness, with the condition held."""
+        now = time.monotonic()
+        stale_in = self.__pending_since + self.__max_staleness - now
+        wait = 0.0
+        if self.__last_started is not None:
+            wait = self.__last_started + self.__min_interval - now
+        if wait <= 0 and self.draining():
+            wait = DRAIN_CHECK_INTERVAL
+        if stale_in <= wait:
+            return max(stale_in, 0.0), wait > 0
+        return max(wait, 0.0), False
+
+    def go(self):
+        while self.state() is koolie.tools.abstract_service.ServiceState.STARTED and self.pending_state() is not koolie.tools.abstract_service.ServiceState.STOPPED:
+            with self.__condition:
+                if self.__pending_since is None:
+                    self.__condition.wait(1.0)
+                    continue
+                wait, forced = self.due()
+                if wait > 0:
+                    self.__condition.wait(min(wait, 1.0))
+                    continue
+                waited = time.monotonic() - self.__pending_since
+                self.__pending_since = None
+                self.__in_flight = True
+                self.__last_started = time.monotonic()
+            if forced:
+                self.__forced += 1
+                _logger.warning('Reload forced after [{:.3f}]s'.format(waited))
+            self.reload(waited)
+
+    def reload(self, waited: float):
+        started = time.monotonic()
+        try:
+            succeeded = bool(self.__reload_function())
+        except Exception as exception:
+            koolie.tools.common.log_exception(exception, logger=_logger)
+            succeeded = False
+        duration = time.monotonic() - started
+        self.__durations.append(duration)
+        self.__reloads += 1
+        if not succeeded:
+            self.__failures += 1
+        self.__last_succeeded = succeeded
+        self.__in_flight = False
+        _logger.info('Reload [{}] succeeded [{}] waited [{:.3f}]s took [{:.3f}]s'.format(self.__reloads, succeeded, waited, duration))
+
+    def __str__(self) -> str:
+        return '{}\nReloads [{}] Requests [{}] Coalesced [{}] Forced [{}] Failures [{}] Last [{}] p99 [{}]'.format(
+            super().__str__(), self.__reloads, self.__requests, self.__coalesced, self.__forced, self.__failures,
+            self.__last_succeeded, koolie.tools.common.percentile(self.durations(), 99)
+        )
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    controller = ReloadController(reload_min_interval=1.0, reload_max_staleness=3.0, reload_function=lambda: True)
+    controller.start()
+    for i in range(30):
+        controller.request()
+        time.sleep(0.1)
+    time.sleep(2)
+    controller.stop()
+    _logger.info(controller)
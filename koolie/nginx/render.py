@@ -0,0 +1,241 @@
+import collections
+import datetime
+import logging
+import os
+import shlex
+import subprocess
+import sys
+import time
+import typing
+import uuid
+
+import koolie.tools.common
+
+_logger = logging.getLogger(__name__)
+
+NGINX_DIRECTORY: str = 'nginx_directory'
+NGINX_DIRECTORY_DEFAULT: str = '/tmp/nginx/'
+
+# The command run by reload(), empty to not reload.
+NGINX_RELOAD_COMMAND: str = 'nginx_reload_command'
+NGINX_RELOAD_COMMAND_DEFAULT: str = 'nginx -s reload'
+
+TYPE_KEY = 'type'
+NAME_KEY = 'name'
+TAG_KEY = 'tag'
+SERVER_KEY = 'server'
+CONFIG_KEY = 'config'
+
+LOAD_POLICY_KEY = 'loadPolicy'
+LOAD_POLICY_UNIQUE = 'unique'
+LOAD_POLICY_APPEND = 'append'
+
+LOCATION_MATCH_MODIFIER = 'matchModifier'
+LOCATION_LOCATION_MATCH = 'locationMatch'
+
+NGINX_SERVER_TYPE = 'nginx/server'
+NGINX_LOCATION_TYPE = 'nginx/location'
+NGINX_UPSTREAM_TYPE = 'nginx/upstream'
+
+NGINX_TYPES = {NGINX_SERVER_TYPE, NGINX_LOCATION_TYPE, NGINX_UPSTREAM_TYPE}
+
+# The directories, relative to the NGINX directory, whose files are owned by the render.
+RENDERED_DIRECTORIES = ['servers', 'upstreams']
+
+METADATA_ID = 'id'
+METADATA_STARTED = 'started'
+METADATA_STOPPED = 'stopped'
+METADATA_LOAD_COUNT = 'load_count'
+
+# Relative file name to content.
+Files = typing.Dict[str, str]
+
+
+def timestamp() -> str:
+    return datetime.datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def source_id(item: dict) -> str:
+    return '{}/{}/{}'.format(item.get(TYPE_KEY), item.get(NAME_KEY), item.get(TAG_KEY))
+
+
+def safe_name(name: object) -> bool:
+    """Names become file names so must be a single path component."""
+    return isinstance(name, str) and name != '' and '/' not in name and not name.startswith('.')
+
+
+def indent(config: str) -> str:
+    return ''.join('    {}\n'.format(line) if line else '\n' for line in config.rstrip('\n').split('\n'))
+
+
+class NGINXConfig(object):
+
+    """Render the NGINX items pushed by the pods into NGINX config files.
+    Items are keyed by type, name and server; 'unique' items are kept once, first loaded wins, 'append' items accumulate.
+    The files are relative to the NGINX directory so the same render can be written by any replica."""
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__()
+
+        self.__kwargs = kwargs
+
+        # (type, name, server) to the unique then appended items.
+        self.__unique: typing.Dict[typing.Tuple[str, str, str], dict] = collections.OrderedDict()
+        self.__append: typing.Dict[typing.Tuple[str, str, str], typing.List[dict]] = collections.OrderedDict()
+
+        self.__load_metadata = dict()
+        self.__dump_metadata = dict()
+
+        self.__loaded_count = 0
+
+    def nginx_directory(self) -> str:
+        return self.__kwargs.get(NGINX_DIRECTORY, NGINX_DIRECTORY_DEFAULT)
+
+    def load_metadata(self) -> dict:
+        return self.__load_metadata
+
+    def dump_metadata(self) -> dict:
+        return self.__dump_metadata
+
+    def loaded_count(self) -> int:
+        return self.__loaded_count
+
+    def load_start(self):
+        self.__unique.clear()
+        self.__append.clear()
+        self.__loaded_count = 0
+        self.__load_metadata = {METADATA_ID: str(uuid.uuid4()), METADATA_STARTED: timestamp(), METADATA_LOAD_COUNT: 0}
+
+    def load_stop(self):
+        self.__load_metadata[METADATA_STOPPED] = timestamp()
+
+    def load(self, data: typing.List[dict]) -> int:
+        """Load the NGINX items from the decoded status of a pod, returning how many were loaded."""
+        count = self.load_items(data)
+        self.__loaded_count += count
+        self.__load_metadata[METADATA_LOAD_COUNT] = self.__load_metadata.get(METADATA_LOAD_COUNT, 0) + count
+        return count
+
+    def load_items(self, data: typing.List[dict]) -> int:
+        count = 0
+        if not isinstance(data, list):
+            return count
+        for item in data:
+            try:
+                if isinstance(item, list):
+                    # The items of a config file, as pushed by PushNGINXConfig.
+                    count += self.load_items(item)
+                    continue
+                if not isinstance(item, dict) or item.get(TYPE_KEY) not in NGINX_TYPES or item.get(CONFIG_KEY) is None:
+                    continue
+                key = (item[TYPE_KEY], item.get(NAME_KEY), item.get(SERVER_KEY))
+                if not safe_name(key[1]) or (item[TYPE_KEY] == NGINX_LOCATION_TYPE and not safe_name(key[2])):
+                    _logger.warning('Ignoring item with unsafe name [{}]'.format(source_id(item)))
+                    continue
+                if item.get(LOAD_POLICY_KEY, LOAD_POLICY_APPEND) == LOAD_POLICY_UNIQUE:
+                    if key in self.__unique:
+                        continue
+                    self.__unique[key] = item
+                else:
+                    self.__append.setdefault(key, list()).append(item)
+                count += 1
+            except Exception as exception:
+                koolie.tools.common.log_exception(exception, logger=_logger)
+        return count
+
+    def blocks(self) -> typing.Dict[typing.Tuple[str, str, str], typing.List[dict]]:
+        """The loaded items per key, unique items first."""
+        blocks = collections.OrderedDict()
+        for key, item in self.__unique.items():
+            blocks.setdefault(key, list()).append(item)
+        for key, items in self.__append.items():
+            blocks.setdefault(key, list()).extend(items)
+        return blocks
+
+    def files(self) -> Files:
+        """Render the loaded items."""
+        files = dict()
+        for (item_type, name, server), items in sorted(self.blocks().items(), key=lambda block: tuple(str(k) for k in block[0])):
+            config = ''.join('# Source [{}]\n{}'.format(source_id(item), item[CONFIG_KEY].rstrip('\n') + '\n') for item in items)
+            if item_type == NGINX_UPSTREAM_TYPE:
+                files['upstreams/{}.conf'.format(name)] = 'upstream {} {{\n{}}}\n'.format(name, indent(config))
+            elif item_type == NGINX_LOCATION_TYPE:
+                match = ' '.join(m for m in [items[0].get(LOCATION_MATCH_MODIFIER), items[0].get(LOCATION_LOCATION_MATCH)] if m)
+                files['servers/{}/{}.conf'.format(server, name)] = 'location {} {{\n{}}}\n'.format(match, indent(config))
+            elif item_type == NGINX_SERVER_TYPE:
+                files['servers/{}.conf'.format(name)] = 'server {{\n{}\n    include servers/{}/*.conf;\n}}\n'.format(indent(config), name)
+        return files
+
+    def dump_start(self):
+        self.__dump_metadata = {METADATA_ID: self.__load_metadata.get(METADATA_ID), METADATA_STARTED: timestamp()}
+
+    def dump(self) -> int:
+        return self.write_files(self.files())
+
+    def dump_stop(self):
+        self.__dump_metadata[METADATA_STOPPED] = timestamp()
+
+    def write_files(self, files: Files) -> int:
+        """Write the files replacing those of any earlier render, returning how many were written or removed.
+        Unchanged files are left alone and each file is replaced atomically.
+        An empty render writes nothing, rather than removing every file NGINX has."""
+        directory = self.nginx_directory()
+        written = 0
+        if not files:
+            _logger.warning('Ignoring an empty render in [{}]'.format(directory))
+            self.__dump_metadata['written'] = written
+            return written
+        for name, content in files.items():
+            if name.split('/')[0] not in RENDERED_DIRECTORIES or '..' in name.split('/'):
+                _logger.warning('Ignoring file outside the rendered directories [{}]'.format(name))
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path, 'r') as file:
+                    if file.read() == content:
+                        continue
+            except OSError:
+                pass
+            koolie.tools.common.ensure_directory(os.path.dirname(path))
+            with open(path + '.tmp', 'w') as file:
+                file.write(content)
+            os.replace(path + '.tmp', path)
+            written += 1
+        for rendered in RENDERED_DIRECTORIES:
+            for folder, sub_folders, file_names in os.walk(os.path.join(directory, rendered)):
+                for file_name in file_names:
+                    path = os.path.join(folder, file_name)
+                    if os.path.relpath(path, directory).replace(os.sep, '/') not in files:
+                        os.remove(path)
+                        written += 1
+        self.__dump_metadata['written'] = written
+        return written
+
+    def reload(self) -> bool:
+        """Run the reload command, return True if it succeeded."""
+        command = self.__kwargs.get(NGINX_RELOAD_COMMAND, NGINX_RELOAD_COMMAND_DEFAULT)
+        if not command:
+            return False
+        try:
+            subprocess.run(shlex.split(command), check=True, timeout=30)
+            return True
+        except Exception as exception:
+            _logger.warning('Failed to reload [{}] with exception [{}]'.format(command, exception))
+            return False
+
+    def __str__(self) -> str:
+        return 'Load [{}] Dump [{}]'.format(self.__load_metadata, self.__dump_metadata)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    import koolie.config.files
+
+    nginx_config = NGINXConfig()
+    nginx_config.load_start()
+    for file_name in sys.argv[1:]:
+        nginx_config.load(koolie.config.files.read_file(file_name, {'os_environ_hostname': 'localhost'}).data)
+    nginx_config.load_stop()
+    for name, content in sorted(nginx_config.files().items()):
+        _logger.info('{}\n{}'.format(name, content))
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import typing
+import zlib
+
+import koolie.nginx.render
+import koolie.tools.common
+
+_logger = logging.getLogger(__name__)
+
+# Persist the pods and the rendered files to this file after each render and warm start from it, default is None so not persisted.
+CONSUME_SNAPSHOT: str = 'consume_snapshot'
+
+SNAPSHOT_FORMAT: int = 1
+
+# Save the snapshot after a render which wrote files, or when it was last saved this many seconds ago.
+# The pods' statuses change without changing the files, eg heartbeats, so they are saved at most this stale.
+CONSUME_SNAPSHOT_INTERVAL: str = 'consume_snapshot_interval'
+CONSUME_SNAPSHOT_INTERVAL_DEFAULT: float = 60.0
+
+
+class Warm(object):
+
+    """A pod's status from the snapshot, used by the next render if the node is unchanged."""
+
+    def __init__(self, zxid: int, version: int, digest: str, items: list) -> None:
+        super().__init__()
+
+        self.zxid = zxid
+        self.version = version
+        self.digest = digest
+        self.items = items
+
+
+def encode_snapshot(snapshot: dict) -> bytes:
+    return zlib.compress(json.dumps(snapshot, separators=(',', ':')).encode('utf-8'), 6)
+
+
+def decode_snapshot(data: bytes) -> dict:
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+
+def sha256_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class Snapshot(object):
+
+    """The pods and the digests of the files rendered from them, saved to a file so a restart starts warm.
+    The pods loaded are warm until added, then their node is checked and the status fetched only if it changed.
+    The lock is the owner's, guarding its pods too, every method but load() and save() is called with it held."""
+
+    def __init__(self, path: str, lock: threading.Condition, **kwargs) -> None:
+        super().__init__()
+
+        # The watched path, a snapshot of another is ignored.
+        self.__path = path
+
+        self.__lock = lock
+
+        self.__file: str = kwargs.get(CONSUME_SNAPSHOT)
+
+        self.__interval: float = kwargs.get(CONSUME_SNAPSHOT_INTERVAL, CONSUME_SNAPSHOT_INTERVAL_DEFAULT)
+
+        # Child to the (mzxid, version, digest) of the status fetched.
+        self.__stats: typing.Dict[str, typing.Tuple[int, int, str]] = dict()
+
+        # Child to its status from the snapshot, until the child is added.
+        self.__warm: typing.Dict[str, Warm] = dict()
+
+        # When the snapshot was last saved, or loaded.
+        self.__saved: float = time.monotonic()
+
+        self.__saves = 0
+
+        self.__hits = 0
+
+    def enabled(self) -> bool:
+        return self.__file is not None
+
+    def saves(self) -> int:
+        return self.__saves
+
+    def hits(self) -> int:
+        """The number of pods whose status came from the snapshot rather than being fetched."""
+        return self.__hits
+
+    def hit(self):
+        self.__hits += 1
+
+    def take(self, child: str) -> Warm:
+        """The child's status from the snapshot, None if it has none. Taken once, when the child is added."""
+        return self.__warm.pop(child, None)
+
+    def discard(self, child: str):
+        """The child's status changed, so its status from the snapshot is of no use."""
+        self.__warm.pop(child, None)
+
+    def fetched(self, child: str, mzxid: int, version: int, digest: str):
+        self.__stats[child] = (mzxid, version, digest)
+
+    def remove(self, child: str):
+        self.__stats.pop(child, None)
+
+    def clear(self):
+        self.__stats.clear()
+
+    def due(self, written: int) -> bool:
+        """Whether to save after a render which wrote this many files."""
+        return self.enabled() and (written > 0 or time.monotonic() - self.__saved >= self.__interval)
+
+    def load(self, directory: str) -> koolie.nginx.render.Files:
+        """Load the pods from the snapshot, each is checked against its node when first rendered.
+        Returns the files if those on disk are those rendered when the snapshot was saved, else None."""
+        if self.__file is None:
+            return None
+        try:
+            with open(self.__file, 'rb') as file:
+                snapshot = decode_snapshot(file.read())
+        except FileNotFoundError:
+            return None
+        except Exception as exception:
+            _logger.warning('Failed to load snapshot [{}] exception [{}]'.format(self.__file, exception))
+            return None
+        if snapshot.get('format') != SNAPSHOT_FORMAT or snapshot.get('path') != self.__path:
+            _logger.warning('Ignoring snapshot [{}] for [{}]'.format(self.__file, snapshot.get('path')))
+            return None
+        with self.__lock:
+            self.__warm = {child: Warm(pod['zxid'], pod['version'], pod['digest'], pod['items']) for child, pod in snapshot['pods'].items()}
+        files = dict()
+        intact = True
+        for name, file_digest in snapshot['files'].items():
+            try:
+                with open(os.path.join(directory, name), 'r') as file:
+                    content = file.read()
+            except OSError:
+                intact = False
+                break
+            if sha256_digest(content.encode('utf-8')) != file_digest:
+                intact = False
+                break
+            files[name] = content
+        _logger.info('Loaded snapshot [{}] pods [{}] files [{}]'.format(self.__file, len(self.__warm), len(files)))
+        return files if intact else None
+
+    def save(self, pods: typing.Dict[str, list], files: koolie.nginx.render.Files, synced: bool):
+        """Save the fetched statuses of the pods and the digests of the files rendered from them, replacing the snapshot.
+        Once synced, all the children have been added and the warm pods not added are gone, until then they are kept."""
+        if self.__file is None:
+            return
+        self.__saved = time.monotonic()
+        with self.__lock:
+            saved = {
+                child: {'zxid': stat[0], 'version': stat[1], 'digest': stat[2], 'items': pods[child]}
+                for child, stat in self.__stats.items()
+                if child in pods
+            }
+            if synced:
+                self.__warm.clear()
+            for child, warm in self.__warm.items():
+                saved.setdefault(child, {'zxid': warm.zxid, 'version': warm.version, 'digest': warm.digest, 'items': warm.items})
+        snapshot = {
+            'format': SNAPSHOT_FORMAT,
+            'path': self.__path,
+            'pods': saved,
+            'files': {name: sha256_digest(content.encode('utf-8')) for name, content in files.items()}
+        }
+        try:
+            koolie.tools.common.ensure_directory(os.path.dirname(self.__file) or '.')
+            with open(self.__file + '.tmp', 'wb') as file:
+                file.write(encode_snapshot(snapshot))
+            os.replace(self.__file + '.tmp', self.__file)
+            self.__saves += 1
+        except Exception as exception:
+            _logger.warning('Failed to save snapshot [{}] exception [{}]'.format(self.__file, exception))
+
+    def __str__(self) -> str:
+        return 'Snapshot [{}] Warm [{}] Hits [{}] Saves [{}]'.format(self.__file, len(self.__warm), self.__hits, self.__saves)
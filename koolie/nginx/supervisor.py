@@ -0,0 +1,205 @@
+import collections
+import logging
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import time
+import typing
+
+import koolie.tools.abstract_service
+import koolie.tools.common
+
+_logger = logging.getLogger(__name__)
+
+# Start and supervise the NGINX master instead of using an external NGINX, default is False.
+NGINX_SUPERVISE: str = 'nginx_supervise'
+
+# The command starting the NGINX master in the foreground, a string or a list.
+NGINX_SUPERVISOR_COMMAND: str = 'nginx_supervisor_command'
+NGINX_SUPERVISOR_COMMAND_DEFAULT: str = "nginx -g 'daemon off;'"
+
+# The seconds a reload waits for the new workers to start.
+NGINX_SUPERVISOR_READY_TIMEOUT: str = 'nginx_supervisor_ready_timeout'
+NGINX_SUPERVISOR_READY_TIMEOUT_DEFAULT: float = 30.0
+
+# The seconds a stop waits for the master to quit gracefully before killing it.
+NGINX_SUPERVISOR_STOP_TIMEOUT: str = 'nginx_supervisor_stop_timeout'
+NGINX_SUPERVISOR_STOP_TIMEOUT_DEFAULT: float = 10.0
+
+# The seconds between checks of the master and of its workers.
+POLL_INTERVAL: float = 0.05
+
+# The seconds to wait before restarting a master which exited, doubled on each restart up to the maximum.
+RESTART_BACKOFF: float = 1.0
+RESTART_BACKOFF_MAX: float = 30.0
+
+# The number of latencies kept for the percentiles.
+READY_LATENCIES: int = 1024
+
+
+def child_pids(pid: int, proc: str = '/proc') -> typing.Set[int]:
+    """The pids of the children of the process, from the parent pid in /proc/<pid>/stat."""
+    children = set()
+    try:
+        pids = [p for p in os.listdir(proc) if p.isdigit()]
+    except OSError:
+        return children
+    for p in pids:
+        try:
+            with open(os.path.join(proc, p, 'stat'), 'r') as file:
+                stat = file.read()
+        except OSError:
+            continue
+        # The command may contain spaces and parentheses, the fields after it are state then parent pid.
+        fields = stat[stat.rfind(')') + 2:].split()
+        if len(fields) > 1 and fields[1] == str(pid):
+            children.add(int(p))
+    return children
+
+
+class NGINXSupervisor(koolie.tools.abstract_service.AbstractService):
+
+    """Run the NGINX master as a child process, restarting it if it exits.
+    reload() sends SIGHUP to the master and waits until the new generation of workers has started, so a reload completes only
+    when NGINX has accepted the new config, without forking 'nginx -s reload'. The old workers drain their connections meanwhile,
+    which can take as long as any connection is kept alive, the ReloadController waits for them before the next reload.
+    The supervisor handles no signals itself, the service owning it decides what a signal does to NGINX."""
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+
+        # The owning service handles the signals, left to AbstractService a SIGHUP would restart the supervisor and so NGINX.
+        self.signal_handlers = dict()
+
+        command = self.get_kv(NGINX_SUPERVISOR_COMMAND, NGINX_SUPERVISOR_COMMAND_DEFAULT)
+        self.__command: typing.List[str] = shlex.split(command) if isinstance(command, str) else list(command)
+
+        self.__ready_timeout: float = self.get_kv(NGINX_SUPERVISOR_READY_TIMEOUT, NGINX_SUPERVISOR_READY_TIMEOUT_DEFAULT)
+
+        self.__stop_timeout: float = self.get_kv(NGINX_SUPERVISOR_STOP_TIMEOUT, NGINX_SUPERVISOR_STOP_TIMEOUT_DEFAULT)
+
+        self.__process: subprocess.Popen = None
+
+        # When the master was last started.
+        self.__spawned: float = None
+
+        self.__reloads = 0
+        self.__failures = 0
+        self.__restarts = 0
+
+        # The seconds from each SIGHUP to the new workers having started.
+        self.__ready_latencies: typing.Deque[float] = collections.deque(maxlen=READY_LATENCIES)
+
+    def pid(self) -> int:
+        """The pid of the master, None if it is not running."""
+        process = self.__process
+        if process is None or process.poll() is not None:
+            return None
+        return process.pid
+
+    def workers(self) -> typing.Set[int]:
+        """The pids of the master's children, the workers and the cache processes."""
+        pid = self.pid()
+        return set() if pid is None else child_pids(pid)
+
+    def reloads(self) -> int:
+        return self.__reloads
+
+    def failures(self) -> int:
+        return self.__failures
+
+    def restarts(self) -> int:
+        return self.__restarts
+
+    def ready_latencies(self) -> typing.List[float]:
+        return list(self.__ready_latencies)
+
+    def before_start(self):
+        self.spawn()
+        super().before_start()
+
+    def before_stop(self):
+        process = self.__process
+        self.__process = None
+        if process is not None and process.poll() is None:
+            # SIGQUIT is the NGINX graceful shutdown.
+            process.send_signal(signal.SIGQUIT)
+            try:
+                process.wait(self.__stop_timeout)
+            except subprocess.TimeoutExpired:
+                _logger.warning('NGINX master [{}] did not quit, killing'.format(process.pid))
+                process.kill()
+                process.wait()
+        super().before_stop()
+
+    def spawn(self):
+        _logger.info('Starting NGINX master [{}]'.format(self.__command))
+        self.__process = subprocess.Popen(self.__command)
+        self.__spawned = time.monotonic()
+
+    def go(self):
+        """Restart the master if it exits, backing off while it keeps exiting."""
+        backoff = RESTART_BACKOFF
+        while self.state() is koolie.tools.abstract_service.ServiceState.STARTED and self.pending_state() is not koolie.tools.abstract_service.ServiceState.STOPPED:
+            process = self.__process
+            if process is None or process.poll() is None:
+                if process is not None and time.monotonic() - self.__spawned > RESTART_BACKOFF_MAX:
+                    backoff = RESTART_BACKOFF
+                time.sleep(POLL_INTERVAL)
+                continue
+            _logger.warning('NGINX master [{}] exited [{}], restarting in [{}]s'.format(process.pid, process.returncode, backoff))
+            until = time.monotonic() + backoff
+            while time.monotonic() < until and self.pending_state() is not koolie.tools.abstract_service.ServiceState.STOPPED:
+                time.sleep(POLL_INTERVAL)
+            if self.pending_state() is koolie.tools.abstract_service.ServiceState.STOPPED:
+                break
+            try:
+                self.spawn()
+                self.__restarts += 1
+            except Exception as exception:
+                koolie.tools.common.log_exception(exception, logger=_logger)
+            backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+
+    def reload(self) -> bool:
+        """Send SIGHUP to the master then wait for the new workers to start, not for the old ones to drain.
+        Returns False if the master is not running or is not ready within the timeout, eg the new config is invalid."""
+        pid = self.pid()
+        if pid is None:
+            _logger.warning('Not reloading, NGINX master is not running')
+            self.__failures += 1
+            return False
+        old = child_pids(pid)
+        started = time.monotonic()
+        os.kill(pid, signal.SIGHUP)
+        self.__reloads += 1
+        while time.monotonic() - started < self.__ready_timeout:
+            if child_pids(pid).difference(old):
+                latency = time.monotonic() - started
+                self.__ready_latencies.append(latency)
+                _logger.info('NGINX master [{}] ready after reload in [{:.3f}]s'.format(pid, latency))
+                return True
+            if self.pid() != pid:
+                break
+            time.sleep(POLL_INTERVAL)
+        _logger.warning('NGINX master [{}] not ready after reload, workers [{}] old [{}]'.format(pid, sorted(child_pids(pid)), sorted(old)))
+        self.__failures += 1
+        return False
+
+    def __str__(self) -> str:
+        return '{}\nNGINX master [{}] Workers [{}] Reloads [{}] Failures [{}] Restarts [{}] Ready p99 [{}]'.format(
+            super().__str__(), self.pid(), len(self.workers()), self.__reloads, self.__failures, self.__restarts,
+            koolie.tools.common.percentile(self.ready_latencies(), 99)
+        )
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    supervisor = NGINXSupervisor(nginx_supervisor_command=sys.argv[1:] or NGINX_SUPERVISOR_COMMAND_DEFAULT)
+    supervisor.start()
+    time.sleep(2)
+    supervisor.reload()
+    supervisor.stop()
+    _logger.info(supervisor)
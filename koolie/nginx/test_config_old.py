@@ -0,0 +1,91 @@
+import os
+import tempfile
+import typing
+import unittest
+
+import koolie.nginx.config_old
+from koolie.nginx.config_old import CONFIG_KEY, NAME_KEY, TYPE_KEY
+
+
+def server(name: str, config: str) -> koolie.nginx.config_old.Server:
+    return koolie.nginx.config_old.Server(**{TYPE_KEY: koolie.nginx.config_old.NGINX_SERVER_TYPE, NAME_KEY: name, CONFIG_KEY: config})
+
+
+def dump_config(bases: list, prefixes: list, suffixes: list, tokens: typing.Dict[str, str]) -> str:
+    """The dump as it was built before it was streamed, a string per file."""
+    prefix = '' if prefixes is None else dump_config(prefixes, None, None, tokens)
+    config = '\n'.join('# FQN [{}]\n{}'.format(base.fqn(), base.config(tokens, True)) for base in bases)
+    suffix = '' if suffixes is None else dump_config(suffixes, None, None, tokens)
+    return '{}\n{}\n{}'.format(prefix, config, suffix)
+
+
+def read(file: str) -> str:
+    with open(file) as f:
+        return f.read()
+
+
+class Unrenderable(koolie.nginx.config_old.Server):
+
+    def config(self, substitute: typing.Dict[str, str] = None, self_in_substitute: bool = True) -> str:
+        raise ValueError('unrenderable')
+
+
+class TestConfigOld(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tokens = {'config__nginx_directory': '/tmp/nginx/'}
+        self.servers = [
+            [server('alpha', 'listen 80;\nroot ${config__nginx_directory};\n'), server('alpha', 'listen 81;\n')],
+            [server('beta', 'listen 82;\n')],
+            [server('gamma', '')]
+        ]
+
+    def files(self, config: koolie.nginx.config_old.Config) -> typing.List[koolie.nginx.config_old.DumpFile]:
+        return [config.dump_server(servers, self.tokens) for servers in self.servers]
+
+    def expected(self, config: koolie.nginx.config_old.Config) -> typing.Dict[str, str]:
+        return {
+            file.name: '# koolie\n\n{}'.format(dump_config(file.bases, file.prefixes, file.suffixes, self.tokens))
+            for file in self.files(config)
+        }
+
+    def dumped(self, directory: str) -> typing.Dict[str, str]:
+        return {name: read(os.path.join(directory, name)) for name in os.listdir(directory)}
+
+    def test_chunks(self):
+        config = koolie.nginx.config_old.Config()
+        for file in self.files(config):
+            expected = dump_config(file.bases, file.prefixes, file.suffixes, self.tokens)
+            self.assertEqual(''.join(config.dump_config_chunks(file.bases, file.prefixes, file.suffixes, self.tokens)), expected)
+            self.assertEqual(config.dump_config(file.bases, file.prefixes, file.suffixes, self.tokens), expected)
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = koolie.nginx.config_old.Config(nginx_directory='{}/'.format(directory))
+            for file in self.files(config):
+                config.write(file.directory, file.name, config.dump_config_chunks(file.bases, file.prefixes, file.suffixes, self.tokens))
+            self.assertEqual(self.dumped('{}/servers/'.format(directory)), self.expected(config))
+
+    def test_dump_files(self):
+        for kwargs in [dict(), dict(dump_workers=3), dict(dump_workers=3, dump_executor=koolie.nginx.config_old.DUMP_EXECUTOR_PROCESS)]:
+            with self.subTest(**kwargs), tempfile.TemporaryDirectory() as directory:
+                config = koolie.nginx.config_old.Config(nginx_directory='{}/'.format(directory), **kwargs)
+                config.dump_files(self.files(config), self.tokens)
+                self.assertEqual(self.dumped('{}/servers/'.format(directory)), self.expected(config))
+
+    def test_dump_files_failed(self):
+        self.servers.append([Unrenderable(**{TYPE_KEY: koolie.nginx.config_old.NGINX_SERVER_TYPE, NAME_KEY: 'delta'})])
+        for kwargs in [dict(), dict(dump_workers=4)]:
+            with self.subTest(**kwargs), tempfile.TemporaryDirectory() as directory:
+                config = koolie.nginx.config_old.Config(nginx_directory='{}/'.format(directory), **kwargs)
+                with self.assertRaises(ValueError):
+                    config.dump_files(self.files(config), self.tokens)
+                # No file is left aside, in parallel none is replaced.
+                dumped = self.dumped('{}/servers/'.format(directory))
+                self.assertEqual([name for name in dumped if name.endswith('.tmp')], [])
+                if kwargs:
+                    self.assertEqual(dumped, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import time
+import unittest
+
+import koolie.kubernetes_api.fake_api
+import koolie.nginx.endpoint_slices
+import koolie.nginx.zookeeper
+from koolie.kubernetes_api.fake_api import ENDPOINT_SLICE_KIND, FakeDiscoveryV1Api, endpoint_slice
+from koolie.zookeeper_api.memory_zookeeper import MemoryEnsemble, UsingMemory
+from koolie.zookeeper_api.pod_churn import PodChurn
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    until = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def read(directory: str, name: str) -> str:
+    try:
+        with open(os.path.join(directory, name)) as file:
+            return file.read()
+    except OSError:
+        return None
+
+
+class TestEndpointSlices(unittest.TestCase):
+
+    def test_slice_items(self):
+        raw = endpoint_slice('churn-abc', 'churn', [('10.0.0.1', True), ('10.0.0.2', False), ('fd00::3', True)], namespace='dev', port=8080)
+        item = koolie.kubernetes_api.fake_api.deserialize(raw, 'V1EndpointSlice')
+        self.assertEqual(koolie.nginx.endpoint_slices.slice_key(item), 'endpointslices/dev/churn-abc')
+        items = koolie.nginx.endpoint_slices.slice_items(item)
+        self.assertEqual([i['tag'] for i in items], ['10.0.0.1:8080', '[fd00::3]:8080'])
+        self.assertEqual(items[0], {'type': 'nginx/upstream', 'name': 'churn', 'tag': '10.0.0.1:8080', 'loadPolicy': 'append', 'config': 'server 10.0.0.1:8080;\n'})
+        self.assertEqual(koolie.nginx.endpoint_slices.slice_items(item, '{namespace}-{service}')[0]['name'], 'dev-churn')
+        self.assertEqual(koolie.nginx.endpoint_slices.slice_items(item, port_name='grpc'), [])
+
+    def test_consume(self):
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1)
+        churn.join(2)
+        api = FakeDiscoveryV1Api(bookmark_interval=0.05)
+        cluster = api.cluster()
+        cluster.add(ENDPOINT_SLICE_KIND, endpoint_slice('churn-abc', 'churn', [('10.0.0.1', True), ('10.0.0.2', False)]))
+        with tempfile.TemporaryDirectory() as directory:
+            consume = koolie.nginx.zookeeper.Consume(
+                koolie_zookeeper_factory=UsingMemory,
+                memory_ensemble=ensemble,
+                nginx_directory=directory,
+                reload_function=lambda: True,
+                reload_min_interval=0.0,
+                consume_endpoint_slices=True,
+                kubernetes_discovery_api=api,
+                informer_timeout=1
+            )
+            consume.start()
+            try:
+                def servers() -> set:
+                    upstream = read(directory, 'upstreams/churn.conf') or ''
+                    return {line.strip()[len('server '):-1] for line in upstream.splitlines() if line.strip().startswith('server ')}
+
+                pods = {'{}:80'.format(pod) for pod in churn.pods()}
+
+                # The ready endpoints are rendered with the pods of the same upstream.
+                self.assertTrue(wait_for(lambda: servers() == pods | {'10.0.0.1:80'}))
+                self.assertIn('endpointslices/default/churn-abc', consume.pod_view())
+
+                cluster.patch(ENDPOINT_SLICE_KIND, 'churn-abc', 'default', {'endpoints': [
+                    {'addresses': ['10.0.0.1'], 'conditions': {'ready': False}},
+                    {'addresses': ['10.0.0.2'], 'conditions': {'ready': True}}
+                ]})
+                self.assertTrue(wait_for(lambda: servers() == pods | {'10.0.0.2:80'}))
+
+                cluster.delete(ENDPOINT_SLICE_KIND, 'churn-abc', 'default')
+                self.assertTrue(wait_for(lambda: servers() == pods))
+                self.assertNotIn('endpointslices/default/churn-abc', consume.pod_view())
+            finally:
+                consume.stop()
+
+    def test_without_zookeeper_pods(self):
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1)
+        churn.join(2)
+        api = FakeDiscoveryV1Api(bookmark_interval=0.05)
+        api.cluster().add(ENDPOINT_SLICE_KIND, endpoint_slice('web-abc', 'web', [('10.0.0.1', True)]))
+        with tempfile.TemporaryDirectory() as directory:
+            consume = koolie.nginx.zookeeper.Consume(
+                koolie_zookeeper_factory=UsingMemory,
+                memory_ensemble=ensemble,
+                nginx_directory=directory,
+                reload_function=lambda: True,
+                reload_min_interval=0.0,
+                consume_endpoint_slices=True,
+                consume_zookeeper_pods=False,
+                kubernetes_discovery_api=api,
+                informer_timeout=1
+            )
+            consume.start()
+            try:
+                self.assertTrue(wait_for(lambda: 'server 10.0.0.1:80;' in (read(directory, 'upstreams/web.conf') or '')))
+                self.assertIsNone(read(directory, 'upstreams/churn.conf'))
+                self.assertEqual(list(consume.pod_view().keys()), ['endpointslices/default/web-abc'])
+            finally:
+                consume.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import threading
+import time
+import unittest
+
+import koolie.pod_api.pod_status
+from koolie.nginx.heartbeats import Heartbeats, pod_heartbeat
+from koolie.zookeeper_api.memory_zookeeper import MemoryEnsemble, UsingMemory
+
+
+def status(heartbeat: float) -> list:
+    return [{'type': koolie.pod_api.pod_status.STATUS_TYPE, koolie.pod_api.pod_status.STATUS_HEARTBEAT_KEY: heartbeat}]
+
+
+class TestHeartbeats(unittest.TestCase):
+
+    def test_pod_heartbeat(self):
+        self.assertEqual(pod_heartbeat(status(5)), 5.0)
+        self.assertIsNone(pod_heartbeat(status(0)))
+        self.assertIsNone(pod_heartbeat([{'type': 'nginx/upstream'}]))
+        self.assertIsNone(pod_heartbeat(None))
+
+    def test_expire(self):
+        ensemble = MemoryEnsemble()
+        ensemble.create(0, '/koolie/pods/foo', make_path=True)
+        ensemble.create(0, '/koolie/pods/bar')
+        lock = threading.Condition(threading.RLock())
+        touched = list()
+        with UsingMemory(memory_ensemble=ensemble) as koolie_zookeeper:
+            for tree in [False, True]:
+                with self.subTest(tree=tree):
+                    heartbeats = Heartbeats(
+                        koolie_zookeeper, '/koolie/pods', lock, lambda child, modified: touched.append(child),
+                        consume_heartbeat_misses=2, consume_heartbeat_tick=0.01, consume_heartbeat_jitter=0.0
+                    )
+                    with lock:
+                        heartbeats.track('foo', status(0.05), ensemble.exists('/koolie/pods/foo').mzxid)
+                        heartbeats.track('bar', status(0.05), ensemble.exists('/koolie/pods/bar').mzxid)
+                    touched.clear()
+                    until = time.monotonic() + 0.15
+                    while time.monotonic() < until:
+                        ensemble.set('/koolie/pods/bar', b'beat')
+                        if tree:
+                            with lock:
+                                heartbeats.modified('bar')
+                        heartbeats.expire(tree, lambda: False)
+                        time.sleep(0.01)
+                    self.assertEqual(heartbeats.stale(), {'foo'})
+                    self.assertEqual(heartbeats.evictions(), 1)
+                    if tree:
+                        # The events are the heartbeats, only the evicted pod is read.
+                        self.assertEqual(touched, [])
+                        self.assertLessEqual(heartbeats.reads(), 2)
+                    else:
+                        self.assertIn('bar', touched)
+                    # Restored once its status is modified again.
+                    ensemble.set('/koolie/pods/foo', b'beat')
+                    time.sleep(0.06)
+                    self.assertTrue(heartbeats.expire(tree, lambda: False))
+                    self.assertEqual(heartbeats.stale(), set())
+                    with lock:
+                        heartbeats.remove('foo')
+                        heartbeats.remove('bar')
+                    time.sleep(0.06)
+                    self.assertFalse(heartbeats.expire(tree, lambda: False))
+
+    def test_disabled(self):
+        heartbeats = Heartbeats(None, '/koolie/pods', threading.Condition(), lambda child, modified: None)
+        heartbeats.track('foo', status(0.05), 1)
+        self.assertFalse(heartbeats.enabled())
+        self.assertFalse(heartbeats.expire(False, lambda: False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import http.client
+import json
+import os
+import socket
+import tempfile
+import time
+import unittest
+
+import koolie.nginx.zookeeper
+from koolie.zookeeper_api.memory_zookeeper import MemoryEnsemble, UsingMemory
+from koolie.zookeeper_api.pod_churn import PodChurn
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    until = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path: str) -> None:
+        super().__init__('localhost')
+        self.__path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.__path)
+
+
+def get(connection: http.client.HTTPConnection, path: str, etag: str = None):
+    connection.request('GET', path, headers={} if etag is None else {'If-None-Match': etag})
+    response = connection.getresponse()
+    body = response.read()
+    return response.status, response.getheader('ETag'), json.loads(body.decode('utf-8')) if body else None
+
+
+class TestReadAPI(unittest.TestCase):
+
+    def consume(self, ensemble: MemoryEnsemble, directory: str, address: str) -> koolie.nginx.zookeeper.Consume:
+        return koolie.nginx.zookeeper.Consume(
+            koolie_zookeeper_factory=UsingMemory,
+            memory_ensemble=ensemble,
+            nginx_directory=directory,
+            nginx_reload_command='',
+            consume_read_api=address
+        )
+
+    def test_http(self):
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1)
+        churn.join(3)
+        with tempfile.TemporaryDirectory() as directory:
+            consume = self.consume(ensemble, directory, '127.0.0.1:0')
+            consume.start()
+            try:
+                self.assertTrue(wait_for(lambda: consume.renders() >= 1 and consume.written_files() is not None))
+                host, port = consume.read_api().address()
+                connection = http.client.HTTPConnection(host, port, timeout=5)
+
+                status, etag, pods = get(connection, '/pods')
+                self.assertEqual((status, pods['pods'], pods['stale']), (200, sorted(churn.pods()), []))
+
+                # Unchanged, so not modified and served without building again.
+                builds = consume.read_api().builds()
+                self.assertEqual(get(connection, '/pods', etag), (304, etag, None))
+                self.assertEqual(get(connection, '/pods')[2], pods)
+                self.assertEqual(consume.read_api().builds(), builds)
+
+                pod = churn.pods()[0]
+                status, _, status_items = get(connection, '/pods/{}'.format(pod))
+                self.assertEqual((status, status_items['items'][0]['hostname']), (200, pod))
+                self.assertEqual(get(connection, '/pods/missing')[0], 404)
+
+                status, _, files = get(connection, '/files')
+                self.assertEqual(status, 200)
+                self.assertIn('upstreams/churn.conf', files['files'])
+                status, _, file = get(connection, '/files/upstreams/churn.conf')
+                self.assertEqual(file['digest'], files['files']['upstreams/churn.conf'])
+                self.assertIn('server {}:80;'.format(pod), file['content'])
+
+                self.assertEqual(get(connection, '/fleet?type=nginx/upstream&tag={}'.format(pod))[2]['pods'], [pod])
+                self.assertEqual(sum(get(connection, '/fleet?hostnames=1')[2]['hostnames'].values()), 3)
+
+                # The answer depends on the time, so it is built every time and has no ETag.
+                builds = consume.read_api().builds()
+                status, timed_etag, timed = get(connection, '/fleet?older_than=3600')
+                self.assertEqual((status, timed_etag, timed['pods']), (200, None, []))
+                self.assertEqual(get(connection, '/fleet?older_than=0')[2]['pods'], sorted(churn.pods()))
+                get(connection, '/fleet?older_than=3600')
+                self.assertEqual(consume.read_api().builds(), builds + 3)
+
+                # A pod joining changes the generation, so the ETag.
+                churn.join(1)
+                self.assertTrue(wait_for(lambda: get(connection, '/pods')[2]['pods'] == sorted(churn.pods())))
+                status, new_etag, _ = get(connection, '/pods', etag)
+                self.assertEqual(status, 200)
+                self.assertNotEqual(new_etag, etag)
+                self.assertEqual(get(connection, '/unknown')[0], 404)
+                connection.close()
+            finally:
+                consume.stop()
+            self.assertIsNone(consume.read_api().address())
+
+    def test_unix(self):
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1)
+        churn.join(2)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'consume.sock')
+            consume = self.consume(ensemble, os.path.join(directory, 'nginx'), 'unix:{}'.format(path))
+            consume.start()
+            try:
+                self.assertTrue(wait_for(lambda: consume.renders() >= 1))
+                connection = UnixHTTPConnection(path)
+                self.assertTrue(wait_for(lambda: get(connection, '/pods')[2]['pods'] == sorted(churn.pods())))
+                connection.close()
+            finally:
+                consume.stop()
+            self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import threading
+import time
+import unittest
+
+import koolie.nginx.reload
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    until = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestReloadController(unittest.TestCase):
+
+    def test_min_interval(self):
+        started = list()
+        release = threading.Event()
+
+        def reload():
+            started.append(time.monotonic())
+            release.wait(5)
+            return True
+
+        controller = koolie.nginx.reload.ReloadController(reload_function=reload, reload_min_interval=0.3, reload_max_staleness=5.0, reload_drain_wait=False)
+        controller.start()
+        try:
+            controller.request()
+            self.assertTrue(wait_for(controller.in_flight))
+            # Requests made while the reload is in flight are coalesced into one more reload.
+            for i in range(10):
+                controller.request()
+            release.set()
+            self.assertTrue(wait_for(lambda: controller.reloads() == 2 and not controller.pending()))
+            self.assertEqual((controller.requests(), controller.coalesced()), (11, 9))
+            self.assertGreaterEqual(started[1] - started[0], 0.3)
+            self.assertEqual(len(controller.durations()), 2)
+            self.assertTrue(controller.last_succeeded())
+        finally:
+            controller.stop()
+
+    def test_max_staleness(self):
+        controller = koolie.nginx.reload.ReloadController(reload_function=lambda: False, reload_min_interval=10.0, reload_max_staleness=0.2, reload_drain_wait=False)
+        controller.start()
+        try:
+            controller.request()
+            self.assertTrue(wait_for(lambda: controller.reloads() == 1))
+            controller.request()
+            # The staleness overrides the min interval.
+            self.assertTrue(wait_for(lambda: controller.reloads() == 2, 2.0))
+            self.assertEqual((controller.forced(), controller.failures()), (1, 2))
+            self.assertFalse(controller.last_succeeded())
+        finally:
+            controller.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import koolie.nginx.snapshot
+from koolie.nginx.snapshot import Snapshot
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            kwargs = dict(consume_snapshot=os.path.join(directory, 'snapshot'))
+            lock = threading.Condition(threading.RLock())
+            with open(os.path.join(directory, 'a.conf'), 'w') as file:
+                file.write('a')
+            saved = Snapshot('/koolie/pods', lock, **kwargs)
+            self.assertTrue(saved.due(1))
+            saved.fetched('foo', 10, 1, 'digest-foo')
+            saved.fetched('bar', 11, 1, 'digest-bar')
+            # Only the fetched pods are saved.
+            saved.save({'foo': [{'type': 'foo'}]}, {'a.conf': 'a'}, True)
+            self.assertEqual(saved.saves(), 1)
+            self.assertFalse(saved.due(0))
+
+            loaded = Snapshot('/koolie/pods', lock, **kwargs)
+            self.assertEqual(loaded.load(directory), {'a.conf': 'a'})
+            warm = loaded.take('foo')
+            self.assertEqual((warm.zxid, warm.version, warm.digest, warm.items), (10, 1, 'digest-foo', [{'type': 'foo'}]))
+            self.assertIsNone(loaded.take('foo'))
+            self.assertIsNone(loaded.take('bar'))
+
+            # The files on disk are not those saved, so they are not taken as written.
+            with open(os.path.join(directory, 'a.conf'), 'w') as file:
+                file.write('b')
+            self.assertIsNone(Snapshot('/koolie/pods', lock, **kwargs).load(directory))
+            # A snapshot of another path is ignored.
+            other = Snapshot('/other', lock, **kwargs)
+            self.assertIsNone(other.load(directory))
+            self.assertIsNone(other.take('foo'))
+
+    def test_warm_until_synced(self):
+        with tempfile.TemporaryDirectory() as directory:
+            kwargs = dict(consume_snapshot=os.path.join(directory, 'snapshot'))
+            lock = threading.Condition(threading.RLock())
+            saved = Snapshot('/koolie/pods', lock, **kwargs)
+            saved.fetched('foo', 10, 1, 'digest-foo')
+            saved.fetched('bar', 11, 1, 'digest-bar')
+            saved.save({'foo': [], 'bar': []}, dict(), True)
+
+            restarted = Snapshot('/koolie/pods', lock, **kwargs)
+            restarted.load(directory)
+            restarted.take('foo')
+            restarted.fetched('foo', 12, 2, 'digest-foo')
+            # Not synced, bar may yet be added so it is kept.
+            restarted.save({'foo': []}, dict(), False)
+            with open(kwargs['consume_snapshot'], 'rb') as file:
+                self.assertEqual(sorted(koolie.nginx.snapshot.decode_snapshot(file.read())['pods'].keys()), ['bar', 'foo'])
+            restarted.save({'foo': []}, dict(), True)
+            with open(kwargs['consume_snapshot'], 'rb') as file:
+                self.assertEqual(sorted(koolie.nginx.snapshot.decode_snapshot(file.read())['pods'].keys()), ['foo'])
+
+    def test_disabled(self):
+        snapshot = Snapshot('/koolie/pods', threading.Condition())
+        self.assertFalse(snapshot.enabled())
+        self.assertFalse(snapshot.due(1))
+        self.assertIsNone(snapshot.load('.'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+import koolie.nginx.supervisor
+
+# Stands in for the NGINX master, on SIGHUP it starts new workers then stops the old ones after draining for a second.
+MASTER = '''
+import signal
+import subprocess
+import sys
+import time
+
+def spawn():
+    # The workers exit with the master.
+    worker = 'import os, time\\nppid = os.getppid()\\nwhile os.getppid() == ppid:\\n    time.sleep(0.05)\\n'
+    return [subprocess.Popen([sys.executable, '-c', worker]) for i in range(2)]
+
+hup = list()
+quit = list()
+signal.signal(signal.SIGHUP, lambda signum, frame: hup.append(signum))
+signal.signal(signal.SIGQUIT, lambda signum, frame: quit.append(signum))
+workers = spawn()
+draining = list()
+while not quit:
+    if hup:
+        hup.clear()
+        draining, workers = workers, spawn()
+        drained = time.monotonic() + 1.0
+    if draining and time.monotonic() > drained:
+        for worker in draining:
+            worker.terminate()
+            worker.wait()
+        draining = list()
+    time.sleep(0.01)
+for worker in workers + draining:
+    worker.terminate()
+    worker.wait()
+'''
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    until = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@unittest.skipUnless(os.path.isdir('/proc'), 'Needs /proc')
+class TestNGINXSupervisor(unittest.TestCase):
+
+    def test_signals(self):
+        # The supervisor is owned by the consumer, a signal to the process must not restart NGINX behind its back.
+        supervisor = koolie.nginx.supervisor.NGINXSupervisor()
+        self.assertEqual(supervisor.signal_handlers, dict())
+
+    def test_reload(self):
+        with tempfile.TemporaryDirectory() as directory:
+            master = os.path.join(directory, 'master.py')
+            with open(master, 'w') as file:
+                file.write(MASTER)
+            supervisor = koolie.nginx.supervisor.NGINXSupervisor(nginx_supervisor_command=[sys.executable, master], nginx_supervisor_ready_timeout=5.0)
+            supervisor.start()
+            try:
+                self.assertTrue(wait_for(lambda: len(supervisor.workers()) == 2))
+                old = supervisor.workers()
+                self.assertTrue(supervisor.reload())
+                # Ready once the new generation has started, while the old one is still draining.
+                self.assertTrue(old.issubset(supervisor.workers()))
+                self.assertLess(supervisor.ready_latencies()[0], 1.0)
+                self.assertTrue(wait_for(lambda: len(supervisor.workers()) == 2 and supervisor.workers().isdisjoint(old)))
+
+                # A master which exits is restarted.
+                pid = supervisor.pid()
+                os.kill(pid, 9)
+                self.assertTrue(wait_for(lambda: supervisor.pid() not in {None, pid}))
+                self.assertEqual(supervisor.restarts(), 1)
+            finally:
+                supervisor.stop()
+            self.assertIsNone(supervisor.pid())
+
+
+if __name__ == '__main__':
+    unittest.main()
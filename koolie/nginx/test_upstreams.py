@@ -0,0 +1,39 @@
+import unittest
+
+import koolie.nginx.upstreams
+
+
+def upstream(*lines) -> str:
+    return 'upstream ydos {{\n{}}}\n'.format(''.join('    {}\n'.format(line) for line in lines))
+
+
+class TestUpstreams(unittest.TestCase):
+
+    def test_membership_changes(self):
+        old = {
+            'upstreams/ydos.conf': upstream('# Source [nginx/upstream/ydos/pod-1]', 'sticky;', 'server pod-1:80;'),
+            'servers/default.conf': 'server {\n}\n'
+        }
+        joined = dict(old)
+        joined['upstreams/ydos.conf'] = upstream('# Source [nginx/upstream/ydos/pod-2]', 'sticky;', 'server pod-1:80;', 'server pod-2:80 max_fails=3;')
+        self.assertEqual(koolie.nginx.upstreams.membership_changes(old, joined), {'ydos': ['pod-1:80', 'pod-2:80 max_fails=3']})
+        self.assertEqual(koolie.nginx.upstreams.membership_changes(old, old), {})
+
+        # Other changes need a reload.
+        changed = dict(old)
+        changed['upstreams/ydos.conf'] = upstream('server pod-1:80;')
+        self.assertIsNone(koolie.nginx.upstreams.membership_changes(old, changed))
+        added = dict(old)
+        added['upstreams/other.conf'] = upstream('server pod-1:80;')
+        self.assertIsNone(koolie.nginx.upstreams.membership_changes(old, added))
+        server = dict(old)
+        server['servers/default.conf'] = 'server {\n    listen 80;\n}\n'
+        self.assertIsNone(koolie.nginx.upstreams.membership_changes(old, server))
+        # An upstream without servers is invalid, so NGINX must not be left thinking it has one.
+        emptied = dict(old)
+        emptied['upstreams/ydos.conf'] = upstream('sticky;')
+        self.assertIsNone(koolie.nginx.upstreams.membership_changes(old, emptied))
+
+
+if __name__ == '__main__':
+    unittest.main()
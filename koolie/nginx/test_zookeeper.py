@@ -0,0 +1,449 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import koolie.nginx.bundle
+import koolie.nginx.render
+import koolie.nginx.snapshot
+import koolie.nginx.upstreams
+import koolie.nginx.zookeeper
+import koolie.pod_api.pod_status
+import koolie.zookeeper_api.koolie_node_watch
+import koolie.zookeeper_api.koolie_zookeeper
+import koolie.zookeeper_api.pod_churn
+from koolie.zookeeper_api.memory_zookeeper import MemoryEnsemble, UsingMemory
+from koolie.zookeeper_api.pod_churn import PodChurn
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    until = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def read(directory: str, name: str) -> str:
+    try:
+        with open(os.path.join(directory, name)) as file:
+            return file.read()
+    except OSError:
+        return None
+
+
+class TestConsume(unittest.TestCase):
+
+    def test_render(self):
+        nginx_config = koolie.nginx.render.NGINXConfig()
+        nginx_config.load_start()
+        for tag in ['pod-2', 'pod-1']:
+            nginx_config.load([
+                {'type': 'nginx/upstream', 'name': 'ydos', 'tag': tag, 'loadPolicy': 'append', 'config': 'server {};'.format(tag)},
+                {'type': 'nginx/upstream', 'name': 'ydos', 'tag': tag, 'loadPolicy': 'unique', 'config': 'sticky;'},
+                {'type': 'nginx/location', 'name': 'status', 'server': 'default', 'tag': tag, 'loadPolicy': 'unique', 'matchModifier': '=', 'locationMatch': '/status/', 'config': 'return 200;'},
+                {'type': 'nginx/upstream', 'name': '../escape', 'config': 'server x;'}
+            ])
+        nginx_config.load_stop()
+        self.assertEqual(nginx_config.loaded_count(), 4)
+        files = nginx_config.files()
+        self.assertEqual(sorted(files.keys()), ['servers/default/status.conf', 'upstreams/ydos.conf'])
+        self.assertEqual(
+            files['upstreams/ydos.conf'],
+            'upstream ydos {\n'
+            '    # Source [nginx/upstream/ydos/pod-2]\n'
+            '    sticky;\n'
+            '    # Source [nginx/upstream/ydos/pod-2]\n'
+            '    server pod-2;\n'
+            '    # Source [nginx/upstream/ydos/pod-1]\n'
+            '    server pod-1;\n'
+            '}\n'
+        )
+        self.assertTrue(files['servers/default/status.conf'].startswith('location = /status/ {\n'))
+
+    def test_write_empty(self):
+        with tempfile.TemporaryDirectory() as directory:
+            nginx_config = koolie.nginx.render.NGINXConfig(nginx_directory=directory)
+            self.assertEqual(nginx_config.write_files({'upstreams/ydos.conf': 'upstream ydos {\n}\n'}), 1)
+            # An empty render removes nothing.
+            self.assertEqual(nginx_config.write_files({}), 0)
+            self.assertIsNotNone(read(directory, 'upstreams/ydos.conf'))
+            self.assertEqual(nginx_config.write_files({'upstreams/other.conf': 'upstream other {\n}\n'}), 2)
+            self.assertIsNone(read(directory, 'upstreams/ydos.conf'))
+
+    def test_election(self):
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1)
+        churn.join(5)
+        with tempfile.TemporaryDirectory() as directory:
+            consumes = list()
+            for i in range(3):
+                consumes.append(koolie.nginx.zookeeper.Consume(
+                    abstract_service_name='consume-{}'.format(i),
+                    koolie_zookeeper_factory=UsingMemory,
+                    memory_ensemble=ensemble,
+                    consume_election=True,
+                    nginx_directory=os.path.join(directory, str(i)),
+                    nginx_reload_command=''
+                ))
+            try:
+                for consume in consumes:
+                    consume.start()
+
+                def rendered(pods, running):
+                    return all(
+                        all('server {}:80;'.format(pod) in (read(consume.get_kv('nginx_directory'), 'upstreams/churn.conf') or '') for pod in pods)
+                        for consume in running
+                    )
+
+                self.assertTrue(wait_for(lambda: rendered(churn.pods(), consumes)))
+                leaders = [consume for consume in consumes if consume.leader()]
+                self.assertEqual(len(leaders), 1)
+                followers = [consume for consume in consumes if not consume.leader()]
+                # Only the leader reads the pods, the followers apply the bundle.
+                self.assertEqual(leaders[0].fetches(), 5)
+                self.assertEqual([follower.fetches() for follower in followers], [0, 0])
+                self.assertTrue(all(follower.applies() >= 1 for follower in followers))
+                self.assertEqual(len({consume.applied_digest() for consume in consumes}), 1)
+
+                churn.join(2)
+                self.assertTrue(wait_for(lambda: rendered(churn.pods(), consumes)))
+
+                # Another replica takes over when the leader stops.
+                leaders[0].stop()
+                self.assertTrue(wait_for(lambda: any(follower.leader() for follower in followers)))
+                churn.join(1)
+                self.assertTrue(wait_for(lambda: rendered(churn.pods(), followers)))
+            finally:
+                for consume in consumes:
+                    consume.stop()
+
+    def test_bundle_too_large(self):
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1)
+        churn.join(3)
+        with tempfile.TemporaryDirectory() as directory:
+            consume = koolie.nginx.zookeeper.Consume(
+                koolie_zookeeper_factory=UsingMemory,
+                memory_ensemble=ensemble,
+                consume_election=True,
+                nginx_directory=directory,
+                nginx_reload_command='',
+                nginx_bundle_max_bytes=16
+            )
+            consume.start()
+            try:
+                # The bundle is not published but the leader still writes its own files.
+                self.assertTrue(wait_for(lambda: all('server {}:80;'.format(pod) in (read(directory, 'upstreams/churn.conf') or '') for pod in churn.pods())))
+                self.assertIsNone(ensemble.exists('/koolie/nginx/generation'))
+                with self.assertRaises(koolie.nginx.bundle.BundleTooLarge):
+                    koolie.nginx.bundle.Bundles(consume.zoo_keeper(), nginx_bundle_max_bytes=16).publish({'upstreams/churn.conf': 'upstream churn {\n}\n'})
+            finally:
+                consume.stop()
+
+    def test_cancel(self):
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1)
+        with tempfile.TemporaryDirectory() as directory:
+            # Slow reads so the pods join while a render is loading.
+            consume = koolie.nginx.zookeeper.Consume(
+                koolie_zookeeper_factory=UsingMemory,
+                memory_ensemble=ensemble,
+                memory_latency=0.005,
+                nginx_directory=directory,
+                reload_function=lambda: True,
+                reload_min_interval=0.5
+            )
+            consume.start()
+            try:
+                for i in range(20):
+                    churn.join(10)
+                    time.sleep(0.02)
+
+                def rendered():
+                    upstream = read(directory, 'upstreams/churn.conf') or ''
+                    return all('server {}:80;'.format(pod) in upstream for pod in churn.pods())
+
+                self.assertTrue(wait_for(rendered, 20))
+                self.assertGreater(consume.cancelled_renders(), 0)
+                self.assertLess(consume.renders(), consume.render_requests())
+                # A cancelled render keeps what it fetched, so each pod is read once.
+                self.assertEqual(consume.fetches(), 200)
+                # The watch callbacks only put in the mailbox, the lag is how long the changes waited for the renders.
+                self.assertEqual(consume.mailbox().pending(), 0)
+                self.assertTrue(consume.mailbox().lags())
+                # Only renders which wrote files reload.
+                self.assertTrue(wait_for(lambda: consume.reload_controller().reloads() >= 1))
+                self.assertLessEqual(consume.reload_controller().reloads(), consume.renders())
+            finally:
+                consume.stop()
+
+    def test_sustained_churn(self):
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1)
+        churn.join(50)
+        with tempfile.TemporaryDirectory() as directory:
+            consume = koolie.nginx.zookeeper.Consume(
+                koolie_zookeeper_factory=UsingMemory,
+                memory_ensemble=ensemble,
+                memory_latency=0.005,
+                nginx_directory=directory,
+                reload_function=lambda: True,
+                reload_min_interval=0.0
+            )
+            consume.start()
+            try:
+                self.assertTrue(wait_for(lambda: consume.renders() >= 1, 10))
+                # A join and a leave every 10ms would cancel every render, each second still completes renders.
+                completed = list()
+                for second in range(4):
+                    renders = consume.renders()
+                    until = time.monotonic() + 1.0
+                    while time.monotonic() < until:
+                        churn.join(1)
+                        churn.leave(1)
+                        time.sleep(0.01)
+                    completed.append(consume.renders() - renders)
+                self.assertTrue(all(count >= 1 for count in completed), completed)
+                self.assertGreater(consume.cancelled_renders(), 0)
+                self.assertGreater(consume.forced_renders(), 0)
+            finally:
+                consume.stop()
+
+    def test_upstreams(self):
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1)
+        churn.join(3)
+        backend = koolie.nginx.upstreams.MemoryUpstreamBackend()
+        with tempfile.TemporaryDirectory() as directory:
+            consume = koolie.nginx.zookeeper.Consume(
+                koolie_zookeeper_factory=UsingMemory,
+                memory_ensemble=ensemble,
+                nginx_directory=directory,
+                nginx_upstreams_backend=backend,
+                reload_function=lambda: True,
+                reload_min_interval=0.0
+            )
+            consume.start()
+            try:
+                def rendered():
+                    upstream = read(directory, 'upstreams/churn.conf') or ''
+                    return all('server {}:80;'.format(pod) in upstream for pod in churn.pods())
+
+                self.assertTrue(wait_for(rendered))
+                self.assertTrue(wait_for(lambda: consume.reload_controller().reloads() == 1))
+
+                # Pods joining and leaving only change the servers, they are pushed without reloading.
+                churn.join(2)
+                churn.leave(1)
+                self.assertTrue(wait_for(lambda: sorted(backend.upstreams().get('churn', [])) == sorted('{}:80'.format(pod) for pod in churn.pods())))
+                self.assertTrue(wait_for(rendered))
+                self.assertGreaterEqual(consume.fast_updates(), 1)
+                self.assertEqual(consume.reload_controller().reloads(), 1)
+
+                # Anything else reloads.
+                churn.join_pod(koolie.zookeeper_api.koolie_zookeeper.pod_child('pod-status', churn.buckets()), koolie.pod_api.pod_status.encode_data([
+                    {'type': 'nginx/location', 'name': 'status', 'server': 'default', 'tag': 'pod-status', 'loadPolicy': 'unique', 'config': 'return 200;'}
+                ]))
+                self.assertTrue(wait_for(lambda: read(directory, 'servers/default/status.conf') is not None))
+                self.assertTrue(wait_for(lambda: consume.reload_controller().reloads() == 2))
+
+                # All the pods leaving, eg while they restart, keeps the files NGINX has.
+                renders = consume.renders()
+                churn.leave(len(churn.pods()))
+                self.assertTrue(wait_for(lambda: consume.renders() > renders and not consume.pod_view()))
+                self.assertIsNotNone(read(directory, 'upstreams/churn.conf'))
+                self.assertIsNotNone(read(directory, 'servers/default/status.conf'))
+                self.assertEqual(consume.reload_controller().reloads(), 2)
+            finally:
+                consume.stop()
+
+    def test_warm_start(self):
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1)
+        churn.join(5)
+        with tempfile.TemporaryDirectory() as directory:
+            def consume():
+                return koolie.nginx.zookeeper.Consume(
+                    koolie_zookeeper_factory=UsingMemory,
+                    memory_ensemble=ensemble,
+                    nginx_directory=os.path.join(directory, 'nginx'),
+                    consume_snapshot=os.path.join(directory, 'snapshot'),
+                    reload_function=lambda: True,
+                    reload_min_interval=0.0
+                )
+
+            def rendered():
+                upstream = read(os.path.join(directory, 'nginx'), 'upstreams/churn.conf') or ''
+                return all('server {}:80;'.format(pod) in upstream for pod in churn.pods()) and upstream.count('server ') == len(churn.pods())
+
+            def run(expected):
+                started = consume()
+                started.start()
+                try:
+                    self.assertTrue(wait_for(lambda: started.renders() >= 1 and rendered()))
+                    counts = lambda: (started.fetches(), started.warm_hits(), started.reload_controller().reloads(), started.snapshot_saves())
+                    wait_for(lambda: counts() == expected, 1.0)
+                    self.assertEqual(counts(), expected)
+                finally:
+                    started.stop()
+
+            # (fetches, warm hits, reloads, snapshot saves)
+            run((5, 0, 1, 1))
+
+            # Unchanged pods come from the snapshot, nothing is fetched, NGINX is not reloaded and the snapshot is not saved again.
+            run((0, 5, 0, 0))
+
+            # Only the pods which changed while stopped are fetched.
+            churn.leave(1)
+            churn.join(1)
+            run((1, 4, 1, 1))
+
+    def test_warm_until_synced(self):
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1, buckets=4)
+        churn.join(8)
+        with tempfile.TemporaryDirectory() as directory:
+            kwargs = dict(
+                koolie_zookeeper_factory=UsingMemory,
+                memory_ensemble=ensemble,
+                zookeeper_pods_buckets=4,
+                nginx_directory=os.path.join(directory, 'nginx'),
+                consume_snapshot=os.path.join(directory, 'snapshot'),
+                reload_function=lambda: True
+            )
+            consume = koolie.nginx.zookeeper.Consume(**kwargs)
+            consume.start()
+            try:
+                # Synced once every bucket has been listed.
+                self.assertTrue(wait_for(lambda: consume.synced() and consume.snapshot_saves() >= 1))
+            finally:
+                consume.stop()
+
+            def saved() -> set:
+                with open(os.path.join(directory, 'snapshot'), 'rb') as file:
+                    return set(koolie.nginx.snapshot.decode_snapshot(file.read())['pods'].keys())
+
+            self.assertEqual(saved(), set(churn.pods()))
+
+            # Not watching, so as if no bucket has been listed yet, the warm pods are kept.
+            restarted = koolie.nginx.zookeeper.Consume(**kwargs)
+            restarted.load_snapshot()
+            restarted.save_snapshot(dict())
+            self.assertEqual(saved(), set(churn.pods()))
+
+            # Once all the children have been applied the warm pods not added are gone.
+            restarted.apply([(koolie.nginx.zookeeper.SYNCED_KEY, koolie.nginx.zookeeper.MESSAGE_SYNCED)], False)
+            restarted.save_snapshot(dict())
+            self.assertEqual(saved(), set())
+
+    @staticmethod
+    def heartbeat_payload(name):
+        # Heartbeats every 0.1s, as PushStatus does every wake.
+        items = koolie.pod_api.pod_status.decode_data(koolie.zookeeper_api.pod_churn.pod_payload(name))
+        items[0][koolie.pod_api.pod_status.STATUS_HEARTBEAT_KEY] = 0.1
+        return koolie.pod_api.pod_status.encode_data(items)
+
+    def test_heartbeat(self):
+        children = koolie.zookeeper_api.koolie_node_watch.KOOLIE_NODE_WATCH_MODE_CHILDREN
+        tree = koolie.zookeeper_api.koolie_node_watch.KOOLIE_NODE_WATCH_MODE_TREE
+        # The emulated tree watch is the one on Kazoo.
+        for mode, emulated in [(children, False), (tree, False), (tree, True)]:
+            with self.subTest(mode=mode, emulated=emulated):
+                self.heartbeat(mode, emulated)
+
+    def heartbeat(self, mode: str, emulated: bool):
+        payload = self.heartbeat_payload
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1, payload=payload)
+        churn.join(3)
+        hung = set()
+        beating = threading.Event()
+
+        def beat():
+            while not beating.wait(0.05):
+                for pod in churn.pods():
+                    if pod not in hung:
+                        churn.set_pod(pod, payload(pod))
+
+        beater = threading.Thread(target=beat, daemon=True)
+        beater.start()
+        with tempfile.TemporaryDirectory() as directory:
+            consume = koolie.nginx.zookeeper.Consume(
+                koolie_zookeeper_factory=UsingMemory,
+                memory_ensemble=ensemble,
+                nginx_directory=directory,
+                nginx_reload_command='',
+                sleep_interval=0.05,
+                koolie_node_watch_mode=mode,
+                memory_tree_watch_emulated=emulated,
+                consume_heartbeat_misses=2,
+                consume_heartbeat_tick=0.05
+            )
+            consume.start()
+            try:
+                def rendered(pods):
+                    upstream = read(directory, 'upstreams/churn.conf') or ''
+                    return all('server {}:80;'.format(pod) in upstream for pod in pods) and upstream.count('server ') == len(pods)
+
+                self.assertTrue(wait_for(lambda: rendered(churn.pods())))
+                self.assertEqual(consume.fleet().query(item_type='nginx/upstream'), sorted(churn.pods()))
+
+                # A hung pod keeps its node but stops updating its status, it is evicted after missing its heartbeats.
+                hung.add(churn.pods()[0])
+                self.assertTrue(wait_for(lambda: rendered(churn.pods()[1:]), 2.0))
+                self.assertEqual(consume.stale(), hung)
+                self.assertTrue(wait_for(lambda: consume.fleet().query(older_than=0.5) == sorted(hung)))
+                self.assertEqual(consume.evictions(), 1)
+                if mode == koolie.zookeeper_api.koolie_node_watch.KOOLIE_NODE_WATCH_MODE_TREE:
+                    # The live pods are seen modified by their events, only the evicted one is read.
+                    reads = consume.heartbeat_reads()
+                    time.sleep(0.5)
+                    self.assertLessEqual(consume.heartbeat_reads() - reads, 8)
+                else:
+                    self.assertGreater(consume.heartbeat_reads(), 0)
+
+                # Restored once it updates its status again.
+                hung.clear()
+                self.assertTrue(wait_for(lambda: rendered(churn.pods()), 2.0))
+                self.assertEqual(consume.stale(), set())
+                self.assertEqual(consume.evictions(), 1)
+            finally:
+                consume.stop()
+                beating.set()
+                beater.join()
+
+    def test_heartbeat_batch(self):
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1, payload=self.heartbeat_payload)
+        churn.join(100)
+        latency = [0.0]
+        with tempfile.TemporaryDirectory() as directory:
+            consume = koolie.nginx.zookeeper.Consume(
+                koolie_zookeeper_factory=UsingMemory,
+                memory_ensemble=ensemble,
+                memory_latency=lambda: latency[0],
+                nginx_directory=directory,
+                nginx_reload_command='',
+                sleep_interval=0.05,
+                consume_heartbeat_misses=2,
+                consume_heartbeat_tick=0.01,
+                consume_heartbeat_batch=50
+            )
+            consume.start()
+            try:
+                self.assertTrue(wait_for(lambda: (read(directory, 'upstreams/churn.conf') or '').count('server ') == 100))
+                # None of the pods heartbeats, they fall due together and are read in two round trips rather than a hundred.
+                latency[0] = 0.02
+                start = time.monotonic()
+                self.assertTrue(wait_for(lambda: len(consume.stale()) == 100))
+                self.assertLess(time.monotonic() - start, 1.0)
+                self.assertEqual(consume.evictions(), 100)
+            finally:
+                consume.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
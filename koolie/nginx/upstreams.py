@@ -0,0 +1,176 @@
+import abc
+import json
+import logging
+import sys
+import threading
+import typing
+import urllib.request
+
+import koolie.nginx.render
+
+_logger = logging.getLogger(__name__)
+
+# Push upstream membership changes to NGINX at runtime instead of reloading, either a backend name or an AbstractUpstreamBackend.
+# The names are UPSTREAMS_BACKEND_HTTP and UPSTREAMS_BACKEND_MEMORY, default is no backend so every change reloads.
+NGINX_UPSTREAMS_BACKEND: str = 'nginx_upstreams_backend'
+
+UPSTREAMS_BACKEND_HTTP: str = 'http'
+UPSTREAMS_BACKEND_MEMORY: str = 'memory'
+
+# The URL the HTTP backend PUTs the servers of an upstream to, formatted with the upstream name.
+# For example an NJS or Lua handler storing them in a shared dict read by the balancer.
+NGINX_UPSTREAMS_URL: str = 'nginx_upstreams_url'
+NGINX_UPSTREAMS_URL_DEFAULT: str = 'http://127.0.0.1:8081/koolie/upstreams/{}'
+
+NGINX_UPSTREAMS_TIMEOUT: str = 'nginx_upstreams_timeout'
+NGINX_UPSTREAMS_TIMEOUT_DEFAULT: float = 5.0
+
+UPSTREAMS_PREFIX: str = 'upstreams/'
+UPSTREAMS_SUFFIX: str = '.conf'
+
+SERVER_PREFIX: str = 'server '
+SOURCE_PREFIX: str = '# Source ['
+
+
+def upstream_name(file_name: str) -> str:
+    """The upstream rendered to the file, None if it is not an upstream file."""
+    if file_name.startswith(UPSTREAMS_PREFIX) and file_name.endswith(UPSTREAMS_SUFFIX):
+        return file_name[len(UPSTREAMS_PREFIX):-len(UPSTREAMS_SUFFIX)]
+    return None
+
+
+def split_upstream(content: str) -> typing.Tuple[typing.List[str], typing.List[str]]:
+    """Split a rendered upstream into its servers, eg 'pod-1:80 max_fails=3', and the rest of its lines, less the source comments."""
+    servers = list()
+    rest = list()
+    for line in content.split('\n'):
+        line = line.strip()
+        if line.startswith(SERVER_PREFIX) and line.endswith(';'):
+            servers.append(line[len(SERVER_PREFIX):-1].strip())
+        elif not line.startswith(SOURCE_PREFIX):
+            rest.append(line)
+    return servers, rest
+
+
+def membership_changes(old: koolie.nginx.render.Files, new: koolie.nginx.render.Files) -> typing.Dict[str, typing.List[str]]:
+    """The servers of each upstream whose membership changed, or None if anything else changed and NGINX must reload."""
+    changes = dict()
+    for file_name in set(old.keys()).union(new.keys()):
+        if old.get(file_name) == new.get(file_name):
+            continue
+        name = upstream_name(file_name)
+        if name is None or file_name not in old or file_name not in new:
+            return None
+        old_servers, old_rest = split_upstream(old[file_name])
+        new_servers, new_rest = split_upstream(new[file_name])
+        if old_rest != new_rest or not new_servers:
+            return None
+        if old_servers != new_servers:
+            changes[name] = new_servers
+    return changes
+
+
+class AbstractUpstreamBackend(abc.ABC):
+
+    """Updates the servers of an upstream in the running NGINX."""
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.__updates = 0
+        self.__failures = 0
+
+    def updates(self) -> int:
+        return self.__updates
+
+    def failures(self) -> int:
+        return self.__failures
+
+    def push(self, changes: typing.Dict[str, typing.List[str]]) -> bool:
+        """Update each upstream, returning False if any failed so NGINX should be reloaded instead."""
+        for name, servers in sorted(changes.items()):
+            try:
+                self.update(name, servers)
+                self.__updates += 1
+            except Exception as exception:
+                self.__failures += 1
+                _logger.warning('Failed to update upstream [{}] exception [{}]'.format(name, exception))
+                return False
+        return True
+
+    @abc.abstractmethod
+    def update(self, name: str, servers: typing.List[str]):
+        """Replace the servers of the upstream, raising an exception if it failed."""
+        pass
+
+    def __str__(self) -> str:
+        return '{} Updates [{}] Failures [{}]'.format(type(self).__name__, self.__updates, self.__failures)
+
+
+class MemoryUpstreamBackend(AbstractUpstreamBackend):
+
+    """Keeps the servers of each upstream, stands in for NGINX in tests."""
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.__lock = threading.Lock()
+
+        self.__upstreams: typing.Dict[str, typing.List[str]] = dict()
+
+    def upstreams(self) -> typing.Dict[str, typing.List[str]]:
+        with self.__lock:
+            return {name: list(servers) for name, servers in self.__upstreams.items()}
+
+    def update(self, name: str, servers: typing.List[str]):
+        with self.__lock:
+            self.__upstreams[name] = list(servers)
+
+
+class HTTPUpstreamBackend(AbstractUpstreamBackend):
+
+    """PUTs the servers of an upstream, as a JSON list, to an endpoint in NGINX."""
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__()
+
+        self.__url: str = kwargs.get(NGINX_UPSTREAMS_URL, NGINX_UPSTREAMS_URL_DEFAULT)
+
+        self.__timeout: float = kwargs.get(NGINX_UPSTREAMS_TIMEOUT, NGINX_UPSTREAMS_TIMEOUT_DEFAULT)
+
+    def update(self, name: str, servers: typing.List[str]):
+        request = urllib.request.Request(
+            self.__url.format(name),
+            data=json.dumps(servers).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='PUT'
+        )
+        with urllib.request.urlopen(request, timeout=self.__timeout) as response:
+            if response.status // 100 != 2:
+                raise IOError('Upstream [{}] status [{}]'.format(name, response.status))
+
+
+def create_backend(**kwargs) -> AbstractUpstreamBackend:
+    """The backend configured by NGINX_UPSTREAMS_BACKEND, None if there is none."""
+    backend = kwargs.get(NGINX_UPSTREAMS_BACKEND)
+    if backend is None or isinstance(backend, AbstractUpstreamBackend):
+        return backend
+    if backend == UPSTREAMS_BACKEND_HTTP:
+        return HTTPUpstreamBackend(**kwargs)
+    if backend == UPSTREAMS_BACKEND_MEMORY:
+        return MemoryUpstreamBackend()
+    if backend:
+        _logger.warning('Unknown upstreams backend [{}]'.format(backend))
+    return None
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    old = {'upstreams/ydos.conf': 'upstream ydos {\n    # Source [nginx/upstream/ydos/pod-1]\n    server pod-1:80;\n}\n'}
+    new = {'upstreams/ydos.conf': 'upstream ydos {\n    # Source [nginx/upstream/ydos/pod-1]\n    server pod-1:80;\n    # Source [nginx/upstream/ydos/pod-2]\n    server pod-2:80;\n}\n'}
+    changes = membership_changes(old, new)
+    _logger.info(changes)
+    backend = MemoryUpstreamBackend()
+    backend.push(changes)
+    _logger.info('{} {}'.format(backend, backend.upstreams()))
@@ -1,97 +1,701 @@
+import itertools
 import logging
-import yaml
-
-import koolie.nginx.config
+import threading
+import time
+import typing
+
+import koolie.nginx.election
+import koolie.nginx.endpoint_slices
+import koolie.nginx.heartbeats
+import koolie.nginx.read_api
+import koolie.nginx.reload
+import koolie.nginx.supervisor
+import koolie.nginx.upstreams
+import koolie.nginx.render
+import koolie.nginx.snapshot
+import koolie.pod_api.fleet
+import koolie.pod_api.pod_snippets
 import koolie.pod_api.pod_status
+import koolie.tools.abstract_service
+import koolie.tools.common
+import koolie.tools.mailbox
 import koolie.zookeeper_api.koolie_node_watch
+import koolie.zookeeper_api.koolie_zookeeper
 
 _logger = logging.getLogger(__name__)
 
+# The number of pods with pending changes before the mailbox overflows and the pods are snapshot instead.
+CONSUME_MAILBOX_CAPACITY: str = 'consume_mailbox_capacity'
+CONSUME_MAILBOX_CAPACITY_DEFAULT: int = koolie.tools.mailbox.MAILBOX_CAPACITY_DEFAULT
+
+# Watch the pods in ZooKeeper, default is True. Set False to render only from the other sources, eg the endpoint slices.
+CONSUME_ZOOKEEPER_PODS: str = 'consume_zookeeper_pods'
+
+# A render checks whether it has been superseded after loading this many pods.
+RENDER_CHECKPOINT_PODS: int = 64
+
+# A render is no longer cancelled once this many renders in a row have been, so steady churn cannot starve the renders.
+CONSUME_RENDER_MAX_CANCELS: str = 'consume_render_max_cancels'
+CONSUME_RENDER_MAX_CANCELS_DEFAULT: int = 4
+
+# Nor once the oldest change it renders was taken this many seconds ago, bounding how far NGINX lags the pods.
+CONSUME_RENDER_DEADLINE: str = 'consume_render_deadline'
+CONSUME_RENDER_DEADLINE_DEFAULT: float = 2.0
+
+# The mailbox messages, keyed by child, the snapshot of all the children has its own key and replaces them.
+MESSAGE_SNAPSHOT: str = 'snapshot'
+MESSAGE_CREATED: str = 'created'
+MESSAGE_DELETED: str = 'deleted'
+MESSAGE_MODIFIED: str = 'modified'
+
+# The items of a source other than ZooKeeper changed, keyed by the source's key, the items are kept by the consumer.
+MESSAGE_SOURCE: str = 'source'
+
+# The generation of the bundle changed, a follower fetches and applies the current bundle in go().
+MESSAGE_GENERATION: str = 'generation'
+
+# The watch has given all the children, once applied every pod of the snapshot still there has been added.
+MESSAGE_SYNCED: str = 'synced'
+
+SNAPSHOT_KEY = None
+
+# No child has these keys.
+GENERATION_KEY = ('generation',)
+SYNCED_KEY = ('synced',)
+
+
+class RenderCancelled(Exception):
+
+    """Raised at a render checkpoint when newer changes are waiting in the mailbox."""
+
+    pass
+
+
+class _Unfetched(object):
+
+    """Marks a pod whose status is to be fetched by the next render, each mark is a new instance."""
+
+    pass
+
 
 class Consume(koolie.zookeeper_api.koolie_node_watch.DeltaNodeWatch):
 
+    """Render the NGINX config from the status of the pods and reload NGINX.
+    The watch callbacks, run in the ZooKeeper event thread, only put the changes in a collapsing mailbox.
+    The go() thread owns the pods, it takes the changes, applies them and renders, a render superseded by newer changes is cancelled.
+    The election, the snapshot and the heartbeats are collaborators, as are the reloads and the NGINX master.
+    With `CONSUME_ELECTION` the replicas elect a leader which alone watches the pods and renders,
+    publishing the render as a content-addressed bundle. Every replica applies a bundle when the generation changes."""
+
     def __init__(self, **kwargs):
+        kwargs.setdefault(
+            koolie.zookeeper_api.koolie_node_watch.KOOLIE_NODE_WATCH_PATH,
+            kwargs.get(koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_PODS_PATH, koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_PODS_PATH_DEFAULT)
+        )
         super().__init__(**kwargs)
 
         self.__kwargs = kwargs
 
-        self.__nginx_config = None
+        # Child to the decoded status of the pod, _Unfetched, or its `Warm` status from the snapshot.
+        self.__pod_items: typing.Dict[str, object] = dict()
+
+        # Guards the pod items, and the snapshot and heartbeats kept with them.
+        self.__render_condition = threading.Condition(threading.RLock())
+
+        self.__mailbox = koolie.tools.mailbox.Mailbox(self.get_kv(CONSUME_MAILBOX_CAPACITY, CONSUME_MAILBOX_CAPACITY_DEFAULT))
 
-        self.__all_nodes = set()
+        # Whether changes have been applied since the last render.
+        self.__dirty = False
 
+        # When the oldest change not yet rendered was taken, None if rendered.
+        self.__dirty_since: float = None
+
+        self.__cancelled = 0
+
+        # The renders cancelled since one completed.
+        self.__consecutive_cancels = 0
+
+        self.__max_cancels: int = self.get_kv(CONSUME_RENDER_MAX_CANCELS, CONSUME_RENDER_MAX_CANCELS_DEFAULT)
+
+        self.__render_deadline: float = self.get_kv(CONSUME_RENDER_DEADLINE, CONSUME_RENDER_DEADLINE_DEFAULT)
+
+        # The renders which ignored newer changes to finish, having been cancelled too often or for too long.
+        self.__forced = 0
+
+        # The children whose status has NGINX items.
         self.__nginx_nodes = set()
 
-        self.__change_nginx_config = None
+        # Elects the replica which renders, None if every replica renders.
+        self.__election: koolie.nginx.election.Election = None
+        if self.get_kv(koolie.nginx.election.CONSUME_ELECTION, False):
+            self.__election = koolie.nginx.election.Election(
+                self.zoo_keeper(), self.name(), self.watch, self.unwatch, lambda: self.__mailbox.put(GENERATION_KEY, MESSAGE_GENERATION), **kwargs
+            )
 
-        self.__added_all_nodes = None
+        # Templates shared by the pods' snippet references are fetched and parsed once.
+        self.__snippets = koolie.pod_api.pod_snippets.SnippetStore(self.zoo_keeper(), **kwargs)
 
-        self.__added_nginx_nodes = None
+        # Upstream membership changes are pushed to NGINX by the backend rather than reloading, None to always reload.
+        self.__upstreams_backend: koolie.nginx.upstreams.AbstractUpstreamBackend = koolie.nginx.upstreams.create_backend(**kwargs)
 
-        self.__removed_nginx_nodes: set = None
+        # The files last written, to find the membership changes.
+        self.__written_files: koolie.nginx.render.Files = None
 
-    def change(self, children):
-        self.__change_nginx_config = koolie.nginx.config.NGINXConfig(**self.__kwargs)
-        self.__added_all_nodes = set()
-        self.__added_nginx_nodes = set()
+        self.__fast_updates = 0
 
-        self.__removed_nginx_nodes = set()
+        self.__snapshot = koolie.nginx.snapshot.Snapshot(self.zookeeper_node_path(), self.__render_condition, **kwargs)
 
-        self.__change_nginx_config.load_start()
-        super().change(children)
-        self.__change_nginx_config.load_stop()
-        _logger.info('NGINX changes, added [{}], removed [{}]'.format(len(self.__added_nginx_nodes), len(self.__removed_nginx_nodes)))
+        # Whether all the children have been applied since watching, only then are the warm pods not added gone.
+        self.__pods_synced = False
 
-        _logger.info('Loaded count [{}]'.format(self.__change_nginx_config.loaded_count()))
+        # The statuses fetched as columns, for fleet-wide queries.
+        self.__fleet = koolie.pod_api.fleet.Fleet()
 
-        self.__all_nodes = self.__added_all_nodes
-        self.__added_all_nodes = None
+        self.__heartbeats = koolie.nginx.heartbeats.Heartbeats(self.zoo_keeper(), self.zookeeper_node_path(), self.__render_condition, self.touch, **kwargs)
 
-        self.__nginx_nodes = self.__added_nginx_nodes
-        self.__added_nginx_nodes = None
+        # Advanced whenever the pods, their statuses or the files written change, next() is atomic so any thread may advance it.
+        self.__view_generations = itertools.count(1)
+        self.__view_generation = 0
 
-        self.__removed_nginx_nodes = None
+        self.__zookeeper_pods: bool = self.get_kv(CONSUME_ZOOKEEPER_PODS, True)
 
-        if self.__change_nginx_config.load_metadata()['load_count'] > 0:
-            self.__change_nginx_config.dump_start()
-            self.__change_nginx_config.dump()
-            self.__change_nginx_config.dump_stop()
+        # The latest items of each key of the other sources, set from their threads and applied by go() like the pods.
+        self.__sources: typing.Dict[str, list] = dict()
 
-            # self.__change_nginx_config.test()
-            # self.__change_nginx_config.nginx_conf()
-            self.__change_nginx_config.reload()
+        # The keys of the other sources among the pod items.
+        self.__source_keys: typing.Set[str] = set()
 
-        self.__change_nginx_config = None
+        # Feeds the ready endpoints of the endpoint slices as sources, None if not configured.
+        self.__endpoint_slices: koolie.nginx.endpoint_slices.EndpointSliceInformer = None
+        if self.get_kv(koolie.nginx.endpoint_slices.CONSUME_ENDPOINT_SLICES, False):
+            endpoint_slices_kwargs = dict(kwargs)
+            endpoint_slices_kwargs[koolie.tools.abstract_service.AbstractService.NAME] = '{}_endpoint_slices'.format(self.name())
+            self.__endpoint_slices = koolie.nginx.endpoint_slices.EndpointSliceInformer(self.source_items, **endpoint_slices_kwargs)
 
-    def added(self, children):
-        _logger.debug('added()')
+        # Serves the view read only, None if not configured.
+        self.__read_api: koolie.nginx.read_api.ReadAPI = None
+        if self.get_kv(koolie.nginx.read_api.CONSUME_READ_API):
+            read_api_kwargs = dict(kwargs)
+            read_api_kwargs[koolie.tools.abstract_service.AbstractService.NAME] = '{}_read_api'.format(self.name())
+            self.__read_api = koolie.nginx.read_api.ReadAPI(self, **read_api_kwargs)
 
-        for child in children:
-            _logger.debug('Child [{}]'.format(child))
+        # The NGINX master when supervised, reloaded by signal rather than the reload command.
+        self.__supervisor: koolie.nginx.supervisor.NGINXSupervisor = None
 
-            self.__added_all_nodes.add_item(child)
+        # Set while restarting, so the supervised NGINX master keeps serving.
+        self.__restarting = False
 
-            # Kazoo returns a tuple, [0] is the data (b array) and [1] is the ZooKeeper info (ZnodeStat).
-            data: tuple = self.zoo_keeper().get_node_value(self.zookeeper_node_path() + '/' + child)
-            if data is None:
-                _logger.warning('Failed to get value for child [{}]'.format(child))
-                continue
+        # Spaces and coalesces the reloads, None if there is nothing to reload.
+        self.__reload_controller: koolie.nginx.reload.ReloadController = None
 
-            j = koolie.pod_api.pod_status.decode_data(data[0])
-            _logger.debug(j)
-            if j is None:
-                _logger.warning('Failed to decode child value')
-                continue
+        reload_kwargs = dict(kwargs)
+        if self.get_kv(koolie.nginx.supervisor.NGINX_SUPERVISE, False):
+            supervisor_kwargs = dict(kwargs)
+            supervisor_kwargs[koolie.tools.abstract_service.AbstractService.NAME] = '{}_supervisor'.format(self.name())
+            self.__supervisor = koolie.nginx.supervisor.NGINXSupervisor(**supervisor_kwargs)
+            reload_kwargs[koolie.nginx.reload.RELOAD_FUNCTION] = self.__supervisor.reload
+        if self.get_kv(koolie.nginx.render.NGINX_RELOAD_COMMAND, koolie.nginx.render.NGINX_RELOAD_COMMAND_DEFAULT) or reload_kwargs.get(koolie.nginx.reload.RELOAD_FUNCTION):
+            reload_kwargs[koolie.tools.abstract_service.AbstractService.NAME] = '{}_reload'.format(self.name())
+            self.__reload_controller = koolie.nginx.reload.ReloadController(**reload_kwargs)
 
-            load_count = self.__change_nginx_config.load(j)
-            if load_count > 0:
-                self.__added_nginx_nodes.add_item(child)
-                _logger.debug('Added child [{}] to NGINX nodes'.format(child))
+        self.__renders = 0
+        self.__fetches = 0
 
-    def removed(self, children):
-        _logger.debug('removed()')
+    def election(self) -> koolie.nginx.election.Election:
+        return self.__election
+
+    def following(self) -> bool:
+        """Whether another replica renders, in election mode and not the leader."""
+        return self.__election is not None and not self.__election.leader()
+
+    def leader(self) -> bool:
+        return self.__election is not None and self.__election.leader()
+
+    def renders(self) -> int:
+        """The number of renders completed."""
+        return self.__renders
+
+    def cancelled_renders(self) -> int:
+        return self.__cancelled
+
+    def forced_renders(self) -> int:
+        """The number of renders finished despite newer changes, to bound the lag under steady churn."""
+        return self.__forced
+
+    def render_requests(self) -> int:
+        """The number of changes put in the mailbox."""
+        return self.__mailbox.puts()
+
+    def mailbox(self) -> koolie.tools.mailbox.Mailbox:
+        return self.__mailbox
 
-        for child in children:
-            _logger.debug('Child [{}]'.format(child))
+    def fetches(self) -> int:
+        """The number of pod statuses fetched from ZooKeeper."""
+        return self.__fetches
 
-            if child in self.__nginx_nodes:
-                self.__removed_nginx_nodes.add(child)
+    def applies(self) -> int:
+        """The number of bundles fetched and applied as a follower."""
+        return 0 if self.__election is None else self.__election.applies()
+
+    def snippets(self) -> koolie.pod_api.pod_snippets.SnippetStore:
+        return self.__snippets
+
+    def applied_digest(self) -> str:
+        return None if self.__election is None else self.__election.applied_digest()
+
+    def reload_controller(self) -> koolie.nginx.reload.ReloadController:
+        return self.__reload_controller
+
+    def supervisor(self) -> koolie.nginx.supervisor.NGINXSupervisor:
+        return self.__supervisor
+
+    def upstreams_backend(self) -> koolie.nginx.upstreams.AbstractUpstreamBackend:
+        return self.__upstreams_backend
+
+    def snapshot(self) -> koolie.nginx.snapshot.Snapshot:
+        return self.__snapshot
+
+    def warm_hits(self) -> int:
+        """The number of pods whose status came from the snapshot rather than being fetched."""
+        return self.__snapshot.hits()
+
+    def snapshot_saves(self) -> int:
+        return self.__snapshot.saves()
+
+    def fast_updates(self) -> int:
+        """The number of writes whose upstream membership changes were pushed instead of reloading."""
+        return self.__fast_updates
+
+    def heartbeats(self) -> koolie.nginx.heartbeats.Heartbeats:
+        return self.__heartbeats
+
+    def stale(self) -> typing.Set[str]:
+        """The children evicted for missing their heartbeats."""
+        return self.__heartbeats.stale()
+
+    def evictions(self) -> int:
+        return self.__heartbeats.evictions()
+
+    def heartbeat_reads(self) -> int:
+        return self.__heartbeats.reads()
+
+    def fleet(self) -> koolie.pod_api.fleet.Fleet:
+        return self.__fleet
+
+    def read_api(self) -> koolie.nginx.read_api.ReadAPI:
+        return self.__read_api
+
+    def endpoint_slices(self) -> koolie.nginx.endpoint_slices.EndpointSliceInformer:
+        return self.__endpoint_slices
+
+    def source_items(self, key: str, items: list):
+        """Set the items of a source other than ZooKeeper, None to remove them. Rendered with the pods, never blocks.
+        Followers apply them too, so a new leader has them."""
+        with self.__render_condition:
+            if items is None:
+                self.__sources.pop(key, None)
+            else:
+                self.__sources[key] = items
+        self.__mailbox.put(key, MESSAGE_SOURCE)
+
+    def view_generation(self) -> int:
+        return self.__view_generation
+
+    def view_changed(self):
+        self.__view_generation = next(self.__view_generations)
+
+    def pod_view(self) -> typing.Dict[str, list]:
+        """The current pods to their decoded status, None if not fetched yet."""
+        with self.__render_condition:
+            return {child: None if isinstance(items, (_Unfetched, koolie.nginx.snapshot.Warm)) else items for child, items in self.__pod_items.items()}
+
+    def written_files(self) -> koolie.nginx.render.Files:
+        files = self.__written_files
+        return None if files is None else dict(files)
+
+    def before_start(self):
+        self.load_snapshot()
+        if self.__supervisor is not None:
+            self.__supervisor.start()
+        if self.__reload_controller is not None:
+            self.__reload_controller.start()
+        if self.__read_api is not None:
+            self.__read_api.start()
+        super().before_start()
+        if self.__endpoint_slices is not None:
+            self.__endpoint_slices.start()
+        if self.__election is not None:
+            self.__election.start()
+
+    def before_stop(self):
+        if self.__election is not None:
+            self.__election.stop()
+        if self.__endpoint_slices is not None:
+            self.__endpoint_slices.stop()
+        super().before_stop()
+        if self.__read_api is not None:
+            self.__read_api.stop()
+        if self.__reload_controller is not None:
+            self.__reload_controller.stop()
+        if self.__supervisor is not None and not self.__restarting:
+            self.__supervisor.stop()
+
+    def restart(self):
+        """Restart watching, eg on SIGHUP. A supervised NGINX master keeps running and is reloaded once the pods are rendered."""
+        self.__restarting = True
+        try:
+            super().restart()
+        finally:
+            self.__restarting = False
+
+    def processes_in_callbacks(self) -> bool:
+        """The callbacks only put the changes in the mailbox, processed() is called once a render has committed them."""
+        return False
+
+    def stopping(self) -> bool:
+        return self.pending_state() is koolie.tools.abstract_service.ServiceState.STOPPED
+
+    def watch(self):
+        """In election mode only the leader watches the pods."""
+        if self.following() or not self.__zookeeper_pods:
+            return
+        super().watch()
+
+    def state_changed(self, state):
+        if self.__election is not None:
+            self.__election.state_changed(state)
+        super().state_changed(state)
+
+    def change(self, children):
+        self.post(SNAPSHOT_KEY, (MESSAGE_SNAPSHOT, list(children)))
+
+    def bucket_change(self, bucket: str, added: typing.Set[str], removed: typing.Set[str]):
+        for child in removed:
+            self.post(child, MESSAGE_DELETED)
+        for child in added:
+            self.post(child, MESSAGE_CREATED)
+
+    def child_created(self, child: str):
+        self.post(child, MESSAGE_CREATED)
+
+    def child_deleted(self, child: str):
+        self.post(child, MESSAGE_DELETED)
+
+    def child_modified(self, child: str):
+        self.post(child, MESSAGE_MODIFIED)
+
+    def children_synced(self):
+        self.post(SYNCED_KEY, MESSAGE_SYNCED)
+
+    def post(self, key: str, message: object):
+        """Put the change in the mailbox for the go() thread, never blocks the ZooKeeper event thread."""
+        if self.following():
+            return
+        self.__mailbox.put(key, message, replace=key is SNAPSHOT_KEY)
+
+    def unwatch(self):
+        with self.__render_condition:
+            self.__mailbox.clear()
+            super().unwatch()
+            self.__pods_synced = False
+            self.__pod_items.clear()
+            self.__snapshot.clear()
+            # The other sources do not come from the watch, so take them again.
+            self.__source_keys.clear()
+            for key in self.__sources.keys():
+                self.__mailbox.put(key, MESSAGE_SOURCE)
+            if self.__election is not None:
+                self.__mailbox.put(GENERATION_KEY, MESSAGE_GENERATION)
+
+    def apply(self, messages: typing.List[typing.Tuple[str, object]], overflowed: bool):
+        """Apply the changes taken from the mailbox to the pods, after an overflow the children are snapshot instead.
+        A snapshot replaces the pending messages, so the other sources are applied again with it.
+        A change of generation applies the current bundle, outside the render condition."""
+        generation = overflowed and self.__election is not None
+        with self.__render_condition:
+            if overflowed:
+                _logger.warning('Mailbox overflowed, snapshot the children')
+                messages = list()
+                if self.__zookeeper_pods and not self.following():
+                    messages.append((SNAPSHOT_KEY, (MESSAGE_SNAPSHOT, self.children())))
+                    # The synced message may have been dropped, the children are all there if the watch is synced.
+                    if self.synced():
+                        messages.append((SYNCED_KEY, MESSAGE_SYNCED))
+                    if self.mode() == koolie.zookeeper_api.koolie_node_watch.KOOLIE_NODE_WATCH_MODE_TREE:
+                        # The modifications may have been dropped too, so the pods are given their heartbeats again.
+                        self.__heartbeats.renew()
+            if any(key is SNAPSHOT_KEY for key, message in messages):
+                messages.extend((key, MESSAGE_SOURCE) for key in self.__source_keys.union(self.__sources.keys()))
+            for key, message in messages:
+                if key == GENERATION_KEY:
+                    generation = True
+                elif key == SYNCED_KEY:
+                    self.__pods_synced = True
+                elif message == MESSAGE_SOURCE:
+                    self.apply_source(key)
+                elif key is SNAPSHOT_KEY:
+                    koolie.zookeeper_api.koolie_node_watch.DeltaNodeWatch.change(self, message[1])
+                elif message == MESSAGE_DELETED:
+                    koolie.zookeeper_api.koolie_node_watch.DeltaNodeWatch.child_deleted(self, key)
+                elif message == MESSAGE_CREATED or key not in self.current():
+                    # A modification collapsed over the creation is a creation.
+                    koolie.zookeeper_api.koolie_node_watch.DeltaNodeWatch.child_created(self, key)
+                else:
+                    koolie.zookeeper_api.koolie_node_watch.DeltaNodeWatch.child_modified(self, key)
+            self.view_changed()
+        if generation:
+            self.apply_generation()
+
+    def apply_source(self, key: str):
+        """Take the latest items of the source's key as a pod's, with the render condition held."""
+        items = self.__sources.get(key)
+        if items is None:
+            if key in self.__source_keys:
+                self.__source_keys.discard(key)
+                self.removed({key})
+            return
+        self.__source_keys.add(key)
+        self.__pod_items[key] = items
+        self.__fleet.update(key, items)
+
+    def added(self, children):
+        """Mark the children to be fetched by the next render, or checked against the snapshot."""
+        _logger.debug('added()')
+        with self.__render_condition:
+            for child in children:
+                warm = self.__snapshot.take(child)
+                self.__pod_items[child] = _Unfetched() if warm is None else warm
+                self.__heartbeats.added(child)
+
+    def modified(self, children):
+        """In tree mode the status of the pods changed, fetch them again."""
+        with self.__render_condition:
+            for child in children:
+                self.__snapshot.discard(child)
+                self.__pod_items[child] = _Unfetched()
+                self.__heartbeats.modified(child)
+
+    def removed(self, children):
+        _logger.debug('removed()')
+        with self.__render_condition:
+            for child in children:
+                self.__pod_items.pop(child, None)
+                self.__snapshot.remove(child)
+                self.__heartbeats.remove(child)
+                self.__fleet.remove(child)
+
+    def go(self):
+        """The actor, take the changes from the mailbox, apply them and render.
+        Changes arriving during a render cancel it, they are then applied and rendered together.
+        After `CONSUME_RENDER_MAX_CANCELS` cancels in a row, or `CONSUME_RENDER_DEADLINE` seconds, the render finishes regardless."""
+        while self.state() is koolie.tools.abstract_service.ServiceState.STARTED and not self.stopping():
+            # Do not wait while due children are left to check.
+            messages, overflowed = self.__mailbox.take(0 if self.__heartbeats.pending() else self.sleep_interval())
+            if messages or overflowed:
+                try:
+                    self.apply(messages, overflowed)
+                except Exception as exception:
+                    koolie.tools.common.log_exception(exception, logger=_logger)
+                self.dirty()
+            try:
+                if self.expire():
+                    self.dirty()
+            except Exception as exception:
+                koolie.tools.common.log_exception(exception, logger=_logger)
+            if not self.__dirty:
+                continue
+            try:
+                self.render()
+                self.rendered()
+            except RenderCancelled as render_cancelled:
+                self.__cancelled += 1
+                self.__consecutive_cancels += 1
+                _logger.info('Render cancelled [{}]'.format(render_cancelled))
+            except Exception as exception:
+                self.rendered()
+                koolie.tools.common.log_exception(exception, logger=_logger)
+
+    def dirty(self):
+        if not self.__dirty:
+            self.__dirty = True
+            self.__dirty_since = time.monotonic()
+
+    def rendered(self):
+        self.__dirty = False
+        self.__dirty_since = None
+        self.__consecutive_cancels = 0
+
+    def cancellable(self) -> bool:
+        """Whether the render may still be cancelled, False once cancelled too often or the changes it renders are too old."""
+        if self.__consecutive_cancels >= self.__max_cancels:
+            return False
+        return self.__dirty_since is None or time.monotonic() - self.__dirty_since < self.__render_deadline
+
+    def checkpoint(self, cversion: int = None):
+        """Raise RenderCancelled if changes are waiting in the mailbox, or the pods have changed since cversion.
+        Once the render is no longer cancellable the newer changes wait for the next render."""
+        if self.stopping():
+            raise RenderCancelled('Render superseded, stopping')
+        if not self.cancellable():
+            return
+        if self.__mailbox.pending() > 0:
+            raise RenderCancelled('Render superseded, pending [{}]'.format(self.__mailbox.pending()))
+        if cversion is not None:
+            stat = self.zoo_keeper().exists(self.zookeeper_node_path())
+            if stat is not None and stat.cversion != cversion:
+                raise RenderCancelled('Render superseded, pods changed cversion [{}] -> [{}]'.format(cversion, stat.cversion))
+
+    def pod_items(self, child: str) -> list:
+        """The decoded status of the pod, fetched if not yet fetched. None if it is no longer current or failed to fetch."""
+        with self.__render_condition:
+            items = self.__pod_items.get(child)
+        warm = items if isinstance(items, koolie.nginx.snapshot.Warm) else None
+        if warm is None and not isinstance(items, _Unfetched):
+            return items
+        path = '{}/{}'.format(self.zookeeper_node_path().rstrip('/'), child)
+        stat = None
+        if self.__snapshot.enabled() or warm is not None or self.__heartbeats.enabled():
+            # Read before the data, so a change in between is fetched again after a restart rather than missed.
+            stat = self.zoo_keeper().exists(path)
+            if stat is None:
+                _logger.warning('Child gone [{}]'.format(child))
+                return None
+        if warm is not None and (stat.mzxid, stat.version) == (warm.zxid, warm.version):
+            self.__snapshot.hit()
+            j = warm.items
+            data_digest = warm.digest
+        else:
+            data: bytes = self.zoo_keeper().get_node_value(path)
+            self.__fetches += 1
+            if data is None:
+                _logger.warning('Failed to get value for child [{}]'.format(child))
+                return None
+            data_digest = koolie.nginx.snapshot.sha256_digest(data)
+            if warm is not None and data_digest == warm.digest:
+                j = warm.items
+            else:
+                j = koolie.pod_api.pod_status.decode_data(data)
+                if j is None:
+                    _logger.warning('Failed to decode child value')
+                    return None
+                j = self.__snippets.expand(j)
+        with self.__render_condition:
+            # Only keep it if the child has not been removed or marked again meanwhile.
+            if self.__pod_items.get(child) is items:
+                self.__pod_items[child] = j
+                self.__fleet.update(child, j)
+                self.view_changed()
+                if stat is not None:
+                    self.__snapshot.fetched(child, stat.mzxid, stat.version, data_digest)
+                    self.__heartbeats.track(child, j, stat.mzxid)
+        return j
+
+    def touch(self, child: str, modified: float):
+        """The pod's status was modified at the time, seen by reading its node rather than fetching it."""
+        self.__fleet.touch(child, modified)
+        self.view_changed()
+
+    def expire(self) -> bool:
+        """Evict the pods which missed their heartbeats and restore those modified again, stopping to apply the changes waiting.
+        Returns True if a pod was evicted or restored, so the render changed."""
+        tree = self.mode() == koolie.zookeeper_api.koolie_node_watch.KOOLIE_NODE_WATCH_MODE_TREE
+        changed = self.__heartbeats.expire(tree, lambda: self.__mailbox.pending() > 0)
+        if changed:
+            self.view_changed()
+        return changed
+
+    def render(self):
+        """Render the current pods, write the files and reload NGINX if they changed.
+        In election mode the render is published for the followers.
+        Raises RenderCancelled at a checkpoint if newer changes are waiting, so only the newest state is written."""
+        if self.following():
+            return
+        cversion = None
+        if self.__zookeeper_pods and self.mode() == koolie.zookeeper_api.koolie_node_watch.KOOLIE_NODE_WATCH_MODE_CHILDREN and self.buckets() <= 0:
+            stat = self.zoo_keeper().exists(self.zookeeper_node_path())
+            cversion = None if stat is None else stat.cversion
+        nginx_config = koolie.nginx.render.NGINXConfig(**self.__kwargs)
+        nginx_config.load_start()
+        nginx_nodes = set()
+        with self.__render_condition:
+            children = sorted(self.__pod_items.keys())
+        stale = self.__heartbeats.stale()
+        for i, child in enumerate(children):
+            if i % RENDER_CHECKPOINT_PODS == 0:
+                self.checkpoint()
+            if child in stale:
+                continue
+            items = self.pod_items(child)
+            if items is not None and nginx_config.load(items) > 0:
+                nginx_nodes.add(child)
+        nginx_config.load_stop()
+        files = nginx_config.files()
+        self.checkpoint(cversion)
+
+        _logger.info('NGINX changes, added [{}], removed [{}]'.format(len(nginx_nodes - self.__nginx_nodes), len(self.__nginx_nodes - nginx_nodes)))
+        self.__nginx_nodes = nginx_nodes
+        self.__renders += 1
+        if not self.cancellable() and self.__mailbox.pending() > 0:
+            self.__forced += 1
+            _logger.info('Render forced after [{}] cancels, pending [{}]'.format(self.__consecutive_cancels, self.__mailbox.pending()))
+
+        if nginx_config.loaded_count() == 0:
+            # An empty render, eg while the pods restart, keeps the files NGINX has rather than removing them.
+            _logger.info('Nothing loaded, keeping the files')
+            self.processed(children)
+            return
+
+        if self.__election is not None:
+            written = self.__election.publish(files, lambda: self.write(nginx_config, files))
+        else:
+            written = self.write(nginx_config, files)
+        if self.__snapshot.due(written):
+            self.save_snapshot(files)
+        self.processed(children)
+
+    def load_snapshot(self):
+        """Load the pods from the snapshot, the files on disk are taken as written if they are those rendered from them."""
+        files = self.__snapshot.load(self.get_kv(koolie.nginx.render.NGINX_DIRECTORY, koolie.nginx.render.NGINX_DIRECTORY_DEFAULT))
+        if files is not None:
+            self.__written_files = files
+            self.view_changed()
+
+    def save_snapshot(self, files: koolie.nginx.render.Files):
+        """Save the fetched pods with the files rendered from them.
+        Until all the children have been applied, eg some buckets are still to be listed, the warm pods not added are kept."""
+        with self.__render_condition:
+            pods = {child: items for child, items in self.__pod_items.items() if not isinstance(items, (_Unfetched, koolie.nginx.snapshot.Warm))}
+        self.__snapshot.save(pods, files, self.__pods_synced or not self.__zookeeper_pods)
+
+    def write(self, nginx_config: koolie.nginx.render.NGINXConfig, files: koolie.nginx.render.Files) -> int:
+        """Write the files and reload or push the upstreams if any changed, returning how many were written or removed."""
+        nginx_config.dump_start()
+        written = nginx_config.write_files(files)
+        nginx_config.dump_stop()
+        _logger.info('Dumped [{}]'.format(nginx_config))
+        changes = None
+        if self.__upstreams_backend is not None and self.__written_files is not None:
+            changes = koolie.nginx.upstreams.membership_changes(self.__written_files, files)
+        self.__written_files = dict(files)
+        self.view_changed()
+        if written == 0:
+            return written
+        if changes is not None and self.__upstreams_backend.push(changes):
+            # Only upstream servers changed and NGINX has them, the files are for the next reload.
+            self.__fast_updates += 1
+            _logger.info('Pushed upstreams [{}] without reloading'.format(sorted(changes.keys())))
+            return written
+        if self.__reload_controller is not None:
+            self.__reload_controller.request()
+        return written
+
+    def apply_generation(self):
+        """A follower fetches and writes the current bundle if not already applied."""
+        if self.__election is not None:
+            self.__election.apply(lambda files: self.write(koolie.nginx.render.NGINXConfig(**self.__kwargs), files))
+
+    def __str__(self) -> str:
+        return '{}\nRenders [{}] Cancelled [{}] Forced [{}] Fetches [{}]\n{}\n{}\n{}\n{}'.format(
+            super().__str__(), self.__renders, self.__cancelled, self.__forced, self.__fetches,
+            self.__election, self.__snapshot, self.__heartbeats, self.__mailbox
+        )
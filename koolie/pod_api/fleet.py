@@ -0,0 +1,387 @@
+import argparse
+import array
+import collections
+import itertools
+import logging
+import math
+import operator
+import random
+import sys
+import threading
+import time
+import typing
+
+import koolie.pod_api.pod_status
+import koolie.zookeeper_api.koolie_zookeeper
+
+_logger = logging.getLogger(__name__)
+
+# A term is an item type and optionally its tag, eg ('nginx/upstream', None) or ('nginx/upstream', 'pod-1').
+Term = typing.Tuple[str, str]
+
+NO_HOSTNAME: int = -1
+
+
+# Translate a flag byte per row, 0 or 1, to and from the ASCII binary digits int() and bin() use.
+_FLAGS_TO_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+_DIGITS_TO_FLAGS = bytes.maketrans(b'01', b'\x00\x01')
+
+
+def bitmap_of(rows: typing.Iterable[int], size: int) -> int:
+    """The bitmap, as an int, with the bits of the rows set."""
+    bits = bytearray((size + 7) // 8)
+    for row in rows:
+        bits[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def bitmap_of_flags(flags: typing.Iterable[bool]) -> int:
+    """The bitmap of the rows whose flag is true, eg map(cutoff.__gt__, column).
+    The flags become a byte each, then binary digits, lowest row last, parsed by int()."""
+    digits = bytes(flags).translate(_FLAGS_TO_DIGITS)[::-1]
+    return int(digits, 2) if digits else 0
+
+
+def flags_of(bitmap: int) -> bytes:
+    """A byte per row, 1 if its bit is set in the bitmap, up to the highest bit set."""
+    return bin(bitmap)[:1:-1].encode('ascii').translate(_DIGITS_TO_FLAGS)
+
+
+def rows_of(bitmap: int) -> typing.Iterator[int]:
+    """The rows whose bits are set in the bitmap, in order."""
+    return itertools.compress(itertools.count(), flags_of(bitmap))
+
+
+class Fleet(object):
+
+    """A columnar snapshot of the pods' statuses, for fleet-wide queries without walking the decoded statuses.
+    Each pod is a row, the names and hostnames are interned, created, modified and heartbeat are float arrays, NaN if missing,
+    and every item type has a bitmap of the rows with it. Tags are mostly unique to a pod, so each type/tag keeps its row,
+    or the set of its rows if shared, made a bitmap when queried. Queries return bitmaps which combine with & and |.
+    Without numpy the queries are not vectorized, each compares every row once in Python. older_than() and overdue() compare with
+    map() and pack the flags with bitmap_of_flags(), names() and hostnames() decode with itertools.compress(), which is about
+    4-7 ms at 50k pods, the same order as walking the decoded statuses. The gain is the memory and combining the bitmaps, not speed.
+    The rows of removed pods are reused. Safe to update from one thread while others query."""
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.__lock = threading.RLock()
+
+        # Row to pod name, None if the row is free.
+        self.__names: typing.List[str] = list()
+        self.__rows: typing.Dict[str, int] = dict()
+        self.__free: typing.List[int] = list()
+
+        self.__hostnames: typing.List[str] = list()
+        self.__hostname_ids: typing.Dict[str, int] = dict()
+
+        self.__hostname = array.array('l')
+        self.__created = array.array('d')
+        self.__modified = array.array('d')
+        self.__heartbeat = array.array('d')
+
+        # Type to its bitmap of rows, mutable so a row is set or cleared in place.
+        self.__types: typing.Dict[str, bytearray] = dict()
+
+        # Type/tag to its row, or its set of rows when more than one pod has it.
+        self.__tags: typing.Dict[Term, typing.Union[int, typing.Set[int]]] = dict()
+
+        # Row to its terms, to clear them when the row is updated or removed.
+        self.__row_terms: typing.List[typing.Tuple[Term, ...]] = list()
+
+        self.__live = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.__rows)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.__rows
+
+    def row(self, name: str) -> int:
+        """Allocate the row of the pod if it has none, with the lock held."""
+        row = self.__rows.get(name)
+        if row is not None:
+            return row
+        if self.__free:
+            row = self.__free.pop()
+            self.__names[row] = name
+        else:
+            row = len(self.__names)
+            self.__names.append(name)
+            self.__hostname.append(NO_HOSTNAME)
+            self.__created.append(math.nan)
+            self.__modified.append(math.nan)
+            self.__heartbeat.append(math.nan)
+            self.__row_terms.append(tuple())
+        self.__rows[name] = row
+        self.set_bit(self.__live, row, True)
+        return row
+
+    @staticmethod
+    def set_bit(bits: bytearray, row: int, value: bool):
+        if row >> 3 >= len(bits):
+            if not value:
+                return
+            bits.extend(bytes((row >> 3) + 1 - len(bits)))
+        if value:
+            bits[row >> 3] |= 1 << (row & 7)
+        else:
+            bits[row >> 3] &= ~(1 << (row & 7)) & 0xff
+
+    def hostname_id(self, hostname: str) -> int:
+        if hostname is None:
+            return NO_HOSTNAME
+        hostname_id = self.__hostname_ids.get(hostname)
+        if hostname_id is None:
+            hostname_id = len(self.__hostnames)
+            self.__hostnames.append(hostname)
+            self.__hostname_ids[hostname] = hostname_id
+        return hostname_id
+
+    def update(self, name: str, items: list):
+        """Set the row of the pod from its decoded status."""
+        status = dict()
+        terms = set()
+        for item in items or list():
+            if not isinstance(item, dict) or 'type' not in item:
+                continue
+            item_type = str(item['type'])
+            if item_type == koolie.pod_api.pod_status.STATUS_TYPE:
+                status = item
+            terms.add((item_type, None))
+            if item.get('tag') is not None:
+                terms.add((item_type, str(item['tag'])))
+
+        def number(key: str) -> float:
+            value = status.get(key)
+            return float(value) if isinstance(value, (int, float)) else math.nan
+
+        with self.__lock:
+            row = self.row(name)
+            hostname = status.get('hostname')
+            self.__hostname[row] = self.hostname_id(None if hostname is None else str(hostname))
+            self.__created[row] = number(koolie.pod_api.pod_status.STATUS_CREATED_KEY)
+            self.__modified[row] = number(koolie.pod_api.pod_status.STATUS_MODIFIED_KEY)
+            self.__heartbeat[row] = number(koolie.pod_api.pod_status.STATUS_HEARTBEAT_KEY)
+            self.clear_terms(row)
+            for term in terms:
+                if term[1] is None:
+                    self.set_bit(self.__types.setdefault(term[0], bytearray()), row, True)
+                    continue
+                rows = self.__tags.get(term)
+                if rows is None:
+                    self.__tags[term] = row
+                elif isinstance(rows, set):
+                    rows.add(row)
+                else:
+                    self.__tags[term] = {rows, row}
+            self.__row_terms[row] = tuple(terms)
+
+    def touch(self, name: str, modified: float):
+        """The status of the pod was modified at the time, without decoding it."""
+        with self.__lock:
+            row = self.__rows.get(name)
+            if row is not None:
+                self.__modified[row] = modified
+
+    def remove(self, name: str) -> bool:
+        with self.__lock:
+            row = self.__rows.pop(name, None)
+            if row is None:
+                return False
+            self.clear_terms(row)
+            self.__row_terms[row] = tuple()
+            self.__names[row] = None
+            self.__hostname[row] = NO_HOSTNAME
+            self.__created[row] = math.nan
+            self.__modified[row] = math.nan
+            self.__heartbeat[row] = math.nan
+            self.set_bit(self.__live, row, False)
+            self.__free.append(row)
+            return True
+
+    def clear_terms(self, row: int):
+        for term in self.__row_terms[row]:
+            if term[1] is None:
+                bits = self.__types[term[0]]
+                self.set_bit(bits, row, False)
+                if not any(bits):
+                    del self.__types[term[0]]
+                continue
+            rows = self.__tags[term]
+            if isinstance(rows, set):
+                rows.discard(row)
+                if len(rows) == 1:
+                    self.__tags[term] = rows.pop()
+            else:
+                del self.__tags[term]
+
+    def live(self) -> int:
+        """The bitmap of every pod."""
+        with self.__lock:
+            return int.from_bytes(self.__live, 'little')
+
+    def terms(self) -> typing.List[Term]:
+        with self.__lock:
+            terms = [(item_type, None) for item_type in self.__types.keys()] + list(self.__tags.keys())
+            return sorted(terms, key=lambda term: (term[0], term[1] or ''))
+
+    def typed(self, item_type: str, tag: str = None) -> int:
+        """The bitmap of the pods with an item of the type, and the tag if given."""
+        with self.__lock:
+            if tag is None:
+                return int.from_bytes(self.__types.get(item_type, b''), 'little')
+            rows = self.__tags.get((item_type, tag))
+            if rows is None:
+                return 0
+            return 1 << rows if isinstance(rows, int) else bitmap_of(rows, len(self.__names))
+
+    def older_than(self, seconds: float, now: float = None) -> int:
+        """The bitmap of the pods whose status was last modified more than the seconds ago."""
+        cutoff = float((time.time() if now is None else now) - seconds)
+        with self.__lock:
+            return bitmap_of_flags(map(cutoff.__gt__, self.__modified))
+
+    def overdue(self, misses: float = 1, now: float = None) -> int:
+        """The bitmap of the pods which have missed more than the number of their heartbeats."""
+        now = float(time.time() if now is None else now)
+        with self.__lock:
+            due = map(operator.add, self.__modified, map(operator.mul, self.__heartbeat, itertools.repeat(float(misses))))
+            return bitmap_of_flags(map(now.__gt__, due))
+
+    def hostname(self, hostname: str) -> int:
+        """The bitmap of the pods on the host."""
+        with self.__lock:
+            hostname_id = self.__hostname_ids.get(hostname)
+            if hostname_id is None:
+                return 0
+            return bitmap_of([row for row, value in enumerate(self.__hostname) if value == hostname_id], len(self.__names))
+
+    def hostnames(self, bitmap: int = None) -> typing.Dict[str, int]:
+        """The number of pods per hostname, of the pods in the bitmap if given."""
+        with self.__lock:
+            if bitmap is None:
+                counts = collections.Counter(self.__hostname)
+            else:
+                counts = collections.Counter(itertools.compress(self.__hostname, flags_of(bitmap)))
+            counts.pop(NO_HOSTNAME, None)
+            return {self.__hostnames[hostname_id]: count for hostname_id, count in counts.items()}
+
+    def names(self, bitmap: int) -> typing.List[str]:
+        """The names of the pods in the bitmap, in row order."""
+        with self.__lock:
+            # The rows of removed pods have no name.
+            return list(filter(None, itertools.compress(self.__names, flags_of(bitmap))))
+
+    @staticmethod
+    def count(bitmap: int) -> int:
+        return bin(bitmap).count('1')
+
+    def select(self, item_type: str = None, tag: str = None, older_than: float = None, hostname: str = None, overdue: float = None, now: float = None) -> int:
+        """The bitmap of the pods matching every criterion given."""
+        with self.__lock:
+            bitmap = self.live()
+            if item_type is not None:
+                bitmap &= self.typed(item_type, tag)
+            if hostname is not None:
+                bitmap &= self.hostname(hostname)
+            if older_than is not None:
+                bitmap &= self.older_than(older_than, now)
+            if overdue is not None:
+                bitmap &= self.overdue(overdue, now)
+            return bitmap
+
+    def query(self, item_type: str = None, tag: str = None, older_than: float = None, hostname: str = None, overdue: float = None, now: float = None) -> typing.List[str]:
+        """The names of the pods matching every criterion given."""
+        with self.__lock:
+            return self.names(self.select(item_type, tag, older_than, hostname, overdue, now))
+
+    def memory(self) -> int:
+        """The bytes held by the columns, bitmaps and indexes, not counting the strings."""
+        with self.__lock:
+            columns = [self.__hostname, self.__created, self.__modified, self.__heartbeat]
+            return (
+                sum(column.itemsize * len(column) for column in columns) +
+                sum(len(bits) for bits in self.__types.values()) + len(self.__live) +
+                sys.getsizeof(self.__tags) + sum(sys.getsizeof(rows) for rows in self.__tags.values() if isinstance(rows, set)) +
+                sys.getsizeof(self.__names) + sys.getsizeof(self.__row_terms) + sum(sys.getsizeof(terms) for terms in self.__row_terms)
+            )
+
+    def __str__(self) -> str:
+        return 'Fleet Pods [{}] Hostnames [{}] Terms [{}] Memory [{}]'.format(len(self.__rows), len(self.__hostnames), len(self.__types) + len(self.__tags), self.memory())
+
+
+def load_fleet(zoo_keeper: koolie.zookeeper_api.koolie_zookeeper.AbstractKoolieZooKeeper, path: str, buckets: int = 0) -> Fleet:
+    """A fleet of the pods under the path, reading every status once."""
+    fleet = Fleet()
+    path = path.rstrip('/')
+    children = zoo_keeper.get_children(path) or list()
+    if buckets > 0:
+        children = ['{}/{}'.format(bucket, child) for bucket in children for child in zoo_keeper.get_children('{}/{}'.format(path, bucket)) or list()]
+    for child in children:
+        data = zoo_keeper.get_node_value('{}/{}'.format(path, child))
+        if data is not None:
+            fleet.update(child, koolie.pod_api.pod_status.decode_data(data))
+    return fleet
+
+
+def synthetic_fleet(pods: int, hosts: int = 100, seed: int = 1) -> typing.Tuple[Fleet, typing.Dict[str, list]]:
+    """A fleet of made up pods, and their statuses as dicts for comparison."""
+    rng = random.Random(seed)
+    now = time.time()
+    fleet = Fleet()
+    statuses = dict()
+    for i in range(pods):
+        name = 'pod-{:06d}'.format(i)
+        statuses[name] = [
+            {
+                'type': koolie.pod_api.pod_status.STATUS_TYPE,
+                koolie.pod_api.pod_status.STATUS_CREATED_KEY: now - 3600,
+                koolie.pod_api.pod_status.STATUS_MODIFIED_KEY: now - rng.uniform(0, 60),
+                koolie.pod_api.pod_status.STATUS_HEARTBEAT_KEY: 10,
+                'hostname': 'host-{:03d}'.format(rng.randrange(hosts))
+            },
+            {'type': 'nginx/upstream', 'name': 'upstream-{}'.format(i % 20), 'tag': name, 'config': 'server {}:80;'.format(name)}
+        ]
+        fleet.update(name, statuses[name])
+    return fleet, statuses
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Query the status of the pods in ZooKeeper, or of a synthetic fleet with --synthetic')
+    parser.add_argument('--zookeeper-hosts', type=str, default=koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_LOCALHOST)
+    parser.add_argument('--path', type=str, default=koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_PODS_PATH_DEFAULT)
+    parser.add_argument('--buckets', type=int, default=koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_PODS_BUCKETS_DEFAULT)
+    parser.add_argument('--synthetic', type=int, default=0, help='Query this many made up pods instead')
+    parser.add_argument('--type', type=str, help='Pods with an item of this type')
+    parser.add_argument('--tag', type=str, help='Pods with an item of the type with this tag')
+    parser.add_argument('--older-than', type=float, help='Pods whose status was modified more than this many seconds ago')
+    parser.add_argument('--hostname', type=str, help='Pods on this host')
+    parser.add_argument('--overdue', type=float, help='Pods which have missed more than this many heartbeats')
+    parser.add_argument('--hostnames', action='store_true', help='Count the matching pods per hostname')
+    args = parser.parse_args()
+
+    if args.synthetic > 0:
+        fleet, _ = synthetic_fleet(args.synthetic)
+    else:
+        zoo_keeper = koolie.zookeeper_api.koolie_zookeeper.create_koolie_zookeeper(ZOOKEEPER_HOSTS=args.zookeeper_hosts)
+        zoo_keeper.start()
+        try:
+            fleet = load_fleet(zoo_keeper, args.path, args.buckets)
+        finally:
+            zoo_keeper.stop()
+    _logger.info(fleet)
+
+    started = time.perf_counter()
+    bitmap = fleet.select(args.type, args.tag, args.older_than, args.hostname, args.overdue)
+    if args.hostnames:
+        result = ['{} {}'.format(hostname, count) for hostname, count in sorted(fleet.hostnames(bitmap).items())]
+    else:
+        result = fleet.names(bitmap)
+    took = time.perf_counter() - started
+    for line in result:
+        print(line)
+    _logger.info('Matched [{}] of [{}] in [{:.3f}]ms'.format(fleet.count(bitmap), len(fleet), took * 1000))
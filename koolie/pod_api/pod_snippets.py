@@ -0,0 +1,186 @@
+import collections
+import copy
+import hashlib
+import json
+import logging
+import string
+import sys
+import threading
+import typing
+
+import yaml
+from kazoo.exceptions import NodeExistsError
+
+import koolie.config.files
+import koolie.zookeeper_api.koolie_zookeeper
+
+_logger = logging.getLogger(__name__)
+
+# Publish the config files as snippet templates and reference them from the status, default is False.
+# Pods with the same config files then share one copy of each.
+POD_SNIPPETS: str = 'pod_snippets'
+
+# Snippet templates are stored under this node by digest, eg /koolie/snippets/<sha256>.
+SNIPPETS_PATH: str = 'snippets_path'
+SNIPPETS_PATH_DEFAULT: str = '/koolie/snippets'
+
+# The number of raw templates a SnippetStore keeps, and of templates parsed with a pod's tokens.
+SNIPPETS_CACHE_SIZE: str = 'snippets_cache_size'
+SNIPPETS_CACHE_SIZE_DEFAULT: int = 1024
+
+SNIPPET_TYPE: str = 'koolie/snippet'
+SNIPPET_DIGEST_KEY: str = 'digest'
+SNIPPET_TOKENS_KEY: str = 'tokens'
+
+
+def template_digest(raw: str) -> str:
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def template_tokens(raw: str) -> typing.Set[str]:
+    """The names of the tokens the template uses."""
+    names = set()
+    for match in string.Template.pattern.finditer(raw):
+        name = match.group('named') or match.group('braced')
+        if name is not None:
+            names.add(name)
+    return names
+
+
+def snippet_reference(digest: str, raw: str, tokens: koolie.config.files.Tokens) -> dict:
+    """The status item referencing the template, with just the tokens it uses."""
+    tokens = koolie.config.files.picklable_tokens(tokens) or dict()
+    return {
+        'type': SNIPPET_TYPE,
+        SNIPPET_DIGEST_KEY: digest,
+        SNIPPET_TOKENS_KEY: {name: tokens[name] for name in sorted(template_tokens(raw)) if name in tokens}
+    }
+
+
+def publish_snippet(zoo_keeper: koolie.zookeeper_api.koolie_zookeeper.AbstractKoolieZooKeeper, raw: str, snippets_path: str = SNIPPETS_PATH_DEFAULT) -> str:
+    """Store the template under its digest if not already stored, return the digest."""
+    digest = template_digest(raw)
+    try:
+        zoo_keeper.create_node('{}/{}'.format(snippets_path.rstrip('/'), digest), raw.encode('utf-8'), make_path=True)
+    except NodeExistsError:
+        pass
+    return digest
+
+
+def tokens_digest(tokens: koolie.config.files.Tokens) -> str:
+    return hashlib.sha256(json.dumps(tokens, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _cache(cache: collections.OrderedDict, key, value, size: int):
+    cache[key] = value
+    while len(cache) > size:
+        cache.popitem(last=False)
+
+
+class SnippetStore(object):
+
+    """Expand the snippet references in pod statuses.
+    Each template is fetched once. It is substituted then parsed as `koolie.config.files.read_file` does, so a snippet renders
+    the same as the file would inline, and parsed once per distinct set of tokens."""
+
+    def __init__(self, zoo_keeper: koolie.zookeeper_api.koolie_zookeeper.AbstractKoolieZooKeeper, **kwargs) -> None:
+        super().__init__()
+
+        self.__zoo_keeper = zoo_keeper
+
+        self.__snippets_path: str = kwargs.get(SNIPPETS_PATH, SNIPPETS_PATH_DEFAULT).rstrip('/')
+
+        self.__cache_size: int = kwargs.get(SNIPPETS_CACHE_SIZE, SNIPPETS_CACHE_SIZE_DEFAULT)
+
+        self.__lock = threading.Lock()
+
+        # Digest to raw template, least recently used first.
+        self.__templates: collections.OrderedDict = collections.OrderedDict()
+
+        # (digest, tokens digest) to the parsed template, least recently used first.
+        self.__parsed: collections.OrderedDict = collections.OrderedDict()
+
+        self.__fetches = 0
+        self.__hits = 0
+        self.__parses = 0
+
+    def fetches(self) -> int:
+        return self.__fetches
+
+    def hits(self) -> int:
+        return self.__hits
+
+    def parses(self) -> int:
+        return self.__parses
+
+    def template(self, digest: str) -> str:
+        """The raw template, fetched if not cached."""
+        with self.__lock:
+            if digest in self.__templates:
+                self.__templates.move_to_end(digest)
+                self.__hits += 1
+                return self.__templates[digest]
+        data = self.__zoo_keeper.get_node_value('{}/{}'.format(self.__snippets_path, digest))
+        self.__fetches += 1
+        if data is None:
+            raise KeyError('Snippet [{}] not found'.format(digest))
+        raw = data.decode('utf-8')
+        if template_digest(raw) != digest:
+            raise ValueError('Snippet digest mismatch [{}]'.format(digest))
+        with self.__lock:
+            _cache(self.__templates, digest, raw, self.__cache_size)
+        return raw
+
+    def parsed(self, digest: str, tokens: koolie.config.files.Tokens) -> object:
+        """The template substituted with the tokens and parsed, a copy the caller may change."""
+        key = (digest, tokens_digest(tokens))
+        with self.__lock:
+            if key in self.__parsed:
+                self.__parsed.move_to_end(key)
+                return copy.deepcopy(self.__parsed[key])
+        data = yaml.safe_load(koolie.config.files.substitute(self.template(digest), tokens))
+        self.__parses += 1
+        with self.__lock:
+            _cache(self.__parsed, key, data, self.__cache_size)
+        return copy.deepcopy(data)
+
+    def expand(self, data: object) -> object:
+        """Replace each snippet reference in the status with the template's items, substituted with the reference's tokens."""
+        if not isinstance(data, list):
+            return data
+        expanded = list()
+        for item in data:
+            if isinstance(item, dict) and item.get('type') == SNIPPET_TYPE:
+                try:
+                    items = self.parsed(item[SNIPPET_DIGEST_KEY], item.get(SNIPPET_TOKENS_KEY) or dict())
+                except Exception as exception:
+                    _logger.warning('Failed to expand snippet [{}] exception [{}]'.format(item.get(SNIPPET_DIGEST_KEY), exception))
+                    continue
+                if isinstance(items, list):
+                    expanded.extend(items)
+                else:
+                    expanded.append(items)
+            else:
+                expanded.append(item)
+        return expanded
+
+    def __str__(self) -> str:
+        return 'Snippets [{}] Cached [{}] Parsed [{}] Fetches [{}] Hits [{}] Parses [{}]'.format(
+            self.__snippets_path, len(self.__templates), len(self.__parsed), self.__fetches, self.__hits, self.__parses
+        )
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    import koolie.zookeeper_api.memory_zookeeper
+
+    with koolie.zookeeper_api.memory_zookeeper.UsingMemory() as zoo_keeper:
+        store = SnippetStore(zoo_keeper)
+        for file_name in sys.argv[1:]:
+            with open(file_name) as file:
+                raw = file.read()
+            reference = snippet_reference(publish_snippet(zoo_keeper, raw), raw, {'os_environ_hostname': 'localhost'})
+            _logger.info(reference)
+            _logger.info(store.expand([reference]))
+        _logger.info(store)
@@ -2,13 +2,20 @@ import koolie
 import logging
 import string
 import sys
+import threading
 import time
 import typing
 import yaml
 
+import kazoo.exceptions
+import kazoo.protocol.states
+
+import koolie.config.files
 import koolie.config.items
+import koolie.pod_api.pod_snippets
 import koolie.tools.abstract_service
 import koolie.tools.common
+import koolie.tools.file_watch
 import koolie.zookeeper_api.koolie_zookeeper
 
 _logger = logging.getLogger(__name__)
@@ -34,7 +41,7 @@ def encode_data(data) -> str:
 def decode_data(data) -> object:
     """Decode the given YAML UTF-8 encoded data, returning an object."""
     try:
-        return yaml.load(data.decode('utf-8'))
+        return yaml.safe_load(data.decode('utf-8'))
     except Exception as exception:
         _logger.warning('Failed to decode data with exception, type [{}] value [{}]'.format(exception, type(data), data))
         return None
@@ -64,14 +71,21 @@ class PushStatus(koolie.tools.abstract_service.SleepService):
 
     CONFIG_FILE = 'config_file'
 
+    # Watch the config files, pushing the status again when one changes rather than waiting for a restart.
+    CONFIG_FILES_WATCH = 'config_files_watch'
+
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
 
         self.__kwargs = kwargs
 
-        self.__zoo_keeper = koolie.zookeeper_api.koolie_zookeeper.UsingKazoo(**kwargs)
+        self.__zoo_keeper = koolie.zookeeper_api.koolie_zookeeper.create_koolie_zookeeper(**kwargs)
 
-        self.__path = '/koolie/pods/{}'.format(kwargs.get('k8s_pod_name', self.name()))
+        self.__path = koolie.zookeeper_api.koolie_zookeeper.pod_path(
+            kwargs.get('k8s_pod_name', self.name()),
+            kwargs.get(koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_PODS_PATH, koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_PODS_PATH_DEFAULT),
+            kwargs.get(koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_PODS_BUCKETS, koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_PODS_BUCKETS_DEFAULT)
+        )
 
         # The data sent to the Zookeeper ephemeral node.
         self.__data: typing.List[..., ...] = list()
@@ -84,29 +98,77 @@ class PushStatus(koolie.tools.abstract_service.SleepService):
 
         self.__items = koolie.config.items.ReadItems()
 
+        self.__file_watch: koolie.tools.file_watch.FileWatch = None
+
+        self.__lost = False
+
+        # Guards the data as wake() and config_file_changed() run in different threads.
+        self.__rlock = threading.RLock()
+
     def before_start(self):
         try:
             self.__zoo_keeper.start()
             self.__items.read(item_files=self.get_kv('item_files', ''))
             self.__data = self.create_status()
-            self.__zoo_keeper.create_ephemeral_node(self.__path, encode_data(self.__data))
+            self.__zoo_keeper.create_ephemeral_node(self.__path, encode_data(self.__data), make_path=True)
+            self.__zoo_keeper.add_state_listener(self.state_changed)
+            if self.get_kv(PushStatus.CONFIG_FILES_WATCH, False):
+                self.__file_watch = koolie.tools.file_watch.FileWatch(
+                    abstract_service_name='{}_file_watch'.format(self.name()),
+                    file_watch_files=self.__kwargs.get('config_files', list()),
+                    file_watch_callback=self.config_file_changed
+                )
+                self.__file_watch.start()
             super().before_start()
         except Exception as exception:
             koolie.tools.common.log_exception(exception, logger=_logger)
 
     def before_stop(self):
+        if self.__file_watch is not None:
+            self.__file_watch.stop()
+            self.__file_watch = None
+        self.__zoo_keeper.remove_state_listener(self.state_changed)
+        try:
+            # The session may be shared and so outlive this service, so remove the ephemeral node explicitly.
+            self.__zoo_keeper.delete_node(self.__path)
+        except Exception as exception:
+            _logger.warning('Failed to delete node [{}] exception [{}]'.format(self.__path, exception))
         self.__zoo_keeper.stop()
         super().before_stop()
 
     def wake(self):
         try:
-            self.__data = self.update_status()
-            self.__zoo_keeper.set_node_value(self.__path, encode_data(self.__data))
+            with self.__rlock:
+                self.__data = self.update_status()
+                self.__zoo_keeper.set_node_value(self.__path, encode_data(self.__data))
+        except kazoo.exceptions.NoNodeError:
+            _logger.info('Node [{}] missing, creating it again'.format(self.__path))
+            self.create_node()
         except Exception as exception:
             koolie.tools.common.log_exception(exception, logger=_logger)
         finally:
             super().wake()
 
+    def state_changed(self, state):
+        """The ephemeral node goes with a lost session, so create it again once reconnected.
+        Called in the ZooKeeper event thread, so the node is created in its own thread."""
+        if state == kazoo.protocol.states.KazooState.LOST:
+            self.__lost = True
+        elif state == kazoo.protocol.states.KazooState.CONNECTED and self.__lost:
+            self.__lost = False
+            threading.Thread(group=None, target=self.create_node, name='{}-create-node'.format(self.name())).start()
+
+    def create_node(self):
+        """Create the ephemeral node with the current data, or set the data if it exists."""
+        try:
+            with self.__rlock:
+                try:
+                    self.__zoo_keeper.create_ephemeral_node(self.__path, encode_data(self.__data), make_path=True)
+                except kazoo.exceptions.NodeExistsError:
+                    self.__zoo_keeper.set_node_value(self.__path, encode_data(self.__data))
+        except Exception as exception:
+            koolie.tools.common.log_exception(exception, logger=_logger)
+
     def create_status(self) -> dict:
         _logger.debug('create_status()')
 
@@ -117,6 +179,8 @@ class PushStatus(koolie.tools.abstract_service.SleepService):
             'type': PushStatus.TYPE,
             PushStatus.CREATED: timestamp,
             PushStatus.MODIFIED: timestamp,
+            # The status is updated every wake, consumers evict the pod once it misses enough of them.
+            STATUS_HEARTBEAT_KEY: self.wake_interval(),
             'hostname': self.__kwargs.get('os_environ_hostname')
         }
         data.append(self.__status)
@@ -126,25 +190,36 @@ class PushStatus(koolie.tools.abstract_service.SleepService):
             self.__config_files = list()
             config_files = self.__kwargs.get('config_files', list())
             assert isinstance(config_files, list)
-            for config_file in config_files:
+            if self.get_kv(koolie.pod_api.pod_snippets.POD_SNIPPETS, False):
+                for config_file in config_files:
+                    try:
+                        self.__config_files.append(self.snippet_item(config_file))
+                    except Exception as exception:
+                        _logger.warning('Failed to publish config file [{}] exception [{}]'.format(config_file, exception))
+                data.extend(self.__config_files)
+                return data
+            results = koolie.config.files.read_files(
+                config_files,
+                tokens=self.__kwargs,
+                workers=self.__kwargs.get(koolie.config.files.LOAD_WORKERS),
+                cache=koolie.config.files.cache_for(self.__kwargs)
+            )
+            for result in results:
                 try:
-                    _logger.debug('Config file [{}]'.format(config_file))
+                    _logger.debug('Config file [{}]'.format(result.name))
+                    assert result.error is None, result.error
 
-                    assert isinstance(config_file, str)
-                    with open(file=config_file, mode='r') as file:
-                        config_file_data = file.read()
-
-                    config_file_yaml = yaml.load(self.substitute(config_file_data))
+                    config_file_yaml = result.data
                     _logger.debug('YAML [{}]'.format(config_file_yaml))
 
                     assert isinstance(config_file_yaml, list)
                     for d in config_file_yaml:
                         assert isinstance(d, dict)
-                        d[PushStatus.CONFIG_FILE] = config_file
+                        d[PushStatus.CONFIG_FILE] = result.name
 
                     self.__config_files.extend(config_file_yaml)
                 except Exception as exception:
-                    _logger.warning('Failed to load config file [{}] exception [{}]'.format(config_file, exception))
+                    _logger.warning('Failed to load config file [{}] exception [{}]'.format(result.name, exception))
         except Exception as exception:
             _logger.warning('Failed to load config files exception [{}]'.format(exception))
 
@@ -153,6 +228,64 @@ class PushStatus(koolie.tools.abstract_service.SleepService):
 
         return data
 
+    def snippet_item(self, config_file: str) -> dict:
+        """Publish the config file as a snippet template and return the item referencing it."""
+        with open(file=config_file, mode='r') as file:
+            raw = file.read()
+        digest = koolie.pod_api.pod_snippets.publish_snippet(
+            self.__zoo_keeper,
+            raw,
+            self.__kwargs.get(koolie.pod_api.pod_snippets.SNIPPETS_PATH, koolie.pod_api.pod_snippets.SNIPPETS_PATH_DEFAULT)
+        )
+        item = koolie.pod_api.pod_snippets.snippet_reference(digest, raw, self.__kwargs)
+        item[PushStatus.CONFIG_FILE] = config_file
+        return item
+
+    def config_file_changed(self, config_file: str):
+        """Re-read the changed config file and push the updated status.
+        The ZooKeeper session and ephemeral node are kept, if the file fails to load the previous content is kept."""
+        _logger.info('Config file changed [{}]'.format(config_file))
+        try:
+            if self.get_kv(koolie.pod_api.pod_snippets.POD_SNIPPETS, False):
+                items = [self.snippet_item(config_file)]
+            else:
+                result = koolie.config.files.read_files(
+                    [config_file],
+                    tokens=self.__kwargs,
+                    cache=koolie.config.files.cache_for(self.__kwargs)
+                )[0]
+                assert result.error is None, result.error
+                assert isinstance(result.data, list)
+                for d in result.data:
+                    assert isinstance(d, dict)
+                    d[PushStatus.CONFIG_FILE] = config_file
+                items = result.data
+        except Exception as exception:
+            _logger.warning('Failed to reload config file [{}] exception [{}]'.format(config_file, exception))
+            return
+        with self.__rlock:
+            self.__config_files = self.replace_config_file(self.__config_files, config_file, items, 0)
+            self.__data = self.replace_config_file(self.__data, config_file, items, 1)
+            self.__status[PushStatus.MODIFIED] = time.time()
+            self.__zoo_keeper.set_node_value(self.__path, encode_data(self.__data))
+
+    def replace_config_file(self, data: list, config_file: str, items: list, start: int) -> list:
+        """Replace the items from the config file, keeping the items in config files order."""
+        def config_file_of(d):
+            return d.get(PushStatus.CONFIG_FILE) if isinstance(d, dict) else None
+
+        config_files = self.__kwargs.get('config_files', list())
+        positions = [i for i, d in enumerate(data) if config_file_of(d) == config_file]
+        if positions:
+            index = positions[0]
+        else:
+            earlier = set(config_files[:config_files.index(config_file)])
+            index = max([i + 1 for i, d in enumerate(data) if config_file_of(d) in earlier], default=start)
+        replaced = [d for d in data[:index] if config_file_of(d) != config_file]
+        replaced.extend(items)
+        replaced.extend(d for d in data[index:] if config_file_of(d) != config_file)
+        return replaced
+
     def update_status(self) -> dict:
         """Update the status.
         Set the MODIFIED value to timestamp."""
@@ -1,10 +1,9 @@
 import logging
 import socket
-import string
 import sys
 import typing
-import yaml
 
+import koolie.config.files
 import koolie.pod_api.pod_status
 
 _logger = logging.getLogger(__name__)
@@ -32,18 +31,22 @@ class PushNGINXConfig(koolie.pod_api.pod_status.PushStatus):
 
     def cache_files(self, file_names: typing.List[str]):
         """Cache the given files."""
+        cache = koolie.config.files.cache_for(self._kwargs)
         for file_name in file_names:
             try:
-                with open(file=file_name, mode='r') as y:
-                    template = string.Template(y.read())
-                    r = template.substitute(self._kwargs)
-                    self._file_cache.append(yaml.load(r))
+                if cache is None:
+                    result = koolie.config.files.read_file(file_name, self._kwargs)
+                else:
+                    result = cache.read(file_name, self._kwargs)
+                assert result.error is None, result.error
+                self._file_cache.append(result.data)
             except Exception as exception:
                 _logger.warning('Failed to cache file [{}] with exception [{}].'.format(file_name, exception))
 
     def create_status(self) -> dict:
         data = super().create_status()
         try:
+            self.clear_files()
             self.cache_files(self.get_kv(PushNGINXConfig.POD_PUSH_CONFIG_FILE).split(','))
             data.extend(self._file_cache)
         except Exception as exception:
@@ -0,0 +1,66 @@
+import unittest
+
+import koolie.pod_api.fleet
+
+
+def status(hostname: str, modified: float, tag: str) -> list:
+    return [
+        {'type': 'pod/status', 'created': 0.0, 'modified': modified, 'heartbeat': 10, 'hostname': hostname},
+        {'type': 'nginx/upstream', 'name': 'ydos', 'tag': tag, 'config': 'server {}:80;'.format(tag)}
+    ]
+
+
+class TestFleet(unittest.TestCase):
+
+    def test_query(self):
+        fleet = koolie.pod_api.fleet.Fleet()
+        fleet.update('pod-1', status('host-a', 100.0, 'pod-1'))
+        fleet.update('pod-2', status('host-a', 50.0, 'pod-2'))
+        fleet.update('pod-3', status('host-b', 10.0, 'shared'))
+        fleet.update('pod-4', status('host-b', 100.0, 'shared'))
+        fleet.update('pod-5', [{'type': 'nginx/location', 'name': 'status'}])
+        self.assertEqual(len(fleet), 5)
+
+        self.assertEqual(fleet.query(older_than=30.0, now=100.0), ['pod-2', 'pod-3'])
+        self.assertEqual(fleet.query(older_than=30.0, hostname='host-b', now=100.0), ['pod-3'])
+        # Modified more than 3 heartbeats of 10s ago.
+        self.assertEqual(fleet.query(overdue=3, now=100.0), ['pod-2', 'pod-3'])
+        self.assertEqual(fleet.query(item_type='nginx/upstream'), ['pod-1', 'pod-2', 'pod-3', 'pod-4'])
+        self.assertEqual(fleet.query(item_type='nginx/upstream', tag='shared'), ['pod-3', 'pod-4'])
+        self.assertEqual(fleet.query(item_type='nginx/upstream', tag='pod-1'), ['pod-1'])
+        self.assertEqual(fleet.hostnames(), {'host-a': 2, 'host-b': 2})
+        self.assertEqual(fleet.hostnames(fleet.older_than(30.0, now=100.0)), {'host-a': 1, 'host-b': 1})
+
+        # The row is reused and the old values do not leak into it.
+        self.assertTrue(fleet.remove('pod-3'))
+        self.assertFalse(fleet.remove('pod-3'))
+        self.assertEqual(fleet.query(item_type='nginx/upstream', tag='shared'), ['pod-4'])
+        fleet.update('pod-6', [{'type': 'nginx/location', 'name': 'status'}])
+        self.assertEqual(fleet.query(older_than=30.0, now=100.0), ['pod-2'])
+        self.assertEqual(fleet.query(item_type='nginx/location'), ['pod-6', 'pod-5'])
+
+        # An update replaces the row's values.
+        fleet.update('pod-2', status('host-c', 100.0, 'pod-2'))
+        self.assertEqual(fleet.query(older_than=30.0, now=100.0), [])
+        self.assertEqual(fleet.hostnames(), {'host-a': 1, 'host-b': 1, 'host-c': 1})
+        fleet.touch('pod-2', 0.0)
+        self.assertEqual(fleet.query(older_than=30.0, now=100.0), ['pod-2'])
+
+    def test_bitmaps(self):
+        for rows in [[], [0], [7, 8], [1, 9, 63, 64, 200]]:
+            with self.subTest(rows=rows):
+                bitmap = koolie.pod_api.fleet.bitmap_of(rows, 256)
+                self.assertEqual(list(koolie.pod_api.fleet.rows_of(bitmap)), rows)
+                self.assertEqual(koolie.pod_api.fleet.bitmap_of_flags(row in rows for row in range(256)), bitmap)
+                self.assertEqual(koolie.pod_api.fleet.flags_of(bitmap).rstrip(b'\x00'), bytes(row in rows for row in range(256)).rstrip(b'\x00'))
+
+    def test_synthetic(self):
+        fleet, statuses = koolie.pod_api.fleet.synthetic_fleet(1000, seed=2)
+        now = max(items[0]['modified'] for items in statuses.values()) + 1
+        expected = sorted(name for name, items in statuses.items() if items[0]['modified'] < now - 30)
+        self.assertEqual(fleet.query(older_than=30, now=now), expected)
+        self.assertEqual(sum(fleet.hostnames().values()), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+import koolie.config.files
+
+import koolie.pod_api.pod_snippets
+import koolie.pod_api.pod_status
+from koolie.zookeeper_api.memory_zookeeper import MemoryEnsemble, UsingMemory
+
+
+class TestPodSnippets(unittest.TestCase):
+
+    def test_shared_template(self):
+        with open(os.path.join(os.path.dirname(__file__), 'pod_1_upstream.yaml')) as file:
+            raw = file.read()
+        ensemble = MemoryEnsemble()
+        with UsingMemory(memory_ensemble=ensemble) as zoo_keeper:
+            statuses = list()
+            for hostname in ['pod-1', 'pod-2', 'pod-3']:
+                digest = koolie.pod_api.pod_snippets.publish_snippet(zoo_keeper, raw)
+                reference = koolie.pod_api.pod_snippets.snippet_reference(digest, raw, {'os_environ_hostname': hostname, 'unused': 'x'})
+                self.assertEqual(reference['tokens'], {'os_environ_hostname': hostname})
+                statuses.append(koolie.pod_api.pod_status.encode_data([{'type': 'pod/status'}, reference]))
+            # One copy of the template however many pods use it.
+            self.assertEqual(zoo_keeper.get_children('/koolie/snippets'), [digest])
+
+            store = koolie.pod_api.pod_snippets.SnippetStore(zoo_keeper)
+            expanded = [store.expand(koolie.pod_api.pod_status.decode_data(status)) for status in statuses]
+            self.assertEqual((store.fetches(), store.hits(), store.parses()), (1, 2, 3))
+            self.assertEqual([items[1]['config'] for items in expanded], ['server pod-1/p1;\n', 'server pod-2/p1;\n', 'server pod-3/p1;\n'])
+            self.assertEqual([items[1]['tag'] for items in expanded], ['pod-1', 'pod-2', 'pod-3'])
+            # The cached template is not changed by the substitution.
+            self.assertIn('${os_environ_hostname}', store.template(digest))
+
+            # The same tokens are parsed once, each pod gets its own copy.
+            again = store.expand(koolie.pod_api.pod_status.decode_data(statuses[0]))
+            self.assertEqual(store.parses(), 3)
+            self.assertEqual(again, expanded[0])
+            again[1]['tag'] = 'changed'
+            self.assertEqual(store.expand(koolie.pod_api.pod_status.decode_data(statuses[0]))[1]['tag'], 'pod-1')
+
+    def test_same_as_inline(self):
+        """Tokens are substituted before parsing, as for a file read inline, so they can be numbers or keys."""
+        raw = '- type: nginx/upstream\n  name: ${name}\n  port: ${port}\n  ${key}: value\n'
+        tokens = {'name': 'ydos', 'port': '80', 'key': 'custom'}
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'upstream.yaml')
+            with open(file_name, 'w') as file:
+                file.write(raw)
+            inline = koolie.config.files.read_file(file_name, tokens).data
+        self.assertEqual(inline, [{'type': 'nginx/upstream', 'name': 'ydos', 'port': 80, 'custom': 'value'}])
+        with UsingMemory(memory_ensemble=MemoryEnsemble()) as zoo_keeper:
+            reference = koolie.pod_api.pod_snippets.snippet_reference(koolie.pod_api.pod_snippets.publish_snippet(zoo_keeper, raw), raw, tokens)
+            store = koolie.pod_api.pod_snippets.SnippetStore(zoo_keeper)
+            self.assertEqual(store.expand([reference]), inline)
+
+
+if __name__ == '__main__':
+    unittest.main()
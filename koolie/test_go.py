@@ -0,0 +1,45 @@
+import os
+import unittest
+import unittest.mock
+
+import koolie.go
+import koolie.pod_api.pod_snippets
+import koolie.pod_api.pod_status
+import koolie.zookeeper_api.koolie_zookeeper
+
+
+class TestGo(unittest.TestCase):
+
+    def test_pod_status(self):
+        args = koolie.go.parser.parse_args(['pod', 'status', '--config-files', 'a.yaml', '--config-files-watch'])
+        self.assertTrue(vars(args)[koolie.pod_api.pod_status.PushStatus.CONFIG_FILES_WATCH])
+        args = koolie.go.parser.parse_args(['pod', 'status'])
+        self.assertFalse(vars(args)[koolie.pod_api.pod_status.PushStatus.CONFIG_FILES_WATCH])
+
+    def test_zookeeper_pods_buckets(self):
+        key = koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_PODS_BUCKETS
+        for command in [['pod', 'status'], ['nginx', 'consume', 'zookeeper']]:
+            with self.subTest(command=command):
+                self.assertEqual(vars(koolie.go.parser.parse_args(command + ['--zookeeper-pods-buckets', '16']))[key], 16)
+                self.assertEqual(vars(koolie.go.parser.parse_args(command))[key], koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_PODS_BUCKETS_DEFAULT)
+
+    def test_snippets(self):
+        args = vars(koolie.go.parser.parse_args(['pod', 'status', '--pod-snippets', '--snippets-path', '/x/snippets']))
+        self.assertTrue(args[koolie.pod_api.pod_snippets.POD_SNIPPETS])
+        self.assertEqual(args[koolie.pod_api.pod_snippets.SNIPPETS_PATH], '/x/snippets')
+        self.assertFalse(vars(koolie.go.parser.parse_args(['pod', 'status']))[koolie.pod_api.pod_snippets.POD_SNIPPETS])
+        for command in [['pod', 'status'], ['nginx', 'consume', 'zookeeper']]:
+            with self.subTest(command=command):
+                self.assertEqual(vars(koolie.go.parser.parse_args(command))[koolie.pod_api.pod_snippets.SNIPPETS_PATH], koolie.pod_api.pod_snippets.SNIPPETS_PATH_DEFAULT)
+
+    def test_default_flag(self):
+        with unittest.mock.patch.dict(os.environ, {'CONFIG_FILES_WATCH': 'true'}):
+            self.assertTrue(koolie.go.default_flag('CONFIG_FILES_WATCH'))
+        with unittest.mock.patch.dict(os.environ, {'CONFIG_FILES_WATCH': '0'}):
+            self.assertFalse(koolie.go.default_flag('CONFIG_FILES_WATCH', True))
+        with unittest.mock.patch.dict(os.environ, clear=True):
+            self.assertTrue(koolie.go.default_flag('CONFIG_FILES_WATCH', True))
+
+
+if __name__ == '__main__':
+    unittest.main()
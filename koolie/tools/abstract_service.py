@@ -43,7 +43,7 @@ def remove_sig_handles(name: str):
     with _sig_rlock:
         handles: Handles
         for handles in _sig_handles.values():
-            handles.pop(name)
+            handles.pop(name, None)
 
 
 def go_sig_handle(signum: int, frame):
@@ -1,5 +1,6 @@
 import linecache
 import logging
+import math
 import os
 import string
 import sys
@@ -37,6 +38,15 @@ def if_none(v: object, o: object) -> object:
     return o if v is None else v
 
 
+def percentile(values: list, p: float) -> float:
+    """Return the p (0-100) percentile of the given values using the nearest rank, None if there are no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(p / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
 def substitute(source, **kwargs):
     template = string.Template(source)
     result = template.substitute(kwargs)
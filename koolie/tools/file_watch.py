@@ -0,0 +1,216 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+import typing
+
+import koolie.tools.abstract_service
+
+_logger = logging.getLogger(__name__)
+
+# inotify(7) event masks.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# The parent directories are watched, not the files, so a file replaced by a rename or a Kubernetes ConfigMap '..data' symlink swap is seen.
+DIRECTORY_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify(object):
+
+    """Minimal inotify(7) binding using ctypes, raises OSError if inotify is not available."""
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.__libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(self.__libc, 'inotify_init1'):
+            raise OSError('inotify not available')
+
+        self.__fd = self.__libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        # Watch descriptor to directory.
+        self.__watches: typing.Dict[int, str] = dict()
+
+    def fileno(self) -> int:
+        return self.__fd
+
+    def add_watch(self, path: str, mask: int = DIRECTORY_MASK) -> int:
+        wd = self.__libc.inotify_add_watch(self.__fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed [{}]'.format(path))
+        self.__watches[wd] = path
+        return wd
+
+    def read(self, timeout: float) -> typing.List[typing.Tuple[str, int, str]]:
+        """Return the (directory, mask, name) events read within the timeout."""
+        readable, _, _ = select.select([self.__fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buffer = os.read(self.__fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = list()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buffer):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(buffer, offset)
+            offset += _EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += length
+            events.append((self.__watches.get(wd), mask, name))
+        return events
+
+    def close(self):
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            self.__fd = -1
+
+
+def file_signature(name: str) -> typing.Tuple[int, int, int]:
+    """The (mtime, size, inode) of the file following symlinks, None if it does not exist."""
+    try:
+        stat = os.stat(name)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+    except OSError:
+        return None
+
+
+def directory_of(name: str) -> str:
+    return os.path.dirname(os.path.abspath(name))
+
+
+class FileWatch(koolie.tools.abstract_service.AbstractService):
+
+    """Watch files for changes, calling changed() with the name of each file whose content changed.
+    Uses inotify on the parent directories when available, otherwise polls.
+    A change is confirmed by comparing the file's (mtime, size, inode) so events for other files are ignored."""
+
+    FILE_WATCH_FILES = 'file_watch_files'
+
+    # Called with the name of each changed file, instead of overriding changed().
+    FILE_WATCH_CALLBACK = 'file_watch_callback'
+
+    FILE_WATCH_POLL_INTERVAL = 'file_watch_poll_interval'
+    FILE_WATCH_POLL_INTERVAL_DEFAULT = 1.0
+
+    # Wait this long after an event for more events, eg a ConfigMap update touching several files.
+    FILE_WATCH_SETTLE = 'file_watch_settle'
+    FILE_WATCH_SETTLE_DEFAULT = 0.01
+
+    # Force polling, eg for file systems inotify does not support.
+    FILE_WATCH_POLL = 'file_watch_poll'
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+
+        self.__files: typing.List[str] = list(self.get_kv(self.FILE_WATCH_FILES, []))
+
+        self.__callback: typing.Callable[[str], None] = self.get_kv(self.FILE_WATCH_CALLBACK)
+
+        self.__signatures: typing.Dict[str, typing.Tuple[int, int, int]] = dict()
+
+        self.__inotify: Inotify = None
+
+        self.__changes = 0
+
+    def files(self) -> typing.List[str]:
+        return list(self.__files)
+
+    def changes(self) -> int:
+        return self.__changes
+
+    def polling(self) -> bool:
+        return self.__inotify is None
+
+    def before_start(self):
+        self.__signatures = {name: file_signature(name) for name in self.__files}
+        if not self.get_kv(self.FILE_WATCH_POLL, False):
+            try:
+                self.__inotify = Inotify()
+                for directory in sorted({directory_of(name) for name in self.__files}):
+                    self.__inotify.add_watch(directory)
+            except Exception as exception:
+                _logger.warning('Failed to use inotify, polling [{}]'.format(exception))
+                self.close()
+        super().before_start()
+
+    def before_stop(self):
+        self.close()
+        super().before_stop()
+
+    def close(self):
+        if self.__inotify is not None:
+            self.__inotify.close()
+            self.__inotify = None
+
+    def check(self, names: typing.Iterable[str] = None) -> typing.List[str]:
+        """Compare the signatures of the given files, or all files, calling changed() for those that differ."""
+        changed = list()
+        for name in self.__files if names is None else names:
+            signature = file_signature(name)
+            if signature != self.__signatures.get(name):
+                self.__signatures[name] = signature
+                changed.append(name)
+        for name in changed:
+            self.__changes += 1
+            try:
+                if self.__callback is None:
+                    self.changed(name)
+                else:
+                    self.__callback(name)
+            except Exception as exception:
+                _logger.warning('Failed to handle change [{}] exception [{}]'.format(name, exception))
+        return changed
+
+    def go(self):
+        poll_interval = self.get_kv(self.FILE_WATCH_POLL_INTERVAL, self.FILE_WATCH_POLL_INTERVAL_DEFAULT)
+        settle = self.get_kv(self.FILE_WATCH_SETTLE, self.FILE_WATCH_SETTLE_DEFAULT)
+        while self.state() is koolie.tools.abstract_service.ServiceState.STARTED and self.pending_state() is not koolie.tools.abstract_service.ServiceState.STOPPED:
+            try:
+                if self.__inotify is None:
+                    time.sleep(poll_interval)
+                    self.check()
+                    continue
+                events = self.__inotify.read(poll_interval)
+                if not events:
+                    continue
+                if settle > 0:
+                    time.sleep(settle)
+                    events.extend(self.__inotify.read(0))
+                directories = {directory for directory, mask, name in events}
+                self.check([name for name in self.__files if directory_of(name) in directories])
+            except Exception as exception:
+                _logger.warning('Exception in go() [{}].'.format(exception))
+                time.sleep(poll_interval)
+
+    def changed(self, name: str):
+        """Called with the name of each changed file."""
+        _logger.info('Changed [{}]'.format(name))
+
+    def __str__(self) -> str:
+        return '{}\nFiles [{}] Polling [{}] Changes [{}]'.format(super().__str__(), len(self.__files), self.polling(), self.__changes)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    file_watch = FileWatch(file_watch_files=sys.argv[1:])
+    file_watch.duration(60)
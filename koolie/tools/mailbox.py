@@ -0,0 +1,140 @@
+import collections
+import logging
+import sys
+import threading
+import time
+import typing
+
+import koolie.tools.common
+
+_logger = logging.getLogger(__name__)
+
+# The number of distinct keys a mailbox holds before it overflows.
+MAILBOX_CAPACITY_DEFAULT: int = 65536
+
+# The number of lags kept for the percentiles.
+MAILBOX_LAGS: int = 1024
+
+
+class Mailbox(object):
+
+    """A bounded mailbox for a single consumer which collapses messages by key, the latest message for a key wins.
+    Producers, eg ZooKeeper watch callbacks, never block. When more than capacity keys are pending the messages are
+    dropped and the next take() reports the overflow, the consumer then recovers by taking a fresh snapshot."""
+
+    def __init__(self, capacity: int = MAILBOX_CAPACITY_DEFAULT) -> None:
+        super().__init__()
+
+        self.__capacity = capacity
+
+        self.__condition = threading.Condition(threading.Lock())
+
+        # Key to message, oldest first.
+        self.__messages: typing.Dict[object, object] = collections.OrderedDict()
+
+        # When the oldest pending message was put, None if empty.
+        self.__since: float = None
+
+        self.__overflowed = False
+
+        self.__puts = 0
+        self.__collapsed = 0
+        self.__overflows = 0
+        self.__takes = 0
+
+        # The seconds from the oldest message of each take being put to it being taken.
+        self.__lags: typing.Deque[float] = collections.deque(maxlen=MAILBOX_LAGS)
+
+    def capacity(self) -> int:
+        return self.__capacity
+
+    def put(self, key: object, message: object, replace: bool = False):
+        """Put the message, replacing any pending for the key, or all pending messages if replace."""
+        with self.__condition:
+            self.__puts += 1
+            if replace:
+                self.__collapsed += len(self.__messages)
+                self.__messages.clear()
+                self.__overflowed = False
+            elif key in self.__messages:
+                self.__collapsed += 1
+                del self.__messages[key]
+            if self.__since is None:
+                self.__since = time.monotonic()
+            self.__messages[key] = message
+            if len(self.__messages) > self.__capacity:
+                _logger.warning('Mailbox overflowed [{}]'.format(len(self.__messages)))
+                self.__overflows += 1
+                self.__messages.clear()
+                self.__overflowed = True
+            self.__condition.notify_all()
+
+    def take(self, timeout: float = None) -> typing.Tuple[typing.List[typing.Tuple[object, object]], bool]:
+        """Wait up to timeout for messages, then take all those pending as (key, message) oldest first, and whether it overflowed."""
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__messages or self.__overflowed, timeout)
+            messages = list(self.__messages.items())
+            overflowed = self.__overflowed
+            if messages or overflowed:
+                self.__takes += 1
+                self.__lags.append(time.monotonic() - self.__since)
+            self.__messages.clear()
+            self.__overflowed = False
+            self.__since = None
+            return messages, overflowed
+
+    def clear(self):
+        with self.__condition:
+            self.__messages.clear()
+            self.__overflowed = False
+            self.__since = None
+
+    def wake(self):
+        """Wake a consumer waiting in take(), eg to stop."""
+        with self.__condition:
+            self.__condition.notify_all()
+
+    def pending(self) -> int:
+        """The number of messages waiting, an overflow counts as one."""
+        with self.__condition:
+            return len(self.__messages) or (1 if self.__overflowed else 0)
+
+    def lag(self) -> float:
+        """The seconds the oldest pending message has been waiting."""
+        with self.__condition:
+            return 0.0 if self.__since is None else time.monotonic() - self.__since
+
+    def lags(self) -> typing.List[float]:
+        return list(self.__lags)
+
+    def puts(self) -> int:
+        return self.__puts
+
+    def collapsed(self) -> int:
+        """The number of messages replaced by a later message before being taken."""
+        return self.__collapsed
+
+    def overflows(self) -> int:
+        return self.__overflows
+
+    def takes(self) -> int:
+        return self.__takes
+
+    def __str__(self) -> str:
+        return 'Mailbox Pending [{}/{}] Puts [{}] Collapsed [{}] Overflows [{}] Takes [{}] Lag [{:.3f}] p99 [{}]'.format(
+            self.pending(), self.__capacity, self.__puts, self.__collapsed, self.__overflows, self.__takes,
+            self.lag(), koolie.tools.common.percentile(self.lags(), 99)
+        )
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    mailbox = Mailbox(capacity=4)
+    for i in range(10):
+        mailbox.put('child-{}'.format(i % 3), i)
+    _logger.info(mailbox.take(0))
+    for i in range(10):
+        mailbox.put('child-{}'.format(i), i)
+    _logger.info(mailbox.take(0))
+    _logger.info(mailbox)
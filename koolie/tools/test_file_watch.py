@@ -0,0 +1,55 @@
+import os
+import tempfile
+import time
+import unittest
+
+import koolie.tools.file_watch
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    until = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestFileWatch(unittest.TestCase):
+
+    def check_config_map(self, poll: bool):
+        """Update the files as a Kubernetes ConfigMap volume does, by swapping the '..data' symlink."""
+        with tempfile.TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, 'v1'))
+            for name in ['a.yaml', 'b.yaml']:
+                with open(os.path.join(directory, 'v1', name), 'w') as file:
+                    file.write('- v1\n')
+                os.symlink(os.path.join('..data', name), os.path.join(directory, name))
+            os.symlink('v1', os.path.join(directory, '..data'))
+
+            changed = list()
+            file_watch = koolie.tools.file_watch.FileWatch(
+                file_watch_files=[os.path.join(directory, 'a.yaml')],
+                file_watch_callback=changed.append,
+                file_watch_poll=poll,
+                file_watch_poll_interval=0.05
+            )
+            with file_watch:
+                self.assertEqual(file_watch.polling(), poll)
+                os.mkdir(os.path.join(directory, 'v2'))
+                for name in ['a.yaml', 'b.yaml']:
+                    with open(os.path.join(directory, 'v2', name), 'w') as file:
+                        file.write('- v2\n')
+                os.symlink('v2', os.path.join(directory, '..data_tmp'))
+                os.replace(os.path.join(directory, '..data_tmp'), os.path.join(directory, '..data'))
+                self.assertTrue(wait_for(lambda: changed == [os.path.join(directory, 'a.yaml')]))
+
+    def test_inotify(self):
+        self.check_config_map(False)
+
+    def test_poll(self):
+        self.check_config_map(True)
+
+
+if __name__ == '__main__':
+    unittest.main()
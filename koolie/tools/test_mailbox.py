@@ -0,0 +1,48 @@
+import threading
+import time
+import unittest
+
+import koolie.tools.mailbox
+
+
+class TestMailbox(unittest.TestCase):
+
+    def test_collapse(self):
+        mailbox = koolie.tools.mailbox.Mailbox(capacity=4)
+        for i in range(9):
+            mailbox.put('child-{}'.format(i % 3), i)
+        # The latest message for each key, in the order the keys were last put.
+        self.assertEqual(mailbox.take(0), ([('child-0', 6), ('child-1', 7), ('child-2', 8)], False))
+        self.assertEqual((mailbox.puts(), mailbox.collapsed(), mailbox.takes()), (9, 6, 1))
+        self.assertEqual(mailbox.take(0), ([], False))
+
+        mailbox.put('child-0', 0)
+        mailbox.put(None, 'snapshot', replace=True)
+        self.assertEqual(mailbox.take(0), ([(None, 'snapshot')], False))
+
+    def test_overflow(self):
+        mailbox = koolie.tools.mailbox.Mailbox(capacity=4)
+        for i in range(5):
+            mailbox.put('child-{}'.format(i), i)
+        self.assertEqual(mailbox.pending(), 1)
+        self.assertEqual(mailbox.take(0), ([], True))
+        self.assertEqual(mailbox.overflows(), 1)
+        self.assertEqual(mailbox.pending(), 0)
+
+    def test_wait(self):
+        mailbox = koolie.tools.mailbox.Mailbox()
+        threading.Timer(0.1, mailbox.put, ['child-0', 0]).start()
+        self.assertEqual(mailbox.take(5), ([('child-0', 0)], False))
+
+        # The lag is from the oldest message being put to it being taken.
+        mailbox.put('child-1', 1)
+        time.sleep(0.1)
+        mailbox.put('child-2', 2)
+        self.assertGreaterEqual(mailbox.lag(), 0.1)
+        mailbox.take(0)
+        self.assertGreaterEqual(mailbox.lags()[-1], 0.1)
+        self.assertEqual(mailbox.lag(), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
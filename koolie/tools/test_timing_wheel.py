@@ -0,0 +1,50 @@
+import unittest
+
+import koolie.tools.timing_wheel
+
+
+class TestTimingWheel(unittest.TestCase):
+
+    def test_advance(self):
+        wheel = koolie.tools.timing_wheel.TimingWheel(tick=1.0, slots=4, now=0.0)
+        wheel.schedule('a', 1.5)
+        wheel.schedule('b', 3.0)
+        # Beyond a turn of the wheel, so it shares a slot with 'b'.
+        wheel.schedule('c', 7.0)
+        self.assertEqual(len(wheel), 3)
+        self.assertEqual(wheel.deadline('a'), 2.0)
+
+        self.assertEqual(wheel.advance(1.9), [])
+        self.assertEqual(wheel.advance(2.0), ['a'])
+        self.assertEqual(wheel.advance(3.5), ['b'])
+        self.assertIn('c', wheel)
+        self.assertEqual(wheel.advance(6.9), [])
+        self.assertEqual(wheel.advance(7.0), ['c'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_schedule(self):
+        wheel = koolie.tools.timing_wheel.TimingWheel(tick=1.0, slots=4, now=0.0)
+        wheel.schedule('a', 2.0)
+        # Rescheduling replaces the deadline.
+        wheel.schedule('a', 5.0)
+        self.assertEqual(wheel.advance(2.0), [])
+        self.assertTrue(wheel.cancel('a'))
+        self.assertFalse(wheel.cancel('a'))
+        self.assertEqual(wheel.advance(5.0), [])
+
+        # A passed deadline expires on the next tick.
+        wheel.schedule('b', 1.0)
+        self.assertEqual(wheel.advance(5.5), [])
+        self.assertEqual(wheel.advance(6.0), ['b'])
+
+    def test_jump(self):
+        """Advancing more than a turn visits each slot once."""
+        wheel = koolie.tools.timing_wheel.TimingWheel(tick=1.0, slots=4, now=0.0)
+        for i in range(20):
+            wheel.schedule(i, float(i))
+        self.assertEqual(sorted(wheel.advance(10.0)), list(range(11)))
+        self.assertEqual(sorted(wheel.advance(100.0)), list(range(11, 20)))
+
+
+if __name__ == '__main__':
+    unittest.main()
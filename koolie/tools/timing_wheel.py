@@ -0,0 +1,102 @@
+import logging
+import math
+import sys
+import time
+import typing
+
+_logger = logging.getLogger(__name__)
+
+TIMING_WHEEL_TICK_DEFAULT: float = 1.0
+
+TIMING_WHEEL_SLOTS_DEFAULT: int = 512
+
+
+class TimingWheel(object):
+
+    """A hashed timing wheel of keys by deadline, for a single thread.
+    A deadline is rounded up to a tick and the key kept in the slot of that tick, deadlines beyond a turn of the wheel
+    share the slot and wait for their turn. Scheduling and cancelling are O(1), advancing visits only the slots of the ticks passed."""
+
+    def __init__(self, tick: float = TIMING_WHEEL_TICK_DEFAULT, slots: int = TIMING_WHEEL_SLOTS_DEFAULT, now: float = None) -> None:
+        super().__init__()
+
+        assert tick > 0 and slots > 0
+
+        self.__tick = tick
+
+        # The time of tick 0.
+        self.__origin: float = time.monotonic() if now is None else now
+
+        # The last tick advanced to.
+        self.__current = 0
+
+        # Each slot is the keys to their tick.
+        self.__slots: typing.List[typing.Dict[object, int]] = [dict() for i in range(slots)]
+
+        # Key to its tick.
+        self.__ticks: typing.Dict[object, int] = dict()
+
+    def tick(self) -> float:
+        return self.__tick
+
+    def __len__(self) -> int:
+        return len(self.__ticks)
+
+    def __contains__(self, key) -> bool:
+        return key in self.__ticks
+
+    def deadline(self, key) -> float:
+        """The deadline of the key rounded up to its tick, None if it is not scheduled."""
+        tick = self.__ticks.get(key)
+        return None if tick is None else self.__origin + tick * self.__tick
+
+    def schedule(self, key, deadline: float):
+        """Expire the key at the deadline, replacing its previous deadline. A deadline already passed expires on the next tick."""
+        self.cancel(key)
+        tick = max(math.ceil((deadline - self.__origin) / self.__tick), self.__current + 1)
+        self.__slots[tick % len(self.__slots)][key] = tick
+        self.__ticks[key] = tick
+
+    def cancel(self, key) -> bool:
+        tick = self.__ticks.pop(key, None)
+        if tick is None:
+            return False
+        del self.__slots[tick % len(self.__slots)][key]
+        return True
+
+    def advance(self, now: float = None) -> typing.List[object]:
+        """Advance to now, returning the keys whose deadline has passed, which are no longer scheduled."""
+        target = math.floor(((time.monotonic() if now is None else now) - self.__origin) / self.__tick)
+        if target <= self.__current:
+            return list()
+        if target - self.__current >= len(self.__slots):
+            indices = range(len(self.__slots))
+        else:
+            indices = (i % len(self.__slots) for i in range(self.__current + 1, target + 1))
+        expired = list()
+        for index in indices:
+            slot = self.__slots[index]
+            for key, tick in list(slot.items()):
+                if tick <= target:
+                    del slot[key]
+                    del self.__ticks[key]
+                    expired.append(key)
+        self.__current = target
+        return expired
+
+    def __str__(self) -> str:
+        return 'TimingWheel Tick [{}] Slots [{}] Keys [{}]'.format(self.__tick, len(self.__slots), len(self.__ticks))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    wheel = TimingWheel(tick=0.1, slots=8)
+    started = time.monotonic()
+    for i in range(10):
+        wheel.schedule('key-{}'.format(i), started + i * 0.25)
+    while len(wheel) > 0:
+        time.sleep(0.1)
+        for key in wheel.advance():
+            _logger.info('Expired [{}] after [{:.2f}]s'.format(key, time.monotonic() - started))
+    _logger.info(wheel)
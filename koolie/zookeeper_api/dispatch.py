@@ -0,0 +1,291 @@
+import collections
+import fnmatch
+import json
+import logging
+import re
+import sys
+import threading
+import time
+import typing
+
+import koolie.tools.abstract_service
+import koolie.tools.common
+
+_logging = logging.getLogger(__name__)
+
+# The number of (child, item) events a handler keeps pending, beyond that it drops them and resyncs from the current items.
+DISPATCH_QUEUE_CAPACITY_DEFAULT: int = 1024
+
+# The seconds a handler's worker waits for an event before checking whether it is stopping.
+POLL_INTERVAL: float = 0.5
+
+EVENT_ADD: str = 'add'
+EVENT_REMOVE: str = 'remove'
+
+# The status items a handler wants, the type is matched exactly and the tag and name as glob patterns, None matches anything.
+Selector = collections.namedtuple('Selector', ['type', 'tag', 'name'])
+Selector.__new__.__defaults__ = (None, None)
+
+# Called with the child and the item.
+Handle = typing.Callable[[str, dict], None]
+
+Match = typing.Callable[[object], bool]
+
+# The items of the children a handler wants, as (child, item).
+Snapshot = typing.Callable[[], typing.List[typing.Tuple[str, dict]]]
+
+
+def compile_pattern(pattern: str) -> Match:
+    """A glob pattern compiled to a match, None if it matches anything. Patterns without wildcards are compared."""
+    if pattern is None or pattern == '*':
+        return None
+    if not any(c in pattern for c in '*?['):
+        return lambda value: value == pattern
+    regex = re.compile(fnmatch.translate(pattern))
+    return lambda value: value is not None and regex.match(str(value)) is not None
+
+
+def item_key(child: str, item: dict) -> typing.Tuple[str, str]:
+    """Identifies the item of the child, an add and a remove of the same item have the same key."""
+    return child, json.dumps(item, sort_keys=True, default=str)
+
+
+class Handler(koolie.tools.abstract_service.AbstractService):
+
+    """A status handler with its own worker, so a slow handler only delays itself.
+    Pending events are collapsed by (child, item) as in `koolie.tools.mailbox.Mailbox`, the latest event for an item wins.
+    The handler keeps the items it has applied, so an add of an applied item or a remove of an unapplied one is not handled twice.
+    When more than capacity items are pending they are dropped and the handler resyncs, adding and removing the
+    difference between the items it has applied and the current items from the snapshot, so no add or remove is lost."""
+
+    def __init__(self, add: Handle, remove: Handle = None, capacity: int = DISPATCH_QUEUE_CAPACITY_DEFAULT, snapshot: Snapshot = None, **kwargs) -> None:
+        super().__init__(**kwargs)
+
+        self.__add = add
+
+        self.__remove = remove
+
+        self.__capacity = capacity
+
+        # Without a snapshot the pending events are never dropped.
+        self.__snapshot = snapshot
+
+        self.__condition = threading.Condition(threading.Lock())
+
+        # Item key to (event, child, item), oldest first.
+        self.__pending: typing.Dict[typing.Tuple[str, str], typing.Tuple[str, str, dict]] = collections.OrderedDict()
+
+        self.__resync = False
+
+        # Item key to the item, for the items added and not since removed. Only used by the worker.
+        self.__applied: typing.Dict[typing.Tuple[str, str], typing.Tuple[str, dict]] = dict()
+
+        self.__handled = 0
+        self.__collapsed = 0
+        self.__resyncs = 0
+        self.__failures = 0
+
+    def handled(self) -> int:
+        return self.__handled
+
+    def collapsed(self) -> int:
+        """The number of events replaced by a later event for the same item before being handled."""
+        return self.__collapsed
+
+    def resyncs(self) -> int:
+        return self.__resyncs
+
+    def failures(self) -> int:
+        return self.__failures
+
+    def pending(self) -> int:
+        """The number of events waiting, a resync counts as one."""
+        with self.__condition:
+            return len(self.__pending) + (1 if self.__resync else 0)
+
+    def applied(self) -> int:
+        return len(self.__applied)
+
+    def offer(self, event: str, child: str, item: dict):
+        """Queue the event, never blocks."""
+        key = item_key(child, item)
+        with self.__condition:
+            if key in self.__pending:
+                self.__collapsed += 1
+                del self.__pending[key]
+            self.__pending[key] = (event, child, item)
+            if len(self.__pending) > self.__capacity and self.__snapshot is not None:
+                _logging.warning('Handler [{}] overflowed [{}], resyncing'.format(self.name(), len(self.__pending)))
+                self.__pending.clear()
+                self.__resync = True
+            self.__condition.notify_all()
+
+    def take(self) -> typing.List[typing.Tuple[str, str, dict]]:
+        """Wait for the pending events and take them, after an overflow the difference from the snapshot instead."""
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__pending or self.__resync, POLL_INTERVAL)
+            events = list(self.__pending.values())
+            resync = self.__resync
+            self.__pending.clear()
+            self.__resync = False
+        if not resync:
+            return events
+        self.__resyncs += 1
+        current = {item_key(child, item): (child, item) for child, item in self.__snapshot()}
+        events = [(EVENT_REMOVE, child, item) for key, (child, item) in self.__applied.items() if key not in current]
+        events.extend((EVENT_ADD, child, item) for key, (child, item) in current.items() if key not in self.__applied)
+        _logging.info('Handler [{}] resynced [{}] events'.format(self.name(), len(events)))
+        return events
+
+    def handle(self, event: str, child: str, item: dict):
+        key = item_key(child, item)
+        if event == EVENT_ADD:
+            if key in self.__applied:
+                return
+            self.__applied[key] = (child, item)
+            handle = self.__add
+        else:
+            if self.__applied.pop(key, None) is None:
+                return
+            handle = self.__remove
+        if handle is None:
+            return
+        try:
+            handle(child, item)
+            self.__handled += 1
+        except Exception as exception:
+            self.__failures += 1
+            koolie.tools.common.log_exception(exception, logger=_logging)
+
+    def go(self):
+        while self.state() is koolie.tools.abstract_service.ServiceState.STARTED and self.pending_state() is not koolie.tools.abstract_service.ServiceState.STOPPED:
+            for event, child, item in self.take():
+                self.handle(event, child, item)
+
+    def __str__(self) -> str:
+        return '{}\nHandled [{}] Collapsed [{}] Resyncs [{}] Failures [{}] Pending [{}]'.format(
+            super().__str__(), self.__handled, self.__collapsed, self.__resyncs, self.__failures, self.pending()
+        )
+
+
+class Dispatcher(object):
+
+    """Dispatch status items to the handlers whose selectors match them.
+    The selectors are compiled once into an index by type, so an item is only tested against the selectors for its type and
+    those for any type. An item goes to a handler once however many of its selectors match.
+    The dispatcher keeps the current items of each child, those added and not removed, for the handlers to resync from."""
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.__lock = threading.Lock()
+
+        self.__handlers: typing.List[typing.Tuple[Handler, typing.Tuple[Selector, ...]]] = list()
+
+        # Type to the (tag match, name match, handler) of its selectors, the None type is the selectors for any type.
+        self.__index: typing.Dict[str, typing.Tuple[typing.Tuple[Match, Match, Handler], ...]] = None
+
+        # Child to the item keys to its current items.
+        self.__items: typing.Dict[str, typing.Dict[typing.Tuple[str, str], dict]] = dict()
+
+        self.__started = False
+
+        self.__dispatched = 0
+
+    def register(self, name: str, selectors: typing.Iterable[Selector], add: Handle, remove: Handle = None, capacity: int = DISPATCH_QUEUE_CAPACITY_DEFAULT) -> Handler:
+        """Add a handler, started with the dispatcher or now if it has been started."""
+        handler = Handler(add, remove, capacity, lambda: self.snapshot(handler), abstract_service_name=name)
+        with self.__lock:
+            self.__handlers.append((handler, tuple(selectors)))
+            self.__index = None
+            started = self.__started
+        if started:
+            handler.start()
+        return handler
+
+    def handlers(self) -> typing.List[Handler]:
+        with self.__lock:
+            return [handler for handler, selectors in self.__handlers]
+
+    def dispatched(self) -> int:
+        return self.__dispatched
+
+    def compile(self) -> typing.Dict[str, typing.Tuple[typing.Tuple[Match, Match, Handler], ...]]:
+        with self.__lock:
+            if self.__index is None:
+                index = collections.defaultdict(list)
+                for handler, selectors in self.__handlers:
+                    for selector in selectors:
+                        index[selector.type].append((compile_pattern(selector.tag), compile_pattern(selector.name), handler))
+                self.__index = {item_type: tuple(entries) for item_type, entries in index.items()}
+            return self.__index
+
+    def matching(self, index, item: dict) -> typing.List[Handler]:
+        """The handlers with a selector matching the item, each once."""
+        handlers = list()
+        for tag_match, name_match, handler in index.get(item.get('type'), ()) + index.get(None, ()):
+            if any(handler is h for h in handlers):
+                continue
+            if tag_match is not None and not tag_match(item.get('tag')):
+                continue
+            if name_match is not None and not name_match(item.get('name')):
+                continue
+            handlers.append(handler)
+        return handlers
+
+    def dispatch(self, event: str, child: str, items: list) -> int:
+        """Offer each item to its handlers, returning the number of events queued."""
+        index = self.compile()
+        queued = 0
+        for item in items or list():
+            if not isinstance(item, dict):
+                continue
+            with self.__lock:
+                if event == EVENT_ADD:
+                    self.__items.setdefault(child, dict())[item_key(child, item)] = item
+                elif child in self.__items:
+                    self.__items[child].pop(item_key(child, item), None)
+                    if not self.__items[child]:
+                        del self.__items[child]
+            for handler in self.matching(index, item):
+                handler.offer(event, child, item)
+                queued += 1
+        self.__dispatched += queued
+        return queued
+
+    def snapshot(self, handler: Handler) -> typing.List[typing.Tuple[str, dict]]:
+        """The current items matching the handler's selectors, as (child, item)."""
+        index = self.compile()
+        with self.__lock:
+            items = [(child, item) for child, child_items in self.__items.items() for item in child_items.values()]
+        return [(child, item) for child, item in items if any(handler is h for h in self.matching(index, item))]
+
+    def start(self):
+        with self.__lock:
+            self.__started = True
+        for handler in self.handlers():
+            handler.start()
+
+    def stop(self):
+        with self.__lock:
+            self.__started = False
+        for handler in self.handlers():
+            handler.stop()
+
+    def __str__(self) -> str:
+        return 'Dispatcher Handlers [{}] Dispatched [{}]'.format(len(self.__handlers), self.__dispatched)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    dispatcher = Dispatcher()
+    dispatcher.register('fast', [Selector('nginx/upstream')], lambda child, item: _logging.info('fast [{}] [{}]'.format(child, item.get('name'))))
+    dispatcher.register('slow', [Selector('nginx/upstream', tag='pod-*')], lambda child, item: time.sleep(1), capacity=2)
+    dispatcher.start()
+    for i in range(5):
+        dispatcher.dispatch(EVENT_ADD, 'pod-{}'.format(i), [{'type': 'nginx/upstream', 'name': 'ydos', 'tag': 'pod-{}'.format(i)}])
+    time.sleep(3)
+    dispatcher.stop()
+    for handler in dispatcher.handlers():
+        _logging.info(handler)
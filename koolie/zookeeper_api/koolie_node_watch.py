@@ -1,10 +1,15 @@
 import abc
 import logging
 import sys
+import threading
+import time
+import typing
 import yaml
 import kazoo.protocol.states
 import koolie.tools.abstract_service
+import koolie.tools.common
 
+import koolie.zookeeper_api.dispatch
 import koolie.zookeeper_api.koolie_zookeeper
 
 
@@ -12,47 +17,361 @@ _logging = logging.getLogger(__name__)
 
 KOOLIE_NODE_WATCH_PATH: str = 'koolie_node_watch_path'
 
+# How the children are watched, either KOOLIE_NODE_WATCH_MODE_CHILDREN or KOOLIE_NODE_WATCH_MODE_TREE.
+KOOLIE_NODE_WATCH_MODE: str = 'koolie_node_watch_mode'
+
+# A ChildrenWatch, re-registered on every change, only children joining and leaving are seen.
+KOOLIE_NODE_WATCH_MODE_CHILDREN: str = 'children'
+
+# One persistent recursive watch (ZooKeeper 3.6 addWatch), data changes to the children are seen too.
+# Only supported by a ZooKeeper access whose supports_tree_watch() is True, Kazoo emulates it with a DataWatch per child.
+KOOLIE_NODE_WATCH_MODE_TREE: str = 'tree'
+
 
 class AbstractNodeWatch(koolie.tools.abstract_service.SleepService):
 
+    """Watch the children of a ZooKeeper node calling change() with the children.
+    In tree mode the children are tracked from the events of a persistent recursive watch, calling child_created(),
+    child_deleted() and child_modified(). Tree mode raises ValueError if the ZooKeeper access does not support it.
+    With `ZOOKEEPER_PODS_BUCKETS` the children are 'bucket/child', each bucket is watched on its own and
+    bucket_change() is called with just that bucket's delta.
+    After the session is lost the watch is registered again on reconnect, callbacks from the old watch are ignored."""
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-        self.__zoo_keeper: koolie.zookeeper_api.koolie_zookeeper.AbstractKoolieZooKeeper = koolie.zookeeper_api.koolie_zookeeper.UsingKazoo(**kwargs)
+        self.__zoo_keeper: koolie.zookeeper_api.koolie_zookeeper.AbstractKoolieZooKeeper = koolie.zookeeper_api.koolie_zookeeper.create_koolie_zookeeper(**kwargs)
 
         self.__change_count = 0;
 
+        # Incremented by watch(), callbacks from an earlier watch return False to end it.
+        self.__generation = 0
+
+        self.__lost = False
+
+        self.__reconnect_count = 0
+
+        # When the current resync started, None if not resyncing.
+        self.__resync_started: float = None
+
+        self.__resync_durations: typing.List[float] = list()
+
+        self.__mode = self.get_kv(KOOLIE_NODE_WATCH_MODE, KOOLIE_NODE_WATCH_MODE_CHILDREN)
+        if self.__mode == KOOLIE_NODE_WATCH_MODE_TREE and not self.__zoo_keeper.supports_tree_watch():
+            raise ValueError('Watch mode [{}] needs persistent recursive watches, [{}] does not support them'.format(self.__mode, type(self.__zoo_keeper).__name__))
+
+        # The path and function of the current persistent recursive watch, None if there is none.
+        self.__tree_watch: typing.Tuple[str, typing.Callable] = None
+
+        # The children in tree mode.
+        self.__children: typing.Set[str] = set()
+
+        # Serialises the watch callbacks in every mode with watch(), so a resync's snapshot and the events never interleave.
+        self.__tree_lock = threading.RLock()
+
+        self.__buckets: int = self.get_kv(koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_PODS_BUCKETS, koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_PODS_BUCKETS_DEFAULT) or 0
+
+        # Bucket to its children in bucket mode.
+        self.__bucket_children: typing.Dict[str, typing.Set[str]] = dict()
+
+        # Whether the current watch has given every child at least once, eg every bucket has been listed in bucket mode.
+        self.__synced = False
+
+        # Called with the children once processed, by a watch which processes them after its callbacks return.
+        self.__processed_listeners: typing.List[typing.Callable[[typing.Collection[str]], None]] = list()
+
     def zoo_keeper(self):
         return self.__zoo_keeper
 
     def zookeeper_node_path(self) -> str:
         return self.get_kv(KOOLIE_NODE_WATCH_PATH)
 
+    def mode(self) -> str:
+        return self.__mode
+
+    def buckets(self) -> int:
+        return self.__buckets
+
+    def children(self) -> typing.List[str]:
+        """The children as last seen by the watch in tree and bucket modes, otherwise read from ZooKeeper."""
+        with self.__tree_lock:
+            if self.__mode == KOOLIE_NODE_WATCH_MODE_TREE:
+                return list(self.__children)
+            if self.__buckets > 0:
+                return ['{}/{}'.format(bucket, child) for bucket, children in self.__bucket_children.items() for child in children]
+        return self.__zoo_keeper.get_children(self.zookeeper_node_path())
+
+    def synced(self) -> bool:
+        """Whether the current watch has given all the children, in bucket mode once every bucket's children have been given."""
+        return self.__synced
+
+    def mark_synced(self, generation: int):
+        """With the lock of the watch callbacks held, the first time for the watch's generation call children_synced()."""
+        if generation != self.__generation or self.__synced:
+            return
+        self.__synced = True
+        self.children_synced()
+
+    def children_synced(self):
+        """Called once the watch has given all the children, after the callbacks giving them, by default does nothing."""
+        pass
+
+    def processes_in_callbacks(self) -> bool:
+        """Whether a change has been processed when the callback reflecting it returns.
+        A watch which only queues the changes returns False and calls processed() once it has processed them."""
+        return True
+
+    def add_processed_listener(self, listener: typing.Callable[[typing.Collection[str]], None]):
+        self.__processed_listeners.append(listener)
+
+    def processed(self, children: typing.Collection[str]):
+        """Tell the listeners the children are now processed, those not in them having been processed as gone."""
+        for listener in self.__processed_listeners:
+            try:
+                listener(children)
+            except Exception as exception:
+                _logging.warning('Processed listener exception [{}]'.format(exception))
+
+    def reconnect_count(self) -> int:
+        return self.__reconnect_count
+
+    def resync_durations(self) -> typing.List[float]:
+        """The seconds from each reconnect to the resynced children being handled by change()."""
+        return list(self.__resync_durations)
+
     def before_start(self):
         _logging.debug('start()')
         self.__zoo_keeper.start()
+        self.__zoo_keeper.add_state_listener(self.state_changed)
         try:
-            self.__zoo_keeper.watch_children(self.zookeeper_node_path(), self.change)
+            self.watch()
         except Exception as exception:
             _logging.warning('Exception [{}]'.format(exception))
 
     def before_stop(self):
         try:
+            self.__generation += 1
+            self.remove_tree_watch()
+            self.__zoo_keeper.remove_state_listener(self.state_changed)
             self.__zoo_keeper.stop()
         except Exception as exception:
             _logging.warning('Exception [{}]'.format(exception))
 
+    def watch(self):
+        """Register the children watch, ending any earlier watch. Holds the lock of the watch callbacks throughout."""
+        with self.__tree_lock:
+            if self.__mode == KOOLIE_NODE_WATCH_MODE_TREE:
+                self.watch_tree()
+                return
+            if self.__buckets > 0:
+                self.watch_buckets()
+                return
+            self.__generation += 1
+            self.__synced = False
+            generation = self.__generation
+
+            def children_watch(children):
+                with self.__tree_lock:
+                    if generation != self.__generation:
+                        return False
+                    self.change(children)
+                    self.mark_synced(generation)
+                    if self.__resync_started is not None:
+                        duration = time.monotonic() - self.__resync_started
+                        self.__resync_started = None
+                        self.__resync_durations.append(duration)
+                        _logging.info('Resynced [{}] children in [{:.3f}]s'.format(len(children), duration))
+
+            self.__zoo_keeper.watch_children(self.zookeeper_node_path(), children_watch)
+
+    def unwatch(self):
+        """End the watch and forget the children, so a later watch() starts afresh."""
+        with self.__tree_lock:
+            self.__generation += 1
+            self.__synced = False
+            self.remove_tree_watch()
+            self.__children = set()
+            self.__bucket_children.clear()
+
+    def remove_tree_watch(self):
+        """Remove the persistent recursive watch from the session, it is shared with the other watches of the process."""
+        tree_watch = self.__tree_watch
+        self.__tree_watch = None
+        if tree_watch is not None:
+            try:
+                self.__zoo_keeper.unwatch_tree(*tree_watch)
+            except Exception as exception:
+                _logging.warning('Failed to remove tree watch [{}] [{}]'.format(tree_watch[0], exception))
+
+    def watch_buckets(self):
+        """Watch the buckets under the node path, and the children of each bucket.
+        Buckets which have gone since the last watch, eg during a lost session, are given to bucket_change() as empty.
+        A bucket deleted then created again is watched again."""
+        path = self.zookeeper_node_path().rstrip('/')
+        with self.__tree_lock:
+            self.__generation += 1
+            self.__synced = False
+            generation = self.__generation
+            # Bucket to the token of its watch, a watch whose bucket has a new token ends.
+            watched: typing.Dict[str, object] = dict()
+            # The buckets whose children have been given, synced once every watched bucket has.
+            given: typing.Set[str] = set()
+
+            def bucket_watch(bucket: str, token: object):
+                def children_watch(children):
+                    if generation != self.__generation or watched.get(bucket) is not token:
+                        return False
+                    with self.__tree_lock:
+                        self.bucket_children(bucket, children)
+                        given.add(bucket)
+                        if given.issuperset(watched.keys()):
+                            self.mark_synced(generation)
+                return children_watch
+
+            def buckets_watch(buckets):
+                if generation != self.__generation:
+                    return False
+                with self.__tree_lock:
+                    for bucket in set(watched.keys()).union(self.__bucket_children.keys()).difference(buckets):
+                        watched.pop(bucket, None)
+                        given.discard(bucket)
+                        self.bucket_children(bucket, [])
+                    for bucket in set(buckets).difference(watched.keys()):
+                        watched[bucket] = object()
+                        self.__zoo_keeper.watch_children('{}/{}'.format(path, bucket), bucket_watch(bucket, watched[bucket]))
+                    if given.issuperset(watched.keys()):
+                        self.mark_synced(generation)
+
+            self.__zoo_keeper.watch_children(path, buckets_watch)
+            if self.__resync_started is not None:
+                duration = time.monotonic() - self.__resync_started
+                self.__resync_started = None
+                self.__resync_durations.append(duration)
+                _logging.info('Resynced [{}] buckets in [{:.3f}]s'.format(len(watched), duration))
+
+    def bucket_children(self, bucket: str, children):
+        """Work out the delta for the bucket and give it to bucket_change()."""
+        previous = self.__bucket_children.get(bucket, set())
+        new = set(children)
+        if new:
+            self.__bucket_children[bucket] = new
+        else:
+            self.__bucket_children.pop(bucket, None)
+        added = {'{}/{}'.format(bucket, child) for child in new.difference(previous)}
+        removed = {'{}/{}'.format(bucket, child) for child in previous.difference(new)}
+        if added or removed:
+            self.bucket_change(bucket, added, removed)
+
+    def bucket_change(self, bucket: str, added: typing.Set[str], removed: typing.Set[str]):
+        """Called in bucket mode with the children, as 'bucket/child', added to and removed from the bucket.
+        By default calls change() with all the children."""
+        self.change(['{}/{}'.format(b, child) for b, children in self.__bucket_children.items() for child in children])
+
+    def watch_tree(self):
+        """Register a persistent recursive watch then snapshot the children.
+        Events racing the snapshot wait for it, they are then applied idempotently."""
+        path = self.zookeeper_node_path().rstrip('/') or '/'
+        prefix = '/' if path == '/' else '{}/'.format(path)
+        depth = 2 if self.__buckets > 0 else 1
+        with self.__tree_lock:
+            self.__generation += 1
+            self.__synced = False
+            generation = self.__generation
+            self.remove_tree_watch()
+
+            def tree_watch(event):
+                if generation != self.__generation:
+                    return False
+                if not event.path.startswith(prefix):
+                    return
+                child = event.path[len(prefix):]
+                if child.count('/') != depth - 1:
+                    return  # A bucket, or below a child.
+                with self.__tree_lock:
+                    if event.type == kazoo.protocol.states.EventType.CREATED:
+                        if child not in self.__children:
+                            self.__children.add(child)
+                            self.child_created(child)
+                    elif event.type == kazoo.protocol.states.EventType.DELETED:
+                        if child in self.__children:
+                            self.__children.discard(child)
+                            self.child_deleted(child)
+                    elif event.type == kazoo.protocol.states.EventType.CHANGED:
+                        if child in self.__children:
+                            self.child_modified(child)
+
+            self.__zoo_keeper.watch_tree(path, tree_watch, depth)
+            self.__tree_watch = (path, tree_watch)
+            if self.__buckets > 0:
+                children = [
+                    '{}/{}'.format(bucket, child)
+                    for bucket in self.__zoo_keeper.get_children(path)
+                    for child in self.__zoo_keeper.get_children('{}{}'.format(prefix, bucket))
+                ]
+            else:
+                children = self.__zoo_keeper.get_children(path)
+            self.__children = set(children)
+            self.change(children)
+            self.mark_synced(generation)
+            if self.__resync_started is not None:
+                duration = time.monotonic() - self.__resync_started
+                self.__resync_started = None
+                self.__resync_durations.append(duration)
+                _logging.info('Resynced [{}] children in [{:.3f}]s'.format(len(children), duration))
+
+    def child_created(self, child: str):
+        """Called in tree mode when a child is created, by default calls change() with all the children."""
+        self.change(list(self.__children))
+
+    def child_deleted(self, child: str):
+        """Called in tree mode when a child is deleted, by default calls change() with all the children."""
+        self.change(list(self.__children))
+
+    def child_modified(self, child: str):
+        """Called in tree mode when the data of a child changes, by default does nothing."""
+        pass
+
+    def state_changed(self, state):
+        """Called in the ZooKeeper event thread, so the resync is done in its own thread."""
+        if state == kazoo.protocol.states.KazooState.LOST:
+            self.__lost = True
+        elif state == kazoo.protocol.states.KazooState.CONNECTED and self.__lost:
+            self.__lost = False
+            threading.Thread(group=None, target=self.resync, name='{}-resync'.format(self.name())).start()
+
+    def resync(self):
+        """Register the watch again after the session was lost, under the lock of the watch callbacks.
+        The fresh children are given to change(), so a subclass diffing against its current children sees only the net change."""
+        self.__reconnect_count += 1
+        self.__resync_started = time.monotonic()
+        _logging.info('Resync [{}] reconnect [{}]'.format(self.zookeeper_node_path(), self.__reconnect_count))
+        try:
+            self.watch()
+        except Exception as exception:
+            self.__resync_started = None
+            _logging.warning('Failed to resync [{}]'.format(exception))
+
     @abc.abstractmethod
     def change(self, children):
         """SubClasses need to override this method and do something.
         By default it increments change count by 1."""
         self.__change_count += 1
 
+    def __str__(self) -> str:
+        return '{}\nPath [{}] Changes [{}] Reconnects [{}] Resync p99 [{}]'.format(
+            super().__str__(),
+            self.zookeeper_node_path(),
+            self.__change_count,
+            self.__reconnect_count,
+            koolie.tools.common.percentile(self.__resync_durations, 99)
+        )
+
 
 class DeltaNodeWatch(AbstractNodeWatch):
 
     """ZooKeeper node watch that performs a delta when changes occur using added() and removed().
-    The delta is calculated based on the current nodes."""
+    The delta is calculated based on the current nodes.
+    In tree mode data changes to a current node are given to modified()."""
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -61,6 +380,7 @@ class DeltaNodeWatch(AbstractNodeWatch):
 
         self._added = 0
         self._removed = 0
+        self._modified = 0
 
     def current(self) -> set:
         return self.__current
@@ -73,10 +393,37 @@ class DeltaNodeWatch(AbstractNodeWatch):
         self.__current = new
         super().change(children)
 
+    def bucket_change(self, bucket: str, added: typing.Set[str], removed: typing.Set[str]):
+        self.__current.difference_update(removed)
+        self.__current.update(added)
+        if removed:
+            self.removed(removed)
+        if added:
+            self.added(added)
+
+    def unwatch(self):
+        super().unwatch()
+        self.__current = set()
+
+    def child_created(self, child: str):
+        self.__current.add(child)
+        self.added({child})
+
+    def child_deleted(self, child: str):
+        self.__current.discard(child)
+        self.removed({child})
+
+    def child_modified(self, child: str):
+        self.modified({child})
+
     def added(self, children) -> object:
         _logging.debug('added()')
         self._added += len(children)
 
+    def modified(self, children) -> object:
+        _logging.debug('modified()')
+        self._modified += len(children)
+
     def removed(self, children) -> object:
         _logging.debug('removed()')
         self._removed += len(children)
@@ -145,54 +492,86 @@ class YAMLNodeWatch(DeltaNodeWatch):
 
 class StatusTypeWatch(DeltaNodeWatch):
 
+    """Dispatch the items of the pods' statuses to handlers, see `koolie.zookeeper_api.dispatch`.
+    Handlers are registered on the dispatcher with selectors, or given by type in the ADD and REMOVE dicts of type to a callable taking the item.
+    Each handler runs in its own worker collapsing its pending events, the watch callbacks only decode and dispatch.
+    The items last seen for a child are dispatched to the remove handlers when it goes, in tree mode a modified child is removed then added."""
+
     ADD = 'StatusTypeWatch_add'
 
     REMOVE = 'StatusTypeWatch_remove'
 
+    DISPATCHER = 'StatusTypeWatch_dispatcher'
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         _logging.debug('StatusTypeWatch.__init__()')
-        self.__kwargs = kwargs
+        self.__dispatcher: koolie.zookeeper_api.dispatch.Dispatcher = self.get_kv(StatusTypeWatch.DISPATCHER) or koolie.zookeeper_api.dispatch.Dispatcher()
+        add = self.get_kv(StatusTypeWatch.ADD) or dict()
+        remove = self.get_kv(StatusTypeWatch.REMOVE) or dict()
+        for item_type in sorted(set(add.keys()).union(remove.keys())):
+            self.__dispatcher.register(
+                '{}_{}'.format(self.name(), item_type),
+                [koolie.zookeeper_api.dispatch.Selector(item_type)],
+                None if item_type not in add else lambda child, item, handle=add[item_type]: handle(item),
+                None if item_type not in remove else lambda child, item, handle=remove[item_type]: handle(item)
+            )
+
+        # Child to the items last dispatched for it.
+        self.__items: typing.Dict[str, list] = dict()
+
+    def dispatcher(self) -> koolie.zookeeper_api.dispatch.Dispatcher:
+        return self.__dispatcher
+
+    def before_start(self):
+        self.__dispatcher.start()
+        super().before_start()
+
+    def before_stop(self):
+        super().before_stop()
+        self.__dispatcher.stop()
+
+    def items(self, child: str) -> list:
+        """The decoded status of the child, None if it failed."""
+        data = self.zoo_keeper().get_node_value('{}/{}'.format(self.zookeeper_node_path().rstrip('/'), child))
+        if data is None:
+            return None
+        j = yaml.safe_load(data.decode('utf-8'))
+        if not isinstance(j, list):
+            _logging.warning('Expected list got [{}]'.format(type(j)))
+            return None
+        return j
+
+    def add(self, child: str):
+        try:
+            items = self.items(child)
+        except Exception as exception:
+            _logging.warning('Failed to get [{}] exception [{}]'.format(child, exception))
+            return
+        if items is not None:
+            self.__items[child] = items
+            self.__dispatcher.dispatch(koolie.zookeeper_api.dispatch.EVENT_ADD, child, items)
+
+    def remove(self, child: str):
+        items = self.__items.pop(child, None)
+        if items is not None:
+            self.__dispatcher.dispatch(koolie.zookeeper_api.dispatch.EVENT_REMOVE, child, items)
 
     def added(self, children) -> object:
+        super().added(children)
         for child in children:
-            _logging.info(child)
-            try:
-                data: tuple = self.zoo_keeper.get_node_value('{}{}'.format(self.__kwargs.get('zookeeper_node_path'), child))
-                if isinstance(data, tuple):
-                    _logging.info('Tuple length [{}]'.format(len(data)))
-
-                    if len(data) >= 1:
-                        value: bytes = data[0]
-                        j = yaml.load(value.decode('utf-8'))
-                        _logging.debug(j)
-                        if isinstance(j, list):
-                            _logging.info('Items [{}]'.format(len(j)))
-                            for item in j:
-                                if isinstance(item, dict):
-                                    handle = self.__kwargs.get(StatusTypeWatch.ADD).get(item.get(koolie.go.KOOLIE_STATUS_TYPE))
-                                    if handle is None:
-                                        _logging.info('No handle for type [{}]'.format(item.get(koolie.go.KOOLIE_STATUS_TYPE)))
-                                    else:
-                                        handle(item)
-                                else:
-                                    _logging.info('Item type [{}]'.format(type(item)))
-                        else:
-                            _logging.warning('Expected list got [{}]'.format(type(j)))
+            self.add(child)
 
-                    if len(data) >= 2:
-                        if isinstance(data[1], kazoo.protocol.states.ZnodeStat):
-                            _logging.info('ZnodeStat [{}]'.format(data[1]))
-                        else:
-                            _logging.warning('Expected ZnodeStat got [{}]'.format(type(data[1])))
-                else:
-                    _logging.warning('Expected tuple got [{}]'.format(type(data)))
-            except Exception as exception:
-                _logging.warning('Exception [{}]'.format(exception))
+    def modified(self, children) -> object:
+        super().modified(children)
+        for child in children:
+            self.remove(child)
+            self.add(child)
 
     def removed(self, children) -> object:
-        return super().removed(children)
-
+        super().removed(children)
+        for child in children:
+            self.remove(child)
 
 if __name__ == '__main__':
     logging.basicConfig(stream=sys.stdout, level=logging.INFO)
@@ -1,12 +1,16 @@
 import abc
 import contextlib
+import hashlib
 import logging
 import sys
+import threading
 import typing
 import uuid
 
+import kazoo.protocol.states
 import kazoo.recipe.watchers
 from kazoo.client import KazooClient
+from kazoo.protocol.states import KeeperState
 from kazoo.exceptions import KazooException
 
 import koolie.tools.abstract_service
@@ -20,6 +24,250 @@ ZOOKEEPER_HOSTS_DEFAULT: str = 'zookeeper.default.svc.cluster.local'
 ZOOKEEPER_NODE_PATH: str = 'ZOOKEEPER_NODE_PATH'
 ZOOKEEPER_NODE_PATH_DEFAULT: str = '/'
 
+# Callable used to create the ZooKeeper access, called with the kwargs, default is `UsingKazoo`.
+KOOLIE_ZOOKEEPER_FACTORY: str = 'koolie_zookeeper_factory'
+
+# The node the pods register under.
+ZOOKEEPER_PODS_PATH: str = 'zookeeper_pods_path'
+ZOOKEEPER_PODS_PATH_DEFAULT: str = '/koolie/pods'
+
+# Register pods under a hash bucket, eg /koolie/pods/007/<pod>, 0 or less registers them directly under the pods path.
+# Producers and consumers must use the same value.
+ZOOKEEPER_PODS_BUCKETS: str = 'zookeeper_pods_buckets'
+ZOOKEEPER_PODS_BUCKETS_DEFAULT: int = 0
+
+
+def pod_bucket(name: str, buckets: int) -> str:
+    """The bucket for the pod name, stable across processes unlike hash()."""
+    digest = hashlib.sha1(name.encode('utf-8')).digest()
+    return '{:03d}'.format(int.from_bytes(digest[:8], 'big') % buckets)
+
+
+def pod_child(name: str, buckets: int = ZOOKEEPER_PODS_BUCKETS_DEFAULT) -> str:
+    """The pod's node relative to the pods path, either the name or 'bucket/name'."""
+    if buckets is None or buckets <= 0:
+        return name
+    return '{}/{}'.format(pod_bucket(name, buckets), name)
+
+
+def pod_path(name: str, pods_path: str = ZOOKEEPER_PODS_PATH_DEFAULT, buckets: int = ZOOKEEPER_PODS_BUCKETS_DEFAULT) -> str:
+    """The full path of the pod's node."""
+    return '{}/{}'.format(pods_path.rstrip('/'), pod_child(name, buckets))
+
+
+# Share one Kazoo client, and so one session, per hosts string across the process, default is True.
+ZOOKEEPER_SHARED_SESSION: str = 'zookeeper_shared_session'
+
+ZOOKEEPER_START_TIMEOUT: str = 'zookeeper_start_timeout'
+ZOOKEEPER_START_TIMEOUT_DEFAULT: float = 5
+
+
+class _SharedSession(object):
+
+    def __init__(self, hosts: str, kazoo_client) -> None:
+        super().__init__()
+
+        self.hosts = hosts
+
+        self.kazoo_client = kazoo_client
+
+        self.references = 0
+
+        self.state = None
+
+    def listener(self, state):
+        _logging.info('Shared session [{}] state [{}]'.format(self.hosts, state))
+        self.state = state
+
+
+class KazooSessions(object):
+
+    """Reference counted Kazoo clients, one per hosts string.
+    The first attach() starts the client and the last detach() stops and closes it.
+    A client which has been stopped or has failed to connect is replaced on the next attach()."""
+
+    def __init__(self, client_factory: typing.Callable[..., KazooClient] = KazooClient) -> None:
+        super().__init__()
+
+        self.__client_factory = client_factory
+
+        self.__lock = threading.Lock()
+
+        self.__sessions: typing.Dict[str, _SharedSession] = dict()
+
+    def attach(self, hosts: str, timeout: float = ZOOKEEPER_START_TIMEOUT_DEFAULT) -> KazooClient:
+        """Return the started client for the hosts, incrementing its reference count."""
+        with self.__lock:
+            session = self.__sessions.get(hosts)
+            if session is not None and session.kazoo_client.client_state == KeeperState.CLOSED:
+                # Stopped outside of detach(), so start it again.
+                _logging.info('Restarting shared session [{}] state [{}]'.format(hosts, session.state))
+                session.kazoo_client.start(timeout=timeout)
+            if session is None:
+                kazoo_client = self.__client_factory(hosts=hosts)
+                session = _SharedSession(hosts, kazoo_client)
+                kazoo_client.add_listener(session.listener)
+                kazoo_client.start(timeout=timeout)
+                self.__sessions[hosts] = session
+            session.references += 1
+            _logging.debug('Attached shared session [{}] references [{}]'.format(hosts, session.references))
+            return session.kazoo_client
+
+    def detach(self, hosts: str):
+        """Decrement the reference count for the hosts, stopping and closing the client when it reaches zero."""
+        with self.__lock:
+            session = self.__sessions.get(hosts)
+            if session is None:
+                _logging.warning('Detach from unknown shared session [{}]'.format(hosts))
+                return
+            session.references -= 1
+            _logging.debug('Detached shared session [{}] references [{}]'.format(hosts, session.references))
+            if session.references > 0:
+                return
+            del self.__sessions[hosts]
+        try:
+            session.kazoo_client.stop()
+            session.kazoo_client.close()
+        except KazooException as exception:
+            _logging.warning('Failed to stop shared session [{}] [{}].'.format(hosts, exception))
+
+    def references(self, hosts: str) -> int:
+        session = self.__sessions.get(hosts)
+        return 0 if session is None else session.references
+
+    def state(self, hosts: str):
+        """The last KazooState of the session for the hosts, None if unknown."""
+        session = self.__sessions.get(hosts)
+        return None if session is None else session.state
+
+    def __str__(self) -> str:
+        return ', '.join('[{}]=[{}/{}]'.format(hosts, session.references, session.state) for hosts, session in self.__sessions.items())
+
+
+_kazoo_sessions = KazooSessions()
+
+
+def kazoo_sessions() -> KazooSessions:
+    """The shared Kazoo sessions of the process."""
+    return _kazoo_sessions
+
+
+class TreeWatchEmulation(object):
+
+    """A persistent recursive watch emulated with a children watch per node and a data watch per node, down to the depth below the path.
+    func is called with a `WatchedEvent` for every node created, changed or deleted after start() returns, as for a watch added by addWatch.
+    The nodes there when started are not given, the caller lists them once started. The watch ends if func returns False or once stopped.
+    The callbacks are serialised by the client, so the events are given in the order of the changes."""
+
+    def __init__(self, koolie_zookeeper: 'AbstractKoolieZooKeeper', path: str, func: typing.Callable, depth: int = 1) -> None:
+        super().__init__()
+
+        self._koolie_zookeeper = koolie_zookeeper
+        self._path = path.rstrip('/') or '/'
+        self._func = func
+        self._depth = depth
+        self._started = False
+        self._stopped = False
+        self._lock = threading.Lock()
+
+        # Node path to the token of its watches, the watches of a node which has gone or been watched again end.
+        self._tokens: typing.Dict[str, object] = dict()
+
+        # Node path to its children as last listed.
+        self._children: typing.Dict[str, typing.Set[str]] = dict()
+
+    def path(self) -> str:
+        return self._path
+
+    def stopped(self) -> bool:
+        return self._stopped
+
+    def start(self):
+        self.watch_node(self._path, 0, self.token(self._path))
+        self._started = True
+
+    def stop(self):
+        """The watches end when next called, func is not called again."""
+        self._stopped = True
+
+    def token(self, path: str) -> object:
+        with self._lock:
+            token = object()
+            self._tokens[path] = token
+            return token
+
+    def current(self, path: str, token: object) -> bool:
+        return not self._stopped and self._tokens.get(path) is token
+
+    def watch_node(self, path: str, level: int, token: object):
+        if level > 0:
+            self._koolie_zookeeper.watch_data(path, self.data_watch(path, token))
+        if level < self._depth:
+            self._koolie_zookeeper.watch_children(path, self.children_watch(path, level, token))
+
+    def data_watch(self, path: str, token: object) -> typing.Callable:
+        mzxid = None
+
+        def data_watch(data, stat):
+            nonlocal mzxid
+            with self._lock:
+                if not self.current(path, token):
+                    return False
+                # Deleted is given by the parent's children watch, keep watching in case it is created again before it is listed.
+                changed = stat is not None and mzxid is not None and stat.mzxid != mzxid
+                mzxid = None if stat is None else stat.mzxid
+            if changed:
+                return self.event(kazoo.protocol.states.EventType.CHANGED, path)
+
+        return data_watch
+
+    def children_watch(self, path: str, level: int, token: object) -> typing.Callable:
+        def children_watch(children):
+            with self._lock:
+                if not self.current(path, token):
+                    return False
+                previous = self._children.get(path, set())
+                new = set(children)
+                self._children[path] = new
+                deleted = [self.child_path(path, child) for child in sorted(previous.difference(new))]
+                created = [self.child_path(path, child) for child in sorted(new.difference(previous))]
+                # A deleted node's own children have gone before it, those not yet seen to have are given first.
+                deleted = [below for child_path in deleted for below in self.forget(child_path)]
+            for child_path in deleted:
+                if self.event(kazoo.protocol.states.EventType.DELETED, child_path) is False:
+                    return False
+            for child_path in created:
+                # Given before its own children, which its watch lists as created.
+                child_token = self.token(child_path)
+                if self.event(kazoo.protocol.states.EventType.CREATED, child_path) is False:
+                    return False
+                self.watch_node(child_path, level + 1, child_token)
+
+        return children_watch
+
+    def child_path(self, path: str, child: str) -> str:
+        return '{}{}'.format(path, child) if path.endswith('/') else '{}/{}'.format(path, child)
+
+    def forget(self, path: str) -> typing.List[str]:
+        """End the watches of the node and those below it, returns their paths deepest first."""
+        prefix = '{}/'.format(path)
+        paths = [p for p in self._tokens.keys() if p == path or p.startswith(prefix)]
+        for p in paths:
+            self._tokens.pop(p, None)
+            self._children.pop(p, None)
+        return sorted(paths, key=lambda p: p.count('/'), reverse=True)
+
+    def event(self, event_type: str, path: str):
+        if not self._started or self._stopped:
+            return None
+        if self._func(kazoo.protocol.states.WatchedEvent(event_type, kazoo.protocol.states.KeeperState.CONNECTED, path)) is False:
+            self._stopped = True
+            return False
+        return None
+
+    def __str__(self) -> str:
+        return 'TreeWatchEmulation [{}] depth [{}] nodes [{}]'.format(self._path, self._depth, len(self._tokens))
+
 
 class AbstractKoolieZooKeeper(koolie.tools.abstract_service.AbstractService):
 
@@ -30,10 +278,44 @@ class AbstractKoolieZooKeeper(koolie.tools.abstract_service.AbstractService):
         super().__init__()
         self._kwargs = kwargs
 
+        # Called with each KazooState change, in the ZooKeeper event thread so they must not block.
+        self._state_listeners: typing.List[typing.Callable] = list()
+
+        # The (path, func) of each emulated persistent recursive watch to its emulation.
+        self._tree_watch_emulations: typing.Dict[typing.Tuple[str, typing.Callable], TreeWatchEmulation] = dict()
+
     def hosts(self) -> str:
         """Convenience method to return the hosts from `_kwargs`"""
         return self._kwargs.get(ZOOKEEPER_HOSTS, ZOOKEEPER_LOCALHOST)
 
+    def add_state_listener(self, listener: typing.Callable):
+        """Add a listener called with the KazooState, eg LOST then CONNECTED after a session expires."""
+        if listener not in self._state_listeners:
+            self._state_listeners.append(listener)
+
+    def remove_state_listener(self, listener: typing.Callable):
+        if listener in self._state_listeners:
+            self._state_listeners.remove(listener)
+
+    def _state_changed(self, state):
+        _logging.debug('State [{}]'.format(state))
+        for listener in list(self._state_listeners):
+            try:
+                listener(state)
+            except Exception as exception:
+                _logging.warning('Exception calling state listener [{}]'.format(exception))
+
+    @abc.abstractmethod
+    def exists(self, path: str):
+        """Return the node stat, or None if the node does not exist."""
+        pass
+
+    @abc.abstractmethod
+    def exists_async(self, path: str):
+        """Send the request without waiting for the reply, returns a result whose get() returns what exists() would.
+        Requests sent together are pipelined, so many are answered in about one round trip."""
+        pass
+
     @abc.abstractmethod
     def get_node_value(self, path: str) -> bytes:
         pass
@@ -50,6 +332,47 @@ class AbstractKoolieZooKeeper(koolie.tools.abstract_service.AbstractService):
     def watch_children(self, path: str, func: callable):
         pass
 
+    @abc.abstractmethod
+    def watch_data(self, path: str, func: callable):
+        """Watch the node's data, func is called with (data, stat) initially and whenever the node changes.
+        Both are None if the node does not exist. The watch ends if func returns False."""
+        pass
+
+    @abc.abstractmethod
+    def election(self, path: str, identifier: str = None):
+        """Return an election under the path, as `kazoo.recipe.election.Election`.
+        run(func) blocks until elected then calls func, leadership lasts until func returns. cancel() ends a run()."""
+        pass
+
+    @abc.abstractmethod
+    def supports_tree_watch(self) -> bool:
+        """Whether watch_tree() is supported, either with ZooKeeper 3.6 and a client sending addWatch or emulated."""
+        pass
+
+    @abc.abstractmethod
+    def watch_tree(self, path: str, func: callable, depth: int = None):
+        """Add a persistent recursive watch, func is called with the WatchedEvent for every node created, changed or deleted at or below the path.
+        The depth is the deepest level below the path the caller needs, an emulated watch does not watch below it.
+        The watch ends if func returns False, it is removed by unwatch_tree() or the session is lost."""
+        pass
+
+    @abc.abstractmethod
+    def unwatch_tree(self, path: str, func: callable):
+        """Remove the persistent recursive watch of func, removing the watch from ZooKeeper once the path has no other."""
+        pass
+
+    def emulate_watch_tree(self, path: str, func: callable, depth: int = None):
+        """watch_tree() with a `TreeWatchEmulation`, for a client without persistent recursive watches."""
+        self.emulate_unwatch_tree(path, func)
+        emulation = TreeWatchEmulation(self, path, func, 1 if depth is None else depth)
+        self._tree_watch_emulations[(path, func)] = emulation
+        emulation.start()
+
+    def emulate_unwatch_tree(self, path: str, func: callable):
+        emulation = self._tree_watch_emulations.pop((path, func), None)
+        if emulation is not None:
+            emulation.stop()
+
     @abc.abstractmethod
     def create_node(self, path, value=b'', acl=None, ephemeral=False, sequence=False, make_path=False) -> str:
         """Create a node with regard to ZooKeeper restrictions."""
@@ -82,26 +405,52 @@ class UsingKazoo(AbstractKoolieZooKeeper):
 
         self._kazoo_client: KazooClient = None
 
+        self._shared = self._kwargs.get(ZOOKEEPER_SHARED_SESSION, True)
+
+        # Incremented by before_stop() so watches from before the stop end, a shared client outlives this service.
+        self._generation = 0
+
     @property
     def kazoo_client(self):
         return self._kazoo_client
 
+    def shared(self) -> bool:
+        return self._shared
+
     def before_start(self):
+        timeout = self._kwargs.get(ZOOKEEPER_START_TIMEOUT, ZOOKEEPER_START_TIMEOUT_DEFAULT)
         try:
-            self._kazoo_client = KazooClient(hosts=self.hosts())
-            self._kazoo_client.start(timeout=5)
-        except KazooException as exception:
+            if self._shared:
+                self._kazoo_client = kazoo_sessions().attach(self.hosts(), timeout)
+            else:
+                self._kazoo_client = KazooClient(hosts=self.hosts())
+                self._kazoo_client.start(timeout=timeout)
+            self._kazoo_client.add_listener(self._state_changed)
+        except Exception as exception:
             _logging.warning('Failed to start Kazoo [{}] [{}]'.format(sys.exc_info()[0], exception))
             self._kazoo_client = None
 
     def before_stop(self):
         try:
-            self._kazoo_client.stop()
+            if self._kazoo_client is None:
+                return
+            self._generation += 1
+            self._kazoo_client.remove_listener(self._state_changed)
+            if self._shared:
+                kazoo_sessions().detach(self.hosts())
+            else:
+                self._kazoo_client.stop()
         except KazooException as exception:
             _logging.warning('Failed to stop Kazoo [{}] [{}].'.format(sys.exc_info()[0], exception))
         finally:
             self._kazoo_client = None
 
+    def exists(self, path: str):
+        return self._kazoo_client.exists(path)
+
+    def exists_async(self, path: str):
+        return self._kazoo_client.exists_async(path)
+
     def get_node_value(self, path) -> bytes:
         try:
             return self._kazoo_client.get(path)[0]
@@ -119,7 +468,38 @@ class UsingKazoo(AbstractKoolieZooKeeper):
         return self._kazoo_client.get_children(path)
 
     def watch_children(self, path: str, func: callable):
-        self._kazoo_client.ChildrenWatch(path, func)
+        generation = self._generation
+
+        def children_watch(children):
+            if generation != self._generation:
+                return False  # Stops the ChildrenWatch.
+            return func(children)
+
+        self._kazoo_client.ChildrenWatch(path, children_watch)
+
+    def watch_data(self, path: str, func: callable):
+        generation = self._generation
+
+        def data_watch(data, stat):
+            if generation != self._generation:
+                return False  # Stops the DataWatch.
+            return func(data, stat)
+
+        self._kazoo_client.DataWatch(path, data_watch)
+
+    def election(self, path: str, identifier: str = None):
+        return self._kazoo_client.Election(path, identifier)
+
+    def supports_tree_watch(self) -> bool:
+        """Kazoo sends neither addWatch nor removeWatches, so the watch is emulated with its ChildrenWatch and DataWatch."""
+        return True
+
+    def watch_tree(self, path: str, func: callable, depth: int = None):
+        """A ChildrenWatch per node and a DataWatch per child, they end with the generation as the other watches do."""
+        self.emulate_watch_tree(path, func, depth)
+
+    def unwatch_tree(self, path: str, func: callable):
+        self.emulate_unwatch_tree(path, func)
 
     def create_node(self, path, value=b'', acl=None, ephemeral=False, sequence=False, make_path=False):
         _logging.debug('create_node()')
@@ -129,19 +509,24 @@ class UsingKazoo(AbstractKoolieZooKeeper):
         self._kazoo_client.delete(path, version, recursive)
 
 
+def create_koolie_zookeeper(**kwargs) -> AbstractKoolieZooKeeper:
+    """Create the ZooKeeper access using the `KOOLIE_ZOOKEEPER_FACTORY` in the kwargs, default is `UsingKazoo`."""
+    return kwargs.get(KOOLIE_ZOOKEEPER_FACTORY, UsingKazoo)(**kwargs)
+
+
 class WithZooKeeper(object):
 
     def __init__(self, **kwargs) -> None:
         super().__init__()
-        self.koolie_zookeeper = UsingKazoo(**kwargs)
+        self.koolie_zookeeper = create_koolie_zookeeper(**kwargs)
 
     @property
-    def koolie_zookeeper(self) -> UsingKazoo:
+    def koolie_zookeeper(self) -> AbstractKoolieZooKeeper:
         return self.__zoo_keeper
 
     @koolie_zookeeper.setter
-    def koolie_zookeeper(self, zoo_keeper: UsingKazoo):
-        assert zoo_keeper is None or isinstance(zoo_keeper, UsingKazoo)
+    def koolie_zookeeper(self, zoo_keeper: AbstractKoolieZooKeeper):
+        assert zoo_keeper is None or isinstance(zoo_keeper, AbstractKoolieZooKeeper)
         self.__zoo_keeper = zoo_keeper
 
     def __str__(self) -> str:
@@ -0,0 +1,745 @@
+import itertools
+import logging
+import queue
+import sys
+import threading
+import time
+import typing
+
+from kazoo.exceptions import BadVersionError, NoNodeError, NodeExistsError, NotEmptyError, SessionExpiredError
+from kazoo.protocol.states import EventType, KazooState, WatchedEvent, ZnodeStat
+
+import koolie.zookeeper_api.koolie_zookeeper
+
+
+_logging = logging.getLogger(__name__)
+
+MEMORY_ENSEMBLE: str = 'memory_ensemble'
+
+# Seconds added to every request, either a number or a callable returning a number (eg random.expovariate).
+MEMORY_LATENCY: str = 'memory_latency'
+
+# Seconds between a change and the watch event being delivered, either a number or a callable returning a number.
+MEMORY_WATCH_LATENCY: str = 'memory_watch_latency'
+
+# Emulate the persistent recursive watches with a watch per node as `UsingKazoo` does, default is False.
+MEMORY_TREE_WATCH_EMULATED: str = 'memory_tree_watch_emulated'
+
+Latency = typing.Union[float, typing.Callable[[], float]]
+
+
+def latency_seconds(latency: Latency) -> float:
+    """Return the seconds for the given latency, calling it if it is a callable."""
+    if latency is None:
+        return 0.0
+    if callable(latency):
+        return float(latency())
+    return float(latency)
+
+
+def parent_path(path: str) -> str:
+    return path[:path.rindex('/')] or '/'
+
+
+def child_name(path: str) -> str:
+    return path[path.rindex('/') + 1:]
+
+
+def join_path(path: str, child: str) -> str:
+    return '{}{}'.format(path, child) if path.endswith('/') else '{}/{}'.format(path, child)
+
+
+class PersistentEvent(WatchedEvent):
+
+    """A watch event from a persistent recursive watch, rather than a one-shot watch."""
+
+    __slots__ = ()
+
+
+class _MemoryNode(object):
+
+    def __init__(self, data: bytes, zxid: int, ephemeral_owner: int = 0) -> None:
+        super().__init__()
+
+        timestamp = int(time.time() * 1000)
+
+        self.data = data
+        self.czxid = zxid
+        self.mzxid = zxid
+        self.pzxid = zxid
+        self.ctime = timestamp
+        self.mtime = timestamp
+        self.version = 0
+        self.cversion = 0
+        self.ephemeral_owner = ephemeral_owner
+        self.children: typing.Set[str] = set()
+
+    def stat(self) -> ZnodeStat:
+        return ZnodeStat(
+            self.czxid,
+            self.mzxid,
+            self.ctime,
+            self.mtime,
+            self.version,
+            self.cversion,
+            0,
+            self.ephemeral_owner,
+            len(self.data),
+            len(self.children),
+            self.pzxid
+        )
+
+
+class MemoryEnsemble(object):
+
+    """An in-memory stand-in for a ZooKeeper ensemble.
+    Supports persistent, ephemeral and sequential nodes, versions, one-shot data and child watches per session
+    and persistent recursive watches (ZooKeeper 3.6 addWatch).
+    Sessions are identified by an int, watch events are handed to the callable given to open_session()."""
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.__rlock = threading.RLock()
+
+        self.__zxid = 0
+
+        self.__session_ids = itertools.count(1)
+
+        self.__nodes: typing.Dict[str, _MemoryNode] = {'/': _MemoryNode(b'', 0)}
+
+        # Session ID to the callable which delivers watch events to that session.
+        self.__sessions: typing.Dict[int, typing.Callable[[WatchedEvent], None]] = dict()
+
+        # Session ID to the paths of the ephemeral nodes it owns.
+        self.__ephemerals: typing.Dict[int, typing.Set[str]] = dict()
+
+        # Path to the session IDs watching it.
+        self.__data_watches: typing.Dict[str, typing.Set[int]] = dict()
+        self.__child_watches: typing.Dict[str, typing.Set[int]] = dict()
+
+        # Path to the session IDs with a persistent recursive watch on it.
+        self.__recursive_watches: typing.Dict[str, typing.Set[int]] = dict()
+
+    def zxid(self) -> int:
+        """The ID of the last transaction."""
+        return self.__zxid
+
+    def sessions(self) -> int:
+        """The number of open sessions."""
+        return len(self.__sessions)
+
+    def nodes(self) -> int:
+        """The number of nodes, including the root."""
+        return len(self.__nodes)
+
+    # Sessions.
+
+    def open_session(self, deliver: typing.Callable[[WatchedEvent], None] = None) -> int:
+        """Open a session, watch events for the session are given to deliver."""
+        with self.__rlock:
+            session_id = next(self.__session_ids)
+            self.__sessions[session_id] = deliver
+            self.__ephemerals[session_id] = set()
+            return session_id
+
+    def close_session(self, session_id: int):
+        """Close the session, deleting its ephemeral nodes and dropping its watches."""
+        self.__end_session(session_id)
+
+    def expire_session(self, session_id: int):
+        """Expire the session as the ensemble would after missed heartbeats.
+        The ephemeral nodes and watches are dropped and the session is told it has been lost."""
+        deliver = self.__sessions.get(session_id)
+        self.__end_session(session_id)
+        if deliver is not None:
+            deliver(WatchedEvent(EventType.NONE, KazooState.LOST, None))
+
+    def __end_session(self, session_id: int):
+        events = list()
+        with self.__rlock:
+            self.__sessions.pop(session_id, None)
+            for watches in (self.__data_watches, self.__child_watches, self.__recursive_watches):
+                for session_ids in watches.values():
+                    session_ids.discard(session_id)
+            for path in sorted(self.__ephemerals.pop(session_id, set()), reverse=True):
+                if path in self.__nodes:
+                    events.extend(self.__delete(path))
+        self.__fire(events)
+
+    # Operations.
+
+    def create(self, session_id: int, path: str, value: bytes = b'', ephemeral: bool = False, sequence: bool = False, make_path: bool = False) -> str:
+        assert isinstance(path, str) and path.startswith('/')
+        assert isinstance(value, bytes)
+        events = list()
+        with self.__rlock:
+            if ephemeral and session_id not in self.__ephemerals:
+                raise SessionExpiredError(session_id)
+            parent = parent_path(path)
+            if parent not in self.__nodes:
+                if not make_path:
+                    raise NoNodeError(parent)
+                self.__make_path(parent, events)
+            parent_node = self.__nodes[parent]
+            if parent_node.ephemeral_owner:
+                raise NoNodeError('Ephemeral nodes can not have children [{}]'.format(parent))
+            if sequence:
+                path = '{}{:010d}'.format(path, parent_node.cversion)
+            if path in self.__nodes:
+                raise NodeExistsError(path)
+            zxid = self.__next_zxid()
+            self.__nodes[path] = _MemoryNode(value, zxid, session_id if ephemeral else 0)
+            if ephemeral:
+                self.__ephemerals[session_id].add(path)
+            self.__add_child(parent_node, child_name(path), zxid)
+            events.extend(self.__triggered(self.__data_watches, path, EventType.CREATED))
+            events.extend(self.__triggered(self.__child_watches, parent, EventType.CHILD))
+            events.extend(self.__recursive(path, EventType.CREATED))
+        self.__fire(events)
+        return path
+
+    def __make_path(self, path: str, events: list):
+        parent = parent_path(path)
+        if parent not in self.__nodes:
+            self.__make_path(parent, events)
+        zxid = self.__next_zxid()
+        self.__nodes[path] = _MemoryNode(b'', zxid)
+        self.__add_child(self.__nodes[parent], child_name(path), zxid)
+        events.extend(self.__triggered(self.__data_watches, path, EventType.CREATED))
+        events.extend(self.__triggered(self.__child_watches, parent, EventType.CHILD))
+        events.extend(self.__recursive(path, EventType.CREATED))
+
+    def exists(self, path: str, watch: int = None) -> ZnodeStat:
+        """Return the node stat, or None if the node does not exist.
+        If given the watch session is told when the node is created, changed or deleted."""
+        with self.__rlock:
+            if watch is not None:
+                self.__data_watches.setdefault(path, set()).add(watch)
+            node = self.__nodes.get(path)
+            return None if node is None else node.stat()
+
+    def get(self, path: str, watch: int = None) -> typing.Tuple[bytes, ZnodeStat]:
+        with self.__rlock:
+            node = self.__node(path)
+            if watch is not None:
+                self.__data_watches.setdefault(path, set()).add(watch)
+            return node.data, node.stat()
+
+    def set(self, path: str, value: bytes, version: int = -1) -> ZnodeStat:
+        assert isinstance(value, bytes)
+        with self.__rlock:
+            node = self.__node(path)
+            if version != -1 and version != node.version:
+                raise BadVersionError(path)
+            node.data = value
+            node.version += 1
+            node.mzxid = self.__next_zxid()
+            node.mtime = int(time.time() * 1000)
+            stat = node.stat()
+            events = self.__triggered(self.__data_watches, path, EventType.CHANGED)
+            events.extend(self.__recursive(path, EventType.CHANGED))
+        self.__fire(events)
+        return stat
+
+    def get_children(self, path: str, watch: int = None) -> typing.List[str]:
+        with self.__rlock:
+            node = self.__node(path)
+            if watch is not None:
+                self.__child_watches.setdefault(path, set()).add(watch)
+            return list(node.children)
+
+    def add_watch(self, path: str, session_id: int):
+        """Add a persistent recursive watch, the session is told of every node created, changed or deleted at or below the path.
+        The watch lasts until removed or the session ends."""
+        with self.__rlock:
+            if session_id not in self.__sessions:
+                raise SessionExpiredError(session_id)
+            self.__recursive_watches.setdefault(path, set()).add(session_id)
+
+    def remove_watch(self, path: str, session_id: int):
+        with self.__rlock:
+            self.__recursive_watches.get(path, set()).discard(session_id)
+
+    def delete(self, path: str, version: int = -1, recursive: bool = False):
+        assert path != '/'
+        with self.__rlock:
+            node = self.__node(path)
+            if version != -1 and version != node.version:
+                raise BadVersionError(path)
+            if node.children and not recursive:
+                raise NotEmptyError(path)
+            events = self.__delete(path)
+        self.__fire(events)
+
+    # Internals, called holding the lock.
+
+    def __next_zxid(self) -> int:
+        self.__zxid += 1
+        return self.__zxid
+
+    def __node(self, path: str) -> _MemoryNode:
+        node = self.__nodes.get(path)
+        if node is None:
+            raise NoNodeError(path)
+        return node
+
+    def __add_child(self, parent: _MemoryNode, name: str, zxid: int):
+        parent.children.add(name)
+        parent.cversion += 1
+        parent.pzxid = zxid
+
+    def __delete(self, path: str) -> list:
+        events = list()
+        node = self.__nodes[path]
+        for child in list(node.children):
+            events.extend(self.__delete(join_path(path, child)))
+        del self.__nodes[path]
+        if node.ephemeral_owner:
+            self.__ephemerals.get(node.ephemeral_owner, set()).discard(path)
+        parent = parent_path(path)
+        parent_node = self.__nodes[parent]
+        parent_node.children.discard(child_name(path))
+        parent_node.cversion += 1
+        parent_node.pzxid = self.__next_zxid()
+        events.extend(self.__triggered(self.__data_watches, path, EventType.DELETED))
+        events.extend(self.__triggered(self.__child_watches, path, EventType.DELETED))
+        events.extend(self.__triggered(self.__child_watches, parent, EventType.CHILD))
+        events.extend(self.__recursive(path, EventType.DELETED))
+        return events
+
+    def __triggered(self, watches: typing.Dict[str, typing.Set[int]], path: str, event_type: str) -> list:
+        """Remove the one-shot watches for the path returning the (deliver, event) pairs to fire."""
+        session_ids = watches.pop(path, None)
+        if not session_ids:
+            return []
+        event = WatchedEvent(event_type, KazooState.CONNECTED, path)
+        return [(self.__sessions[session_id], event) for session_id in session_ids if self.__sessions.get(session_id) is not None]
+
+    def __recursive(self, path: str, event_type: str) -> list:
+        """Return the (deliver, event) pairs for the persistent recursive watches at or above the path."""
+        if not self.__recursive_watches:
+            return []
+        events = list()
+        event = PersistentEvent(event_type, KazooState.CONNECTED, path)
+        watched = path
+        while True:
+            for session_id in self.__recursive_watches.get(watched, ()):
+                deliver = self.__sessions.get(session_id)
+                if deliver is not None:
+                    events.append((deliver, event))
+            if watched == '/':
+                break
+            watched = parent_path(watched)
+        return events
+
+    @staticmethod
+    def __fire(events: list):
+        """Deliver the events, outside of the lock so sessions can call straight back in."""
+        for deliver, event in events:
+            try:
+                deliver(event)
+            except Exception as exception:
+                _logging.warning('Failed to deliver event [{}] with exception [{}]'.format(event, exception))
+
+    def __str__(self) -> str:
+        return 'ZXID [{}] Sessions [{}] Nodes [{}]'.format(self.zxid(), self.sessions(), self.nodes())
+
+
+_default_ensemble = MemoryEnsemble()
+
+
+def default_ensemble() -> MemoryEnsemble:
+    """The process wide ensemble used when `MEMORY_ENSEMBLE` is not given."""
+    return _default_ensemble
+
+
+class _MemoryChildrenWatch(object):
+
+    """Mirrors `kazoo.recipe.watchers.ChildrenWatch`, func is called initially and whenever the children change.
+    The watch stops if the node does not exist or func returns False."""
+
+    def __init__(self, koolie_zookeeper: 'UsingMemory', path: str, func: typing.Callable) -> None:
+        super().__init__()
+
+        self._koolie_zookeeper = koolie_zookeeper
+        self._path = path
+        self._func = func
+        self._stopped = False
+        self._prior_children = None
+        self._run_lock = threading.Lock()
+
+    def stopped(self) -> bool:
+        return self._stopped
+
+    def get_children(self, resumed: bool = False):
+        with self._run_lock:
+            if self._stopped:
+                return
+            try:
+                children = self._koolie_zookeeper.watched_children(self._path)
+            except NoNodeError:
+                self._stopped = True
+                return
+            if resumed and self._prior_children == children:
+                return
+            self._prior_children = children
+            if self._func(children) is False:
+                self._stopped = True
+
+
+class _MemoryDataWatch(object):
+
+    """Mirrors `kazoo.recipe.watchers.DataWatch`, func is called with (data, stat) initially and whenever the node changes.
+    The watch stops if func returns False."""
+
+    def __init__(self, koolie_zookeeper: 'UsingMemory', path: str, func: typing.Callable) -> None:
+        super().__init__()
+
+        self._koolie_zookeeper = koolie_zookeeper
+        self._path = path
+        self._func = func
+        self._stopped = False
+        self._prior_stat: ZnodeStat = None
+        self._run_lock = threading.Lock()
+
+    def stopped(self) -> bool:
+        return self._stopped
+
+    def get_data(self, resumed: bool = False):
+        with self._run_lock:
+            if self._stopped:
+                return
+            data, stat = self._koolie_zookeeper.watched_data(self._path)
+            if resumed and self._prior_stat == stat:
+                return
+            self._prior_stat = stat
+            if self._func(data, stat) is False:
+                self._stopped = True
+
+
+class _MemoryAsyncResult(object):
+
+    """Mirrors `kazoo.interfaces.IAsyncResult`, the value is there once the latency has passed since the request was sent."""
+
+    def __init__(self, value, ready: float) -> None:
+        super().__init__()
+
+        self._value = value
+        self._ready = ready
+
+    def get(self, block: bool = True, timeout: float = None):
+        seconds = self._ready - time.monotonic()
+        if seconds > 0:
+            time.sleep(seconds)
+        return self._value
+
+
+class MemoryElection(object):
+
+    """Mirrors `kazoo.recipe.election.Election` using an ephemeral sequential node per contender, the lowest leads."""
+
+    def __init__(self, koolie_zookeeper: 'UsingMemory', path: str, identifier: str = None) -> None:
+        super().__init__()
+
+        self._koolie_zookeeper = koolie_zookeeper
+        self._path = path
+        self._identifier = '' if identifier is None else identifier
+        self._cancelled = False
+        self._wake = threading.Event()
+
+    def contenders(self) -> typing.List[str]:
+        """The identifiers of the contenders, the leader first."""
+        contenders = list()
+        for child in sorted(self._koolie_zookeeper.get_children(self._path), key=lambda child: child[-10:]):
+            value = self._koolie_zookeeper.get_node_value(join_path(self._path, child))
+            if value is not None:
+                contenders.append(value.decode('utf-8'))
+        return contenders
+
+    def run(self, func: typing.Callable, *args, **kwargs):
+        self._cancelled = False
+        self._wake.clear()
+        node = self._koolie_zookeeper.create_node(
+            join_path(self._path, 'contender_'), self._identifier.encode('utf-8'), ephemeral=True, sequence=True, make_path=True
+        )
+        name = child_name(node)
+        done = threading.Event()
+
+        def children_watch(children):
+            self._wake.set()
+            return not done.is_set()
+
+        try:
+            self._koolie_zookeeper.watch_children(self._path, children_watch)
+            while not self._cancelled:
+                children = sorted(self._koolie_zookeeper.get_children(self._path), key=lambda child: child[-10:])
+                if name not in children:
+                    raise SessionExpiredError('Lost election node [{}]'.format(node))
+                if children[0] == name:
+                    return func(*args, **kwargs)
+                self._wake.wait(1)
+                self._wake.clear()
+        finally:
+            done.set()
+            try:
+                self._koolie_zookeeper.delete_node(node)
+            except NoNodeError:
+                pass
+
+    def cancel(self):
+        self._cancelled = True
+        self._wake.set()
+
+
+class UsingMemory(koolie.zookeeper_api.koolie_zookeeper.AbstractKoolieZooKeeper):
+
+    """Concrete class to access a `MemoryEnsemble`, a drop in replacement for `UsingKazoo` without a real ensemble.
+    Watch events are delivered on a single event thread per instance, as Kazoo does."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self._ensemble: MemoryEnsemble = kwargs.get(MEMORY_ENSEMBLE) or default_ensemble()
+
+        self._latency: Latency = kwargs.get(MEMORY_LATENCY, 0.0)
+
+        self._watch_latency: Latency = kwargs.get(MEMORY_WATCH_LATENCY, 0.0)
+
+        self._tree_watch_emulated: bool = kwargs.get(MEMORY_TREE_WATCH_EMULATED, False)
+
+        self._session_id: int = None
+
+        self._events: queue.Queue = None
+
+        self._event_thread: threading.Thread = None
+
+        # Path to the children watches for that path.
+        self._children_watches: typing.Dict[str, typing.List[_MemoryChildrenWatch]] = dict()
+
+        # Path to the data watches for that path.
+        self._data_watches: typing.Dict[str, typing.List[_MemoryDataWatch]] = dict()
+
+        # Path to the functions of the persistent recursive watches for that path.
+        self._tree_watches: typing.Dict[str, typing.List[typing.Callable]] = dict()
+
+    @property
+    def ensemble(self) -> MemoryEnsemble:
+        return self._ensemble
+
+    @property
+    def session_id(self) -> int:
+        return self._session_id
+
+    def before_start(self):
+        self._events = queue.Queue()
+        self._event_thread = threading.Thread(group=None, target=self._go_events, name='{}-events'.format(self.name()), daemon=True)
+        self._event_thread.start()
+        self._session_id = self._ensemble.open_session(self._deliver)
+
+    def before_stop(self):
+        try:
+            self._ensemble.close_session(self._session_id)
+        finally:
+            self._session_id = None
+            self._children_watches.clear()
+            self._data_watches.clear()
+            self._tree_watches.clear()
+            self._events.put(None)
+            self._event_thread.join()
+            self._event_thread = None
+
+    def expire_session(self):
+        """Expire the current session, dropping ephemeral nodes and watches.
+        A new session is opened straight away and the children watches re-established, as Kazoo does."""
+        _logging.info('Expire session [{}]'.format(self._session_id))
+        self._ensemble.expire_session(self._session_id)
+
+    # Watch events.
+
+    def _deliver(self, event: WatchedEvent):
+        """Called by the ensemble, queue the event for the event thread."""
+        self._events.put((time.monotonic() + latency_seconds(self._watch_latency), event))
+
+    def _go_events(self):
+        while True:
+            item = self._events.get()
+            if item is None:
+                break
+            due, event = item
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self._event(event)
+            except Exception as exception:
+                _logging.warning('Exception handling event [{}] [{}]'.format(event, exception))
+
+    def _event(self, event: WatchedEvent):
+        if isinstance(event, PersistentEvent):
+            self._run_tree_watches(event)
+        elif event.state == KazooState.LOST:
+            # Persistent watches end with the session, as in ZooKeeper.
+            self._tree_watches.clear()
+            self._state_changed(KazooState.LOST)
+            self._session_id = self._ensemble.open_session(self._deliver)
+            _logging.info('Session lost, new session [{}]'.format(self._session_id))
+            self._state_changed(KazooState.CONNECTED)
+            for path in list(self._children_watches.keys()):
+                self._run_children_watches(path, True)
+            for path in list(self._data_watches.keys()):
+                self._run_data_watches(path, True)
+        else:
+            if event.type in {EventType.CHILD, EventType.DELETED}:
+                self._run_children_watches(event.path, False)
+            if event.type in {EventType.CREATED, EventType.CHANGED, EventType.DELETED}:
+                self._run_data_watches(event.path, False)
+
+    def _run_children_watches(self, path: str, resumed: bool):
+        watches = self._children_watches.get(path, [])
+        for watch in list(watches):
+            watch.get_children(resumed)
+            if watch.stopped():
+                watches.remove(watch)
+        if not watches:
+            self._children_watches.pop(path, None)
+
+    def _run_data_watches(self, path: str, resumed: bool):
+        watches = self._data_watches.get(path, [])
+        for watch in list(watches):
+            watch.get_data(resumed)
+            if watch.stopped():
+                watches.remove(watch)
+        if not watches:
+            self._data_watches.pop(path, None)
+
+    def _run_tree_watches(self, event: WatchedEvent):
+        watched = event.path
+        while True:
+            funcs = self._tree_watches.get(watched)
+            if funcs:
+                for func in list(funcs):
+                    try:
+                        if func(event) is False:
+                            funcs.remove(func)
+                    except Exception as exception:
+                        _logging.warning('Exception in tree watch [{}] [{}]'.format(watched, exception))
+                if not funcs:
+                    self._tree_watches.pop(watched, None)
+                    self._ensemble.remove_watch(watched, self._session_id)
+            if watched == '/':
+                break
+            watched = parent_path(watched)
+
+    def watched_children(self, path: str) -> typing.List[str]:
+        """Get the children and leave a child watch for this session."""
+        self._delay()
+        return self._ensemble.get_children(path, self._session_id)
+
+    def watched_data(self, path: str) -> typing.Tuple[bytes, ZnodeStat]:
+        """Get the data and stat, (None, None) if the node does not exist, and leave a data watch for this session."""
+        self._delay()
+        try:
+            return self._ensemble.get(path, self._session_id)
+        except NoNodeError:
+            self._ensemble.exists(path, self._session_id)
+            return None, None
+
+    # AbstractKoolieZooKeeper methods.
+
+    def _delay(self):
+        seconds = latency_seconds(self._latency)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def exists(self, path: str) -> ZnodeStat:
+        self._delay()
+        return self._ensemble.exists(path)
+
+    def exists_async(self, path: str) -> _MemoryAsyncResult:
+        return _MemoryAsyncResult(self._ensemble.exists(path), time.monotonic() + latency_seconds(self._latency))
+
+    def get_node_value(self, path: str) -> bytes:
+        self._delay()
+        try:
+            return self._ensemble.get(path)[0]
+        except Exception as exception:
+            _logging.warning('Failed to get value for path [{}] with exception [{}]'.format(path, exception))
+            return None
+
+    def set_node_value(self, path: str, value: bytes = b''):
+        assert path is not None and isinstance(path, str)
+        assert value is not None and isinstance(value, bytes)
+        self._delay()
+        self._ensemble.set(path, value, -1)
+
+    def get_children(self, path: str) -> typing.List[str]:
+        self._delay()
+        return self._ensemble.get_children(path)
+
+    def watch_children(self, path: str, func: callable):
+        watch = _MemoryChildrenWatch(self, path, func)
+        self._children_watches.setdefault(path, list()).append(watch)
+        watch.get_children()
+        if watch.stopped():
+            self._children_watches[path].remove(watch)
+
+    def watch_data(self, path: str, func: callable):
+        watch = _MemoryDataWatch(self, path, func)
+        self._data_watches.setdefault(path, list()).append(watch)
+        watch.get_data()
+        if watch.stopped():
+            self._data_watches[path].remove(watch)
+
+    def election(self, path: str, identifier: str = None) -> MemoryElection:
+        return MemoryElection(self, path, identifier)
+
+    def supports_tree_watch(self) -> bool:
+        return True
+
+    def watch_tree(self, path: str, func: callable, depth: int = None):
+        if self._tree_watch_emulated:
+            self.emulate_watch_tree(path, func, depth)
+            return
+        self._tree_watches.setdefault(path, list()).append(func)
+        self._ensemble.add_watch(path, self._session_id)
+
+    def unwatch_tree(self, path: str, func: callable):
+        if self._tree_watch_emulated:
+            self.emulate_unwatch_tree(path, func)
+            return
+        funcs = self._tree_watches.get(path, [])
+        if func in funcs:
+            funcs.remove(func)
+        if not funcs and self._tree_watches.pop(path, None) is not None:
+            self._ensemble.remove_watch(path, self._session_id)
+
+    def create_node(self, path, value=b'', acl=None, ephemeral=False, sequence=False, make_path=False) -> str:
+        self._delay()
+        return self._ensemble.create(self._session_id, path, value, ephemeral, sequence, make_path)
+
+    def delete_node(self, path, version=-1, recursive=False):
+        self._delay()
+        self._ensemble.delete(path, version, recursive)
+
+    def __str__(self) -> str:
+        return '{}\nSession [{}] {}'.format(super().__str__(), self._session_id, self._ensemble)
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    koolie_zookeeper: UsingMemory
+    with UsingMemory() as koolie_zookeeper:
+
+        def children(children: list):
+            _logging.info('Children [{}]'.format(children))
+
+        koolie_zookeeper.create_node('/koolie/pods', make_path=True)
+        koolie_zookeeper.watch_children('/koolie/pods', children)
+        koolie_zookeeper.create_ephemeral_node('/koolie/pods/foo', 'bar'.encode('utf-8'))
+        _logging.info(koolie_zookeeper.get_node_value('/koolie/pods/foo').decode('utf-8'))
+        koolie_zookeeper.expire_session()
+        time.sleep(1)
+        _logging.info(koolie_zookeeper)
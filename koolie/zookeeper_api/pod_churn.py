@@ -0,0 +1,294 @@
+import argparse
+import logging
+import random
+import sys
+import threading
+import time
+import typing
+
+from kazoo.exceptions import NodeExistsError
+
+import koolie.pod_api.pod_status
+import koolie.tools.common
+import koolie.zookeeper_api.koolie_node_watch
+import koolie.zookeeper_api.koolie_zookeeper
+import koolie.zookeeper_api.memory_zookeeper
+
+_logging = logging.getLogger(__name__)
+
+POD_CHURN_PATH_DEFAULT: str = '/koolie/pods'
+
+
+def pod_payload(name: str) -> bytes:
+    """A status payload like the one `PushStatus` creates, with an upstream for the pod."""
+    timestamp = time.time()
+    return koolie.pod_api.pod_status.encode_data(
+        [
+            {
+                'type': koolie.pod_api.pod_status.STATUS_TYPE,
+                koolie.pod_api.pod_status.STATUS_CREATED_KEY: timestamp,
+                koolie.pod_api.pod_status.STATUS_MODIFIED_KEY: timestamp,
+                'hostname': name
+            },
+            {
+                'type': 'nginx/upstream',
+                'name': 'churn',
+                'tag': name,
+                'loadPolicy': 'append',
+                'config': 'server {}:80;\n'.format(name)
+            }
+        ]
+    )
+
+
+class PodChurn(object):
+
+    """Simulate pods joining and leaving the pods path of a `MemoryEnsemble`.
+    Each pod has its own session and ephemeral node, as `PushStatus` does, under a hash bucket if buckets is more than 0.
+    Pods are identified by their node relative to the path, eg 'pod-000001' or '007/pod-000001'.
+    Attach a node watch to measure the latency from each join or leave to the watch's change() returning."""
+
+    def __init__(self, ensemble: koolie.zookeeper_api.memory_zookeeper.MemoryEnsemble = None, path: str = POD_CHURN_PATH_DEFAULT, seed: int = None, payload: typing.Callable[[str], bytes] = pod_payload, buckets: int = koolie.zookeeper_api.koolie_zookeeper.ZOOKEEPER_PODS_BUCKETS_DEFAULT) -> None:
+        super().__init__()
+
+        self.__ensemble = koolie.zookeeper_api.memory_zookeeper.default_ensemble() if ensemble is None else ensemble
+
+        self.__path = path
+
+        self.__random = random.Random(seed)
+
+        self.__payload = payload
+
+        self.__buckets = buckets
+
+        self.__rlock = threading.RLock()
+
+        self.__count = 0
+
+        # Pod name to session ID, plus the pod names as a list for random choice.
+        self.__sessions: typing.Dict[str, int] = dict()
+        self.__alive: typing.List[str] = list()
+
+        # Pod name to the (time, joined) of a change not yet seen by the watch.
+        self.__pending: typing.Dict[str, typing.Tuple[float, bool]] = dict()
+
+        self.__latencies: typing.List[float] = list()
+
+        try:
+            self.__ensemble.create(0, path, make_path=True)
+        except NodeExistsError:
+            pass
+
+    def ensemble(self) -> koolie.zookeeper_api.memory_zookeeper.MemoryEnsemble:
+        return self.__ensemble
+
+    def path(self) -> str:
+        return self.__path
+
+    def buckets(self) -> int:
+        return self.__buckets
+
+    def pods(self) -> typing.List[str]:
+        return list(self.__alive)
+
+    def pending(self) -> int:
+        return len(self.__pending)
+
+    def latencies(self) -> typing.List[float]:
+        return list(self.__latencies)
+
+    def attach(self, watch: koolie.zookeeper_api.koolie_node_watch.AbstractNodeWatch):
+        """Record the latency of each change until the watch has processed it.
+        If the watch processes the changes after its callbacks return, eg Consume renders them, the latency is until it reports
+        them processed. Otherwise wrap the watch's change(), in tree mode child_created() and child_deleted() and in bucket mode
+        bucket_children(). Call before the watch is started."""
+        if not watch.processes_in_callbacks():
+            watch.add_processed_listener(self.observed)
+            return
+        change = watch.change
+        child_created = watch.child_created
+        child_deleted = watch.child_deleted
+        bucket_children = watch.bucket_children
+
+        def timed_change(children):
+            try:
+                return change(children)
+            finally:
+                self.observed(children)
+
+        def timed_child_created(child):
+            try:
+                return child_created(child)
+            finally:
+                self.observed_child(child, True)
+
+        def timed_child_deleted(child):
+            try:
+                return child_deleted(child)
+            finally:
+                self.observed_child(child, False)
+
+        def timed_bucket_children(bucket, children):
+            try:
+                return bucket_children(bucket, children)
+            finally:
+                self.observed(['{}/{}'.format(bucket, child) for child in children], '{}/'.format(bucket))
+
+        watch.change = timed_change
+        watch.bucket_children = timed_bucket_children
+        watch.child_created = timed_child_created
+        watch.child_deleted = timed_child_deleted
+
+    def observed(self, children, prefix: str = ''):
+        """Record the latency of every pending change, to a child starting with the prefix, reflected by the given children."""
+        now = time.monotonic()
+        children = set(children)
+        with self.__rlock:
+            for name, (changed, joined) in list(self.__pending.items()):
+                if name.startswith(prefix) and (name in children) == joined:
+                    self.__latencies.append(now - changed)
+                    del self.__pending[name]
+
+    def observed_child(self, name: str, joined: bool):
+        """Record the latency of the pending change to the child, if it is reflected."""
+        now = time.monotonic()
+        with self.__rlock:
+            pending = self.__pending.get(name)
+            if pending is not None and pending[1] == joined:
+                self.__latencies.append(now - pending[0])
+                del self.__pending[name]
+
+    def join(self, count: int = 1) -> typing.List[str]:
+        """Add count pods, returning their nodes relative to the path."""
+        names = list()
+        for i in range(count):
+            with self.__rlock:
+                self.__count += 1
+                name = 'pod-{:06d}'.format(self.__count)
+            child = koolie.zookeeper_api.koolie_zookeeper.pod_child(name, self.__buckets)
+            self.join_pod(child, self.__payload(name))
+            names.append(child)
+        return names
+
+    def join_pod(self, child: str, payload: bytes):
+        """Add the pod with its own session, the child is its node relative to the path.
+        If the pod is already there its payload is set instead."""
+        with self.__rlock:
+            if child in self.__sessions:
+                self.set_pod(child, payload)
+                return
+            session_id = self.__ensemble.open_session()
+            self.__sessions[child] = session_id
+            self.__alive.append(child)
+            self.__pending[child] = (time.monotonic(), True)
+        self.__ensemble.create(session_id, koolie.zookeeper_api.memory_zookeeper.join_path(self.__path, child), payload, ephemeral=True, make_path=True)
+
+    def leave_pod(self, child: str, expire: bool = False) -> bool:
+        """Remove the pod, returning False if it is not there."""
+        with self.__rlock:
+            session_id = self.__sessions.pop(child, None)
+            if session_id is None:
+                return False
+            self.__alive.remove(child)
+            self.__pending[child] = (time.monotonic(), False)
+        if expire:
+            self.__ensemble.expire_session(session_id)
+        else:
+            self.__ensemble.close_session(session_id)
+        return True
+
+    def set_pod(self, child: str, payload: bytes):
+        """Change the pod's payload, as PushStatus does when its config files change."""
+        self.__ensemble.set(koolie.zookeeper_api.memory_zookeeper.join_path(self.__path, child), payload)
+
+    def leave(self, count: int = 1, expire: bool = False) -> typing.List[str]:
+        """Remove count random pods, either closing their sessions or expiring them as a crashed pod would."""
+        names = list()
+        for i in range(count):
+            with self.__rlock:
+                if not self.__alive:
+                    break
+                index = self.__random.randrange(len(self.__alive))
+                self.__alive[index], self.__alive[-1] = self.__alive[-1], self.__alive[index]
+                name = self.__alive.pop()
+                session_id = self.__sessions.pop(name)
+                self.__pending[name] = (time.monotonic(), False)
+            if expire:
+                self.__ensemble.expire_session(session_id)
+            else:
+                self.__ensemble.close_session(session_id)
+            names.append(name)
+        return names
+
+    def churn(self, events: int, rate: float, pods: int = None, expire_ratio: float = 0.0):
+        """Make events joins or leaves at rate per second, keeping the number of pods around pods.
+        Of the leaves expire_ratio are session expiries rather than clean closes."""
+        pods = len(self.__alive) if pods is None else pods
+        started = time.monotonic()
+        for i in range(events):
+            wait = started + i / rate - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            if self.__random.random() < 0.5 + (pods - len(self.__alive)) / max(pods, 1):
+                self.join()
+            else:
+                self.leave(expire=self.__random.random() < expire_ratio)
+
+    def wait(self, timeout: float = 10.0) -> bool:
+        """Wait for the watch to see every change, return False on timeout."""
+        until = time.monotonic() + timeout
+        while self.__pending:
+            if time.monotonic() > until:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def report(self) -> typing.Dict[str, object]:
+        latencies = self.latencies()
+        return {
+            'changes': len(latencies),
+            'pending': self.pending(),
+            'p50': koolie.tools.common.percentile(latencies, 50),
+            'p90': koolie.tools.common.percentile(latencies, 90),
+            'p99': koolie.tools.common.percentile(latencies, 99),
+            'max': max(latencies) if latencies else None
+        }
+
+    def __str__(self) -> str:
+        return 'Pods [{}] {}'.format(len(self.__alive), self.report())
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Pod churn against an in-memory ZooKeeper')
+    parser.add_argument('--pods', type=int, default=2000)
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--rate', type=float, default=500.0)
+    parser.add_argument('--expire-ratio', type=float, default=0.1)
+    parser.add_argument('--watch-latency', type=float, default=0.0)
+    parser.add_argument('--mode', default=koolie.zookeeper_api.koolie_node_watch.KOOLIE_NODE_WATCH_MODE_CHILDREN)
+    parser.add_argument('--buckets', type=int, default=0)
+    args = parser.parse_args()
+
+    churn = PodChurn(buckets=args.buckets)
+
+    watch = koolie.zookeeper_api.koolie_node_watch.DeltaNodeWatch(
+        koolie_node_watch_path=churn.path(),
+        koolie_zookeeper_factory=koolie.zookeeper_api.memory_zookeeper.UsingMemory,
+        memory_ensemble=churn.ensemble(),
+        memory_watch_latency=args.watch_latency,
+        koolie_node_watch_mode=args.mode,
+        zookeeper_pods_buckets=args.buckets
+    )
+    churn.attach(watch)
+    watch.start()
+    try:
+        churn.join(args.pods)
+        churn.wait()
+        _logging.info('Joined {}'.format(churn))
+        churn.churn(args.events, args.rate, args.pods, args.expire_ratio)
+        churn.wait()
+        _logging.info('Churned {}'.format(churn))
+    finally:
+        watch.stop()
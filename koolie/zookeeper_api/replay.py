@@ -0,0 +1,253 @@
+import argparse
+import base64
+import gzip
+import importlib
+import json
+import logging
+import sys
+import threading
+import time
+import typing
+
+import koolie.zookeeper_api.koolie_node_watch
+import koolie.zookeeper_api.memory_zookeeper
+import koolie.zookeeper_api.pod_churn
+
+_logging = logging.getLogger(__name__)
+
+RECORDING_FORMAT: int = 1
+
+# The events of a recording, each has the seconds since the recording started as 't'.
+# Pods joining with their payloads, pods leaving, and pods whose payload changed in tree mode.
+# Recordings made in children mode have no 'set' events.
+EVENT_TIME: str = 't'
+EVENT_JOIN: str = 'join'
+EVENT_LEAVE: str = 'leave'
+EVENT_SET: str = 'set'
+
+
+def encode_payload(payload: bytes) -> str:
+    return base64.b64encode(payload or b'').decode('ascii')
+
+
+def decode_payload(payload: str) -> bytes:
+    return base64.b64decode(payload.encode('ascii'))
+
+
+def read_header(file_name: str) -> dict:
+    with gzip.open(file_name, 'rt', encoding='utf-8') as file:
+        header = json.loads(file.readline())
+    if header.get('format') != RECORDING_FORMAT:
+        raise ValueError('Unknown recording format [{}]'.format(header.get('format')))
+    return header
+
+
+def read_events(file_name: str) -> typing.Iterator[dict]:
+    """The events of the recording, read as they are needed."""
+    with gzip.open(file_name, 'rt', encoding='utf-8') as file:
+        file.readline()
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Recorder(koolie.zookeeper_api.koolie_node_watch.DeltaNodeWatch):
+
+    """Record the pods joining and leaving the watched path, with their payloads, to a gzipped file of JSON lines.
+    The first event is the pods already there when the recording starts.
+    In tree mode changes to the payloads are recorded too."""
+
+    RECORDER_FILE: str = 'recorder_file'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self.__file_name: str = self.get_kv(self.RECORDER_FILE)
+
+        self.__file = None
+
+        self.__lock = threading.Lock()
+
+        self.__started: float = None
+
+        self.__events = 0
+
+    def events(self) -> int:
+        return self.__events
+
+    def before_start(self):
+        self.__file = gzip.open(self.__file_name, 'wt', encoding='utf-8')
+        self.__file.write(json.dumps({'format': RECORDING_FORMAT, 'path': self.zookeeper_node_path(), 'started': time.time(), 'mode': self.mode(), 'buckets': self.buckets()}) + '\n')
+        self.__started = time.monotonic()
+        super().before_start()
+
+    def before_stop(self):
+        super().before_stop()
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+        _logging.info('Recorded [{}] events to [{}]'.format(self.__events, self.__file_name))
+
+    def record(self, kind: str, value: object):
+        with self.__lock:
+            if self.__file is None:
+                return
+            self.__file.write(json.dumps({EVENT_TIME: round(time.monotonic() - self.__started, 6), kind: value}, separators=(',', ':')) + '\n')
+            self.__events += 1
+
+    def payloads(self, children) -> typing.Dict[str, str]:
+        path = self.zookeeper_node_path().rstrip('/')
+        payloads = dict()
+        for child in sorted(children):
+            payload = self.zoo_keeper().get_node_value('{}/{}'.format(path, child))
+            if payload is not None:
+                payloads[child] = encode_payload(payload)
+        return payloads
+
+    def added(self, children):
+        super().added(children)
+        if children:
+            self.record(EVENT_JOIN, self.payloads(children))
+
+    def removed(self, children):
+        super().removed(children)
+        if children:
+            self.record(EVENT_LEAVE, sorted(children))
+
+    def modified(self, children):
+        super().modified(children)
+        if children:
+            self.record(EVENT_SET, self.payloads(children))
+
+
+class Replayer(object):
+
+    """Replay a recording into a `MemoryEnsemble` through a `PodChurn`, at the recorded pace multiplied by speed.
+    A speed of 0 replays as fast as possible.
+    Attach the node watch under test to measure the latency from each join or leave to the watch having processed it."""
+
+    def __init__(self, file_name: str, ensemble: koolie.zookeeper_api.memory_zookeeper.MemoryEnsemble = None, speed: float = 1.0) -> None:
+        super().__init__()
+
+        self.__file_name = file_name
+
+        self.__header = read_header(file_name)
+
+        self.__churn = koolie.zookeeper_api.pod_churn.PodChurn(
+            koolie.zookeeper_api.memory_zookeeper.MemoryEnsemble() if ensemble is None else ensemble,
+            path=self.__header['path']
+        )
+
+        self.__speed = speed
+
+        self.__events = 0
+
+        self.__duration: float = None
+
+    def header(self) -> dict:
+        return dict(self.__header)
+
+    def path(self) -> str:
+        return self.__header['path']
+
+    def ensemble(self) -> koolie.zookeeper_api.memory_zookeeper.MemoryEnsemble:
+        return self.__churn.ensemble()
+
+    def churn(self) -> koolie.zookeeper_api.pod_churn.PodChurn:
+        return self.__churn
+
+    def attach(self, watch: koolie.zookeeper_api.koolie_node_watch.AbstractNodeWatch):
+        """Measure the watch, call before the watch is started."""
+        self.__churn.attach(watch)
+
+    def replay(self) -> int:
+        """Apply the events, returning how many."""
+        started = time.monotonic()
+        for event in read_events(self.__file_name):
+            if self.__speed > 0:
+                wait = started + event[EVENT_TIME] / self.__speed - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+            for child, payload in event.get(EVENT_JOIN, dict()).items():
+                self.__churn.join_pod(child, decode_payload(payload))
+            for child in event.get(EVENT_LEAVE, list()):
+                self.__churn.leave_pod(child)
+            for child, payload in event.get(EVENT_SET, dict()).items():
+                self.__churn.set_pod(child, decode_payload(payload))
+            self.__events += 1
+        self.__duration = time.monotonic() - started
+        return self.__events
+
+    def wait(self, timeout: float = 10.0) -> bool:
+        return self.__churn.wait(timeout)
+
+    def report(self) -> typing.Dict[str, object]:
+        report = self.__churn.report()
+        report.update(events=self.__events, speed=self.__speed, duration=self.__duration)
+        return report
+
+    def __str__(self) -> str:
+        return 'Replay [{}] Pods [{}] {}'.format(self.__file_name, len(self.__churn.pods()), self.report())
+
+
+def watch_class(name: str) -> type:
+    """The class named by its module and name, eg 'koolie.nginx.zookeeper.Consume'."""
+    module_name, class_name = name.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Record the pods of a ZooKeeper path, or replay a recording against a node watch')
+    subparsers = parser.add_subparsers(dest='command')
+
+    record_parser = subparsers.add_parser('record')
+    record_parser.add_argument('--zookeeper-hosts', type=str, default='localhost:2181')
+    record_parser.add_argument('--path', type=str, default=koolie.zookeeper_api.pod_churn.POD_CHURN_PATH_DEFAULT)
+    record_parser.add_argument('--mode', default=koolie.zookeeper_api.koolie_node_watch.KOOLIE_NODE_WATCH_MODE_CHILDREN, help='Kazoo only supports children mode, so payload changes are not recorded')
+    record_parser.add_argument('--buckets', type=int, default=0)
+    record_parser.add_argument('--duration', type=float, default=60.0)
+    record_parser.add_argument('file')
+
+    replay_parser = subparsers.add_parser('replay')
+    replay_parser.add_argument('--speed', type=float, default=1.0, help='Multiple of the recorded pace, 0 for as fast as possible')
+    replay_parser.add_argument('--watch', type=str, default='koolie.zookeeper_api.koolie_node_watch.DeltaNodeWatch', help='The node watch class')
+    replay_parser.add_argument('--mode', default=koolie.zookeeper_api.koolie_node_watch.KOOLIE_NODE_WATCH_MODE_CHILDREN)
+    replay_parser.add_argument('file')
+
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        recorder = Recorder(
+            recorder_file=args.file,
+            ZOOKEEPER_HOSTS=args.zookeeper_hosts,
+            koolie_node_watch_path=args.path,
+            koolie_node_watch_mode=args.mode,
+            zookeeper_pods_buckets=args.buckets
+        )
+        recorder.start()
+        try:
+            time.sleep(args.duration)
+        finally:
+            recorder.stop()
+    elif args.command == 'replay':
+        replayer = Replayer(args.file, speed=args.speed)
+        watch = watch_class(args.watch)(
+            koolie_node_watch_path=replayer.path(),
+            koolie_zookeeper_factory=koolie.zookeeper_api.memory_zookeeper.UsingMemory,
+            memory_ensemble=replayer.ensemble(),
+            koolie_node_watch_mode=args.mode,
+            zookeeper_pods_buckets=replayer.header().get('buckets', 0)
+        )
+        replayer.attach(watch)
+        watch.start()
+        try:
+            replayer.replay()
+            replayer.wait()
+            _logging.info(replayer)
+        finally:
+            watch.stop()
+    else:
+        parser.print_help()
@@ -0,0 +1,105 @@
+import threading
+import time
+import unittest
+
+import koolie.zookeeper_api.dispatch
+import koolie.zookeeper_api.koolie_node_watch
+from koolie.zookeeper_api.dispatch import EVENT_ADD, EVENT_REMOVE, Selector
+from koolie.zookeeper_api.memory_zookeeper import MemoryEnsemble, UsingMemory
+from koolie.zookeeper_api.pod_churn import PodChurn
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    until = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestDispatch(unittest.TestCase):
+
+    def test_selectors(self):
+        dispatcher = koolie.zookeeper_api.dispatch.Dispatcher()
+        seen = {'upstreams': list(), 'pods': list(), 'any': list()}
+        dispatcher.register('upstreams', [Selector('nginx/upstream', name='ydos')], lambda child, item: seen['upstreams'].append(item['tag']))
+        # Matching both selectors the item is still handled once.
+        dispatcher.register('pods', [Selector('nginx/upstream', tag='pod-?'), Selector('nginx/upstream', tag='pod-[12]')], lambda child, item: seen['pods'].append(item['tag']))
+        dispatcher.register('any', [Selector(None, tag='pod-1')], lambda child, item: seen['any'].append(item['type']))
+        dispatcher.start()
+        try:
+            items = [
+                {'type': 'nginx/upstream', 'name': 'ydos', 'tag': 'pod-1'},
+                {'type': 'nginx/upstream', 'name': 'other', 'tag': 'pod-22'},
+                {'type': 'nginx/location', 'name': 'status', 'tag': 'pod-1'},
+                'not an item'
+            ]
+            self.assertEqual(dispatcher.dispatch(EVENT_ADD, 'pod-1', items), 4)
+            self.assertTrue(wait_for(lambda: sum(handler.handled() for handler in dispatcher.handlers()) == 4))
+            self.assertEqual(seen, {'upstreams': ['pod-1'], 'pods': ['pod-1'], 'any': ['nginx/upstream', 'nginx/location']})
+            # No handler takes removes, they are still tracked.
+            self.assertEqual(dispatcher.dispatch(EVENT_REMOVE, 'pod-1', items), 4)
+            self.assertTrue(wait_for(lambda: sum(handler.applied() for handler in dispatcher.handlers()) == 0))
+            self.assertEqual(sum(handler.handled() for handler in dispatcher.handlers()), 4)
+        finally:
+            dispatcher.stop()
+
+    def test_slow_handler(self):
+        """A slow handler overflows and resyncs, the fast one still handles every item and neither loses a remove."""
+        dispatcher = koolie.zookeeper_api.dispatch.Dispatcher()
+        release = threading.Event()
+        fast = set()
+        slow = set()
+
+        def slow_add(child, item):
+            release.wait(5)
+            slow.add(child)
+
+        dispatcher.register('slow', [Selector('pod/status')], slow_add, lambda child, item: slow.discard(child), capacity=2)
+        dispatcher.register('fast', [Selector('pod/status')], lambda child, item: fast.add(child), lambda child, item: fast.discard(child))
+        dispatcher.start()
+        try:
+            for i in range(10):
+                dispatcher.dispatch(EVENT_ADD, 'pod-{}'.format(i), [{'type': 'pod/status', 'hostname': 'pod-{}'.format(i)}])
+            for i in range(0, 10, 2):
+                dispatcher.dispatch(EVENT_REMOVE, 'pod-{}'.format(i), [{'type': 'pod/status', 'hostname': 'pod-{}'.format(i)}])
+            # An add and remove of the same item collapse.
+            dispatcher.dispatch(EVENT_ADD, 'pod-20', [{'type': 'pod/status', 'hostname': 'pod-20'}])
+            dispatcher.dispatch(EVENT_REMOVE, 'pod-20', [{'type': 'pod/status', 'hostname': 'pod-20'}])
+            expected = {'pod-{}'.format(i) for i in range(1, 10, 2)}
+            self.assertTrue(wait_for(lambda: fast == expected))
+            handler = dispatcher.handlers()[0]
+            self.assertGreaterEqual(handler.resyncs(), 1)
+            release.set()
+            # The first add was taken before the overflow, the resync removes it again.
+            self.assertTrue(wait_for(lambda: slow == expected and handler.pending() == 0))
+            self.assertEqual(handler.applied(), 5)
+        finally:
+            release.set()
+            dispatcher.stop()
+
+    def test_status_type_watch(self):
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1)
+        churn.join(3)
+        added = list()
+        removed = list()
+        watch = koolie.zookeeper_api.koolie_node_watch.StatusTypeWatch(
+            koolie_node_watch_path=churn.path(),
+            koolie_zookeeper_factory=UsingMemory,
+            memory_ensemble=ensemble,
+            StatusTypeWatch_add={'pod/status': lambda item: added.append(item['hostname'])}
+        )
+        watch.dispatcher().register('upstreams', [Selector('nginx/upstream', name='churn')], None, lambda child, item: removed.append(child))
+        watch.start()
+        try:
+            self.assertTrue(wait_for(lambda: sorted(added) == sorted(churn.pods())))
+            left = churn.leave(1)
+            self.assertTrue(wait_for(lambda: removed == left))
+        finally:
+            watch.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,38 @@
 import unittest
 
-from koolie.zookeeper_api.koolie_zookeeper import AbstractKoolieZooKeeper, UsingKazoo
+from kazoo.protocol.states import KazooState, KeeperState
+
+from koolie.zookeeper_api.koolie_zookeeper import AbstractKoolieZooKeeper, KazooSessions, UsingKazoo
+
+
+class StubKazooClient(object):
+
+    """Just enough of KazooClient for KazooSessions."""
+
+    created = 0
+
+    def __init__(self, hosts: str) -> None:
+        super().__init__()
+        StubKazooClient.created += 1
+        self.hosts = hosts
+        self.client_state = KeeperState.CLOSED
+        self.listeners = list()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def start(self, timeout=None):
+        self.client_state = KeeperState.CONNECTED
+        for listener in self.listeners:
+            listener(KazooState.CONNECTED)
+
+    def stop(self):
+        self.client_state = KeeperState.CLOSED
+        for listener in self.listeners:
+            listener(KazooState.LOST)
+
+    def close(self):
+        pass
 
 
 class MyTestCase(unittest.TestCase):
@@ -19,5 +51,24 @@ class MyTestCase(unittest.TestCase):
                 print(child)
 
 
+class TestKazooSessions(unittest.TestCase):
+
+    def test_reference_count(self):
+        sessions = KazooSessions(client_factory=StubKazooClient)
+        created = StubKazooClient.created
+        a = sessions.attach('zookeeper:2181')
+        b = sessions.attach('zookeeper:2181')
+        self.assertIs(a, b)
+        self.assertIsNot(a, sessions.attach('other:2181'))
+        self.assertEqual(StubKazooClient.created - created, 2)
+        self.assertEqual(sessions.references('zookeeper:2181'), 2)
+        self.assertEqual(sessions.state('zookeeper:2181'), KazooState.CONNECTED)
+        sessions.detach('zookeeper:2181')
+        self.assertEqual(a.client_state, KeeperState.CONNECTED)
+        sessions.detach('zookeeper:2181')
+        self.assertEqual(a.client_state, KeeperState.CLOSED)
+        self.assertEqual(sessions.references('zookeeper:2181'), 0)
+
+
 if __name__ == '__main__':
     unittest.main()
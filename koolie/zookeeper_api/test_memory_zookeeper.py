@@ -0,0 +1,268 @@
+import time
+import unittest
+
+from kazoo.exceptions import BadVersionError, NodeExistsError
+from kazoo.protocol.states import EventType
+
+from koolie.zookeeper_api.koolie_node_watch import DeltaNodeWatch
+from koolie.zookeeper_api.koolie_zookeeper import UsingKazoo, pod_child
+from koolie.zookeeper_api.memory_zookeeper import MemoryEnsemble, UsingMemory
+from koolie.zookeeper_api.pod_churn import PodChurn
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    until = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestMemoryZooKeeper(unittest.TestCase):
+
+    def test_versions(self):
+        ensemble = MemoryEnsemble()
+        ensemble.create(0, '/koolie/pods/foo', b'bar', make_path=True)
+        self.assertRaises(NodeExistsError, ensemble.create, 0, '/koolie/pods/foo')
+        stat = ensemble.set('/koolie/pods/foo', b'baz', 0)
+        self.assertEqual(stat.version, 1)
+        self.assertRaises(BadVersionError, ensemble.set, '/koolie/pods/foo', b'qux', 0)
+        self.assertEqual(ensemble.get('/koolie/pods/foo')[0], b'baz')
+        self.assertEqual(ensemble.exists('/koolie/pods').cversion, 1)
+
+    def test_ephemeral(self):
+        ensemble = MemoryEnsemble()
+        with UsingMemory(memory_ensemble=ensemble) as koolie_zookeeper:
+            koolie_zookeeper.create_node('/koolie/pods', make_path=True)
+            koolie_zookeeper.create_ephemeral_node('/koolie/pods/foo', b'bar')
+            self.assertEqual(koolie_zookeeper.get_children('/koolie/pods'), ['foo'])
+            koolie_zookeeper.expire_session()
+            self.assertEqual(koolie_zookeeper.get_children('/koolie/pods'), [])
+            self.assertTrue(wait_for(lambda: ensemble.sessions() == 1))
+        self.assertEqual(ensemble.sessions(), 0)
+
+    def test_exists_async(self):
+        ensemble = MemoryEnsemble()
+        ensemble.create(0, '/koolie/pods/foo', make_path=True)
+        with UsingMemory(memory_ensemble=ensemble, memory_latency=0.1) as koolie_zookeeper:
+            start = time.monotonic()
+            results = [koolie_zookeeper.exists_async(path) for path in ['/koolie/pods/foo', '/koolie/pods/bar'] * 10]
+            stats = [result.get() for result in results]
+            # Pipelined, so about one round trip rather than twenty.
+            self.assertLess(time.monotonic() - start, 0.5)
+            self.assertEqual([stat is None for stat in stats], [False, True] * 10)
+            self.assertEqual(stats[0], koolie_zookeeper.exists('/koolie/pods/foo'))
+
+    def test_watch_children(self):
+        ensemble = MemoryEnsemble()
+        seen = list()
+        with UsingMemory(memory_ensemble=ensemble, memory_watch_latency=0.01) as koolie_zookeeper:
+            koolie_zookeeper.create_node('/koolie/pods', make_path=True)
+            koolie_zookeeper.watch_children('/koolie/pods', lambda children: seen.append(sorted(children)))
+            ensemble.create(ensemble.open_session(), '/koolie/pods/foo', b'', ephemeral=True)
+            self.assertTrue(wait_for(lambda: seen[-1] == ['foo']))
+            koolie_zookeeper.expire_session()
+            ensemble.create(0, '/koolie/pods/bar')
+            self.assertTrue(wait_for(lambda: seen[-1] == ['bar', 'foo']))
+
+    def test_resync(self):
+        ensemble = MemoryEnsemble()
+        ensemble.create(0, '/koolie/pods/foo', make_path=True)
+        ensemble.create(0, '/koolie/pods/bar')
+        deltas = list()
+
+        class RecordingNodeWatch(DeltaNodeWatch):
+
+            def added(self, children):
+                deltas.append(('added', sorted(children)))
+
+            def removed(self, children):
+                deltas.append(('removed', sorted(children)))
+
+        watch = RecordingNodeWatch(koolie_node_watch_path='/koolie/pods', koolie_zookeeper_factory=UsingMemory, memory_ensemble=ensemble)
+        watch.start()
+        try:
+            self.assertTrue(wait_for(lambda: watch.current() == {'foo', 'bar'}))
+            deltas.clear()
+            # Changes while the session is being replaced are only seen by the resync.
+            watch.zoo_keeper().expire_session()
+            ensemble.delete('/koolie/pods/foo')
+            ensemble.create(0, '/koolie/pods/baz')
+            self.assertTrue(wait_for(lambda: watch.current() == {'bar', 'baz'}))
+            self.assertTrue(wait_for(lambda: watch.reconnect_count() == 1 and len(watch.resync_durations()) == 1))
+            self.assertEqual(sorted(delta for delta in deltas if delta[1]), [('added', ['baz']), ('removed', ['foo'])])
+        finally:
+            watch.stop()
+
+    def test_watch_tree(self):
+        # Emulated as on Kazoo, with a children watch and a data watch per node.
+        for emulated in [False, True]:
+            with self.subTest(emulated=emulated):
+                self.watch_tree(emulated)
+
+    def watch_tree(self, emulated: bool):
+        ensemble = MemoryEnsemble()
+        ensemble.create(0, '/koolie/pods/foo', make_path=True)
+        modified = list()
+
+        class ModifiedNodeWatch(DeltaNodeWatch):
+
+            def modified(self, children):
+                modified.extend(children)
+
+        watch = ModifiedNodeWatch(
+            koolie_node_watch_path='/koolie/pods', koolie_node_watch_mode='tree', koolie_zookeeper_factory=UsingMemory, memory_ensemble=ensemble,
+            memory_tree_watch_emulated=emulated
+        )
+        watch.start()
+        try:
+            self.assertTrue(wait_for(lambda: watch.current() == {'foo'}))
+            ensemble.create(0, '/koolie/pods/bar')
+            ensemble.set('/koolie/pods/foo', b'snippets')
+            ensemble.create(0, '/koolie/pods/bar/below')
+            # The emulation reads the node when the one-shot watch fires, a change then a delete could be seen as just the delete.
+            self.assertTrue(wait_for(lambda: modified == ['foo']))
+            ensemble.delete('/koolie/pods/foo')
+            self.assertTrue(wait_for(lambda: watch.current() == {'bar'}))
+            self.assertEqual(modified, ['foo'])
+            watch.zoo_keeper().expire_session()
+            self.assertTrue(wait_for(lambda: watch.reconnect_count() == 1))
+            ensemble.set('/koolie/pods/bar', b'snippets')
+            self.assertTrue(wait_for(lambda: modified == ['foo', 'bar']))
+            # Unwatching removes the persistent watch from the session rather than leaving it to the next event.
+            watch.unwatch()
+            self.assertNotIn('/koolie/pods', watch.zoo_keeper()._tree_watches)
+            self.assertEqual(watch.zoo_keeper()._tree_watch_emulations, {})
+        finally:
+            watch.stop()
+
+    def test_watch_tree_emulated_buckets(self):
+        ensemble = MemoryEnsemble()
+        ensemble.create(0, '/koolie/pods/000/foo', make_path=True)
+        events = list()
+        with UsingMemory(memory_ensemble=ensemble, memory_tree_watch_emulated=True) as koolie_zookeeper:
+            def tree_watch(event):
+                events.append((event.type, event.path))
+
+            koolie_zookeeper.watch_tree('/koolie/pods', tree_watch, 2)
+            # The nodes there when started are not given.
+            self.assertEqual(events, [])
+            ensemble.create(0, '/koolie/pods/001/bar', make_path=True)
+            self.assertTrue(wait_for(lambda: len(events) == 2))
+            ensemble.set('/koolie/pods/000/foo', b'status')
+            ensemble.create(0, '/koolie/pods/000/foo/below')
+            self.assertTrue(wait_for(lambda: len(events) == 3))
+            ensemble.delete('/koolie/pods/001/bar')
+            self.assertTrue(wait_for(lambda: len(events) == 4))
+            ensemble.delete('/koolie/pods/001')
+            self.assertTrue(wait_for(lambda: len(events) == 5))
+            self.assertEqual(events, [
+                (EventType.CREATED, '/koolie/pods/001'),
+                (EventType.CREATED, '/koolie/pods/001/bar'),
+                (EventType.CHANGED, '/koolie/pods/000/foo'),
+                (EventType.DELETED, '/koolie/pods/001/bar'),
+                (EventType.DELETED, '/koolie/pods/001')
+            ])
+            koolie_zookeeper.unwatch_tree('/koolie/pods', tree_watch)
+            ensemble.set('/koolie/pods/000/foo', b'status')
+            time.sleep(0.1)
+            self.assertEqual(len(events), 5)
+
+    def test_watch_tree_unsupported(self):
+        # A client which cannot watch the tree fails the mode when configured rather than silently watching the children.
+        class Unsupported(UsingMemory):
+
+            def supports_tree_watch(self) -> bool:
+                return False
+
+        with self.assertRaises(ValueError):
+            DeltaNodeWatch(koolie_node_watch_path='/koolie/pods', koolie_node_watch_mode='tree', koolie_zookeeper_factory=Unsupported)
+        self.assertTrue(UsingKazoo().supports_tree_watch())
+
+    def test_pod_churn(self):
+        churn = PodChurn(MemoryEnsemble(), seed=1)
+        watch = DeltaNodeWatch(
+            koolie_node_watch_path=churn.path(),
+            koolie_zookeeper_factory=UsingMemory,
+            memory_ensemble=churn.ensemble()
+        )
+        churn.attach(watch)
+        watch.start()
+        try:
+            churn.join(50)
+            churn.leave(10)
+            churn.leave(10, expire=True)
+            self.assertTrue(churn.wait())
+            self.assertEqual(watch.current(), set(churn.pods()))
+            self.assertEqual(churn.report()['pending'], 0)
+        finally:
+            watch.stop()
+
+    def test_buckets(self):
+        for mode in ['children', 'tree']:
+            churn = PodChurn(MemoryEnsemble(), seed=1, buckets=16)
+            changes = list()
+
+            class BucketNodeWatch(DeltaNodeWatch):
+
+                def change(self, children):
+                    changes.append(children)
+                    super().change(children)
+
+            watch = BucketNodeWatch(
+                koolie_node_watch_path=churn.path(),
+                koolie_node_watch_mode=mode,
+                zookeeper_pods_buckets=churn.buckets(),
+                koolie_zookeeper_factory=UsingMemory,
+                memory_ensemble=churn.ensemble()
+            )
+            churn.attach(watch)
+            watch.start()
+            try:
+                churn.join(50)
+                churn.leave(10)
+                churn.leave(10, expire=True)
+                self.assertTrue(churn.wait())
+                self.assertEqual(watch.current(), set(churn.pods()))
+                self.assertTrue(all(pod_child(pod.split('/')[1], 16) == pod for pod in churn.pods()))
+                if mode == 'children':
+                    # Only the changed buckets are processed, never the whole list.
+                    self.assertEqual(changes, [])
+                watch.zoo_keeper().expire_session()
+                self.assertTrue(wait_for(lambda: watch.reconnect_count() == 1))
+                churn.join(5)
+                self.assertTrue(churn.wait())
+                self.assertEqual(watch.current(), set(churn.pods()))
+            finally:
+                watch.stop()
+
+    def test_bucket_recreated(self):
+        ensemble = MemoryEnsemble()
+        ensemble.create(0, '/koolie/pods/b1/foo', make_path=True)
+        watch = DeltaNodeWatch(
+            koolie_node_watch_path='/koolie/pods',
+            zookeeper_pods_buckets=16,
+            koolie_zookeeper_factory=UsingMemory,
+            memory_ensemble=ensemble
+        )
+        watch.start()
+        try:
+            self.assertTrue(wait_for(lambda: watch.current() == {'b1/foo'}))
+            # Emptied then deleted, the bucket's watch ends.
+            ensemble.delete('/koolie/pods/b1/foo')
+            self.assertTrue(wait_for(lambda: watch.current() == set()))
+            ensemble.delete('/koolie/pods/b1')
+            self.assertTrue(wait_for(lambda: ensemble.exists('/koolie/pods/b1') is None))
+            time.sleep(0.1)
+            # Created again, the bucket is watched again.
+            ensemble.create(0, '/koolie/pods/b1/bar', make_path=True)
+            self.assertTrue(wait_for(lambda: watch.current() == {'b1/bar'}))
+            ensemble.create(0, '/koolie/pods/b1/baz')
+            self.assertTrue(wait_for(lambda: watch.current() == {'b1/bar', 'b1/baz'}))
+        finally:
+            watch.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import tempfile
+import time
+import typing
+import unittest
+
+import koolie.nginx.zookeeper
+import koolie.zookeeper_api.koolie_node_watch
+import koolie.zookeeper_api.replay
+from koolie.zookeeper_api.memory_zookeeper import MemoryEnsemble, UsingMemory
+from koolie.zookeeper_api.pod_churn import PodChurn
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    until = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class SlowConsume(koolie.nginx.zookeeper.Consume):
+
+    RENDER_SECONDS = 0.2
+
+    def render(self):
+        time.sleep(SlowConsume.RENDER_SECONDS)
+        super().render()
+
+
+class TestReplay(unittest.TestCase):
+
+    def record(self, file_name: str, mode: str) -> typing.Tuple[PodChurn, int]:
+        ensemble = MemoryEnsemble()
+        churn = PodChurn(ensemble, seed=1)
+        churn.join(3)
+        recorder = koolie.zookeeper_api.replay.Recorder(
+            recorder_file=file_name,
+            koolie_node_watch_path=churn.path(),
+            koolie_zookeeper_factory=UsingMemory,
+            memory_ensemble=ensemble,
+            koolie_node_watch_mode=mode
+        )
+        churn.attach(recorder)
+        recorder.start()
+        try:
+            self.assertTrue(churn.wait())
+            churn.join(4)
+            churn.wait()
+            churn.leave(2)
+            churn.wait()
+            churn.set_pod(churn.pods()[0], b'changed')
+            self.assertTrue(wait_for(lambda: recorder.events() >= 4))
+        finally:
+            recorder.stop()
+        return churn, recorder.events()
+
+    def test_replay(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'pods.gz')
+            recorded, events = self.record(file_name, koolie.zookeeper_api.koolie_node_watch.KOOLIE_NODE_WATCH_MODE_TREE)
+
+            replayer = koolie.zookeeper_api.replay.Replayer(file_name, speed=0)
+            self.assertEqual(replayer.path(), recorded.path())
+            watch = koolie.zookeeper_api.koolie_node_watch.DeltaNodeWatch(
+                koolie_node_watch_path=replayer.path(),
+                koolie_zookeeper_factory=UsingMemory,
+                memory_ensemble=replayer.ensemble()
+            )
+            replayer.attach(watch)
+            watch.start()
+            try:
+                # The watch may deliver the pods joining together or one by one, so the count of events varies.
+                self.assertEqual(replayer.replay(), events)
+                self.assertTrue(replayer.wait())
+                self.assertEqual(watch.current(), set(recorded.pods()))
+                report = replayer.report()
+                # At full speed a pod may leave before its join is seen, so at most the 3 + 4 joins and 2 leaves are measured.
+                self.assertEqual((report['events'], report['pending']), (events, 0))
+                self.assertTrue(0 < report['changes'] <= 9)
+                self.assertIsNotNone(report['p99'])
+                # The payloads are replayed too, including the change.
+                pod = recorded.pods()[0]
+                self.assertEqual(replayer.ensemble().get('{}/{}'.format(replayer.path(), pod))[0], b'changed')
+            finally:
+                watch.stop()
+
+    def test_replay_consume(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'pods.gz')
+            self.record(file_name, koolie.zookeeper_api.koolie_node_watch.KOOLIE_NODE_WATCH_MODE_TREE)
+
+            replayer = koolie.zookeeper_api.replay.Replayer(file_name, speed=0)
+            watch = SlowConsume(
+                koolie_node_watch_path=replayer.path(),
+                koolie_zookeeper_factory=UsingMemory,
+                memory_ensemble=replayer.ensemble(),
+                nginx_directory=os.path.join(directory, 'nginx'),
+                reload_function=lambda: True
+            )
+            self.assertFalse(watch.processes_in_callbacks())
+            replayer.attach(watch)
+            watch.start()
+            try:
+                replayer.replay()
+                self.assertTrue(replayer.wait())
+                latencies = replayer.churn().latencies()
+                self.assertTrue(latencies)
+                # Measured to the end of the render, not to the change being put in the mailbox.
+                self.assertGreaterEqual(min(latencies), SlowConsume.RENDER_SECONDS)
+            finally:
+                watch.stop()
+
+if __name__ == '__main__':
+    unittest.main()